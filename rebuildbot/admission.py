@@ -0,0 +1,359 @@
+"""
+rebuildbot/admission.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import time
+import errno
+import logging
+from tempfile import gettempdir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CGROUP_ROOT = '/sys/fs/cgroup/rebuildbot'
+CPU_PERIOD = 100000  # cgroup v2 cpu.max period, in microseconds
+MAX_ADMISSION_WAIT = 1800  # seconds to hold back a build when none is running
+
+#: ionice scheduling class names to ``ionice -c`` numbers
+IONICE_CLASSES = {
+    'best-effort': 2,
+    'idle': 3,
+}
+
+
+class AdmissionController(object):
+    """
+    Decides whether the host has enough headroom to start another local
+    build, and confines each build's process tree.
+
+    A build is only admitted while the 1-minute load average, available
+    memory and free disk space are within the configured thresholds (any
+    of which may be None, to not check it). So that a busy host cannot stall
+    a run forever, if no local build is running and builds have been held
+    back for :py:const:`~.MAX_ADMISSION_WAIT` seconds, the next one is
+    admitted anyway.
+
+    Each build's command is run under ``nice`` and ``ionice`` if requested,
+    and if a CPU or memory limit is set, in its own cgroup (v2) under
+    ``cgroup_root``; this must be a directory delegated to the user running
+    ReBuildBot, with the ``cpu`` and ``memory`` controllers available.
+    """
+
+    def __init__(self, max_load=None, min_free_memory_mb=None,
+                 min_free_disk_mb=None, disk_path=None, nice=None,
+                 ionice=None, cpu_limit=None, memory_limit_mb=None,
+                 cgroup_root=DEFAULT_CGROUP_ROOT):
+        """
+        :param max_load: maximum 1-minute load average to start a build at
+        :type max_load: float
+        :param min_free_memory_mb: minimum available memory, in MB, to start
+          a build with
+        :type min_free_memory_mb: int
+        :param min_free_disk_mb: minimum free space, in MB, on the filesystem
+          containing ``disk_path`` to start a build with
+        :type min_free_disk_mb: int
+        :param disk_path: path on the filesystem builds are cloned to;
+          defaults to the system temporary directory
+        :type disk_path: str
+        :param nice: niceness to run builds at
+        :type nice: int
+        :param ionice: I/O scheduling class to run builds in; a key of
+          :py:const:`~.IONICE_CLASSES`
+        :type ionice: str
+        :param cpu_limit: maximum number of CPUs each build may use
+        :type cpu_limit: float
+        :param memory_limit_mb: maximum memory, in MB, each build may use
+        :type memory_limit_mb: int
+        :param cgroup_root: cgroup v2 directory to create per-build cgroups
+          in
+        :type cgroup_root: str
+        """
+        self.max_load = max_load
+        self.min_free_memory_mb = min_free_memory_mb
+        self.min_free_disk_mb = min_free_disk_mb
+        if disk_path is None:
+            disk_path = gettempdir()
+        self.disk_path = disk_path
+        self.nice = nice
+        self.ionice = ionice
+        self.cpu_limit = cpu_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.cgroup_root = cgroup_root
+        self.refused_since = None
+
+    def admit(self, num_running=0):
+        """
+        Return None if a new local build may be started now, otherwise a
+        string describing why not.
+
+        :param num_running: number of local builds currently running
+        :type num_running: int
+        :rtype: str
+        """
+        reason = self.check()
+        if reason is None:
+            self.refused_since = None
+            return None
+        now = time.time()
+        if self.refused_since is None:
+            self.refused_since = now
+        if (
+                num_running == 0 and
+                now - self.refused_since >= MAX_ADMISSION_WAIT
+        ):
+            logger.warning("Starting local build even though %s; no build "
+                           "has been admitted for %ds", reason,
+                           now - self.refused_since)
+            self.refused_since = None
+            return None
+        return reason
+
+    def check(self):
+        """
+        Check the thresholds; return None if they are all met, otherwise a
+        string describing the first that is not.
+
+        :rtype: str
+        """
+        if self.max_load is not None:
+            load = os.getloadavg()[0]
+            if load > self.max_load:
+                return 'load average %.2f is above %s' % (load, self.max_load)
+        if self.min_free_memory_mb is not None:
+            free = available_memory_mb()
+            if free is not None and free < self.min_free_memory_mb:
+                return 'only %d MB of memory is available' % free
+        if self.min_free_disk_mb is not None:
+            free = free_disk_mb(self.disk_path)
+            if free is not None and free < self.min_free_disk_mb:
+                return 'only %d MB of disk is free on %s' % (
+                    free, self.disk_path)
+        return None
+
+    def command(self, cmd, cgroup=None):
+        """
+        Return ``cmd`` (a list of arguments) wrapped to run under the
+        configured ``nice`` and ``ionice`` settings and, if ``cgroup`` is not
+        None, in that cgroup. The wrapper ``exec``s, so the process ID of
+        the command is that of the returned command.
+
+        :param cmd: the command to run
+        :type cmd: list
+        :param cgroup: path to the cgroup to run the command in
+        :type cgroup: str
+        :rtype: list
+        """
+        prefix = []
+        if cgroup is not None:
+            # join the cgroup before exec, so every child is inside it
+            prefix.extend([
+                'sh', '-c', 'echo $$ > "$0" && exec "$@"',
+                os.path.join(cgroup, 'cgroup.procs')
+            ])
+        if self.nice is not None:
+            prefix.extend(['nice', '-n', str(self.nice)])
+        if self.ionice is not None:
+            prefix.extend(['ionice', '-c', str(IONICE_CLASSES[self.ionice])])
+        return prefix + cmd
+
+    def create_cgroup(self, slug):
+        """
+        If a CPU or memory limit is set, create a cgroup for the build of
+        ``slug`` with those limits and return its path. Return None if no
+        limit is set, or if the cgroup cannot be created (in which case the
+        build runs without limits).
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: str
+        """
+        if self.cpu_limit is None and self.memory_limit_mb is None:
+            return None
+        path = os.path.join(self.cgroup_root, 'build-%s-%d' % (
+            slug.replace('/', '__'), os.getpid()))
+        try:
+            if not os.path.isdir(self.cgroup_root):
+                os.makedirs(self.cgroup_root)
+            write_file(os.path.join(self.cgroup_root, 'cgroup.subtree_control'),
+                       '+cpu +memory')
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            if self.cpu_limit is not None:
+                write_file(os.path.join(path, 'cpu.max'), '%d %d' % (
+                    int(self.cpu_limit * CPU_PERIOD), CPU_PERIOD))
+            if self.memory_limit_mb is not None:
+                write_file(os.path.join(path, 'memory.max'),
+                           str(self.memory_limit_mb * 1024 * 1024))
+        except (IOError, OSError) as ex:
+            logger.warning("Unable to set up cgroup %s; running build of %s "
+                           "without CPU/memory limits: %s", path, slug, ex)
+            self.remove_cgroup(path)
+            return None
+        logger.debug("Created cgroup %s for build of %s", path, slug)
+        return path
+
+    def cgroup_usage(self, path):
+        """
+        Return the resource usage accounted to the cgroup at ``path`` by the
+        kernel, which (unlike :py:func:`os.wait4`) includes processes that
+        were never waited for, such as daemonized VM helpers. Keys are
+        ``cpu``, ``user_cpu`` and ``sys_cpu`` (seconds, from ``cpu.stat``),
+        ``max_memory_mb`` (from ``memory.peak``) and ``read_bytes`` and
+        ``write_bytes`` (from ``io.stat``); any that the kernel does not
+        provide are omitted.
+
+        :param path: path to the cgroup
+        :type path: str
+        :rtype: dict
+        """
+        res = {}
+        cpu = read_keyed_file(os.path.join(path, 'cpu.stat'))
+        for key, name in [('usage_usec', 'cpu'), ('user_usec', 'user_cpu'),
+                          ('system_usec', 'sys_cpu')]:
+            if key in cpu:
+                res[name] = cpu[key] / 1000000.0
+        try:
+            with open(os.path.join(path, 'memory.peak'), 'r') as fh:
+                res['max_memory_mb'] = int(fh.read().strip()) / (
+                    1024.0 * 1024.0)
+        except (IOError, OSError, ValueError):
+            pass
+        try:
+            with open(os.path.join(path, 'io.stat'), 'r') as fh:
+                lines = fh.readlines()
+        except (IOError, OSError):
+            lines = []
+        for line in lines:
+            for field in line.split()[1:]:
+                key, _, val = field.partition('=')
+                if key in ['rbytes', 'wbytes']:
+                    name = 'read_bytes' if key == 'rbytes' else 'write_bytes'
+                    res[name] = res.get(name, 0) + int(val)
+        return res
+
+    def remove_cgroup(self, path):
+        """
+        Remove a cgroup created by :py:meth:`~.create_cgroup`, once all of
+        its processes have exited.
+
+        :param path: path to the cgroup, or None
+        :type path: str
+        """
+        if path is None or not os.path.isdir(path):
+            return
+        try:
+            os.rmdir(path)
+        except OSError as ex:
+            logger.warning("Unable to remove cgroup %s: %s", path, ex)
+
+
+def available_memory_mb():
+    """
+    Return the memory available for new processes, in MB, from
+    ``/proc/meminfo``; None if it cannot be determined.
+
+    :rtype: int
+    """
+    try:
+        with open('/proc/meminfo', 'r') as fh:
+            for line in fh:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def free_disk_mb(path):
+    """
+    Return the space available to unprivileged users on the filesystem
+    containing ``path``, in MB; None if it cannot be determined. If ``path``
+    does not exist yet (i.e. a workspace directory before the first run),
+    its nearest existing parent is checked instead.
+
+    :param path: a path on the filesystem
+    :type path: str
+    :rtype: int
+    """
+    path = os.path.abspath(path)
+    while True:
+        try:
+            st = os.statvfs(path)
+        except OSError as ex:
+            parent = os.path.dirname(path)
+            if ex.errno == errno.ENOENT and parent != path:
+                path = parent
+                continue
+            logger.warning("Unable to check free disk space on %s: %s",
+                           path, ex)
+            return None
+        return (st.f_bavail * st.f_frsize) // (1024 * 1024)
+
+
+def read_keyed_file(path):
+    """
+    Read a cgroup flat-keyed file (lines of "key value") into a dict of
+    integer values; return an empty dict if it cannot be read.
+
+    :param path: path to read
+    :type path: str
+    :rtype: dict
+    """
+    res = {}
+    try:
+        with open(path, 'r') as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) == 2:
+                    res[parts[0]] = int(parts[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return res
+
+
+def write_file(path, content):
+    """
+    Write ``content`` to the (cgroup control) file at ``path``.
+
+    :param path: path to write to
+    :type path: str
+    :param content: the content to write
+    :type content: str
+    """
+    with open(path, 'w') as fh:
+        fh.write(content)
@@ -0,0 +1,168 @@
+"""
+rebuildbot/authcache.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import json
+import time
+import logging
+import hashlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTH_TTL = 86400  # seconds cached credentials are used for
+
+
+def fingerprint(secret):
+    """
+    Return a SHA-256 hex digest of ``secret``, to key cache entries by a
+    credential without storing the credential itself.
+
+    :param secret: the secret, i.e. a GitHub token
+    :type secret: str
+    :rtype: str
+    """
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+
+class AuthCache(object):
+    """
+    Persistent, JSON-backed cache of the results of authenticating to
+    external services (the Travis access token and the S3 bucket's
+    website endpoint), so that later runs can skip those requests. Each entry
+    expires ``ttl`` seconds after it is stored. The file holds credentials,
+    so it is only readable by its owner.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_AUTH_TTL):
+        """
+        Load the cache from ``path``, if it exists.
+
+        :param path: path to the JSON cache file
+        :type path: str
+        :param ttl: seconds each entry is valid for
+        :type ttl: int
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        """
+        Load and return the cache data from ``self.path``. If the file does
+        not exist or cannot be parsed, return an empty cache.
+
+        :rtype: dict
+        """
+        if not os.path.exists(self.path):
+            logger.debug("No authentication cache found at %s", self.path)
+            return {'entries': {}}
+        try:
+            with open(self.path, 'r') as fh:
+                data = json.load(fh)
+        except ValueError:
+            logger.warning("Unable to parse authentication cache at %s; "
+                           "ignoring it", self.path, exc_info=True)
+            return {'entries': {}}
+        data.setdefault('entries', {})
+        return data
+
+    def get(self, key):
+        """
+        Return the value stored under ``key``, or None if there is none or
+        it has expired.
+
+        :param key: cache key
+        :type key: str
+        """
+        with self.lock:
+            entry = self.data['entries'].get(key, None)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.time():
+            logger.debug("Cached %s has expired", key.split(':')[0])
+            return None
+        return entry['value']
+
+    def set(self, key, value):
+        """
+        Store ``value`` under ``key``, expiring ``self.ttl`` seconds from now,
+        and save the cache.
+
+        :param key: cache key
+        :type key: str
+        :param value: JSON-serializable value
+        """
+        with self.lock:
+            self.data['entries'][key] = {
+                'value': value, 'expires': time.time() + self.ttl
+            }
+            self.save()
+
+    def delete(self, key):
+        """
+        Remove the value stored under ``key``, if any, and save the cache;
+        i.e. when the cached credential has been rejected.
+
+        :param key: cache key
+        :type key: str
+        """
+        with self.lock:
+            if self.data['entries'].pop(key, None) is None:
+                return
+            self.save()
+        logger.debug("Removed cached %s", key.split(':')[0])
+
+    def save(self):
+        """
+        Write the cache data to ``self.path``, readable only by its owner.
+        The file is written to a temporary path and then renamed into place,
+        so an interrupted write never leaves a truncated cache file.
+        """
+        dirname = os.path.dirname(self.path)
+        if dirname != '' and not os.path.exists(dirname):
+            os.makedirs(dirname, 0o700)
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self.data, fh, sort_keys=True, indent=2)
+        os.chmod(tmp_path, 0o600)
+        os.rename(tmp_path, self.path)
+        logger.debug("Wrote authentication cache to %s", self.path)
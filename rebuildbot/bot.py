@@ -43,7 +43,9 @@ import shutil
 import logging
 import time
 import re
-from datetime import datetime
+import json
+import threading
+from datetime import datetime, timedelta
 from platform import node as platform_node
 from getpass import getuser
 
@@ -57,11 +59,30 @@ from boto.s3.key import Key
 
 from travispy.errors import TravisError
 
-from .travis import Travis
-from .exceptions import GitTokenMissingError, PollTimeoutException
+from .travis import Travis, BATCH_PAGE_SIZE, BATCH_MAX_PAGES
+from .exceptions import (GitTokenMissingError, PollTimeoutException,
+                         CircuitOpenError)
 from .github_wrapper import GitHubWrapper
 from .buildinfo import BuildInfo
 from .local_build import LocalBuild
+from .history import (BuildHistory, DEFAULT_STATE_DIR, median,
+                      DEFAULT_REGRESSION_WINDOW, DEFAULT_REGRESSION_THRESHOLD)
+from .scheduler import BuildScheduler
+from .workspace import WorkspaceManager, DEFAULT_MAX_SIZE_MB
+from .caches import CacheManager
+from .reaper import Reaper
+from .prefetch import Prefetcher, DEFAULT_MIN_FREE_MB
+from .admission import AdmissionController, DEFAULT_CGROUP_ROOT
+from .discovery import Discoverer
+from .webhook import (WebhookReceiver, DEFAULT_WEBHOOK_WINDOW,
+                      WEBHOOK_POLL_INTERVAL)
+from .httpsession import HTTPConfig, DEFAULT_RETRIES, DEFAULT_POOL_SIZE
+from .ratelimit import RateLimiter, DEFAULT_RESERVE
+from .triggers import TriggerQueue
+from .authcache import AuthCache, DEFAULT_AUTH_TTL
+from .connector import Connector
+from .circuitbreaker import (CircuitBreaker, DEFAULT_FAILURE_THRESHOLD,
+                             DEFAULT_MAX_OUTAGE)
 from .version import _VERSION
 
 # python3 ConfigParser
@@ -84,9 +105,31 @@ class ReBuildBot(object):
 
     def __init__(self, bucket_name, s3_prefix='rebuildbot', dry_run=False,
                  date_check=True, run_travis=True, run_local=True,
-                 log_buffer=None, ignore_repos=[]):
+                 log_buffer=None, ignore_repos=[], schedule='alphabetical',
+                 state_dir=None, build_timeout=None, inactivity_timeout=None,
+                 repo_timeouts={}, deadline=None, time_budget=None,
+                 max_repos=None, stale_after=None,
+                 persistent_workspaces=False,
+                 workspace_max_size=DEFAULT_MAX_SIZE_MB, caches=[],
+                 cache_limits={}, prefetch=0,
+                 prefetch_min_free=DEFAULT_MIN_FREE_MB, race_clone=False,
+                 local_workers=1, max_load=None, min_free_memory=None,
+                 min_free_disk=None, build_nice=None, build_ionice=None,
+                 build_cpu_limit=None, build_memory_limit=None,
+                 cgroup_root=DEFAULT_CGROUP_ROOT, repo_tags={},
+                 tag_limits={}, regression_window=DEFAULT_REGRESSION_WINDOW,
+                 regression_threshold=DEFAULT_REGRESSION_THRESHOLD,
+                 webhook_port=None, webhook_window=DEFAULT_WEBHOOK_WINDOW,
+                 http_retries=DEFAULT_RETRIES, http_timeouts={},
+                 rate_limit_reserve=DEFAULT_RESERVE,
+                 breaker_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 max_outage=DEFAULT_MAX_OUTAGE, max_travis_in_flight=None,
+                 travis_attach=True, cancel_stale_travis=False,
+                 auth_cache_ttl=DEFAULT_AUTH_TTL):
         """
-        Initialize ReBuildBot and attempt to connect to all external services.
+        Initialize ReBuildBot. External services are connected to in the
+        background when the run starts (see :py:meth:`~.start_connections`),
+        or on first use.
 
         :param bucket_name: the name of the S3 bucket to write results to
         :type bucket_name: str
@@ -106,21 +149,316 @@ class ReBuildBot(object):
         :type log_buffer: LogBuffer
         :param ignore_repos: list of repo slugs (USER/NAME) to completely ignore
         :type ignore_repos: list
+        :param schedule: name of the policy used to order local builds; see
+          :py:class:`~.BuildScheduler`
+        :type schedule: str
+        :param state_dir: directory to store persistent state (such as build
+          history) in; defaults to :py:const:`~.DEFAULT_STATE_DIR`
+        :type state_dir: str
+        :param build_timeout: if not None, kill any local build that runs for
+          longer than this many seconds
+        :type build_timeout: int
+        :param inactivity_timeout: if not None, kill any local build that
+          produces no output for this many seconds
+        :type inactivity_timeout: int
+        :param repo_timeouts: dict of repo slug (USER/NAME) to per-repository
+          local build timeout in seconds, overriding ``build_timeout``
+        :type repo_timeouts: dict
+        :param deadline: if not None, local time of day by which the run must
+          finish; see :py:meth:`~.get_deadline`
+        :type deadline: datetime.time
+        :param time_budget: if not None, number of seconds after starting by
+          which the run must finish
+        :type time_budget: int
+        :param max_repos: if not None, when discovering projects only build
+          the ``max_repos`` whose last successful rebuild is oldest
+        :type max_repos: int
+        :param stale_after: if not None, when discovering projects only build
+          those not successfully rebuilt in this many days
+        :type stale_after: int
+        :param persistent_workspaces: if True, run local builds in persistent
+          per-repository workspaces under ``state_dir`` instead of fresh
+          clones; see :py:class:`~.WorkspaceManager`
+        :type persistent_workspaces: bool
+        :param workspace_max_size: maximum total size of persistent
+          workspaces in MB, above which the least recently used are removed
+        :type workspace_max_size: int
+        :param caches: names of shared dependency caches to keep under
+          ``state_dir`` and export to local builds; see
+          :py:const:`~.CACHES`
+        :type caches: list
+        :param cache_limits: dict of cache name to size limit in MB,
+          overriding the defaults
+        :type cache_limits: dict
+        :param prefetch: number of upcoming local builds to clone in the
+          background while the current one runs; 0 to disable
+        :type prefetch: int
+        :param prefetch_min_free: free disk space in MB that prefetching
+          must leave
+        :type prefetch_min_free: int
+        :param race_clone: if True, clone repositories with no known working
+          clone protocol from their SSH and HTTPS URLs concurrently
+        :type race_clone: bool
+        :param local_workers: maximum number of local builds to run at once
+        :type local_workers: int
+        :param max_load: only start a local build while the 1-minute load
+          average is at most this
+        :type max_load: float
+        :param min_free_memory: only start a local build while at least this
+          many MB of memory are available
+        :type min_free_memory: int
+        :param min_free_disk: only start a local build while at least this
+          many MB are free on the filesystem builds are cloned to
+        :type min_free_disk: int
+        :param build_nice: niceness to run local builds at
+        :type build_nice: int
+        :param build_ionice: I/O scheduling class to run local builds in; see
+          :py:const:`~.IONICE_CLASSES`
+        :type build_ionice: str
+        :param build_cpu_limit: maximum CPUs each local build may use,
+          enforced with a cgroup under ``cgroup_root``
+        :type build_cpu_limit: float
+        :param build_memory_limit: maximum memory in MB each local build may
+          use, enforced with a cgroup under ``cgroup_root``
+        :type build_memory_limit: int
+        :param cgroup_root: delegated cgroup v2 directory to create per-build
+          cgroups in
+        :type cgroup_root: str
+        :param repo_tags: dict of repository slug to a list of resource tags
+          for its local builds, in addition to any in its ``.rebuildbot.yml``
+        :type repo_tags: dict
+        :param tag_limits: dict of resource tag to the maximum number of
+          local builds with that tag to run at once
+        :type tag_limits: dict
+        :param regression_window: number of past passed builds of each
+          repository to compare build durations to
+        :type regression_window: int
+        :param regression_threshold: minimum slowdown, in percent, of a
+          build compared to past builds to flag as a regression
+        :type regression_threshold: float
+        :param webhook_port: if not None, receive Travis webhook
+          notifications on this port (see :py:class:`~.WebhookReceiver`),
+          and only poll Travis for builds that have not reported in time
+        :type webhook_port: int
+        :param webhook_window: seconds (beyond the expected duration of the
+          build, from build history) to wait for a webhook notification of a
+          Travis build before polling for it
+        :type webhook_window: int
+        :param http_retries: number of times to retry failed idempotent
+          requests to Travis, GitHub and S3
+        :type http_retries: int
+        :param http_timeouts: dict of service name ('travis', 'github' or
+          's3') to request timeout in seconds, overriding
+          :py:const:`~.DEFAULT_TIMEOUTS`
+        :type http_timeouts: dict
+        :param rate_limit_reserve: number of requests in each GitHub and
+          Travis rate-limit window to leave unused
+        :type rate_limit_reserve: int
+        :param breaker_threshold: number of consecutive failed calls to
+          Travis or GitHub after which to stop calling it for a while (see
+          :py:class:`~.CircuitBreaker`)
+        :type breaker_threshold: int
+        :param max_outage: seconds Travis may be unavailable before its
+          unfinished builds are abandoned, and Travis or GitHub before
+          discovery from it gives up
+        :type max_outage: int
+        :param max_travis_in_flight: maximum number of Travis builds to have
+          triggered but not finished at once, or None for no limit; the rest
+          wait to be triggered (see :py:class:`~.TriggerQueue`)
+        :type max_travis_in_flight: int
+        :param travis_attach: whether to use a Travis build of a repository
+          that is already pending or running instead of triggering another
+        :type travis_attach: bool
+        :param cancel_stale_travis: whether to cancel pending or running
+          Travis builds previously triggered by ReBuildBot, other than the
+          one used
+        :type cancel_stale_travis: bool
+        :param auth_cache_ttl: seconds to cache the Travis access token and
+          user and the S3 bucket endpoint for (see :py:class:`~.AuthCache`),
+          or 0 to not cache them
+        :type auth_cache_ttl: int
         """
         self.s3_prefix = s3_prefix
         self.date_check = date_check
+        self.ratelimit = RateLimiter(reserve=rate_limit_reserve)
+        self.breakers = {
+            'travis': CircuitBreaker('travis', threshold=breaker_threshold),
+            'github': CircuitBreaker('github', threshold=breaker_threshold),
+        }
+        self.max_outage = max_outage
+        # keep a connection per thread that may be making requests at once
+        self.http = HTTPConfig(
+            retries=http_retries, timeouts=http_timeouts,
+            pool_size=max(DEFAULT_POOL_SIZE, local_workers + prefetch),
+            governor=self.ratelimit
+        )
         self.gh_token = self.get_github_token()
-        self.github = GitHubWrapper(self.gh_token)
-        self.travis = Travis(self.gh_token)
-        self.bucket_endpoint = None
-        self.bucket = self.connect_s3(bucket_name)
         self.dry_run = dry_run
         self.run_travis = run_travis
         self.run_local = run_local
         self.log_buffer = log_buffer
         self.ignore_repos = [x.lower() for x in ignore_repos]
+        if state_dir is None:
+            state_dir = DEFAULT_STATE_DIR
+        self.state_dir = os.path.expanduser(state_dir)
+        self.auth_cache = None
+        if auth_cache_ttl > 0:
+            self.auth_cache = AuthCache(
+                os.path.join(self.state_dir, 'auth.json'), ttl=auth_cache_ttl
+            )
+        self.bucket_endpoint = None
+        self.connections = {
+            'github': Connector('github', self.connect_github),
+            'travis': Connector('travis', self.connect_travis),
+            's3': Connector('s3', lambda: self.connect_s3(bucket_name)),
+        }
+        """mapping of service names to :py:class:`~.Connector` objects"""
+        self.history = BuildHistory(
+            os.path.join(self.state_dir, 'history.json')
+        )
+        self.scheduler = BuildScheduler(schedule, history=self.history,
+                                        tag_limits=tag_limits,
+                                        repo_tags=repo_tags)
+        self.build_timeout = build_timeout
+        self.inactivity_timeout = inactivity_timeout
+        self.repo_timeouts = dict(
+            (k.lower(), v) for k, v in repo_timeouts.items()
+        )
         """mapping of repository slugs to BuildInfo objects"""
+        self.deadline_time = deadline
+        self.time_budget = time_budget
+        self.deadline = None
+        self.max_repos = max_repos
+        self.stale_after = stale_after
+        self.race_clone = race_clone
+        self.reaper = Reaper()
+        self.workspaces = None
+        if persistent_workspaces:
+            self.workspaces = WorkspaceManager(
+                os.path.join(self.state_dir, 'workspaces'),
+                max_size_mb=workspace_max_size, reaper=self.reaper
+            )
+        self.caches = None
+        if len(caches) > 0:
+            self.caches = CacheManager(os.path.join(self.state_dir, 'caches'),
+                                       caches, limits_mb=cache_limits,
+                                       reaper=self.reaper)
+        self.prefetcher = None
+        if prefetch > 0 and not self.dry_run:
+            self.prefetcher = Prefetcher(prefetch, workspaces=self.workspaces,
+                                         reaper=self.reaper,
+                                         min_free_mb=prefetch_min_free,
+                                         history=self.history,
+                                         race_clone=race_clone)
+        self.local_workers = max(local_workers, 1)
+        self.local_running = {}
+        """mapping of repository slugs to threads running local builds"""
+        self.admission = None
+        limits = [max_load, min_free_memory, min_free_disk, build_nice,
+                  build_ionice, build_cpu_limit, build_memory_limit]
+        if len([x for x in limits if x is not None]) > 0:
+            disk_path = None
+            if self.workspaces is not None:
+                disk_path = self.workspaces.root
+            self.admission = AdmissionController(
+                max_load=max_load, min_free_memory_mb=min_free_memory,
+                min_free_disk_mb=min_free_disk, disk_path=disk_path,
+                nice=build_nice, ionice=build_ionice,
+                cpu_limit=build_cpu_limit,
+                memory_limit_mb=build_memory_limit, cgroup_root=cgroup_root
+            )
+        self.regression_window = regression_window
+        self.regression_threshold = regression_threshold
+        self.regressions = {}
+        """mapping of repository slugs to build duration regressions"""
+        self.webhooks = None
+        if webhook_port is not None and self.run_travis and not self.dry_run:
+            # the public key is fetched in run(), once Travis is connected
+            self.webhooks = WebhookReceiver(webhook_port)
+        self.webhook_window = webhook_window
+        self.travis_next_poll = {}
+        """mapping of repository slugs to the next time to poll Travis"""
+        self.triggers = TriggerQueue(self.trigger_travis_build,
+                                     max_in_flight=max_travis_in_flight)
+        self.travis_attach = travis_attach
+        self.cancel_stale_travis = cancel_stale_travis
         self.builds = {}
+        self.discoverer = None
+        self.select_stale = True
+        self.stale_decided = {}
+        """mapping of slugs to whether discovery kept (True) or dropped them
+        as rebuilt too recently"""
+        self.stale_held = {}
+        """mapping of slugs to Travis-only BuildInfo objects waiting for
+        GitHub discovery to supply their manifest"""
+
+    @property
+    def github(self):
+        """
+        The :py:class:`~.GitHubWrapper`; connected on first use.
+        """
+        return self.connections['github'].get()
+
+    @github.setter
+    def github(self, value):
+        self.connections['github'] = Connector.for_value('github', value)
+
+    @property
+    def travis(self):
+        """
+        The :py:class:`~.Travis` connection; connected on first use.
+        """
+        return self.connections['travis'].get()
+
+    @travis.setter
+    def travis(self, value):
+        self.connections['travis'] = Connector.for_value('travis', value)
+
+    @property
+    def bucket(self):
+        """
+        The S3 Bucket to write results to; connected on first use.
+        """
+        return self.connections['s3'].get()
+
+    @bucket.setter
+    def bucket(self, value):
+        self.connections['s3'] = Connector.for_value('s3', value)
+
+    def start_connections(self):
+        """
+        Start connecting, in the background and at the same time, to the
+        services this run will use: S3, GitHub if running local builds, and
+        Travis if running Travis builds. Any other service is only connected
+        to if it is used; with ``--no-travis``, Travis never is.
+        """
+        names = ['s3']
+        if self.run_local:
+            names.append('github')
+        if self.run_travis:
+            names.append('travis')
+        for name in names:
+            self.connections[name].start()
+
+    def connect_github(self):
+        """
+        Connect to GitHub; return a :py:class:`~.GitHubWrapper`.
+
+        :rtype: :py:class:`~.GitHubWrapper`
+        """
+        with self.ratelimit.phase('startup'):
+            return GitHubWrapper(self.gh_token, http=self.http)
+
+    def connect_travis(self):
+        """
+        Connect to Travis, using cached credentials if there are any; return
+        a :py:class:`~.Travis`.
+
+        :rtype: :py:class:`~.Travis`
+        """
+        with self.ratelimit.phase('startup'):
+            return Travis(self.gh_token, http=self.http,
+                          cache=self.auth_cache)
 
     def run(self, projects=None):
         """
@@ -130,19 +468,63 @@ class ReBuildBot(object):
         or else all projects found from Travis and GitHub.
         Send notifications when done.
 
+        Projects are discovered in the background (see
+        :py:meth:`~.start_discovery`), and their builds are started by
+        :py:meth:`~.runner_loop` as they are found. If ``self.max_repos`` is
+        set, every project must be known before the stalest can be chosen, so
+        discovery instead runs to completion (:py:meth:`~.find_projects`)
+        before any build is started.
+
         :param projects: list of project/repository full names (slugs) to build,
         if building a subset of all
         :type projects: list of strings
         """
         start_dt = self.dt_now()
-        self.builds = self.find_projects(projects)
-        self.start_travis_builds()
-        # @TODO probably need a timeout here
-        while self.have_work_to_do:
-            self.runner_loop()
+        self.start_connections()
+        self.sweep_leftovers()
+        self.deadline = self.get_deadline(start_dt)
+        if self.deadline is not None:
+            logger.info("Run must finish by %s", self.deadline)
+        if self.webhooks is not None:
+            self.webhooks.start(self.travis.webhook_public_key())
+        self.builds = {}
+        with self.ratelimit.phase('builds'):
+            if self.max_repos is None:
+                self.start_discovery(projects)
+            else:
+                self.builds = self.find_projects(projects)
+                self.start_travis_builds()
+            # fail before building anything if results cannot be written
+            logger.debug("Writing results to S3 bucket %s", self.bucket.name)
+            while self.have_work_to_do:
+                if self.deadline_reached:
+                    logger.warning("Deadline of %s reached; skipping "
+                                   "remaining work", self.deadline)
+                    self.skip_remaining_builds()
+                    break
+                self.runner_loop()
+        self.wait_for_local_builds()
+        if self.webhooks is not None:
+            self.webhooks.stop()
+        # wait for prefetches first, so the history they update is complete
+        if self.prefetcher is not None:
+            self.prefetcher.discard_all()
         end_dt = self.dt_now()
         duration = end_dt - start_dt
         self.handle_results(duration)
+        logger.debug("Waiting for background directory removal to finish")
+        self.reaper.wait()
+
+    def sweep_leftovers(self):
+        """
+        Queue removal of temporary clones (and workspaces awaiting removal)
+        left over from previous runs that crashed or were killed.
+        """
+        if self.dry_run:
+            return
+        self.reaper.sweep()
+        if self.workspaces is not None:
+            self.reaper.sweep(self.workspaces.root, clones=False)
 
     def runner_loop(self):
         """
@@ -150,29 +532,395 @@ class ReBuildBot(object):
 
         Loop first polls all non-complete Travis builds for their result, and
         if the build has completed, updates the appropriate ``self.builds``
-        object. After each Travis polling cycle, one local build is run to
-        completion (serially).
-
-        This logic is optimized to reduce load on the host machine by running
-        local builds serially. Maybe this should be changed at some point, but
-        since my use case is mainly running
+        object. After each Travis polling cycle, local builds are started in
+        the order given by ``self.scheduler``, skipping any with a resource
+        tag that is at its limit. If ``self.admission`` is set, a build is
+        only started if it admits one.
+
+        By default (``self.local_workers`` is 1), one local build is run to
+        completion (serially) per cycle. This keeps load on the host machine
+        down; since my use case is mainly running
         `Beaker <https://github.com/puppetlabs/beaker/>`_ tests for Puppet
         modules, which spin up VirtualBox machines, I only want one running
-        at a time.
+        at a time. With more workers, builds are started in background
+        threads until that many are running, and finished ones are collected
+        on the next cycle. Giving the VirtualBox builds a resource tag with a
+        limit of 1 keeps them serial while other builds run alongside them.
         """
+        discovered = self.check_discovery()
+        webhook_updates = self.check_webhooks()
         travis_updates = self.poll_travis_updates()
+        triggered = self.admit_travis_builds()
+        finished_local = self.finish_local_builds()
         ran_local = False
-        for name, bi in sorted(self.builds.items()):
-            if bi.run_local and bi.local_build_finished is False:
-                logger.info('Creating local build of %s', name)
-                b = LocalBuild(name, bi, dry_run=self.dry_run)
-                b.run()
-                ran_local = True
+        remaining = self.seconds_remaining()
+        order = self.scheduler.order(self.builds)
+        for idx, (name, bi) in enumerate(order):
+            if len(self.local_running) >= self.local_workers:
                 break
-        if not ran_local and not travis_updates:
+            if not self.local_build_pending(name, bi):
+                continue
+            if (
+                    remaining is not None and
+                    not self.scheduler.fits(bi, remaining)
+            ):
+                logger.warning("Skipping local build of %s; expected to "
+                               "take %ds but only %ds remain before the "
+                               "deadline", name,
+                               self.scheduler.expected_duration(bi),
+                               remaining)
+                bi.set_local_build_skipped(
+                    'expected to take %ds; only %ds remained before the '
+                    'deadline' % (self.scheduler.expected_duration(bi),
+                                  remaining))
+                continue
+            tag = self.scheduler.blocking_tag(
+                bi, [self.builds[n] for n in self.local_running])
+            if tag is not None:
+                logger.debug("Not starting local build of %s yet; the "
+                             "limit of builds tagged '%s' are running",
+                             name, tag)
+                continue
+            if self.admission is not None:
+                reason = self.admission.admit(len(self.local_running))
+                if reason is not None:
+                    logger.info("Not starting local build of %s yet: %s",
+                                name, reason)
+                    break
+            logger.info('Creating local build of %s', name)
+            prefetched = None
+            if self.prefetcher is not None:
+                prefetched = self.prefetcher.take(name)
+                self.prefetcher.prefetch([
+                    (n, b) for n, b in order[idx + 1:]
+                    if self.local_build_pending(n, b)
+                ])
+            b = LocalBuild(name, bi, dry_run=self.dry_run,
+                           timeout=self.local_build_timeout(name),
+                           inactivity_timeout=self.inactivity_timeout,
+                           workspaces=self.workspaces,
+                           caches=self.caches, reaper=self.reaper,
+                           prefetched=prefetched, history=self.history,
+                           race_clone=self.race_clone,
+                           admission=self.admission,
+                           clone_depth=bi.manifest.get('clone_depth', None),
+                           cache_names=bi.manifest.get('caches', None))
+            ran_local = True
+            if self.local_workers > 1:
+                self.start_local_build(name, b)
+                continue
+            b.run()
+            self.after_local_build(name)
+            break
+        if (
+                ran_local or travis_updates or finished_local or
+                discovered or webhook_updates or triggered
+        ):
+            return
+        if self.discovering:
+            logger.info("No Travis builds updated and no local builds to run; "
+                        "waiting up to 10 seconds for more projects to be "
+                        "discovered")
+            self.check_discovery(timeout=10)
+            return
+        if self.webhooks is not None:
             logger.info("No Travis builds updated and no local builds to run; "
-                        "sleeping 10 seconds")
-            time.sleep(10)
+                        "waiting up to 10 seconds for Travis webhook "
+                        "notifications")
+            self.check_webhooks(timeout=10)
+            return
+        logger.info("No Travis builds updated and no local builds to run; "
+                    "sleeping 10 seconds")
+        time.sleep(10)
+
+    def start_discovery(self, projects):
+        """
+        Start finding projects to build in the background with a
+        :py:class:`~.Discoverer`, using the sources from
+        :py:meth:`~.discovery_sources`. The projects it finds are added to
+        ``self.builds`` by :py:meth:`~.check_discovery`.
+
+        :param projects: list of project/repository full names (slugs) to
+          build, or None to find them from Travis and GitHub
+        :type projects: list of strings
+        """
+        if projects is None:
+            logger.info("Finding candidate projects from Travis and GitHub "
+                        "in the background")
+        else:
+            logger.info("Using explicit projects list: %s", projects)
+        self.select_stale = projects is None
+        self.stale_decided = {}
+        self.stale_held = {}
+        self.discoverer = Discoverer(self.discovery_sources(projects))
+        self.discoverer.start()
+
+    @property
+    def discovering(self):
+        """
+        Return True while background discovery has not finished.
+
+        :rtype: bool
+        """
+        return self.discoverer is not None and not self.discoverer.done
+
+    def check_discovery(self, timeout=None):
+        """
+        Add the projects found by background discovery since the last call to
+        ``self.builds`` (see :py:meth:`~.add_discovered`). Return True if
+        any were found.
+
+        :param timeout: if not None and nothing has been found yet, wait up
+          to this many seconds for a project to be found
+        :type timeout: float
+        :rtype: bool
+        """
+        if not self.discovering:
+            return False
+        return self.add_discovered(self.discoverer.get(timeout=timeout))
+
+    def add_discovered(self, discovered):
+        """
+        Add newly discovered BuildInfo objects to ``self.builds``, merging
+        them with any already found for the same repository, and trigger
+        Travis builds for those that newly have one. When discovering all
+        projects, those rebuilt too recently are dropped (see
+        :py:meth:`~.select_discovered`). Return True if any were added.
+
+        :param discovered: newly discovered BuildInfo objects
+        :type discovered: list
+        :rtype: bool
+        """
+        added = False
+        travis = {}
+        for bi in self.select_discovered(discovered):
+            existing = self.builds.get(bi.slug, None)
+            if bi.run_travis and (existing is None or not existing.run_travis):
+                travis[bi.slug] = bi
+            if existing is None:
+                self.builds[bi.slug] = bi
+            else:
+                existing.merge(bi)
+                if bi.slug in travis:
+                    travis[bi.slug] = existing
+            added = True
+        if len(travis) > 0:
+            self.start_travis_builds(travis)
+        return added
+
+    def select_discovered(self, discovered):
+        """
+        Return those of ``discovered`` to add when discovering all projects,
+        dropping repositories rebuilt too recently (see
+        :py:meth:`~.rebuilt_recently`). The decision is made once per
+        repository, from its ``.rebuildbot.yml`` if it has one, and applies
+        to every BuildInfo later found for it. A Travis-only BuildInfo of a
+        repository that has been rebuilt before is held until GitHub
+        discovery either finds the repository (and its manifest) or
+        finishes, so that the manifest's ``rebuild_interval`` wins whichever
+        source finds the repository first.
+
+        :param discovered: newly discovered BuildInfo objects
+        :type discovered: list
+        :rtype: list
+        """
+        if not self.select_stale:
+            return discovered
+        now = self.dt_now()
+        github_done = (
+            not self.run_local or self.discoverer is None or
+            'github' in self.discoverer.finished
+        )
+        pending = list(discovered)
+        if github_done:
+            for slug in sorted(self.stale_held.keys()):
+                pending.append(self.stale_held.pop(slug))
+        res = []
+        for bi in pending:
+            if bi.slug in self.stale_decided:
+                if self.stale_decided[bi.slug]:
+                    res.append(bi)
+                continue
+            held = self.stale_held.pop(bi.slug, None)
+            if held is not None:
+                bi.merge(held)
+            last = self.history.last_success(bi.slug)
+            if last is not None and not bi.run_local and not github_done:
+                logger.debug("Waiting for GitHub discovery before deciding "
+                             "whether to rebuild %s", bi.slug)
+                self.stale_held[bi.slug] = bi
+                continue
+            keep = not self.rebuilt_recently(bi.slug, bi, last, now)
+            self.stale_decided[bi.slug] = keep
+            if keep:
+                res.append(bi)
+        return res
+
+    def local_build_pending(self, name, build_info):
+        """
+        Return whether the local build of ``name`` still needs to be started.
+
+        :param name: the repository slug / full name
+        :type name: str
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: bool
+        """
+        return (
+            build_info.run_local and
+            build_info.local_build_finished is False and
+            name not in self.local_running
+        )
+
+    def start_local_build(self, name, local_build):
+        """
+        Run ``local_build`` in a background thread, tracked in
+        ``self.local_running`` until :py:meth:`~.finish_local_builds` finds it
+        has finished.
+
+        :param name: the repository slug / full name
+        :type name: str
+        :param local_build: the build to run
+        :type local_build: :py:class:`~.LocalBuild`
+        """
+        t = threading.Thread(target=local_build.run,
+                             name='local-build-%s' % name)
+        t.daemon = True
+        self.local_running[name] = t
+        t.start()
+
+    def finish_local_builds(self):
+        """
+        Collect local builds started by :py:meth:`~.start_local_build` that
+        have finished. Return True if any had.
+
+        :rtype: bool
+        """
+        finished = False
+        for name, t in sorted(self.local_running.items()):
+            if t.is_alive():
+                continue
+            t.join()
+            del self.local_running[name]
+            logger.debug("Local build of %s finished", name)
+            self.after_local_build(name)
+            finished = True
+        return finished
+
+    def wait_for_local_builds(self):
+        """
+        Wait for all local builds started in the background to finish.
+        """
+        for name, t in sorted(self.local_running.items()):
+            logger.info("Waiting for local build of %s to finish", name)
+            t.join()
+        self.finish_local_builds()
+
+    def after_local_build(self, name):
+        """
+        Called after the local build of ``name`` finishes; evict persistent
+        workspaces and shared cache entries over their size limits. The
+        workspaces of running builds and of queued or completed prefetches
+        are kept. Caches are only evicted when no other local build is
+        running, as one may be using them.
+
+        :param name: the repository slug / full name
+        :type name: str
+        """
+        if self.workspaces is not None:
+            keep = [name] + sorted(self.local_running.keys())
+            if self.prefetcher is not None:
+                keep += self.prefetcher.slugs
+            self.workspaces.evict(keep=keep)
+        if self.caches is not None and len(self.local_running) == 0:
+            self.caches.evict()
+
+    def local_build_timeout(self, slug):
+        """
+        Return the hard timeout in seconds for the local build of ``slug``;
+        the per-repository timeout if one is set, else the ``timeout`` from
+        its manifest, else ``self.build_timeout``.
+        If the run has a deadline, the timeout is capped at the time remaining
+        before it.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :returns: timeout in seconds, or None for no timeout
+        :rtype: int
+        """
+        timeout = self.repo_timeouts.get(slug.lower(), None)
+        if timeout is None and slug in self.builds:
+            timeout = self.builds[slug].manifest.get('timeout', None)
+        if timeout is None:
+            timeout = self.build_timeout
+        remaining = self.seconds_remaining()
+        if remaining is None:
+            return timeout
+        remaining = max(int(remaining), 0)
+        if timeout is None or remaining < timeout:
+            return remaining
+        return timeout
+
+    def get_deadline(self, start_dt):
+        """
+        Return the datetime by which a run started at ``start_dt`` must
+        finish; the earlier of ``self.time_budget`` seconds after
+        ``start_dt`` and the next occurrence of ``self.deadline_time``, or
+        None if neither is set.
+
+        :param start_dt: when the run started
+        :type start_dt: datetime.datetime
+        :rtype: datetime.datetime
+        """
+        candidates = []
+        if self.time_budget is not None:
+            candidates.append(
+                start_dt + timedelta(seconds=self.time_budget))
+        if self.deadline_time is not None:
+            dt = datetime.combine(start_dt.date(), self.deadline_time)
+            if dt <= start_dt:
+                dt += timedelta(days=1)
+            candidates.append(dt)
+        if len(candidates) == 0:
+            return None
+        return min(candidates)
+
+    def seconds_remaining(self):
+        """
+        Return the number of seconds left before ``self.deadline``, or None
+        if the run has no deadline.
+
+        :rtype: float
+        """
+        if self.deadline is None:
+            return None
+        return (self.deadline - self.dt_now()).total_seconds()
+
+    @property
+    def deadline_reached(self):
+        """
+        Return True if the run has a deadline and it has passed.
+
+        :rtype: bool
+        """
+        remaining = self.seconds_remaining()
+        return remaining is not None and remaining <= 0
+
+    def skip_remaining_builds(self):
+        """
+        Called when the deadline is reached; mark all Travis builds that are
+        still being polled and all local builds that have not run as skipped,
+        so that the report is complete.
+        """
+        self.triggers.clear()
+        for name, bi in sorted(self.builds.items()):
+            if bi.run_travis and not bi.travis_build_finished:
+                logger.info("Abandoning Travis build of %s", name)
+                bi.set_travis_build_skipped(
+                    'still running at deadline; stopped polling')
+            if self.local_build_pending(name, bi):
+                logger.info("Skipping local build of %s", name)
+                bi.set_local_build_skipped('not started before deadline')
 
     @property
     def have_work_to_do(self):
@@ -183,6 +931,8 @@ class ReBuildBot(object):
         :returns: whether there are builds running or remaining to run
         :rtype: boolean
         """
+        if self.discovering or self.triggers.busy:
+            return True
         for name, bi in self.builds.items():
             if not bi.is_done:
                 return True
@@ -197,12 +947,58 @@ class ReBuildBot(object):
         :type duration: :py:class:`datetime.timedelta`
         """
         prefix = self.get_s3_prefix()
+        self.ratelimit.log_summary()
+        self.check_regressions()
         self.write_local_output(prefix)
         log_url = self.get_log_buffer_url(prefix)
         report = self.generate_report(prefix, duration, log_url)
         url = self.write_to_s3(prefix, 'index.html', report, ctype='text/html')
         logger.info("Full report written to: %s", url)
+        json_url = self.write_to_s3(prefix, 'results.json',
+                                    self.generate_results_json(duration),
+                                    ctype='application/json')
+        logger.info("Machine-readable results written to: %s", json_url)
         self.write_index_html(url)
+        self.update_history()
+
+    def check_regressions(self):
+        """
+        Compare the duration of each build in this run to its build history
+        (see :py:meth:`~.BuildHistory.find_regressions`), flag significant
+        slowdowns on the BuildInfo for the report, and store them in
+        ``self.regressions``. Nothing is checked for dry runs.
+        """
+        self.regressions = {}
+        if self.dry_run:
+            return
+        for slug, bi in sorted(self.builds.items()):
+            regressions = self.history.find_regressions(
+                bi, window=self.regression_window,
+                threshold=self.regression_threshold
+            )
+            if len(regressions) == 0:
+                continue
+            for kind, (pct, baseline) in sorted(regressions.items()):
+                logger.warning("%s %s build took %.0f%% longer than its "
+                               "median of %.0fs", slug, kind, pct, baseline)
+            bi.set_regressions(regressions)
+            self.regressions[slug] = regressions
+
+    def update_history(self):
+        """
+        Record the results of this run's builds in ``self.history`` and save
+        it, so future runs can schedule based on them. Nothing is recorded for
+        dry runs.
+        """
+        if self.dry_run:
+            logger.info("DRY RUN: not updating build history")
+            return
+        self.history.record_builds(self.builds, self.dt_now())
+        try:
+            self.history.save()
+        except (IOError, OSError):
+            logger.exception("Unable to save build history to %s",
+                             self.history.path)
 
     def get_log_buffer_url(self, prefix):
         """
@@ -249,12 +1045,72 @@ class ReBuildBot(object):
             'dry_run': self.dry_run,
             'duration': str(duration),
             'log_url': log_url,
+            'regressions': sorted(self.regressions.keys()),
+            'outages': self.outage_strs(),
         }
         build_infos = self.get_build_info_html_list()
 
         html = template.render(run_info=run_info, builds=build_infos)
         return html
 
+    def generate_results_json(self, duration):
+        """
+        Generate machine-readable JSON results for this run; the outcome of
+        each build (see :py:meth:`~.BuildInfo.as_dict`), including local
+        build resource usage.
+
+        :param duration: the duration of the entire ReBuildBot run
+        :type duration: :py:class:`datetime.timedelta`
+        :rtype: str
+        """
+        res = {
+            'version': _VERSION,
+            'host': platform_node(),
+            'dry_run': self.dry_run,
+            'duration': duration.total_seconds(),
+            'regressions': sorted(self.regressions.keys()),
+            'api_usage': self.ratelimit.summary(),
+            'outages': self.outages(),
+            'builds': dict(
+                (name, bi.as_dict()) for name, bi in self.builds.items()
+            ),
+        }
+        return json.dumps(res, sort_keys=True, indent=2)
+
+    def outages(self):
+        """
+        Return the outages of every external service during the run, as a
+        list of dicts (see :py:meth:`~.CircuitBreaker.summary`) sorted by
+        start time.
+
+        :rtype: list
+        """
+        res = []
+        for name, breaker in sorted(self.breakers.items()):
+            res.extend(breaker.summary())
+        return sorted(res, key=lambda x: x['start'])
+
+    def outage_strs(self):
+        """
+        Return a human-readable description of each outage (see
+        :py:meth:`~.outages`) for the report.
+
+        :rtype: list
+        """
+        res = []
+        for o in self.outages():
+            start = datetime.fromtimestamp(o['start'])
+            if o['end'] is None:
+                until = 'until the end of the run'
+            else:
+                until = 'for %s' % timedelta(
+                    seconds=int(o['end'] - o['start']))
+            res.append('%s unavailable from %s %s (%d failed calls; last '
+                       'error: %s)' % (o['service'],
+                                       start.strftime('%H:%M:%S'), until,
+                                       o['failures'], o['error']))
+        return res
+
     def get_build_info_html_list(self):
         """
         Return a list of 3-tuples for builds, in sorted order, each one being
@@ -358,9 +1214,9 @@ class ReBuildBot(object):
         Find which projects to run, and create an :py:class:`~.BuildInfo` object
         for each project. Return a dict of project/repo name to BuildInfo obj.
 
-        If ``projects`` is not None, use only those repository names. Otherwise,
-        call :py:meth:`~.GitHubWrapper.get_find_projects` and
-        :py:meth:`~.Travis.get_repos` to find the eligible projects.
+        This runs every source from :py:meth:`~.discovery_sources` to
+        completion, and then (when finding all projects) applies
+        :py:meth:`~.select_stale_projects`.
 
         :param projects: list of project/repository full names (slugs) to build,
         if building a subset of all
@@ -371,74 +1227,247 @@ class ReBuildBot(object):
         builds = {}
         if projects is None:
             logger.info("Finding candidate projects from Travis and GitHub")
-            # GitHub
-            if self.run_local:
-                for repo, tup in self.github.find_projects(
-                        date_check=self.date_check).items():
-                    if repo.lower() in self.ignore_repos:
-                        logger.info('Ignoring GitHub repo: %s', repo)
-                        continue
-                    https_clone_url, ssh_clone_url = tup
-                    builds[repo] = BuildInfo(repo, run_local=True,
-                                             https_clone_url=https_clone_url,
-                                             ssh_clone_url=ssh_clone_url)
-            else:
-                logger.warning("Skipping local builds")
-            # Travis
-            if self.run_travis:
-                for repo in self.travis.get_repos(date_check=self.date_check):
-                    if repo.lower() in self.ignore_repos:
-                        logger.info('Ignoring TravisCI repo: %s', repo)
-                        continue
-                    if repo not in builds:
-                        builds[repo] = BuildInfo(repo)
-                    builds[repo].run_travis = True
-            else:
-                logger.warning("Skipping Travis builds")
-            logger.debug("Candidate projects identified.")
+        else:
+            logger.info("Using explicit projects list: %s", projects)
+        for name, func in self.discovery_sources(projects):
+            for bi in func():
+                if bi.slug in builds:
+                    builds[bi.slug].merge(bi)
+                else:
+                    builds[bi.slug] = bi
+        if projects is not None:
             return builds
-        logger.info("Using explicit projects list: %s", projects)
-        for project in projects:
-            run_local = False
-            https_clone_url = None
-            ssh_clone_url = None
-            if self.run_local:
-                tup = self.github.get_project_config(project)
-                https_clone_url, ssh_clone_url = tup
-                if https_clone_url is not None or ssh_clone_url is not None:
-                    run_local = True
-            else:
-                logger.warning("Skipping local builds")
-            tmp_build = BuildInfo(project, run_local=run_local,
-                                  https_clone_url=https_clone_url,
-                                  ssh_clone_url=ssh_clone_url)
-            if self.run_travis:
-                try:
-                    self.travis.get_last_build(project)
-                    tmp_build.run_travis = True
-                except (TravisError, KeyError):
-                    pass
-            else:
-                logger.warning("Skipping Travis builds")
-            if tmp_build.run_local or tmp_build.run_travis:
-                builds[project] = tmp_build
-        return builds
+        logger.debug("Candidate projects identified.")
+        return self.select_stale_projects(builds)
+
+    def discovery_sources(self, projects):
+        """
+        Return a list of (name, function) discovery sources for
+        :py:class:`~.Discoverer` or :py:meth:`~.find_projects`; each function
+        returns a generator of :py:class:`~.BuildInfo` objects.
+
+        If ``projects`` is not None, the only source checks each of those
+        repository names (:py:meth:`~.discover_explicit`). Otherwise, GitHub
+        (:py:meth:`~.discover_github`) and Travis
+        (:py:meth:`~.discover_travis`) are searched for eligible projects.
+
+        :param projects: list of project/repository full names (slugs) to
+          build, if building a subset of all
+        :type projects: list of strings
+        :rtype: list
+        """
+        if projects is not None:
+            return [('projects', lambda: self.discover_explicit(projects))]
+        sources = []
+        if self.run_local:
+            sources.append(('github', self.discover_github))
+        else:
+            logger.warning("Skipping local builds")
+        if self.run_travis:
+            sources.append(('travis', self.discover_travis))
+        else:
+            logger.warning("Skipping Travis builds")
+        return sources
+
+    def discover_github(self):
+        """
+        Generator of BuildInfo objects for the GitHub repositories with a
+        ``.rebuildbot.sh`` (see :py:meth:`~.GitHubWrapper.inspect_repo`),
+        except those in ``self.ignore_repos``. The GitHub calls are made
+        through the ``github`` circuit breaker; if GitHub becomes
+        unavailable, listing repositories resumes where it stopped and
+        inspecting one is retried once it is available again (see
+        :py:meth:`~.CircuitBreaker.iterate`), for up to ``self.max_outage``
+        seconds.
+        """
+        breaker = self.breakers['github']
+        with self.ratelimit.phase('discovery'):
+            for repo in breaker.iterate(self.github.iter_repos,
+                                        max_outage=self.max_outage):
+                if repo.full_name.lower() in self.ignore_repos:
+                    logger.info('Ignoring GitHub repo: %s', repo.full_name)
+                    continue
+                tup = breaker.call_retrying(
+                    self.max_outage, self.github.inspect_repo, repo,
+                    date_check=self.date_check)
+                if tup is None:
+                    continue
+                https_clone_url, ssh_clone_url, size, manifest = tup
+                yield BuildInfo(repo.full_name, run_local=True,
+                                https_clone_url=https_clone_url,
+                                ssh_clone_url=ssh_clone_url,
+                                repo_size=size, manifest=manifest)
+
+    def discover_travis(self):
+        """
+        Generator of BuildInfo objects for the repositories to trigger
+        Travis builds of (see :py:meth:`~.Travis.repo_eligible`), except those
+        in ``self.ignore_repos``. The Travis calls are made through the
+        ``travis`` circuit breaker, and retried as in
+        :py:meth:`~.discover_github`.
+        """
+        breaker = self.breakers['travis']
+        with self.ratelimit.phase('discovery'):
+            for r in breaker.iterate(self.travis.iter_user_repos,
+                                     max_outage=self.max_outage):
+                if r.slug.lower() in self.ignore_repos:
+                    logger.info('Ignoring TravisCI repo: %s', r.slug)
+                    continue
+                if not breaker.call_retrying(
+                        self.max_outage, self.travis.repo_eligible, r,
+                        date_check=self.date_check):
+                    continue
+                bi = BuildInfo(r.slug)
+                bi.run_travis = True
+                yield bi
+
+    def discover_explicit(self, projects):
+        """
+        Generator of BuildInfo objects for each of ``projects`` that has a
+        ``.rebuildbot.sh`` on GitHub or builds on Travis.
+
+        :param projects: list of project/repository full names (slugs)
+        :type projects: list of strings
+        """
+        with self.ratelimit.phase('discovery'):
+            for project in projects:
+                run_local = False
+                https_clone_url = None
+                ssh_clone_url = None
+                size = None
+                manifest = None
+                if self.run_local:
+                    try:
+                        tup = self.breakers['github'].call(
+                            self.github.get_project_config, project)
+                    except Exception:
+                        logger.exception("Unable to get GitHub project "
+                                         "config for %s; not running a local "
+                                         "build", project)
+                        tup = (None, None, None, None)
+                    https_clone_url, ssh_clone_url, size, manifest = tup
+                    if https_clone_url is not None or ssh_clone_url is not None:
+                        run_local = True
+                else:
+                    logger.warning("Skipping local builds")
+                tmp_build = BuildInfo(project, run_local=run_local,
+                                      https_clone_url=https_clone_url,
+                                      ssh_clone_url=ssh_clone_url,
+                                      repo_size=size, manifest=manifest)
+                if self.run_travis:
+                    try:
+                        self.breakers['travis'].call(
+                            self.travis.get_last_build, project)
+                        tmp_build.run_travis = True
+                    except (TravisError, KeyError, CircuitOpenError):
+                        pass
+                else:
+                    logger.warning("Skipping Travis builds")
+                if tmp_build.run_local or tmp_build.run_travis:
+                    yield tmp_build
+
+    def select_stale_projects(self, builds):
+        """
+        Rotate through discovered projects over several runs. If
+        ``self.stale_after`` is set, drop projects that have been successfully
+        rebuilt (according to ``self.history``) within that many days; a
+        project's ``rebuild_interval`` manifest setting overrides it. If
+        ``self.max_repos`` is set, keep only that many of the remaining
+        projects, those with the oldest last successful rebuild first
+        (projects that have never been successfully rebuilt are oldest).
+
+        :param builds: dict of repo/project name to BuildInfo object
+        :type builds: dict
+        :returns: dict of repo/project name to BuildInfo object to build
+        :rtype: dict
+        """
+        if (
+                self.max_repos is None and self.stale_after is None and
+                not any('rebuild_interval' in bi.manifest
+                        for bi in builds.values())
+        ):
+            return builds
+        now = self.dt_now()
+        candidates = []
+        for slug in sorted(builds.keys()):
+            last = self.history.last_success(slug)
+            if self.rebuilt_recently(slug, builds[slug], last, now):
+                continue
+            if last is None:
+                last = datetime.min
+            candidates.append((last, slug))
+        candidates = sorted(candidates)
+        if self.max_repos is not None:
+            candidates = candidates[:self.max_repos]
+        selected = dict((slug, builds[slug]) for last, slug in candidates)
+        logger.info("Selected %d of %d candidate projects by staleness: %s",
+                    len(selected), len(builds), sorted(selected.keys()))
+        return selected
+
+    def rebuilt_recently(self, slug, build_info, last, now):
+        """
+        Return True if ``slug`` was last successfully rebuilt at ``last``,
+        less than its ``rebuild_interval`` manifest setting (or
+        ``self.stale_after``) days before ``now``.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :param last: time of the last successful rebuild, or None
+        :type last: datetime.datetime
+        :param now: the current time
+        :type now: datetime.datetime
+        :rtype: bool
+        """
+        interval = build_info.manifest.get('rebuild_interval',
+                                           self.stale_after)
+        if interval is None or last is None:
+            return False
+        if now - last >= timedelta(days=interval):
+            return False
+        logger.info("Skipping %s; last successful rebuild was %s", slug, last)
+        return True
+
+    def s3_connection(self):
+        """
+        Return a new connection to S3, from :py:func:`boto.connect_s3`, with
+        the HTTP settings applied.
+
+        :rtype: :py:class:`boto.s3.connection.S3Connection`
+        """
+        return self.http.configure_boto(boto.connect_s3())
 
     def connect_s3(self, bucket_name):
         """
         Connect to Amazon S3 via :py:func:`boto.connect_s3` and get a Bucket
-        object for ``bucket_name``; return the Bucket.
+        object for ``bucket_name``; return the Bucket. The bucket is always
+        checked, so that a run fails before building anything if its results
+        cannot be written. If ``self.auth_cache`` has the bucket's website
+        endpoint, it is used instead of looking up the bucket's location;
+        otherwise the endpoint is stored in it.
 
         :param bucket_name: the name of the S3 bucket to write results to
         :type bucket_name: str
         :rtype: :py:class:`boto.s3.bucket.Bucket`
         """
         logger.debug("Connecting to S3")
-        conn = boto.connect_s3()
+        conn = self.s3_connection()
+        key = 's3:' + bucket_name
+        endpoint = None
+        if self.auth_cache is not None:
+            endpoint = self.auth_cache.get(key)
         logger.debug("Getting S3 bucket %s", bucket_name)
         bucket = conn.get_bucket(bucket_name)
         logger.debug("Got bucket")
+        if endpoint is not None:
+            logger.debug("Using cached endpoint for S3 bucket %s",
+                         bucket_name)
+            self.bucket_endpoint = endpoint
+            return bucket
         self.bucket_endpoint = bucket.get_website_endpoint()
+        if self.auth_cache is not None:
+            self.auth_cache.set(key, self.bucket_endpoint)
         return bucket
 
     def get_github_token(self):
@@ -464,18 +1493,22 @@ class ReBuildBot(object):
         logger.debug("Using GitHub token from ~/.gitconfig")
         return token
 
-    def start_travis_builds(self):
+    def start_travis_builds(self, builds=None):
         """
-        Iterate all BuildInfo objects in ``self.builds``; for any with
-        ``run_travis`` True, start a Travis build of the repository and update
-        the BuildInfo object with the Build ID of the triggered build. If an
-        error or exception is encountered while triggering the build, store it
-        in the BuildInfo object and continue on.
+        Iterate all BuildInfo objects in ``builds``; for any with
+        ``run_travis`` True, queue a Travis build of the repository to be
+        triggered (see :py:meth:`~.trigger_travis_build`), and start
+        triggering as many as may be in flight at once (see
+        :py:meth:`~.admit_travis_builds`).
+
+        :param builds: dict of repo/project name to BuildInfo object to
+          trigger builds of; defaults to ``self.builds``
+        :type builds: dict
         """
-        started = 0
-        errored = 0
-        logger.info("Triggering Travis builds")
-        for repo_slug, build_info in sorted(self.builds.items()):
+        if builds is None:
+            builds = self.builds
+        queued = 0
+        for repo_slug, build_info in sorted(builds.items()):
             if (
                     not build_info.run_travis or
                     build_info.travis_build_finished
@@ -486,56 +1519,342 @@ class ReBuildBot(object):
                             repo_slug)
                 build_info.set_dry_run()
                 continue
+            if self.triggers.add(repo_slug, build_info):
+                queued += 1
+        if queued > 0:
+            logger.info("Queued %d Travis builds to trigger", queued)
+        self.admit_travis_builds()
+
+    def trigger_travis_build(self, repo_slug, build_info):
+        """
+        Start a Travis build of the repository and update the BuildInfo
+        object with the Build ID of the triggered build. If
+        ``self.travis_attach`` is True and a build is already pending or
+        running, that build is used instead (see
+        :py:meth:`~.Travis.run_build`). If an error or exception is
+        encountered while triggering the build, store it in the BuildInfo
+        object. Called in a background thread by ``self.triggers``.
+
+        :param repo_slug: the repository slug / full name
+        :type repo_slug: str
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        """
+        with self.ratelimit.phase('builds'):
             try:
-                old_id, new_id = self.travis.run_build(repo_slug)
-                build_info.set_travis_build_ids(old_id, new_id)
+                old_id, new_id = self.breakers['travis'].call(
+                    self.travis.run_build, repo_slug,
+                    attach=self.travis_attach,
+                    cancel_stale=self.cancel_stale_travis)
+                if old_id is None and new_id is not None:
+                    build_info.set_travis_build_attached(new_id)
+                else:
+                    build_info.set_travis_build_ids(old_id, new_id)
             except Exception as ex:
                 build_info.set_travis_trigger_error(ex)
                 logger.exception(ex)
-        logger.info("Finished triggering Travis builds; triggered %s "
-                    "successfully, %s had errors being triggered", started,
-                    errored)
+
+    def admit_travis_builds(self):
+        """
+        Collect Travis builds that have finished being triggered, and start
+        triggering queued builds while fewer than the maximum are in flight
+        (see :py:meth:`~.travis_in_flight`). While Travis is unavailable,
+        nothing is triggered. Return True if any build finished or started
+        being triggered.
+
+        :rtype: bool
+        """
+        finished = self.triggers.collect()
+        if (
+                len(self.triggers.waiting) == 0 or
+                not self.breakers['travis'].is_closed
+        ):
+            return len(finished) > 0
+        started = self.triggers.admit(self.travis_in_flight())
+        return len(finished) > 0 or len(started) > 0
+
+    def travis_in_flight(self):
+        """
+        Return the number of Travis builds that have been triggered and have
+        not finished, not counting those still being triggered.
+
+        :rtype: int
+        """
+        count = 0
+        for repo_slug, build_info in self.builds.items():
+            if (
+                    not build_info.run_travis or
+                    build_info.travis_build_finished or
+                    build_info.travis_trigger_error is not None or
+                    (build_info.travis_last_build_id is None and
+                     build_info.travis_build_id is None) or
+                    self.triggers.is_queued(repo_slug)
+            ):
+                continue
+            count += 1
+        return count
 
     def poll_travis_updates(self):
         """
         For all Travis builds that have not yet completed, poll TravisCI to
         check if they've finished, and if so, update the BuildInfo object.
 
+        All builds are first checked with a single listing of recent builds
+        (see :py:meth:`~.batch_poll_travis`); only those it could not
+        account for are polled individually (see
+        :py:meth:`~.poll_travis_build`). While Travis is unavailable (its
+        circuit breaker is open) it is not polled, and once it has been
+        unavailable for ``self.max_outage`` seconds the unfinished builds are
+        abandoned (see :py:meth:`~.abandon_travis_builds`).
+
         Return True if anything changed, False otherwise.
         """
-        have_changes = False
         logger.debug("Polling for Travis updates")
+        if self.breakers['travis'].outage_duration > self.max_outage:
+            return self.abandon_travis_builds()
+        pending = []
         for repo_slug, build_info in sorted(self.builds.items()):
             if self.dry_run:
                 build_info.set_dry_run()
                 continue
             if (
                     not build_info.run_travis or
-                    build_info.travis_build_finished
+                    build_info.travis_build_finished or
+                    self.triggers.is_queued(repo_slug)
             ):
                 continue
-            build_id = build_info.travis_build_id
-            if build_id is None:
-                # try to fetch a new build ID
-                build_id = self.update_travis_build(build_info)
-                # if we still didn't get a new build ID...
-                if build_id is None:
-                    logger.warning("Still have not gotten new Travis build ID "
-                                   "for %s; skipping", repo_slug)
+            if not self.travis_poll_due(repo_slug):
+                continue
+            pending.append((repo_slug, build_info))
+        have_changes = False
+        if len(pending) > 0:
+            have_changes, pending = self.batch_poll_travis(pending)
+        for repo_slug, build_info in pending:
+            if self.poll_travis_build(repo_slug, build_info):
+                have_changes = True
+        logger.debug("Completed updating Travis build status; have_changes=%s",
+                     have_changes)
+        return have_changes
+
+    def batch_poll_travis(self, pending):
+        """
+        Update the Travis builds in ``pending`` from one listing of the
+        user's recent builds (:py:meth:`~.Travis.get_recent_builds`), rather
+        than one API call per build; a build newer than the one before the
+        trigger gives the triggered build's ID, and the state of the build
+        with that ID shows whether it has finished.
+
+        Only about one page of the listing is read per
+        :py:const:`~.BATCH_PAGE_SIZE` pending builds, so that one old build
+        that never finishes cannot make every poll page far back through
+        the user's builds; builds older than the pages read are polled
+        individually instead.
+
+        Return a 2-tuple of whether anything changed, and the list of
+        (slug, BuildInfo) pairs that must be polled individually: those
+        whose build was not in (or was older than) the listing or whose
+        state it did not give, or all of them if the listing failed (but
+        none if Travis is unavailable).
+
+        :param pending: list of (repo slug, BuildInfo) pairs to update
+        :type pending: list
+        :rtype: tuple
+        """
+        ids = []
+        for repo_slug, build_info in pending:
+            if build_info.travis_build_id is not None:
+                ids.append(build_info.travis_build_id)
+            elif build_info.travis_last_build_id is not None:
+                ids.append(build_info.travis_last_build_id + 1)
+        if len(ids) == 0:
+            return False, pending
+        max_pages = min(len(ids) // BATCH_PAGE_SIZE + 1, BATCH_MAX_PAGES)
+        try:
+            builds, covered = self.breakers['travis'].call(
+                self.travis.get_recent_builds, min(ids), max_pages)
+        except CircuitOpenError:
+            logger.debug("Travis is unavailable; not polling")
+            return False, []
+        except Exception:
+            logger.exception("Unable to list recent Travis builds; polling "
+                             "each build individually")
+            return False, pending
+        by_slug = {}
+        for build in builds:
+            if build.slug is not None:
+                by_slug.setdefault(build.slug.lower(), []).append(build)
+        have_changes = False
+        leftover = []
+        for repo_slug, build_info in pending:
+            found = by_slug.get(repo_slug.lower(), [])
+            if build_info.travis_build_id is None:
+                if (
+                        build_info.travis_last_build_id is None or
+                        build_info.travis_last_build_id + 1 < covered
+                ):
+                    leftover.append((repo_slug, build_info))
                     continue
-                else:
-                    have_changes = True
-            t_build = self.travis.get_build(build_id)
-            if t_build.finished:
+                newer = [
+                    b.id for b in found
+                    if b.id > build_info.travis_last_build_id
+                ]
+                if len(newer) == 0:
+                    logger.debug("No new Travis build of %s yet", repo_slug)
+                    continue
+                logger.debug("Found new Travis build ID %s for %s",
+                             min(newer), repo_slug)
+                build_info.set_travis_build_ids(
+                    build_info.travis_last_build_id, min(newer))
+                have_changes = True
+            match = [b for b in found if b.id == build_info.travis_build_id]
+            if len(match) == 0 or match[0].state is None:
+                leftover.append((repo_slug, build_info))
+                continue
+            if match[0].finished:
                 logger.debug("Build %s of %s has finished; updating",
                              build_info.travis_build_id, repo_slug)
-                build_info.set_travis_build_finished(t_build)
+                build_info.set_travis_build_finished(match[0])
                 have_changes = True
             else:
                 logger.debug("Build %s of %s still running",
                              build_info.travis_build_id, repo_slug)
-        logger.debug("Completed updating Travis build status; have_changes=%s",
-                     have_changes)
+        return have_changes, leftover
+
+    def poll_travis_build(self, repo_slug, build_info):
+        """
+        Poll TravisCI for the status of one build that has not yet
+        completed, first finding its build ID if it is not yet known, and
+        update the BuildInfo object if it has finished.
+
+        Return True if anything changed, False otherwise.
+
+        :param repo_slug: the repository slug / full name
+        :type repo_slug: str
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: bool
+        """
+        have_changes = False
+        build_id = build_info.travis_build_id
+        if build_id is None:
+            # try to fetch a new build ID
+            build_id = self.update_travis_build(build_info)
+            # if we still didn't get a new build ID...
+            if build_id is None:
+                logger.warning("Still have not gotten new Travis build ID "
+                               "for %s; skipping", repo_slug)
+                return False
+            have_changes = True
+        try:
+            t_build = self.breakers['travis'].call(self.travis.get_build,
+                                                   build_id)
+        except CircuitOpenError:
+            return have_changes
+        except Exception:
+            logger.exception("Unable to get Travis build %s of %s", build_id,
+                             repo_slug)
+            return have_changes
+        if t_build.finished:
+            logger.debug("Build %s of %s has finished; updating",
+                         build_info.travis_build_id, repo_slug)
+            build_info.set_travis_build_finished(t_build)
+            have_changes = True
+        else:
+            logger.debug("Build %s of %s still running",
+                         build_info.travis_build_id, repo_slug)
+        return have_changes
+
+    def check_webhooks(self, timeout=None):
+        """
+        Apply the Travis webhook notifications received by ``self.webhooks``
+        since the last call to the corresponding BuildInfo objects; a
+        notification for a build newer than the one before the trigger gives
+        the triggered build's ID, and one for a finished build marks it
+        finished. Return True if anything changed, False otherwise.
+
+        :param timeout: seconds to wait for a notification if none have been
+          received, or None to return immediately
+        :type timeout: float
+        :rtype: bool
+        """
+        if self.webhooks is None:
+            return False
+        have_changes = False
+        for slug, build in self.webhooks.get(timeout=timeout):
+            bi = self.builds.get(slug, None)
+            if bi is None or not bi.run_travis or bi.travis_build_finished:
+                continue
+            if bi.travis_build_id is None:
+                if (
+                        bi.travis_last_build_id is None or
+                        build.id <= bi.travis_last_build_id
+                ):
+                    continue
+                logger.info("Got new Travis build ID %s for %s from webhook",
+                            build.id, slug)
+                bi.set_travis_build_ids(bi.travis_last_build_id, build.id)
+                have_changes = True
+            elif build.id != bi.travis_build_id:
+                continue
+            if build.finished:
+                logger.info("Travis build %s of %s finished (%s), per "
+                            "webhook", build.id, slug, build.state)
+                bi.set_travis_build_finished(build)
+                have_changes = True
+        return have_changes
+
+    def travis_poll_due(self, slug):
+        """
+        Return whether Travis should be polled for the build of ``slug``.
+        Without webhooks, this is always True. With them, a build is only
+        polled if no webhook notification has finished it within
+        ``self.webhook_window`` seconds plus its expected duration (the
+        median of its past passed Travis builds) of first being checked, and
+        then only every :py:const:`~.WEBHOOK_POLL_INTERVAL` seconds.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: bool
+        """
+        if self.webhooks is None:
+            return True
+        now = self.dt_now()
+        due = self.travis_next_poll.get(slug, None)
+        if due is None:
+            window = self.webhook_window
+            expected = median(self.history.passed_durations(slug, 'travis'))
+            if expected is not None:
+                window += expected
+            self.travis_next_poll[slug] = now + timedelta(seconds=window)
+            return False
+        if now < due:
+            return False
+        logger.info("No webhook notification for Travis build of %s within "
+                    "expected window; polling", slug)
+        self.travis_next_poll[slug] = now + timedelta(
+            seconds=WEBHOOK_POLL_INTERVAL)
+        return True
+
+    def abandon_travis_builds(self):
+        """
+        Called when Travis has been unavailable for more than
+        ``self.max_outage`` seconds; mark all Travis builds that are still
+        being polled as skipped, so that the run can finish. Return True if
+        there were any.
+
+        :rtype: bool
+        """
+        self.triggers.clear()
+        have_changes = False
+        for name, bi in sorted(self.builds.items()):
+            if bi.run_travis and not bi.travis_build_finished:
+                logger.warning("Abandoning Travis build of %s; Travis has "
+                               "been unavailable for more than %d seconds",
+                               name, self.max_outage)
+                bi.set_travis_build_skipped(
+                    'Travis unavailable for more than %d seconds; stopped '
+                    'polling' % self.max_outage)
+                have_changes = True
         return have_changes
 
     def update_travis_build(self, bi):
@@ -553,13 +1872,20 @@ class ReBuildBot(object):
         logger.debug("Checking for new build ID for %s (last ID %s)",
                      bi.slug, bi.travis_last_build_id)
         try:
-            new = self.travis.wait_for_new_build(
-                bi.slug, bi.travis_last_build_id
+            new = self.breakers['travis'].call(
+                self.travis.wait_for_new_build, bi.slug,
+                bi.travis_last_build_id
             )
         except PollTimeoutException:
             logger.exception("Still have not found new Build ID for %s",
                              bi.slug)
             return None
+        except CircuitOpenError:
+            return None
+        except Exception:
+            logger.exception("Unable to poll for new Build ID for %s",
+                             bi.slug)
+            return None
         bi.set_travis_build_ids(bi.travis_last_build_id, new)
         return new
 
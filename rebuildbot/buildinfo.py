@@ -50,7 +50,7 @@ class BuildInfo(object):
     """
 
     def __init__(self, repo_slug, run_local=False, https_clone_url=None,
-                 ssh_clone_url=None):
+                 ssh_clone_url=None, repo_size=None, manifest=None):
         """
         Initialize a BuildInfo data container.
 
@@ -62,15 +62,25 @@ class BuildInfo(object):
         :type https_clone_url: string
         :param ssh_clone_url: the SSH git clone URL for the repo
         :type ssh_clone_url: string
+        :param repo_size: size of the repository on GitHub, in KB
+        :type repo_size: int
+        :param manifest: settings from the repository's ``.rebuildbot.yml``;
+          see :py:func:`~.parse_manifest`
+        :type manifest: dict
         """
         self.slug = repo_slug  # repo full name / slug
         self.https_clone_url = https_clone_url
         self.ssh_clone_url = ssh_clone_url
+        self.repo_size = repo_size
+        if manifest is None:
+            manifest = {}
+        self.manifest = manifest
         self.run_travis = False  # whether or not to run Travis build
         self.run_local = run_local  # whether or not to run local build
         self.travis_trigger_error = None  # Exception when triggering travis
         self.travis_build_id = None  # Travis Build ID of the new build
         self.travis_last_build_id = None
+        self.travis_build_attached = False  # using a build already running
         self.travis_build_result = None  # travispy.entities.build.Build
 
         # set by self.set_local_build()
@@ -85,6 +95,13 @@ class BuildInfo(object):
         self.local_build_duration = None
         self.local_build_s3_link = None
         self.local_build_repo_str = None
+        self.local_build_timed_out = False  # build killed by a timeout
+        self.local_build_skipped = None  # reason the build was not run
+        self.cache_stats = None  # dict, from CacheManager.stats()
+        self.local_build_rusage = None  # dict, from LocalBuild.poll_process()
+        self.clone_attempts = []  # dicts, from self.add_clone_attempt()
+        self.regressions = {}  # from self.set_regressions()
+        self.resource_tags = manifest.get('tags', [])
 
         # set by self.set_travis_build_finished()
         # these mirror the fields of :py:class:`travispy.entities.build.Build`
@@ -96,6 +113,7 @@ class BuildInfo(object):
         self.travis_build_number = None
         self.travis_build_url = None
         self.travis_build_finished = False
+        self.travis_build_skipped = None  # reason polling was abandoned
 
     @property
     def is_done(self):
@@ -114,6 +132,26 @@ class BuildInfo(object):
             return False
         return True
 
+    def merge(self, other):
+        """
+        Merge in another BuildInfo for the same repository, found by a
+        different discovery source; enable its Travis build if ``other``
+        has one, and take its clone URLs, size and manifest if it has a
+        local build and this one does not.
+
+        :param other: BuildInfo for the same repository
+        :type other: :py:class:`~.BuildInfo`
+        """
+        if other.run_travis:
+            self.run_travis = True
+        if other.run_local and not self.run_local:
+            self.run_local = True
+            self.https_clone_url = other.https_clone_url
+            self.ssh_clone_url = other.ssh_clone_url
+            self.repo_size = other.repo_size
+            self.manifest = other.manifest
+            self.resource_tags = other.resource_tags
+
     def set_travis_trigger_error(self, e):
         """
         If an exception is encountered triggering the Travis build, store the
@@ -136,6 +174,17 @@ class BuildInfo(object):
         self.travis_last_build_id = last_id
         self.travis_build_id = new_id
 
+    def set_travis_build_attached(self, build_id):
+        """
+        Store the ID of a Travis build that was already pending or running,
+        which is used instead of triggering another.
+
+        :param build_id: the ID of the Travis build
+        :type build_id: int
+        """
+        self.travis_build_id = build_id
+        self.travis_build_attached = True
+
     def set_travis_build_finished(self, build):
         """
         Update the object with a reference to a finished Travis Build.
@@ -154,7 +203,7 @@ class BuildInfo(object):
 
     def set_local_build(self, return_code=None, output=None, excinfo=None,
                         ex_type=None, traceback=None, start_dt=None,
-                        end_dt=None, repo_str=None):
+                        end_dt=None, repo_str=None, timed_out=False):
         """
         When a local build is finished, update with its return code and
         output string.
@@ -175,6 +224,8 @@ class BuildInfo(object):
         :type end_dt: datetime.datetime
         :param repo_str: string describing the state of the cloned repo
         :type repo_str: str
+        :param timed_out: whether the build was killed for exceeding a timeout
+        :type timed_out: bool
         """
         self.local_build_return_code = return_code
         self.local_build_output = output
@@ -185,9 +236,97 @@ class BuildInfo(object):
         self.local_build_start = start_dt
         self.local_build_end = end_dt
         self.local_build_repo_str = repo_str
+        self.local_build_timed_out = timed_out
         if start_dt is not None and end_dt is not None:
             self.local_build_duration = end_dt - start_dt
 
+    def set_local_build_skipped(self, reason):
+        """
+        Mark the local build as finished without having been run.
+
+        :param reason: why the build was skipped
+        :type reason: str
+        """
+        self.local_build_skipped = reason
+        self.local_build_finished = True
+
+    def set_travis_build_skipped(self, reason):
+        """
+        Mark the Travis build as finished without its result being known,
+        i.e. because we stopped polling for it.
+
+        :param reason: why the build was skipped
+        :type reason: str
+        """
+        self.travis_build_skipped = reason
+        self.travis_build_finished = True
+
+    def set_cache_stats(self, stats):
+        """
+        Store the shared dependency cache statistics for the local build.
+
+        :param stats: cache statistics, from :py:meth:`~.CacheManager.stats`
+        :type stats: dict
+        """
+        self.cache_stats = stats
+
+    def set_regressions(self, regressions):
+        """
+        Store the build duration regressions found for this run.
+
+        :param regressions: dict of build kind ("local" or "travis") to a
+          2-tuple of (percent slowdown, median past duration in seconds), from
+          :py:meth:`~.BuildHistory.find_regressions`
+        :type regressions: dict
+        """
+        self.regressions = regressions
+
+    def regression_html(self, kind):
+        """
+        Return an HTML string flagging a duration regression of the ``kind``
+        ("local" or "travis") build, or an empty string if there is none.
+
+        :param kind: "local" or "travis"
+        :type kind: str
+        :rtype: str
+        """
+        if kind not in self.regressions:
+            return ''
+        pct, baseline = self.regressions[kind]
+        return '<br /><strong>{p:.0f}% slower than usual (median ' \
+            '{b})</strong>'.format(p=pct, b=timedelta(seconds=int(baseline)))
+
+    def set_local_build_rusage(self, usage):
+        """
+        Store the resource usage of the local build's process tree.
+
+        :param usage: resource usage, from :py:func:`~.rusage_dict`, with
+          a ``cgroup`` key holding :py:meth:`~.AdmissionController.cgroup_usage`
+          if the build ran in a cgroup
+        :type usage: dict
+        """
+        self.local_build_rusage = usage
+
+    def add_clone_attempt(self, protocol, url, duration, excinfo=None):
+        """
+        Record an attempt to clone the repository for the local build.
+
+        :param protocol: the clone protocol, "ssh" or "https"
+        :type protocol: str
+        :param url: the URL cloned from
+        :type url: str
+        :param duration: how long the attempt took, in seconds
+        :type duration: float
+        :param excinfo: the exception raised if the attempt failed
+        :type excinfo: Exception
+        """
+        self.clone_attempts.append({
+            'protocol': protocol,
+            'url': url,
+            'duration': duration,
+            'error': None if excinfo is None else str(excinfo)
+        })
+
     def set_local_build_s3_link(self, link):
         """
         Set the link to where the local build output was uploaded to S3.
@@ -224,6 +363,11 @@ class BuildInfo(object):
 
         :rtype: str
         """
+        if self.local_build_skipped is not None:
+            return "=> Build of {s} skipped: {r}\n".format(
+                s=self.slug,
+                r=self.local_build_skipped
+            )
         if (
                 self.local_build_exception is not None and
                 self.local_build_output is None
@@ -250,12 +394,24 @@ class BuildInfo(object):
                 s=self.slug,
                 r=repo_str
             )
+        if len(self.clone_attempts) > 0:
+            start_str += "=> Clone: {c}\n".format(c=self.clone_attempts_str)
         if self.local_build_end is not None:
             end_str = "=> Build ends at {d}\n".format(
                 d=self.local_build_end.strftime('%Y-%m-%d %H:%M:%S')
             )
         if self.local_build_duration is not None:
             time_str = " in %s" % self.local_build_duration
+        if self.local_build_rusage:
+            end_str += "=> Resources: {r}\n".format(r=self.rusage_str)
+        if self.local_build_timed_out:
+            return "{s}{o}\n\n{e}==> Build timed out{t}: {m}".format(
+                o=self.local_build_output,
+                t=time_str,
+                s=start_str,
+                e=end_str,
+                m=self.local_build_exception
+            )
         return "{s}{o}\n\n{e}==> Build exited {r}{t}".format(
             o=self.local_build_output,
             r=self.local_build_return_code,
@@ -270,6 +426,9 @@ class BuildInfo(object):
 
         :rtype: str
         """
+        if self.travis_build_skipped is not None:
+            return '<span class="icon skipped">&nbsp;</span>Skipped: ' \
+                '{r}'.format(r=self.travis_build_skipped)
         if self.travis_build_url is None or self.travis_build_duration is None:
             return 'n/a'
         s = '<span class="icon {icon}">&nbsp;</span>'.format(
@@ -280,6 +439,9 @@ class BuildInfo(object):
             num=self.travis_build_number,
             d=timedelta(seconds=self.travis_build_duration)
         )
+        if self.travis_build_attached:
+            s += ' (already running; not triggered)'
+        s += self.regression_html('travis')
         return s
 
     @property
@@ -304,6 +466,8 @@ class BuildInfo(object):
 
         :rtype: str
         """
+        if self.local_build_timed_out:
+            return 'timedout'
         if (
                 self.local_build_exception is not None and
                 self.local_build_output is None
@@ -321,11 +485,169 @@ class BuildInfo(object):
         """
         if not self.run_local:
             return '&nbsp;'
+        if self.local_build_skipped is not None:
+            return '<span class="icon skipped">&nbsp;</span>Skipped: ' \
+                '{r}'.format(r=self.local_build_skipped)
         s = '<span class="icon {icon}">&nbsp;</span>'.format(
             icon=self.local_build_icon
         )
-        s += '<a href="{url}">Local Build</a> ran in {d}'.format(
+        verb = 'ran in'
+        if self.local_build_timed_out:
+            verb = 'timed out after'
+        s += '<a href="{url}">Local Build</a> {v} {d}'.format(
             url=self.local_build_s3_link,
+            v=verb,
             d=self.local_build_duration
         )
+        s += self.regression_html('local')
+        if self.cache_stats:
+            s += '<br /><small>{c}</small>'.format(c=self.cache_stats_str)
+        if self.local_build_rusage:
+            s += '<br /><small>{r}</small>'.format(r=self.rusage_str)
         return s
+
+    @property
+    def rusage_str(self):
+        """
+        Return a short string summarizing ``self.local_build_rusage``, i.e.
+        "CPU 61.2s user, 8.4s sys; max RSS 512.0 MB; 120 blocks in, 3400
+        out; 2100/340 vol/invol context switches; cgroup: CPU 75.0s, peak
+        memory 1536.0 MB, read 1.2 MB, wrote 40.0 MB".
+
+        :rtype: str
+        """
+        u = self.local_build_rusage
+        parts = []
+        if 'user_cpu' in u:
+            parts.append('CPU {u:.1f}s user, {s:.1f}s sys'.format(
+                u=u['user_cpu'], s=u['sys_cpu']))
+            parts.append('max RSS {m:.1f} MB'.format(
+                m=u['max_rss_kb'] / 1024.0))
+            parts.append('{i} blocks in, {o} out'.format(
+                i=u['block_in'], o=u['block_out']))
+            parts.append('{v}/{i} vol/invol context switches'.format(
+                v=u['voluntary_switches'], i=u['involuntary_switches']))
+        cg = u.get('cgroup', {})
+        cg_parts = []
+        if 'cpu' in cg:
+            cg_parts.append('CPU {c:.1f}s'.format(c=cg['cpu']))
+        if 'max_memory_mb' in cg:
+            cg_parts.append('peak memory {m:.1f} MB'.format(
+                m=cg['max_memory_mb']))
+        if 'read_bytes' in cg:
+            cg_parts.append('read {r:.1f} MB'.format(
+                r=cg['read_bytes'] / (1024.0 * 1024.0)))
+        if 'write_bytes' in cg:
+            cg_parts.append('wrote {w:.1f} MB'.format(
+                w=cg['write_bytes'] / (1024.0 * 1024.0)))
+        if len(cg_parts) > 0:
+            parts.append('cgroup: ' + ', '.join(cg_parts))
+        return '; '.join(parts)
+
+    def as_dict(self):
+        """
+        Return a JSON-serializable dict of the outcome of this repository's
+        builds, for machine-readable output. ``local`` and ``travis`` are
+        None if that build was not run.
+
+        :rtype: dict
+        """
+        res = {'slug': self.slug, 'local': None, 'travis': None}
+        if self.run_local:
+            duration = None
+            if self.local_build_duration is not None:
+                duration = self.local_build_duration.total_seconds()
+            exc = None
+            if self.local_build_exception is not None:
+                exc = str(self.local_build_exception)
+            res['local'] = {
+                'return_code': self.local_build_return_code,
+                'duration': duration,
+                'timed_out': self.local_build_timed_out,
+                'skipped': self.local_build_skipped,
+                'exception': exc,
+                'output_url': self.local_build_s3_link,
+                'resource_usage': self.local_build_rusage,
+                'cache_stats': self.cache_stats,
+                'regression': regression_dict(self.regressions, 'local'),
+            }
+        if self.run_travis:
+            exc = None
+            if self.travis_trigger_error is not None:
+                exc = str(self.travis_trigger_error)
+            res['travis'] = {
+                'build_id': self.travis_build_id,
+                'number': self.travis_build_number,
+                'state': self.travis_build_state,
+                'duration': self.travis_build_duration,
+                'url': self.travis_build_url,
+                'skipped': self.travis_build_skipped,
+                'attached': self.travis_build_attached,
+                'trigger_error': exc,
+                'regression': regression_dict(self.regressions, 'travis'),
+            }
+        return res
+
+    @property
+    def cache_stats_str(self):
+        """
+        Return a short string summarizing ``self.cache_stats``, i.e.
+        "pip: 120 cached (2 updated, 0 removed), 3 new; 1.2 MB written". A
+        cache that another build used at the same time has no statistics.
+
+        :rtype: str
+        """
+        parts = []
+        for name, st in sorted(self.cache_stats.items()):
+            if st is None:
+                parts.append('{n}: shared with a concurrent build'.format(
+                    n=name))
+                continue
+            parts.append(
+                '{n}: {c} cached ({u} updated, {r} removed), {a} new; '
+                '{m:.1f} MB written'.format(
+                    n=name,
+                    c=st['cached'],
+                    u=st['updated'],
+                    r=st['removed'],
+                    a=st['added'],
+                    m=st['written_bytes'] / (1024.0 * 1024.0)
+                ))
+        return '; '.join(parts)
+
+    @property
+    def clone_attempts_str(self):
+        """
+        Return a short string summarizing ``self.clone_attempts``, i.e.
+        "ssh <git@github.com:foo/bar.git> failed after 30.0s; https
+        <https://github.com/foo/bar.git> ok in 2.1s".
+
+        :rtype: str
+        """
+        parts = []
+        for a in self.clone_attempts:
+            if a['error'] is None:
+                res = 'ok in'
+            else:
+                res = 'failed after'
+            parts.append('{p} <{u}> {r} {d:.1f}s'.format(
+                p=a['protocol'], u=a['url'], r=res, d=a['duration']))
+        return '; '.join(parts)
+
+
+def regression_dict(regressions, kind):
+    """
+    Return the duration regression of the ``kind`` build in ``regressions``
+    (see :py:meth:`~.BuildInfo.set_regressions`) as a JSON-serializable dict,
+    or None if there is none.
+
+    :param regressions: regressions, as stored by ``set_regressions``
+    :type regressions: dict
+    :param kind: "local" or "travis"
+    :type kind: str
+    :rtype: dict
+    """
+    if kind not in regressions:
+        return None
+    pct, baseline = regressions[kind]
+    return {'percent': pct, 'median_duration': baseline}
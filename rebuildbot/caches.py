@@ -0,0 +1,335 @@
+"""
+rebuildbot/caches.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import logging
+import threading
+from shutil import rmtree
+
+from .workspace import dir_size
+from .reaper import REAP_PREFIX
+
+logger = logging.getLogger(__name__)
+
+#: Caches that can be shared between local builds. For each cache name,
+#: ``env`` is the list of environment variables that are set to the cache
+#: directory for each build, ``limit_mb`` is the default size limit in MB,
+#: and ``unit_dir`` (if not None) is a subdirectory whose entries are evicted
+#: as a whole, rather than file-by-file.
+CACHES = {
+    'pip': {
+        'env': ['PIP_CACHE_DIR'],
+        'limit_mb': 2048,
+        'unit_dir': None,
+    },
+    'bundler': {
+        'env': ['BUNDLE_USER_CACHE'],
+        'limit_mb': 2048,
+        'unit_dir': None,
+    },
+    'npm': {
+        'env': ['npm_config_cache'],
+        'limit_mb': 2048,
+        'unit_dir': None,
+    },
+    'vagrant': {
+        'env': ['VAGRANT_HOME'],
+        'limit_mb': 20480,
+        'unit_dir': 'boxes',
+    },
+}
+
+
+class CacheManager(object):
+    """
+    Manages persistent dependency caches shared between local builds.
+
+    Each enabled cache is a directory under ``root``, which is exported to
+    ``.rebuildbot.sh`` via the environment variables listed in
+    :py:const:`~.CACHES` (i.e. ``PIP_CACHE_DIR``). When a cache grows above
+    its size limit, the least recently used files (or for Vagrant, boxes)
+    are removed until it no longer does.
+
+    Per-build statistics (see :py:meth:`~.begin_build`) compare a cache's
+    contents before and after the build, so they are only kept for caches
+    that no other build used at the same time; otherwise they would count
+    the other build's downloads too.
+    """
+
+    def __init__(self, root, names, limits_mb={}, reaper=None):
+        """
+        :param root: directory to keep caches in
+        :type root: str
+        :param names: names of the caches to enable; keys of
+          :py:const:`~.CACHES`
+        :type names: list
+        :param limits_mb: dict of cache name to size limit in MB, overriding
+          the defaults in :py:const:`~.CACHES`
+        :type limits_mb: dict
+        :param reaper: if not None, remove evicted directories in the
+          background with this reaper instead of synchronously
+        :type reaper: :py:class:`~.Reaper`
+        """
+        for name in list(names) + list(limits_mb.keys()):
+            if name not in CACHES:
+                raise ValueError("Unknown cache '%s'; must be one of: %s" % (
+                    name, ', '.join(sorted(CACHES.keys()))))
+        self.root = root
+        self.reaper = reaper
+        self.names = sorted(set(names))
+        self.limits_mb = dict(
+            (n, limits_mb.get(n, CACHES[n]['limit_mb'])) for n in self.names
+        )
+        self.lock = threading.Lock()
+        self.users = dict((n, set()) for n in self.names)
+        """mapping of cache name to the IDs of builds currently using it"""
+        self.shared = {}
+        """mapping of build ID to the names of caches it shared"""
+        self.next_id = 0
+
+    def path_for(self, name):
+        """
+        Return the directory for a cache.
+
+        :param name: the cache name
+        :type name: str
+        :rtype: str
+        """
+        return os.path.join(self.root, name)
+
+    def selected(self, names=None):
+        """
+        Return the names of the enabled caches that are in ``names``, or all
+        of them if ``names`` is None.
+
+        :param names: cache names a build uses, or None for all
+        :type names: list
+        :rtype: list
+        """
+        if names is None:
+            return self.names
+        return [n for n in self.names if n in names]
+
+    def env(self, names=None):
+        """
+        Create the cache directories if needed, and return a dict of the
+        environment variables to set for a build.
+
+        :param names: if not None, only export these caches
+        :type names: list
+        :rtype: dict
+        """
+        env = {}
+        for name in self.selected(names):
+            path = self.path_for(name)
+            if not os.path.exists(path):
+                os.makedirs(path)
+            for var in CACHES[name]['env']:
+                env[var] = path
+        return env
+
+    def snapshot(self, names=None):
+        """
+        Return a dict of cache name to a dict of the files (paths relative to
+        the cache directory) currently in it to their (size, mtime) 2-tuples,
+        for use with :py:meth:`~.stats`.
+
+        :param names: if not None, only snapshot these caches
+        :type names: list
+        :rtype: dict
+        """
+        res = {}
+        for name in self.selected(names):
+            path = self.path_for(name)
+            files = {}
+            for dirpath, dirnames, filenames in os.walk(path):
+                for f in filenames:
+                    fpath = os.path.join(dirpath, f)
+                    try:
+                        st = os.lstat(fpath)
+                    except OSError:
+                        continue
+                    files[os.path.relpath(fpath, path)] = (
+                        st.st_size, st.st_mtime)
+            res[name] = files
+        return res
+
+    def stats(self, before, names=None):
+        """
+        Compare the current contents of the caches with a
+        :py:meth:`~.snapshot` taken before a build. Return a dict of cache
+        name to a dict with keys ``cached`` (number of files present before
+        the build), ``updated`` (number of those whose size or modification
+        time changed, i.e. that were rewritten or deleted and fetched again),
+        ``removed`` (number of those that are gone), ``added`` (number of
+        files the build added) and ``written_bytes`` (the total size of the
+        updated and added files).
+
+        :param before: snapshot taken before the build
+        :type before: dict
+        :param names: if not None, only compare these caches
+        :type names: list
+        :rtype: dict
+        """
+        after = self.snapshot(names)
+        res = {}
+        for name in self.selected(names):
+            old = before.get(name, {})
+            new = after[name]
+            added = [f for f in new if f not in old]
+            updated = [f for f in new if f in old and new[f] != old[f]]
+            res[name] = {
+                'cached': len(old),
+                'updated': len(updated),
+                'removed': len([f for f in old if f not in new]),
+                'added': len(added),
+                'written_bytes': sum(new[f][0] for f in added + updated),
+            }
+        return res
+
+    def begin_build(self, names=None):
+        """
+        Record that a build using the caches in ``names`` (or all of them)
+        is starting, and snapshot those that no other running build uses.
+        Return a token to pass to :py:meth:`~.end_build`.
+
+        :param names: if not None, the caches the build uses
+        :type names: list
+        :rtype: dict
+        """
+        selected = self.selected(names)
+        with self.lock:
+            build_id = self.next_id
+            self.next_id += 1
+            shared = set()
+            for name in selected:
+                if len(self.users[name]) > 0:
+                    shared.add(name)
+                    for other in self.users[name]:
+                        self.shared[other].add(name)
+                self.users[name].add(build_id)
+            self.shared[build_id] = shared
+        before = self.snapshot([n for n in selected if n not in shared])
+        return {'id': build_id, 'names': selected, 'before': before}
+
+    def end_build(self, token):
+        """
+        Record that the build :py:meth:`~.begin_build` returned ``token``
+        for has finished, and return its cache statistics: a dict of cache
+        name to the dict from :py:meth:`~.stats`, or to None if another
+        build used the cache at the same time.
+
+        :param token: the token from :py:meth:`~.begin_build`
+        :type token: dict
+        :rtype: dict
+        """
+        with self.lock:
+            for name in token['names']:
+                self.users[name].discard(token['id'])
+            shared = self.shared.pop(token['id'])
+        alone = [n for n in token['names'] if n not in shared]
+        res = dict((n, None) for n in shared)
+        if len(alone) > 0:
+            res.update(self.stats(token['before'], alone))
+        return res
+
+    def evict(self):
+        """
+        For each cache over its size limit, remove the least recently used
+        entries until it is not.
+        """
+        for name in self.names:
+            path = self.path_for(name)
+            if not os.path.isdir(path):
+                continue
+            entries = self._entries(name)
+            total = sum([e[2] for e in entries])
+            limit = self.limits_mb[name] * 1024 * 1024
+            if total <= limit:
+                continue
+            logger.info("Cache %s is %d MB; evicting down to %d MB", name,
+                        total // (1024 * 1024), self.limits_mb[name])
+            for atime, p, size in sorted(entries):
+                if total <= limit:
+                    break
+                logger.debug("Evicting %s from %s cache", p, name)
+                if os.path.isdir(p) and not os.path.islink(p):
+                    if self.reaper is not None:
+                        self.reaper.reap(p)
+                    else:
+                        rmtree(p)
+                else:
+                    os.unlink(p)
+                total -= size
+
+    def _entries(self, name):
+        """
+        Return a list of the evictable entries in a cache, as 3-tuples of
+        (last access or modification time, path, size in bytes).
+
+        :param name: the cache name
+        :type name: str
+        :rtype: list
+        """
+        path = self.path_for(name)
+        entries = []
+        unit_dir = CACHES[name]['unit_dir']
+        if unit_dir is not None:
+            units = os.path.join(path, unit_dir)
+            if not os.path.isdir(units):
+                return []
+            for e in os.listdir(units):
+                if e.startswith(REAP_PREFIX):
+                    continue
+                p = os.path.join(units, e)
+                st = os.lstat(p)
+                entries.append((max(st.st_atime, st.st_mtime), p,
+                                dir_size(p) if os.path.isdir(p)
+                                else st.st_size))
+            return entries
+        for dirpath, dirnames, filenames in os.walk(path):
+            for f in filenames:
+                p = os.path.join(dirpath, f)
+                try:
+                    st = os.lstat(p)
+                except OSError:
+                    continue
+                entries.append((max(st.st_atime, st.st_mtime), p,
+                                st.st_size))
+        return entries
@@ -0,0 +1,374 @@
+"""
+rebuildbot/circuitbreaker.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import re
+import time
+import logging
+import threading
+
+from .exceptions import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 3  # consecutive failures to open the circuit
+DEFAULT_BACKOFF = 30  # seconds the circuit first stays open
+MAX_BACKOFF = 1800  # longest the circuit stays open between trial calls
+DEFAULT_MAX_OUTAGE = 3600  # seconds of outage before giving up on a service
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+def error_status(ex):
+    """
+    Return the HTTP status code of an exception from one of the API clients
+    (requests, PyGithub, TravisPy or ReBuildBot's own), or None if it has
+    none.
+
+    :param ex: the exception
+    :type ex: Exception
+    :rtype: int
+    """
+    response = getattr(ex, 'response', None)
+    if response is not None and hasattr(response, 'status_code'):
+        return response.status_code
+    for attr in ['status_code', 'status']:
+        val = getattr(ex, attr, None)
+        if isinstance(val, int):
+            return val
+    # TravisPy's TravisError only keeps the status in its message
+    m = re.match(r'^\[(\d+)\]', str(ex))
+    if m is not None:
+        return int(m.group(1))
+    return None
+
+
+def is_service_failure(ex):
+    """
+    Return whether an exception raised by an API call means that the service
+    is unavailable - a connection error or timeout, or a 429 or 5xx response
+    - rather than an answer such as "not found" or a poll that timed out
+    waiting for a build.
+
+    :param ex: the exception
+    :type ex: Exception
+    :rtype: bool
+    """
+    status = error_status(ex)
+    if status is not None:
+        return status == 429 or status >= 500
+    # requests' and socket's exceptions are IOErrors
+    return isinstance(ex, (IOError, OSError))
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for one external service. After ``threshold``
+    consecutive failed calls (see :py:func:`~.is_service_failure`) the
+    circuit opens and calls are refused (:py:meth:`~.allow` returns False,
+    and :py:meth:`~.call` raises :py:exc:`~.CircuitOpenError`) for
+    ``backoff`` seconds; then a single trial call is let through. If it
+    succeeds the circuit closes, otherwise it opens again for twice as long,
+    up to :py:const:`~.MAX_BACKOFF`. Each period the circuit was open is
+    recorded in ``outages`` for the report.
+    """
+
+    def __init__(self, service, threshold=DEFAULT_FAILURE_THRESHOLD,
+                 backoff=DEFAULT_BACKOFF, max_backoff=MAX_BACKOFF):
+        """
+        :param service: service name, for logging and the report
+        :type service: str
+        :param threshold: consecutive failures that open the circuit
+        :type threshold: int
+        :param backoff: seconds the circuit first stays open
+        :type backoff: float
+        :param max_backoff: longest the circuit stays open between trials
+        :type max_backoff: float
+        """
+        self.service = service
+        self.threshold = max(threshold, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.open_for = backoff
+        self.retry_at = None
+        self.outages = []
+        """list of dicts describing each outage; see :py:meth:`~.summary`"""
+
+    @property
+    def is_closed(self):
+        """
+        Return whether the service is considered available.
+
+        :rtype: bool
+        """
+        return self.state == STATE_CLOSED
+
+    @property
+    def outage_duration(self):
+        """
+        Return the number of seconds the current outage has lasted, or 0 if
+        the circuit is closed.
+
+        :rtype: float
+        """
+        if self.is_closed or len(self.outages) == 0:
+            return 0
+        return time.time() - self.outages[-1]['start']
+
+    def allow(self):
+        """
+        Return whether a call to the service may be made now. When an open
+        circuit's backoff has elapsed, this returns True once, for a trial
+        call, and False to everyone else until that call's result is
+        recorded.
+
+        :rtype: bool
+        """
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.time() >= self.retry_at:
+                logger.info("Trying %s again after outage", self.service)
+                self.state = STATE_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Record a successful call; close the circuit if it was open.
+        """
+        with self.lock:
+            self.failures = 0
+            if self.state == STATE_CLOSED:
+                return
+            now = time.time()
+            self.outages[-1]['end'] = now
+            logger.warning("%s is available again after %d seconds",
+                           self.service, now - self.outages[-1]['start'])
+            self.state = STATE_CLOSED
+            self.open_for = self.backoff
+            self.retry_at = None
+
+    def record_failure(self, ex):
+        """
+        Record a failed call; open the circuit if this is one failure too
+        many, or re-open it (with double the backoff) if this was the trial
+        call.
+
+        :param ex: the exception the call raised
+        :type ex: Exception
+        """
+        with self.lock:
+            self.failures += 1
+            now = time.time()
+            if self.state == STATE_CLOSED:
+                if self.failures < self.threshold:
+                    return
+                self.outages.append({'start': now, 'end': None,
+                                     'failures': 0, 'error': None})
+            elif self.state == STATE_HALF_OPEN:
+                self.open_for = min(self.open_for * 2, self.max_backoff)
+            self.outages[-1]['failures'] = self.failures
+            self.outages[-1]['error'] = str(ex)
+            self.state = STATE_OPEN
+            self.retry_at = now + self.open_for
+            logger.warning("%s unavailable after %d consecutive failures "
+                           "(%s); suspending calls for %d seconds",
+                           self.service, self.failures, ex, self.open_for)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call ``func`` with the given arguments through the circuit breaker
+        and return its result. Exceptions it raises are re-raised after
+        being recorded as a failure (see :py:func:`~.is_service_failure`) or
+        not.
+
+        :raises: :py:exc:`~.CircuitOpenError` if the circuit is open
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.service, self.retry_at)
+        try:
+            res = func(*args, **kwargs)
+        except Exception as ex:
+            if is_service_failure(ex):
+                self.record_failure(ex)
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return res
+
+    def wait(self):
+        """
+        Block until the circuit may allow a call: until an open circuit's
+        backoff has elapsed, or for a second while another caller's trial
+        call is in progress. Return immediately if the circuit is closed.
+        """
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return
+            delay = 1
+            if self.state == STATE_OPEN:
+                delay = self.retry_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def retryable(self, ex, max_outage):
+        """
+        Return whether a call that raised ``ex`` should be made again once
+        the circuit allows it: if the service was unavailable (a service
+        failure, or the circuit was open) for no more than ``max_outage``
+        seconds so far.
+
+        :param ex: the exception the call raised
+        :type ex: Exception
+        :param max_outage: seconds of outage after which to give up
+        :type max_outage: float
+        :rtype: bool
+        """
+        if not isinstance(ex, CircuitOpenError) and \
+                not is_service_failure(ex):
+            return False
+        return self.outage_duration <= max_outage
+
+    def call_retrying(self, max_outage, func, *args, **kwargs):
+        """
+        Like :py:meth:`~.call`, but if the service is unavailable, wait for
+        the circuit to allow calls (see :py:meth:`~.wait`) and try again,
+        until the outage has lasted more than ``max_outage`` seconds.
+
+        :param max_outage: seconds of outage after which to give up
+        :type max_outage: float
+        :param func: the function to call with the remaining arguments
+        :raises: the last exception, if it is not a service failure or the
+          outage lasted too long
+        """
+        while True:
+            try:
+                return self.call(func, *args, **kwargs)
+            except Exception as ex:
+                if not self.retryable(ex, max_outage):
+                    raise
+                logger.info("Calling %s again once it is available (%s)",
+                            self.service, ex)
+            self.wait()
+
+    def iterate(self, func, max_outage=DEFAULT_MAX_OUTAGE):
+        """
+        Generator yielding the items of the iterable returned by ``func()``
+        (i.e. a generator that makes API calls as it is consumed, such as a
+        paginated listing), getting each one through :py:meth:`~.call`, so
+        that failures while iterating count towards opening the circuit.
+
+        A generator that has raised cannot be resumed, so if the service is
+        unavailable, ``func()`` is called again once the circuit allows
+        calls, and the items already yielded are skipped; ``func`` should
+        therefore be cheap to restart, doing any per-item API calls outside
+        of it (with :py:meth:`~.call_retrying`). Listing the skipped items
+        again does not count as a successful call, so a listing that keeps
+        failing at the same place still opens the circuit.
+
+        :param func: function returning the iterable to consume
+        :type func: callable
+        :param max_outage: seconds of outage after which to give up
+        :type max_outage: float
+        :raises: the last exception, if it is not a service failure or the
+          outage lasted more than ``max_outage`` seconds
+        """
+        done = 0
+        it = None
+        while True:
+            if it is None:
+                it = iter(func())
+                pos = 0
+            try:
+                if pos < done:
+                    item = self._replay(it)
+                else:
+                    item = self.call(next, it)
+            except StopIteration:
+                return
+            except Exception as ex:
+                if not self.retryable(ex, max_outage):
+                    raise
+                logger.warning("Error listing from %s after %d items (%s); "
+                               "restarting once it is available",
+                               self.service, done, ex)
+                it = None
+                self.wait()
+                continue
+            pos += 1
+            if pos > done:
+                done = pos
+                yield item
+
+    def _replay(self, it):
+        """
+        Return ``next(it)`` for an item :py:meth:`~.iterate` has already
+        yielded, recording a failure but not a success.
+        """
+        try:
+            return next(it)
+        except StopIteration:
+            raise
+        except Exception as ex:
+            if is_service_failure(ex):
+                self.record_failure(ex)
+            raise
+
+    def summary(self):
+        """
+        Return a list of dicts describing each outage, with ``service``,
+        ``start`` and ``end`` (epoch times; ``end`` is None if it is
+        ongoing), ``failures`` (the number of failed calls) and ``error``
+        (the last error) keys.
+
+        :rtype: list
+        """
+        with self.lock:
+            res = []
+            for o in self.outages:
+                d = dict(o)
+                d['service'] = self.service
+                res.append(d)
+            return res
@@ -0,0 +1,127 @@
+"""
+rebuildbot/connector.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Connector(object):
+    """
+    Connects to one external service in a background thread, so that the
+    connections to several services overlap with each other and with the
+    rest of startup. The connection is started by :py:meth:`~.start`, or by
+    the first call to :py:meth:`~.get`, which waits for it to finish; a
+    service that is never used is never connected to.
+    """
+
+    def __init__(self, name, func):
+        """
+        :param name: service name, for logging
+        :type name: str
+        :param func: function called with no arguments to connect to the
+          service; returns the connection object
+        :type func: callable
+        """
+        self.name = name
+        self.func = func
+        self.lock = threading.Lock()
+        self.thread = None
+        self.connected = False
+        self.value = None
+        self.exception = None
+
+    @classmethod
+    def for_value(cls, name, value):
+        """
+        Return a Connector that is already connected, with ``value`` as its
+        connection object.
+
+        :param name: service name
+        :type name: str
+        :param value: the connection object
+        :rtype: :py:class:`~.Connector`
+        """
+        c = cls(name, None)
+        c.value = value
+        c.connected = True
+        return c
+
+    def start(self):
+        """
+        Start connecting in a background thread, unless this has already
+        been started or is connected.
+        """
+        with self.lock:
+            if self.thread is not None or self.connected:
+                return
+            logger.debug("Connecting to %s", self.name)
+            self.thread = threading.Thread(target=self._run,
+                                           name='connect-%s' % self.name)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def get(self):
+        """
+        Return the connection object, connecting first if needed and
+        waiting for the connection to finish.
+
+        :raises: the exception raised while connecting, if any
+        """
+        self.start()
+        if self.thread is not None:
+            self.thread.join()
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def _run(self):
+        """thread target; connect and store the result or exception"""
+        start = time.time()
+        try:
+            self.value = self.func()
+        except Exception as ex:
+            logger.debug("Error connecting to %s", self.name, exc_info=True)
+            self.exception = ex
+            return
+        self.connected = True
+        logger.debug("Connected to %s in %.2fs", self.name,
+                     time.time() - start)
@@ -0,0 +1,148 @@
+"""
+rebuildbot/discovery.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import time
+import logging
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+
+class Discoverer(object):
+    """
+    Runs project discovery in background threads, so that builds can be
+    started as soon as the first projects are found instead of after every
+    repository on GitHub and Travis has been inspected.
+
+    Each source is a function returning an iterable (usually a generator) of
+    :py:class:`~.BuildInfo` objects; each is run in its own thread, and the
+    BuildInfo objects it yields are handed to the main thread by
+    :py:meth:`~.get`. A source that raises an exception is logged and treated
+    as finished, so one failing API does not stop the others.
+    """
+
+    def __init__(self, sources):
+        """
+        :param sources: list of (name, function) 2-tuples; ``function`` is
+          called with no arguments and returns an iterable of BuildInfo
+          objects
+        :type sources: list
+        """
+        self.sources = sources
+        self.queue = Queue()
+        self.threads = []
+        self.running = 0
+        """number of sources that have not finished (as seen by get())"""
+        self.finished = set()
+        """names of the sources that have finished (as seen by get())"""
+        self.errors = {}
+        """mapping of source name to the exception that stopped it"""
+
+    def start(self):
+        """
+        Start a discovery thread for each source.
+        """
+        for name, func in self.sources:
+            t = threading.Thread(target=self._run, args=(name, func),
+                                 name='discover-%s' % name)
+            t.daemon = True
+            self.threads.append(t)
+            self.running += 1
+            t.start()
+
+    @property
+    def done(self):
+        """
+        Return True once every source has finished and everything it found
+        has been returned by :py:meth:`~.get`.
+
+        :rtype: bool
+        """
+        return self.running == 0
+
+    def get(self, timeout=None):
+        """
+        Return a list of the BuildInfo objects discovered since the last
+        call, without blocking. If ``timeout`` is given and nothing has been
+        discovered yet, wait up to that many seconds for the first one.
+
+        :param timeout: seconds to wait if nothing is available, or None to
+          return immediately
+        :type timeout: float
+        :rtype: list
+        """
+        res = []
+        block = timeout is not None
+        while self.running > 0:
+            try:
+                name, item = self.queue.get(block, timeout)
+            except Empty:
+                break
+            block = False
+            if item is None:
+                self.running -= 1
+                self.finished.add(name)
+                continue
+            res.append(item)
+        return res
+
+    def _run(self, name, func):
+        """
+        thread target; put (name, BuildInfo) for everything ``func`` yields
+        on the queue, followed by (name, None) once it is finished
+        """
+        start = time.time()
+        count = 0
+        try:
+            for build_info in func():
+                logger.debug("Discovered %s from %s", build_info.slug, name)
+                self.queue.put((name, build_info))
+                count += 1
+        except Exception as ex:
+            logger.exception("Error discovering projects from %s", name)
+            self.errors[name] = ex
+        finally:
+            logger.info("Discovery from %s finished; found %d projects in "
+                        "%.1fs", name, count, time.time() - start)
+            self.queue.put((name, None))
@@ -90,3 +90,53 @@ class PollTimeoutException(Exception):
                            s=(wait_time * num_times)
                        )
         super(PollTimeoutException, self).__init__(self.message)
+
+
+class LocalBuildTimeoutError(Exception):
+    """
+    Raised when a local build is killed for exceeding its hard timeout, or for
+    producing no output for longer than its inactivity timeout.
+    """
+
+    def __init__(self, repo, kind, timeout, output):
+        self.repo = repo
+        self.kind = kind
+        self.timeout = timeout
+        self.output = output
+
+        if kind == 'inactivity':
+            desc = 'producing no output for'
+        else:
+            desc = 'running for more than'
+        self.message = "Local build of {r} killed after {d} {t} " \
+                       "seconds".format(r=repo, d=desc, t=timeout)
+        super(LocalBuildTimeoutError, self).__init__(self.message)
+
+
+class ManifestError(Exception):
+    """
+    Raised when a repository's ``.rebuildbot.yml`` manifest is invalid.
+    """
+
+    def __init__(self, repo, problem):
+        self.repo = repo
+        self.problem = problem
+
+        self.message = "Invalid .rebuildbot.yml in {r}: {p}".format(
+            r=repo, p=problem)
+        super(ManifestError, self).__init__(self.message)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an external service that is considered
+    unavailable (its :py:class:`~.CircuitBreaker` is open).
+    """
+
+    def __init__(self, service, retry_at):
+        self.service = service
+        self.retry_at = retry_at
+
+        self.message = "{s} is unavailable; not calling it until it " \
+                       "recovers".format(s=service)
+        super(CircuitOpenError, self).__init__(self.message)
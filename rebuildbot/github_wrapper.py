@@ -42,6 +42,12 @@ import datetime
 
 from github import Github
 from github.GithubException import (UnknownObjectException, GithubException)
+from github.Requester import (HTTPSRequestsConnectionClass,
+                              HTTPRequestsConnectionClass)
+
+from .manifest import parse_manifest, MANIFEST_FILE
+from .exceptions import ManifestError
+from .httpsession import HTTPConfig
 
 logger = logging.getLogger(__name__)
 
@@ -51,66 +57,184 @@ class GitHubWrapper(object):
     ReBuildBot wrapper around PyGithub
     """
 
-    def __init__(self, token):
-        """connect to GitHub with the given token"""
+    def __init__(self, token, http=None, base_url=None):
+        """
+        connect to GitHub with the given token
+
+        :param token: GitHub API token
+        :type token: str
+        :param http: shared HTTP settings (timeout and retries) for PyGithub
+        :type http: :py:class:`~.HTTPConfig`
+        :param base_url: base URL of the GitHub API, if not PyGithub's default
+          of ``https://api.github.com``
+        :type base_url: str
+        """
         self.token = token
+        self.base_url = base_url
+        if http is None:
+            http = HTTPConfig()
+        kwargs = {}
+        if base_url is not None:
+            kwargs['base_url'] = base_url
         logger.debug("Connecting to GitHub API")
-        self.github = Github(token)
+        self.github = Github(token, timeout=http.timeout('github'),
+                             retry=http.retry(), **kwargs)
+        self.use_adapter(http)
         logger.debug("Connected to GitHub API")
 
+    def use_adapter(self, http):
+        """
+        Send PyGithub's requests through a pooled
+        :py:class:`~.ServiceHTTPAdapter` from ``http``, so that they share
+        its keep-alive pool and are paced by its rate-limit governor.
+
+        PyGithub has no public hook for this, so the connection class of
+        this instance's (private) Requester is replaced; with a PyGithub
+        version that does not have one, it is left as-is.
+
+        :param http: shared HTTP settings
+        :type http: :py:class:`~.HTTPConfig`
+        """
+        requester = getattr(self.github, '_Github__requester', None)
+        if requester is None or not hasattr(
+                requester, '_Requester__connectionClass'):
+            logger.debug("Unable to configure PyGithub connections")
+            return
+
+        if self.base_url is not None and self.base_url.startswith('http:'):
+            cls = HTTPRequestsConnectionClass
+        else:
+            cls = HTTPSRequestsConnectionClass
+
+        def connection(*args, **kwargs):
+            cnx = cls(*args, **kwargs)
+            cnx.session.mount(cnx.protocol + '://', http.adapter('github'))
+            return cnx
+
+        requester._Requester__connectionClass = connection
+
     def find_projects(self, date_check=True):
         """
         Iterate all GitHub repositories and find any with a .rebuildbot.sh;
         remove from this set any which have had a commit on master in the last
         24 hours. Return the result as a dict, where keys are the repository
-        full name / slug, and values are 2-tuples (HTTPS clone URL,
-        SSH clone URL)
+        full name / slug, and values are 4-tuples (HTTPS clone URL,
+        SSH clone URL, repository size in KB, manifest dict). The manifest is
+        read from the repository's ``.rebuildbot.yml`` (see
+        :py:meth:`~.get_manifest`) in the same pass.
 
         :param date_check: whether or not to skip running local builds on repos
         with a commit to master in the last 24 hours; if True, skip those repos
         :type date_check: bool
-        :returns: dict of repository slug strings to 2-tuples of (HTTPS clone
-        URL string, SSH clone URL string)
+        :returns: dict of repository slug strings to 4-tuples of (HTTPS clone
+        URL string, SSH clone URL string, int size in KB, manifest dict)
         :rtype: dict
         """
-        projects = {}
-        for repo in self.get_repos():
-            if self.repo_commit_in_last_day(repo) and date_check:
-                logger.debug("Skipping repository '%s' - commit on master in "
-                             "last day", repo.full_name)
-                continue
-            try:
-                repo.get_file_contents('.rebuildbot.sh')
-            except UnknownObjectException:
-                logger.debug("Skipping repository '%s' - .rebuildbot.sh not "
-                             "present", repo.full_name)
-                continue
-            projects[repo.full_name] = (repo.clone_url, repo.ssh_url)
+        projects = dict(self.iter_projects(date_check=date_check))
         logger.debug("Found %d repos: %s", len(projects),
                      sorted(list(projects.keys())))
         return projects
 
+    def iter_projects(self, date_check=True):
+        """
+        Generator version of :py:meth:`~.find_projects`; yields
+        (repository slug, 4-tuple) 2-tuples as each repository is inspected,
+        so that callers can start work before all repositories have been
+        checked.
+
+        :param date_check: whether or not to skip repos with a commit to
+          master in the last 24 hours
+        :type date_check: bool
+        :returns: generator of (slug, (HTTPS clone URL, SSH clone URL,
+          size in KB, manifest dict)) tuples
+        """
+        for repo in self.iter_repos():
+            tup = self.inspect_repo(repo, date_check=date_check)
+            if tup is not None:
+                yield (repo.full_name, tup)
+
+    def inspect_repo(self, repo, date_check=True):
+        """
+        Return the (HTTPS clone URL, SSH clone URL, size in KB, manifest
+        dict) 4-tuple for a repository from :py:meth:`~.iter_repos`, or None
+        if it has no .rebuildbot.sh or (if ``date_check`` is True) had a
+        commit to master in the last 24 hours.
+
+        :param repo: the repository to inspect
+        :type repo: :py:class:`github.github.Repository`
+        :param date_check: whether or not to skip repos with a commit to
+          master in the last 24 hours
+        :type date_check: bool
+        :rtype: tuple
+        """
+        if self.repo_commit_in_last_day(repo) and date_check:
+            logger.debug("Skipping repository '%s' - commit on master in "
+                         "last day", repo.full_name)
+            return None
+        try:
+            repo.get_contents('.rebuildbot.sh')
+        except UnknownObjectException:
+            logger.debug("Skipping repository '%s' - .rebuildbot.sh not "
+                         "present", repo.full_name)
+            return None
+        return (repo.clone_url, repo.ssh_url, repo.size,
+                self.get_manifest(repo))
+
     def get_project_config(self, repo_full_name, branch='master'):
         """
-        Given the full name to a repository, return the HTTPS clone URL, and the
-        SSH clone url as a 2-tuple of strings. If the project does not have a
-        .rebuildbot.sh present, return (None, None)
+        Given the full name to a repository, return the HTTPS clone URL, the
+        SSH clone url, the repository size in KB and the manifest dict (see
+        :py:meth:`~.get_manifest`) as a 4-tuple. If the project does not have
+        a .rebuildbot.sh present, return (None, None, None, None)
 
         :param repo_full_name: the full name / slug for the repo
         :type repo_full_name: string
         :param branch_name: the branch name to check
         :type branch_name: string
-        :returns: 2-tuple of (HTTPS clone URL string, SSH clone URL string)
+        :returns: 4-tuple of (HTTPS clone URL string, SSH clone URL string,
+          int size in KB, manifest dict)
         :rtype: tuple
         """
         repo = self.github.get_repo(repo_full_name)
         try:
-            repo.get_file_contents('.rebuildbot.sh', ref=branch)
+            repo.get_contents('.rebuildbot.sh', ref=branch)
         except UnknownObjectException:
             logger.debug("Skipping repository '%s' - .rebuildbot.sh not "
                          "present", repo.full_name)
-            return (None, None)
-        return (repo.clone_url, repo.ssh_url)
+            return (None, None, None, None)
+        return (repo.clone_url, repo.ssh_url, repo.size,
+                self.get_manifest(repo, branch=branch))
+
+    def get_manifest(self, repo, branch=None):
+        """
+        Return the settings from the repository's ``.rebuildbot.yml``
+        manifest (see :py:func:`~.parse_manifest`), or an empty dict if it
+        does not have one or it is invalid.
+
+        :param repo: the repository
+        :type repo: :py:class:`github.Repository.Repository`
+        :param branch: the branch to read the manifest from, if not the
+          default branch
+        :type branch: string
+        :rtype: dict
+        """
+        kwargs = {}
+        if branch is not None:
+            kwargs['ref'] = branch
+        try:
+            content = repo.get_contents(MANIFEST_FILE, **kwargs)
+        except UnknownObjectException:
+            return {}
+        text = content.decoded_content
+        if not isinstance(text, str):
+            text = text.decode('utf-8')
+        try:
+            manifest = parse_manifest(text, repo.full_name)
+        except ManifestError as ex:
+            logger.warning("%s; ignoring it", ex.message)
+            return {}
+        logger.debug("Repository %s manifest: %s", repo.full_name, manifest)
+        return manifest
 
     def get_repos(self):
         """
@@ -121,15 +245,22 @@ class GitHubWrapper(object):
         :returns: list of :py:class:`github.github.Repository` objects
         :rtype: list of :py:class:`github.github.Repository`
         """
-        repos = []
+        return list(self.iter_repos())
+
+    def iter_repos(self):
+        """
+        Generator version of :py:meth:`~.get_repos`; yields each repository as
+        it is read from the paginated API response.
+
+        :returns: generator of :py:class:`github.github.Repository` objects
+        """
         user = self.github.get_user()
         for repo in user.get_repos():
             if repo.owner.login != user.login:
                 logger.debug("Skipping repository owned by another user: %s",
                              repo.full_name)
                 continue
-            repos.append(repo)
-        return repos
+            yield repo
 
     def repo_commit_in_last_day(self, repo_obj, branch_name=None):
         """
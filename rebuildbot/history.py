@@ -0,0 +1,389 @@
+"""
+rebuildbot/history.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_DIR = '~/.rebuildbot'  # where persistent state is stored
+MAX_RUNS = 30  # maximum number of past runs to keep per repository
+DT_FORMAT = '%Y-%m-%dT%H:%M:%S'  # format for datetimes stored in history
+DEFAULT_REGRESSION_WINDOW = 10  # past runs to compare build durations to
+DEFAULT_REGRESSION_THRESHOLD = 20  # minimum % slowdown to flag
+MIN_REGRESSION_RUNS = 5  # minimum past runs needed to detect a slowdown
+REGRESSION_SIGMAS = 3  # robust z-score above which a slowdown is significant
+
+
+class BuildHistory(object):
+    """
+    Persistent, JSON-backed record of the outcome of past builds of each
+    repository, used to inform scheduling of future runs. Clone protocols
+    are recorded from prefetch and build threads, so changes to the data and
+    saving it are serialized by a lock.
+    """
+
+    def __init__(self, path):
+        """
+        Load build history from ``path``, if it exists.
+
+        :param path: path to the JSON history file
+        :type path: str
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        """
+        Load and return the history data from ``self.path``. If the file does
+        not exist or cannot be parsed, return empty history.
+
+        :rtype: dict
+        """
+        if not os.path.exists(self.path):
+            logger.debug("No build history found at %s", self.path)
+            return {'repos': {}}
+        try:
+            with open(self.path, 'r') as fh:
+                data = json.load(fh)
+        except ValueError:
+            logger.warning("Unable to parse build history at %s; ignoring it",
+                           self.path, exc_info=True)
+            return {'repos': {}}
+        data.setdefault('repos', {})
+        logger.debug("Loaded build history for %d repos from %s",
+                     len(data['repos']), self.path)
+        return data
+
+    def save(self):
+        """
+        Write the history data to ``self.path``. The file is written to a
+        temporary path and then renamed into place, so an interrupted write
+        never leaves a truncated history file.
+        """
+        dirname = os.path.dirname(self.path)
+        if dirname != '' and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_path = self.path + '.tmp'
+        with self.lock:
+            content = json.dumps(self.data, sort_keys=True, indent=2)
+        with open(tmp_path, 'w') as fh:
+            fh.write(content)
+        os.rename(tmp_path, self.path)
+        logger.debug("Wrote build history to %s", self.path)
+
+    def runs_for(self, slug):
+        """
+        Return the list of recorded runs for a repository, oldest first. Each
+        run is a dict with keys ``date``, ``local_duration``,
+        ``local_return_code``, ``travis_duration`` and ``travis_state``; any
+        of these other than ``date`` may be None. Runs recorded since local
+        build resource usage was captured also have ``local_cpu`` (user plus
+        system CPU seconds) and ``local_max_rss_kb``.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: list
+        """
+        return self.data['repos'].get(slug, {}).get('runs', [])
+
+    def record_build(self, build_info, dt):
+        """
+        Record the outcome of one repository's builds in this run.
+
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :param dt: the time of this run
+        :type dt: datetime.datetime
+        """
+        run = {
+            'date': dt.strftime(DT_FORMAT),
+            'local_duration': None,
+            'local_return_code': None,
+            'travis_duration': None,
+            'travis_state': None,
+        }
+        if (
+                build_info.local_build_finished and
+                build_info.local_build_duration is not None
+        ):
+            run['local_duration'] = \
+                build_info.local_build_duration.total_seconds()
+            run['local_return_code'] = build_info.local_build_return_code
+            usage = build_info.local_build_rusage
+            if usage and 'user_cpu' in usage:
+                run['local_cpu'] = usage['user_cpu'] + usage['sys_cpu']
+                run['local_max_rss_kb'] = usage['max_rss_kb']
+        if build_info.travis_build_finished and \
+                build_info.travis_build_state is not None:
+            run['travis_duration'] = build_info.travis_build_duration
+            run['travis_state'] = build_info.travis_build_state
+        if run['local_duration'] is None and run['travis_state'] is None:
+            return
+        with self.lock:
+            repo = self.data['repos'].setdefault(build_info.slug, {})
+            runs = repo.setdefault('runs', [])
+            runs.append(run)
+            repo['runs'] = runs[-MAX_RUNS:]
+            if run_succeeded(run):
+                repo['last_success'] = run['date']
+
+    def record_builds(self, builds, dt):
+        """
+        Record the outcome of every build in ``builds``.
+
+        :param builds: dict of repository slug to BuildInfo
+        :type builds: dict
+        :param dt: the time of this run
+        :type dt: datetime.datetime
+        """
+        for slug, build_info in sorted(builds.items()):
+            self.record_build(build_info, dt)
+
+    def local_durations(self, slug):
+        """
+        Return the list of past local build durations for a repository, in
+        seconds, oldest first.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: list
+        """
+        return [
+            r['local_duration'] for r in self.runs_for(slug)
+            if r.get('local_duration') is not None
+        ]
+
+    def expected_local_duration(self, slug):
+        """
+        Return the expected duration of a local build of ``slug`` in seconds,
+        as the median of previously-recorded durations, or None if there is
+        no history for it.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: float
+        """
+        return median(self.local_durations(slug))
+
+    def passed_durations(self, slug, kind):
+        """
+        Return the list of past durations in seconds, oldest first, of the
+        ``kind`` ("local" or "travis") builds of a repository that passed.
+        Failed builds often stop early, so they are not comparable.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param kind: "local" or "travis"
+        :type kind: str
+        :rtype: list
+        """
+        res = []
+        for r in self.runs_for(slug):
+            if r.get(kind + '_duration') is None:
+                continue
+            if kind == 'local' and r.get('local_return_code') != 0:
+                continue
+            if kind == 'travis' and r.get('travis_state') != 'passed':
+                continue
+            res.append(r[kind + '_duration'])
+        return res
+
+    def find_regressions(self, build_info,
+                         window=DEFAULT_REGRESSION_WINDOW,
+                         threshold=DEFAULT_REGRESSION_THRESHOLD):
+        """
+        Compare the durations of this run's passed local and Travis builds of
+        a repository to those of its last ``window`` passed builds, and
+        return any that are significantly slower (see
+        :py:func:`~.detect_regression`). This must be called before the run
+        is recorded with :py:meth:`~.record_build`.
+
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :param window: number of past runs to compare to
+        :type window: int
+        :param threshold: minimum slowdown to report, in percent
+        :type threshold: float
+        :returns: dict of build kind ("local" or "travis") to a 2-tuple of
+          (float percent change, float median past duration in seconds)
+        :rtype: dict
+        """
+        current = {}
+        if (
+                build_info.local_build_finished and
+                build_info.local_build_return_code == 0 and
+                build_info.local_build_duration is not None
+        ):
+            current['local'] = build_info.local_build_duration.total_seconds()
+        if (
+                build_info.travis_build_finished and
+                build_info.travis_build_state == 'passed' and
+                build_info.travis_build_duration is not None
+        ):
+            current['travis'] = build_info.travis_build_duration
+        res = {}
+        for kind, duration in sorted(current.items()):
+            past = self.passed_durations(build_info.slug, kind)[-window:]
+            pct = detect_regression(duration, past, threshold)
+            if pct is not None:
+                res[kind] = (pct, median(past))
+        return res
+
+    def last_success(self, slug):
+        """
+        Return the time of the last run in which the builds of ``slug``
+        succeeded (see :py:func:`~.run_succeeded`), or None if they never
+        have. This is kept separately from the list of runs, so it is not
+        lost when old runs are discarded.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: datetime.datetime
+        """
+        dt = self.data['repos'].get(slug, {}).get('last_success', None)
+        if dt is None:
+            return None
+        return datetime.strptime(dt, DT_FORMAT)
+
+    def clone_protocol(self, slug, host=None):
+        """
+        Return the clone protocol ("ssh" or "https") that last worked for
+        ``slug``, or if it has never been cloned, the one that last worked for
+        any repository on ``host``; None if neither is known.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param host: the host name the repository is cloned from
+        :type host: str
+        :rtype: str
+        """
+        proto = self.data['repos'].get(slug, {}).get('clone_protocol', None)
+        if proto is not None or host is None:
+            return proto
+        return self.data.get('hosts', {}).get(host, {}).get(
+            'clone_protocol', None)
+
+    def set_clone_protocol(self, slug, host, proto):
+        """
+        Record that cloning ``slug`` from ``host`` via ``proto`` worked.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param host: the host name the repository was cloned from
+        :type host: str
+        :param proto: the protocol that worked, "ssh" or "https"
+        :type proto: str
+        """
+        with self.lock:
+            self.data['repos'].setdefault(slug, {})['clone_protocol'] = proto
+            hosts = self.data.setdefault('hosts', {})
+            hosts.setdefault(host, {})['clone_protocol'] = proto
+
+
+def run_succeeded(run):
+    """
+    Return whether a recorded run was successful; that is, nothing in it
+    failed and at least one of the local or Travis builds passed.
+
+    :param run: a run, as returned by :py:meth:`~.BuildHistory.runs_for`
+    :type run: dict
+    :rtype: bool
+    """
+    local_ok = run.get('local_return_code') == 0
+    travis_ok = run.get('travis_state') == 'passed'
+    if run.get('local_duration') is not None and not local_ok:
+        return False
+    if run.get('travis_state') is not None and not travis_ok:
+        return False
+    return local_ok or travis_ok
+
+
+def median(values):
+    """
+    Return the median of a list of numbers, or None if it is empty.
+
+    :param values: numbers to find the median of
+    :type values: list
+    :rtype: float
+    """
+    if len(values) == 0:
+        return None
+    s = sorted(values)
+    mid = len(s) // 2
+    if len(s) % 2 == 1:
+        return s[mid]
+    return (s[mid - 1] + s[mid]) / 2.0
+
+
+def detect_regression(duration, past, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Return the percentage by which ``duration`` exceeds the median of the
+    ``past`` durations if it is a significant slowdown, else None. A
+    slowdown is significant if there are at least
+    :py:const:`~.MIN_REGRESSION_RUNS` past durations, it is at least
+    ``threshold`` percent, and ``duration`` is more than
+    :py:const:`~.REGRESSION_SIGMAS` robust standard deviations (estimated
+    from the median absolute deviation, so one unusually slow past run does
+    not mask later ones) above the median.
+
+    :param duration: the current duration
+    :type duration: float
+    :param past: past durations
+    :type past: list
+    :param threshold: minimum slowdown to report, in percent
+    :type threshold: float
+    :rtype: float
+    """
+    if len(past) < MIN_REGRESSION_RUNS:
+        return None
+    med = median(past)
+    if med <= 0:
+        return None
+    spread = 1.4826 * median([abs(x - med) for x in past])
+    if duration <= med + (REGRESSION_SIGMAS * spread):
+        return None
+    pct = (duration - med) * 100.0 / med
+    if pct < threshold:
+        return None
+    return pct
@@ -0,0 +1,229 @@
+"""
+rebuildbot/httpsession.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import random
+import logging
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .defaults import DEFAULT_RETRIES, DEFAULT_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF = 0.5  # base of the exponential backoff, in seconds
+DEFAULT_POOL_SIZE = 10  # connections kept alive per host
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_METHODS = ['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'TRACE']
+"""idempotent methods; POSTs (i.e. build triggers) are never retried"""
+
+
+class JitteredRetry(Retry):
+    """
+    :py:class:`urllib3.util.retry.Retry` with "full jitter" - each backoff is
+    a random time between zero and the exponential backoff, so that many
+    clients retrying at once do not all hit the service at the same time.
+    """
+
+    def get_backoff_time(self):
+        """
+        Return a random time up to the exponential backoff for the number
+        of consecutive errors so far.
+
+        :rtype: float
+        """
+        backoff = super(JitteredRetry, self).get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return random.uniform(0, backoff)
+
+
+class ServiceHTTPAdapter(HTTPAdapter):
+    """
+    :py:class:`requests.adapters.HTTPAdapter` for one service, that applies a
+    default timeout to every request that does not specify one and, if given
+    a :py:class:`~.RateLimiter`, waits for it before each request and feeds
+    it each response.
+    """
+
+    def __init__(self, service=None, timeout=None, governor=None, **kwargs):
+        """
+        :param service: service name
+        :type service: str
+        :param timeout: default timeout in seconds
+        :type timeout: float
+        :param governor: rate-limit governor shared by all clients
+        :type governor: :py:class:`~.RateLimiter`
+        """
+        self.service = service
+        self.timeout = timeout
+        self.governor = governor
+        super(ServiceHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.governor is None:
+            return super(ServiceHTTPAdapter, self).send(request, **kwargs)
+        self.governor.acquire(self.service)
+        res = super(ServiceHTTPAdapter, self).send(request, **kwargs)
+        self.governor.observe(self.service, res.status_code, res.headers)
+        return res
+
+
+class HTTPConfig(object):
+    """
+    Shared HTTP settings - connection pool size, retries with jittered
+    exponential backoff on connection errors and 429/5xx responses, and
+    per-service timeouts - applied to the Travis, GitHub and S3 clients.
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, timeouts={},
+                 pool_size=DEFAULT_POOL_SIZE, backoff=DEFAULT_BACKOFF,
+                 governor=None):
+        """
+        :param retries: maximum number of retries of a failed request
+        :type retries: int
+        :param timeouts: dict of service name ('travis', 'github' or 's3')
+          to timeout in seconds, overriding :py:const:`~.DEFAULT_TIMEOUTS`
+        :type timeouts: dict
+        :param pool_size: number of connections to keep alive per host;
+          this should be at least the number of concurrent requests
+        :type pool_size: int
+        :param backoff: base of the exponential backoff between retries, in
+          seconds
+        :type backoff: float
+        :param governor: rate-limit governor to pace requests with
+        :type governor: :py:class:`~.RateLimiter`
+        """
+        self.retries = retries
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts)
+        self.pool_size = max(pool_size, 1)
+        self.backoff = backoff
+        self.governor = governor
+
+    def timeout(self, service):
+        """
+        Return the timeout in seconds for the named service.
+
+        :param service: service name
+        :type service: str
+        :rtype: float
+        """
+        return self.timeouts[service]
+
+    def retry(self):
+        """
+        Return a new :py:class:`~.JitteredRetry` for these settings.
+
+        :rtype: :py:class:`~.JitteredRetry`
+        """
+        kwargs = {
+            'total': self.retries,
+            'backoff_factor': self.backoff,
+            'status_forcelist': RETRY_STATUSES,
+            'raise_on_status': False,
+        }
+        try:
+            return JitteredRetry(allowed_methods=RETRY_METHODS, **kwargs)
+        except TypeError:
+            # urllib3 < 1.26
+            return JitteredRetry(method_whitelist=RETRY_METHODS, **kwargs)
+
+    def adapter(self, service):
+        """
+        Return a new pooled, retrying :py:class:`~.ServiceHTTPAdapter` for
+        the named service.
+
+        :param service: service name
+        :type service: str
+        :rtype: :py:class:`~.ServiceHTTPAdapter`
+        """
+        return ServiceHTTPAdapter(service=service,
+                                  timeout=self.timeout(service),
+                                  governor=self.governor,
+                                  pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size,
+                                  max_retries=self.retry())
+
+    def configure_session(self, session, service):
+        """
+        Mount pooled, retrying adapters for the named service on an existing
+        :py:class:`requests.Session`; return the session.
+
+        :param session: the session to configure
+        :type session: :py:class:`requests.Session`
+        :param service: service name
+        :type service: str
+        :rtype: :py:class:`requests.Session`
+        """
+        adapter = self.adapter(service)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        logger.debug("Configured %s HTTP session: pool size %d, %d retries, "
+                     "timeout %ss", service, self.pool_size, self.retries,
+                     self.timeout(service))
+        return session
+
+    def new_session(self, service):
+        """
+        Return a new :py:class:`requests.Session` configured for the named
+        service.
+
+        :param service: service name
+        :type service: str
+        :rtype: :py:class:`requests.Session`
+        """
+        return self.configure_session(Session(), service)
+
+    def configure_boto(self, conn):
+        """
+        Apply the retry count and S3 timeout to a boto connection. boto
+        keeps its own connection pool, and already retries 5xx responses and
+        connection errors with jittered exponential backoff.
+
+        :param conn: the boto connection
+        :type conn: :py:class:`boto.connection.AWSAuthConnection`
+        :returns: the connection
+        """
+        conn.num_retries = self.retries
+        conn.http_connection_kwargs['timeout'] = self.timeout('s3')
+        return conn
@@ -0,0 +1,1077 @@
+"""
+rebuildbot/loadtest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import datetime
+import tempfile
+import threading
+import multiprocessing
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+try:
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from socketserver import ThreadingMixIn
+
+try:
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote, urlencode
+except ImportError:
+    from urllib.parse import urlparse, parse_qs, unquote, urlencode
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import requests
+from git import Repo, Actor
+from boto.s3.connection import S3Connection, OrdinaryCallingFormat
+
+from .bot import ReBuildBot
+from .github_wrapper import GitHubWrapper
+from .travis import Travis
+from .logbuffer import LogBuffer
+
+logger = logging.getLogger(__name__)
+
+LOGIN = 'loadtest'  # owner of all synthetic repositories
+BUCKET_NAME = 'rebuildbot-loadtest'
+GITHUB_TOKEN = 'loadtest-github-token'
+TRAVIS_TOKEN = 'loadtest-travis-token'
+OLD_DATE = '2015-01-01T00:00:00Z'  # last commit / build of every repo
+GITHUB_RATE_LIMIT = 5000  # requests per hour, as for an authenticated user
+SERVICES = ['github', 'travis', 's3']
+
+DEFAULT_REPOS = 1000
+DEFAULT_LOCAL_FRACTION = 0.02
+DEFAULT_TRAVIS_FRACTION = 0.5
+
+BUILD_SCRIPT = """#!/bin/sh
+echo "rebuildbot load test build of $(basename $(pwd))"
+sleep %s
+"""
+
+
+class Scenario(object):
+    """
+    The synthetic repositories, and the behavior of the fake services, for a
+    load test. All randomness comes from ``seed``, so a scenario is
+    repeatable.
+    """
+
+    def __init__(self, repos=DEFAULT_REPOS,
+                 local_fraction=DEFAULT_LOCAL_FRACTION,
+                 travis_fraction=DEFAULT_TRAVIS_FRACTION, latencies=None,
+                 failure_rates=None, travis_build_secs=0, local_build_secs=0,
+                 seed=1):
+        """
+        :param repos: number of synthetic repositories
+        :type repos: int
+        :param local_fraction: fraction of the repositories that have a
+          ``.rebuildbot.sh``, i.e. are built locally
+        :type local_fraction: float
+        :param travis_fraction: fraction of the repositories that build on
+          Travis
+        :type travis_fraction: float
+        :param latencies: dict of service name to seconds added to each of
+          its responses
+        :type latencies: dict
+        :param failure_rates: dict of service name to the fraction of its
+          requests that fail with a 503 response
+        :type failure_rates: dict
+        :param travis_build_secs: seconds each triggered Travis build runs for
+        :type travis_build_secs: int
+        :param local_build_secs: seconds each local build script runs for
+        :type local_build_secs: int
+        :param seed: random seed
+        :type seed: int
+        """
+        self.latencies = latencies or {}
+        self.failure_rates = failure_rates or {}
+        self.travis_build_secs = travis_build_secs
+        self.local_build_secs = local_build_secs
+        self.seed = seed
+        rng = random.Random(seed)
+        self.repos = []
+        for i in range(repos):
+            self.repos.append({
+                'id': i + 1,
+                'name': 'repo%05d' % i,
+                'slug': '%s/repo%05d' % (LOGIN, i),
+                'local': rng.random() < local_fraction,
+                'travis': rng.random() < travis_fraction,
+            })
+        self.by_slug = dict((r['slug'], r) for r in self.repos)
+
+    def as_dict(self):
+        """
+        Return a summary of the scenario, for the report.
+
+        :rtype: dict
+        """
+        return {
+            'repos': len(self.repos),
+            'local_repos': len([r for r in self.repos if r['local']]),
+            'travis_repos': len([r for r in self.repos if r['travis']]),
+            'latencies': self.latencies,
+            'failure_rates': self.failure_rates,
+            'travis_build_secs': self.travis_build_secs,
+            'local_build_secs': self.local_build_secs,
+            'seed': self.seed,
+        }
+
+
+class Response(object):
+    """An HTTP response from a :py:class:`~.FakeService`"""
+
+    def __init__(self, status, body=b'', headers=None):
+        """
+        :param status: HTTP status code
+        :type status: int
+        :param body: response body; a dict or list is sent as JSON
+        :param headers: response headers
+        :type headers: dict
+        """
+        self.status = status
+        self.headers = headers or {}
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            self.headers.setdefault('Content-Type', 'application/json')
+        elif not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.body = body
+
+
+class FakeService(object):
+    """
+    Base class for the fake services. Requests are matched against
+    ``self.routes``, a list of (method, regex, name) 3-tuples; the handler
+    for a route is the ``route_<name>`` method, called with the request and
+    the regex groups. Every request is counted by route, and delayed and
+    failed according to the :py:class:`~.Scenario`.
+    """
+
+    name = None
+    routes = []
+
+    def __init__(self, scenario):
+        """
+        :param scenario: the load test scenario
+        :type scenario: :py:class:`~.Scenario`
+        """
+        self.scenario = scenario
+        self.latency = scenario.latencies.get(self.name, 0)
+        self.failure_rate = scenario.failure_rates.get(self.name, 0)
+        self.rng = random.Random(scenario.seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.failures = 0
+        self.base_url = None
+        self.compiled = [
+            (m, re.compile('^' + r + '$'), n) for m, r, n in self.routes
+        ]
+
+    def stats(self):
+        """
+        Return this service's request counts.
+
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'requests': sum(self.counts.values()),
+                'failures': self.failures,
+                'by_route': dict(self.counts),
+            }
+
+    def handle(self, method, path, headers, body):
+        """
+        Handle one request; return a :py:class:`~.Response`.
+
+        :param method: HTTP method
+        :type method: str
+        :param path: request path, including any query string
+        :type path: str
+        :param headers: request headers
+        :type headers: dict
+        :param body: request body
+        :type body: bytes
+        :rtype: :py:class:`~.Response`
+        """
+        url = urlparse(path)
+        if url.path == '/_stats':
+            return Response(200, self.stats())
+        query = dict(
+            (k, v[0]) for k, v in parse_qs(url.query, True).items()
+        )
+        for m, regex, name in self.compiled:
+            match = regex.match(url.path)
+            if m != method or match is None:
+                continue
+            key = '%s %s' % (method, name)
+            with self.lock:
+                self.counts[key] = self.counts.get(key, 0) + 1
+                fail = self.rng.random() < self.failure_rate
+                if fail:
+                    self.failures += 1
+            if self.latency > 0:
+                time.sleep(self.latency)
+            if fail:
+                return Response(503, {'message': 'load test failure'})
+            req = {'query': query, 'headers': headers, 'body': body}
+            return getattr(self, 'route_' + name)(req, *match.groups())
+        with self.lock:
+            key = '%s (unknown)' % method
+            self.counts[key] = self.counts.get(key, 0) + 1
+        logger.warning("%s: no route for %s %s", self.name, method, path)
+        return Response(404, {'message': 'Not Found'})
+
+    def repo(self, slug):
+        """
+        Return the scenario's repository dict for ``slug``, or None.
+
+        :param slug: repository slug
+        :type slug: str
+        :rtype: dict
+        """
+        return self.scenario.by_slug.get(unquote(slug), None)
+
+
+class FakeGitHub(FakeService):
+    """
+    The GitHub API endpoints used by :py:class:`~.GitHubWrapper`, and a
+    read-only git server for cloning, which serves every repository from one
+    template repository over git's "dumb" HTTP protocol.
+    """
+
+    name = 'github'
+    routes = [
+        ('GET', r'/user', 'user'),
+        ('GET', r'/user/repos', 'user_repos'),
+        ('GET', r'/repos/([^/]+)/([^/]+)', 'repo'),
+        ('GET', r'/repos/([^/]+)/([^/]+)/branches/([^/]+)', 'branch'),
+        ('GET', r'/repos/([^/]+)/([^/]+)/contents/(.+)', 'contents'),
+        ('GET', r'/git/[^/]+/[^/]+\.git/(.+)', 'git'),
+    ]
+
+    def __init__(self, scenario, git_dir=None):
+        """
+        :param scenario: the load test scenario
+        :type scenario: :py:class:`~.Scenario`
+        :param git_dir: the template repository's ``.git`` directory
+        :type git_dir: str
+        """
+        super(FakeGitHub, self).__init__(scenario)
+        self.git_dir = git_dir
+
+    def handle(self, method, path, headers, body):
+        res = super(FakeGitHub, self).handle(method, path, headers, body)
+        with self.lock:
+            used = sum(
+                v for k, v in self.counts.items() if not k.endswith(' git')
+            )
+        res.headers['X-RateLimit-Limit'] = str(GITHUB_RATE_LIMIT)
+        res.headers['X-RateLimit-Remaining'] = str(
+            max(0, GITHUB_RATE_LIMIT - used))
+        res.headers['X-RateLimit-Reset'] = str(int(time.time()) + 3600)
+        return res
+
+    def repo_json(self, repo):
+        """
+        Return the API representation of a repository.
+
+        :param repo: scenario repository dict
+        :type repo: dict
+        :rtype: dict
+        """
+        return {
+            'id': repo['id'],
+            'name': repo['name'],
+            'full_name': repo['slug'],
+            'owner': {'login': LOGIN, 'id': 1, 'type': 'User'},
+            'url': '%s/repos/%s' % (self.base_url, repo['slug']),
+            'clone_url': '%s/git/%s.git' % (self.base_url, repo['slug']),
+            'ssh_url': None,
+            'size': 100,
+            'default_branch': 'master',
+        }
+
+    def route_user(self, req):
+        return Response(200, {
+            'login': LOGIN, 'id': 1, 'type': 'User',
+            'url': self.base_url + '/user',
+        })
+
+    def route_user_repos(self, req):
+        page = int(req['query'].get('page', 1))
+        per_page = int(req['query'].get('per_page', 30))
+        repos = self.scenario.repos
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(repos):
+            q = dict(req['query'])
+            q['page'] = page + 1
+            headers['Link'] = '<%s/user/repos?%s>; rel="next"' % (
+                self.base_url, urlencode(sorted(q.items())))
+        return Response(
+            200, [self.repo_json(r) for r in repos[start:start + per_page]],
+            headers=headers
+        )
+
+    def route_repo(self, req, owner, name):
+        repo = self.repo(owner + '/' + name)
+        if repo is None:
+            return Response(404, {'message': 'Not Found'})
+        return Response(200, self.repo_json(repo))
+
+    def route_branch(self, req, owner, name, branch):
+        return Response(200, {
+            'name': branch,
+            'commit': {
+                'sha': 'a' * 40,
+                'commit': {'author': {'name': LOGIN, 'date': OLD_DATE}},
+            },
+        })
+
+    def route_contents(self, req, owner, name, path):
+        repo = self.repo(owner + '/' + name)
+        if repo is None or not repo['local'] or path != '.rebuildbot.sh':
+            return Response(404, {'message': 'Not Found'})
+        return Response(200, {
+            'type': 'file', 'encoding': 'base64', 'name': path, 'path': path,
+            'content': '', 'size': 0, 'sha': 'b' * 40,
+        })
+
+    def route_git(self, req, path):
+        root = os.path.normpath(self.git_dir) + os.sep
+        full = os.path.normpath(os.path.join(root, path))
+        if not full.startswith(root) or not os.path.isfile(full):
+            return Response(404, 'Not Found')
+        with open(full, 'rb') as fh:
+            return Response(200, fh.read(),
+                            headers={'Content-Type': 'text/plain'})
+
+
+class FakeTravis(FakeService):
+    """
+    The Travis v2 (TravisPy) and v3 API endpoints used by
+    :py:class:`~.Travis`. Every Travis repository starts with one old,
+    passed build; a triggered build starts at once and passes after the
+    scenario's ``travis_build_secs``.
+    """
+
+    name = 'travis'
+    routes = [
+        ('POST', r'/auth/github', 'auth'),
+        ('GET', r'/users/', 'user'),
+        ('GET', r'/repos', 'repos'),
+        ('GET', r'/repos/([^/]+)/([^/]+)', 'repo'),
+        ('GET', r'/builds/(\d+)', 'build'),
+        ('GET', r'/builds', 'builds'),
+        ('GET', r'/repo/([^/]+)/builds', 'repo_builds'),
+        ('POST', r'/repo/([^/]+)/requests', 'trigger'),
+        ('POST', r'/build/(\d+)/cancel', 'cancel'),
+    ]
+
+    def __init__(self, scenario):
+        super(FakeTravis, self).__init__(scenario)
+        self.builds = {}
+        self.last_build = {}
+        self.next_id = 1
+        for repo in scenario.repos:
+            if repo['travis']:
+                self.add_build(repo, 0, 'passed', time.time() - 86400 * 365)
+
+    def add_build(self, repo, duration, state=None, started=None,
+                  message='initial build'):
+        """
+        Add a build of ``repo``; return its ID. Call with ``self.lock`` held,
+        except from the constructor.
+
+        :param repo: scenario repository dict
+        :type repo: dict
+        :param duration: seconds the build runs for
+        :type duration: int
+        :param state: fixed state of the build, or None to derive it from
+          the time
+        :type state: str
+        :param started: start time, or None for now
+        :type started: float
+        :param message: commit message
+        :type message: str
+        :rtype: int
+        """
+        build_id = self.next_id
+        self.next_id += 1
+        self.builds[build_id] = {
+            'id': build_id, 'slug': repo['slug'], 'repo_id': repo['id'],
+            'number': str(build_id), 'state': state, 'duration': duration,
+            'started': started or time.time(), 'message': message,
+        }
+        self.last_build[repo['slug']] = build_id
+        return build_id
+
+    def state(self, build):
+        """
+        Return the current state of a build.
+
+        :param build: build dict
+        :type build: dict
+        :rtype: str
+        """
+        if build['state'] is not None:
+            return build['state']
+        if time.time() - build['started'] >= build['duration']:
+            return 'passed'
+        return 'started'
+
+    def v2_build(self, build):
+        """
+        Return the v2 API representation of a build.
+
+        :param build: build dict
+        :type build: dict
+        :rtype: dict
+        """
+        state = self.state(build)
+        started = datetime.datetime.utcfromtimestamp(build['started'])
+        finished = None
+        if state not in ['created', 'started']:
+            finished = (started + datetime.timedelta(
+                seconds=build['duration'])).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return {
+            'id': build['id'], 'repository_id': build['repo_id'],
+            'commit_id': build['id'], 'number': build['number'],
+            'pull_request': False, 'config': {}, 'state': state,
+            'started_at': started.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'finished_at': finished, 'duration': build['duration'],
+            'job_ids': [],
+        }
+
+    def v3_build(self, build):
+        """
+        Return the v3 API representation of a build.
+
+        :param build: build dict
+        :type build: dict
+        :rtype: dict
+        """
+        return {
+            '@type': 'build', 'id': build['id'], 'number': build['number'],
+            'state': self.state(build), 'duration': build['duration'],
+            'event_type': 'api', 'repository': {'slug': build['slug']},
+            'commit': {'message': build['message']},
+        }
+
+    def v2_repo(self, repo):
+        """
+        Return the v2 API representation of a repository.
+
+        :param repo: scenario repository dict
+        :type repo: dict
+        :rtype: dict
+        """
+        build = self.v2_build(self.builds[self.last_build[repo['slug']]])
+        return {
+            'id': repo['id'], 'slug': repo['slug'], 'description': '',
+            'active': True, 'last_build_id': build['id'],
+            'last_build_number': build['number'],
+            'last_build_state': build['state'],
+            'last_build_duration': build['duration'],
+            'last_build_started_at': build['started_at'],
+            'last_build_finished_at': build['finished_at'],
+        }
+
+    def route_auth(self, req):
+        return Response(200, {'access_token': TRAVIS_TOKEN})
+
+    def route_user(self, req):
+        return Response(200, {'user': {
+            'id': 1, 'login': LOGIN, 'name': LOGIN,
+            'email': LOGIN + '@example.com',
+        }})
+
+    def route_repos(self, req):
+        with self.lock:
+            repos = [
+                self.v2_repo(r) for r in self.scenario.repos if r['travis']
+            ]
+        return Response(200, {'repos': repos})
+
+    def route_repo(self, req, owner, name):
+        repo = self.repo(owner + '/' + name)
+        if repo is None or not repo['travis']:
+            return Response(404, {'file': 'not found'})
+        with self.lock:
+            return Response(200, {'repo': self.v2_repo(repo)})
+
+    def route_build(self, req, build_id):
+        with self.lock:
+            build = self.builds.get(int(build_id), None)
+            if build is None:
+                return Response(404, {'file': 'not found'})
+            return Response(200, {'build': self.v2_build(build)})
+
+    def route_builds(self, req):
+        limit = int(req['query'].get('limit', 100))
+        offset = int(req['query'].get('offset', 0))
+        with self.lock:
+            ids = sorted(self.builds.keys(), reverse=True)
+            page = [self.v3_build(self.builds[i])
+                    for i in ids[offset:offset + limit]]
+        is_last = offset + limit >= len(ids)
+        pagination = {'is_last': is_last, 'next': None}
+        if not is_last:
+            pagination['next'] = {
+                '@href': '/builds?limit=%d&offset=%d&sort_by=id:desc' % (
+                    limit, offset + limit)
+            }
+        return Response(200, {
+            '@type': 'builds', 'builds': page, '@pagination': pagination
+        })
+
+    def route_repo_builds(self, req, slug):
+        states = req['query'].get('state', '').split(',')
+        with self.lock:
+            builds = [
+                self.v3_build(b) for b in self.builds.values()
+                if b['slug'] == unquote(slug)
+            ]
+        builds = sorted(
+            [b for b in builds if b['state'] in states or states == ['']],
+            key=lambda b: b['id'], reverse=True
+        )
+        return Response(200, {'@type': 'builds', 'builds': builds,
+                              '@pagination': {'is_last': True}})
+
+    def route_trigger(self, req, slug):
+        repo = self.repo(slug)
+        if repo is None or not repo['travis']:
+            return Response(404, {'error_message': 'repository not found'})
+        message = json.loads(req['body'].decode('utf-8'))['request'].get(
+            'message', '')
+        with self.lock:
+            self.add_build(repo, self.scenario.travis_build_secs,
+                           message=message)
+        return Response(202, {'@type': 'pending'})
+
+    def route_cancel(self, req, build_id):
+        with self.lock:
+            build = self.builds.get(int(build_id), None)
+            if build is None:
+                return Response(404, {'error_message': 'build not found'})
+            build['state'] = 'canceled'
+        return Response(202, {'@type': 'pending'})
+
+
+class FakeS3(FakeService):
+    """
+    The path-style S3 endpoints used by boto to check the bucket, find its
+    location, and upload and list the reports. Objects are kept in memory.
+    """
+
+    name = 's3'
+    routes = [
+        ('HEAD', r'/([^/]+)/?', 'head_bucket'),
+        ('GET', r'/([^/]+)/?', 'get_bucket'),
+        ('PUT', r'/([^/]+)/(.+)', 'put_object'),
+        ('GET', r'/([^/]+)/(.+)', 'get_object'),
+    ]
+
+    def __init__(self, scenario):
+        super(FakeS3, self).__init__(scenario)
+        self.objects = {}
+
+    def route_head_bucket(self, req, bucket):
+        if bucket != BUCKET_NAME:
+            return Response(404)
+        return Response(200)
+
+    def route_get_bucket(self, req, bucket):
+        if bucket != BUCKET_NAME:
+            return Response(404, '<Error><Code>NoSuchBucket</Code></Error>')
+        ns = 'http://s3.amazonaws.com/doc/2006-03-01/'
+        if 'location' in req['query']:
+            return Response(200, '<?xml version="1.0" encoding="UTF-8"?>'
+                                 '<LocationConstraint xmlns="%s"/>' % ns)
+        prefix = req['query'].get('prefix', '')
+        max_keys = int(req['query'].get('max-keys', 1000))
+        with self.lock:
+            keys = sorted(k for k in self.objects if k.startswith(prefix))
+        contents = ''.join(
+            '<Contents><Key>%s</Key><Size>%d</Size>'
+            '<LastModified>2015-01-01T00:00:00.000Z</LastModified>'
+            '<ETag>"%s"</ETag></Contents>' % (
+                k, len(self.objects[k]), hashlib.md5(
+                    self.objects[k]).hexdigest())
+            for k in keys[:max_keys]
+        )
+        return Response(200, '<?xml version="1.0" encoding="UTF-8"?>'
+                             '<ListBucketResult xmlns="%s"><Name>%s</Name>'
+                             '<Prefix>%s</Prefix><MaxKeys>%d</MaxKeys>'
+                             '<IsTruncated>false</IsTruncated>%s'
+                             '</ListBucketResult>' % (
+                                 ns, bucket, prefix, max_keys, contents))
+
+    def route_put_object(self, req, bucket, key):
+        with self.lock:
+            self.objects[unquote(key)] = req['body']
+        return Response(200, headers={
+            'ETag': '"%s"' % hashlib.md5(req['body']).hexdigest()
+        })
+
+    def route_get_object(self, req, bucket, key):
+        with self.lock:
+            body = self.objects.get(unquote(key), None)
+        if body is None:
+            return Response(404, '<Error><Code>NoSuchKey</Code></Error>')
+        return Response(200, body)
+
+
+class FakeHTTPServer(ThreadingMixIn, HTTPServer):
+    """threaded HTTP server for one :py:class:`~.FakeService`"""
+
+    daemon_threads = True
+
+    def __init__(self, service):
+        """
+        Bind to a free port on localhost, and set the service's base URL.
+
+        :param service: the service to serve
+        :type service: :py:class:`~.FakeService`
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeRequestHandler)
+        self.service = service
+        service.base_url = 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    """pass requests to the server's :py:class:`~.FakeService`"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        res = self.server.service.handle(
+            self.command, self.path, dict(self.headers.items()), body)
+        self.send_response(res.status)
+        for k, v in res.headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(res.body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(res.body)
+
+    do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = handle_request
+
+    def log_message(self, fmt, *args):
+        """log requests at debug level, rather than to stderr"""
+        logger.debug("%s: " + fmt, self.server.service.name, *args)
+
+
+def make_template_repo(path, build_secs=0):
+    """
+    Create the git repository that every synthetic repository is cloned
+    from, with a ``.rebuildbot.sh`` that sleeps for ``build_secs``, ready to
+    be served over git's "dumb" HTTP protocol. Return its ``.git`` directory.
+
+    :param path: directory to create the repository in
+    :type path: str
+    :param build_secs: seconds the build script runs for
+    :type build_secs: int
+    :rtype: str
+    """
+    repo = Repo.init(path)
+    repo.git.symbolic_ref('HEAD', 'refs/heads/master')
+    script = os.path.join(path, '.rebuildbot.sh')
+    with open(script, 'w') as fh:
+        fh.write(BUILD_SCRIPT % build_secs)
+    os.chmod(script, 0o755)
+    repo.index.add(['.rebuildbot.sh'])
+    actor = Actor(LOGIN, LOGIN + '@example.com')
+    repo.index.commit('load test repository', author=actor, committer=actor)
+    repo.git.update_server_info()
+    return os.path.realpath(repo.git_dir)
+
+
+def serve(servers):
+    """
+    Serve each of ``servers`` in its own thread, forever; the target of the
+    fake services' process.
+
+    :param servers: the servers
+    :type servers: list of :py:class:`~.FakeHTTPServer`
+    """
+    threads = []
+    for server in servers:
+        t = threading.Thread(target=server.serve_forever,
+                             name='fake-' + server.service.name)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+
+class FakeServices(object):
+    """
+    The fake GitHub, Travis and S3 services for a :py:class:`~.Scenario`,
+    run in a separate process so that they do not count towards the load
+    test's memory usage or compete with ReBuildBot for the GIL.
+    """
+
+    def __init__(self, scenario, git_dir):
+        """
+        :param scenario: the load test scenario
+        :type scenario: :py:class:`~.Scenario`
+        :param git_dir: the template repository's ``.git`` directory
+        :type git_dir: str
+        """
+        self.servers = dict(
+            (s.name, FakeHTTPServer(s)) for s in [
+                FakeGitHub(scenario, git_dir=git_dir), FakeTravis(scenario),
+                FakeS3(scenario)
+            ]
+        )
+        self.urls = dict(
+            (name, srv.service.base_url) for name, srv in self.servers.items()
+        )
+        self.process = None
+
+    def start(self):
+        """Start serving, in a forked process"""
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except AttributeError:
+            ctx = multiprocessing
+        self.process = ctx.Process(target=serve,
+                                   args=(list(self.servers.values()),),
+                                   name='rebuildbot-loadtest-fakes')
+        self.process.daemon = True
+        self.process.start()
+        # the child process has the listening sockets now
+        for server in self.servers.values():
+            server.socket.close()
+        logger.info("Started fake services: %s", self.urls)
+
+    def stats(self):
+        """
+        Return each service's request counts.
+
+        :rtype: dict
+        """
+        return dict(
+            (name, requests.get(url + '/_stats').json())
+            for name, url in self.urls.items()
+        )
+
+    def stop(self):
+        """Stop serving"""
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+
+
+class LoadTestBot(ReBuildBot):
+    """
+    :py:class:`~.ReBuildBot` connected to :py:class:`~.FakeServices`
+    instead of the real GitHub, Travis and S3.
+    """
+
+    def __init__(self, urls, *args, **kwargs):
+        """
+        :param urls: dict of service name to the base URL of its fake
+        :type urls: dict
+        """
+        self.urls = urls
+        super(LoadTestBot, self).__init__(*args, **kwargs)
+
+    def get_github_token(self):
+        return GITHUB_TOKEN
+
+    def connect_github(self):
+        with self.ratelimit.phase('startup'):
+            return GitHubWrapper(self.gh_token, http=self.http,
+                                 base_url=self.urls['github'])
+
+    def connect_travis(self):
+        with self.ratelimit.phase('startup'):
+            return Travis(self.gh_token, http=self.http,
+                          cache=self.auth_cache, uri=self.urls['travis'])
+
+    def s3_connection(self):
+        url = urlparse(self.urls['s3'])
+        conn = S3Connection(
+            aws_access_key_id='loadtest', aws_secret_access_key='loadtest',
+            host=url.hostname, port=url.port, is_secure=False,
+            calling_format=OrdinaryCallingFormat()
+        )
+        return self.http.configure_boto(conn)
+
+
+def peak_memory_kb():
+    """
+    Return the peak resident memory of this process, in KB, or None if it
+    cannot be found.
+
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss = rss // 1024  # bytes on OS X, KB elsewhere
+    return rss
+
+
+def run_load_test(scenario, **kwargs):
+    """
+    Run :py:meth:`~.ReBuildBot.run` against :py:class:`~.FakeServices` for
+    ``scenario``, and return a report of how it went.
+
+    :param scenario: the load test scenario
+    :type scenario: :py:class:`~.Scenario`
+    :param kwargs: keyword arguments for :py:class:`~.ReBuildBot`
+    :returns: dict with the scenario, the wall time in seconds, the peak
+      memory in KB, the fake services' request counts and build counts
+    :rtype: dict
+    """
+    tmpdir = tempfile.mkdtemp(prefix='rebuildbot-loadtest-')
+    services = None
+    # capture logging for the report, as the runner does
+    log_buffer = LogBuffer()
+    handler = logging.StreamHandler(log_buffer)
+    handler.setLevel(logging.WARNING)
+    logging.getLogger().addHandler(handler)
+    try:
+        git_dir = make_template_repo(os.path.join(tmpdir, 'template'),
+                                     build_secs=scenario.local_build_secs)
+        services = FakeServices(scenario, git_dir)
+        services.start()
+        kwargs.setdefault('state_dir', os.path.join(tmpdir, 'state'))
+        kwargs.setdefault('log_buffer', log_buffer)
+        start = time.time()
+        bot = LoadTestBot(services.urls, BUCKET_NAME, **kwargs)
+        bot.run()
+        wall = time.time() - start
+        builds = list(bot.builds.values())
+        return {
+            'scenario': scenario.as_dict(),
+            'wall_seconds': round(wall, 3),
+            'peak_memory_kb': peak_memory_kb(),
+            'api_calls': services.stats(),
+            'builds': {
+                'total': len(builds),
+                'local': len([b for b in builds if b.run_local]),
+                'local_finished': len(
+                    [b for b in builds if b.local_build_finished]),
+                'local_passed': len(
+                    [b for b in builds if b.local_build_return_code == 0]),
+                'travis': len([b for b in builds if b.run_travis]),
+                'travis_finished': len(
+                    [b for b in builds if b.travis_build_finished]),
+                'travis_passed': len(
+                    [b for b in builds if b.travis_build_state == 'passed']),
+            },
+        }
+    finally:
+        logging.getLogger().removeHandler(handler)
+        if services is not None:
+            services.stop()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def format_report(report):
+    """
+    Return a human-readable summary of a :py:func:`~.run_load_test` report.
+
+    :param report: the report
+    :type report: dict
+    :rtype: str
+    """
+    sc = report['scenario']
+    lines = [
+        'Scenario: %d repos (%d local, %d Travis), seed %d' % (
+            sc['repos'], sc['local_repos'], sc['travis_repos'], sc['seed']),
+        'Wall time: %.1fs' % report['wall_seconds'],
+    ]
+    if report['peak_memory_kb'] is not None:
+        lines.append('Peak memory: %.1f MB' % (
+            report['peak_memory_kb'] / 1024.0))
+    b = report['builds']
+    lines.append('Local builds: %d (%d finished, %d passed)' % (
+        b['local'], b['local_finished'], b['local_passed']))
+    lines.append('Travis builds: %d (%d finished, %d passed)' % (
+        b['travis'], b['travis_finished'], b['travis_passed']))
+    for name in SERVICES:
+        stats = report['api_calls'][name]
+        lines.append('%s: %d requests, %d failed' % (
+            name, stats['requests'], stats['failures']))
+        for route in sorted(stats['by_route'].keys()):
+            lines.append('    %-28s %d' % (route, stats['by_route'][route]))
+    return '\n'.join(lines)
+
+
+def service_value(s):
+    """
+    argparse type for ``--latency`` and ``--failure-rate``; parse a
+    ``SERVICE=VALUE`` string into a 2-tuple of (service name, float value).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        name, val = s.rsplit('=', 1)
+        val = float(val)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'%s' is not in SERVICE=VALUE format" % s)
+    if name not in SERVICES:
+        raise argparse.ArgumentTypeError(
+            "unknown service '%s'; must be one of: %s" % (
+                name, ', '.join(SERVICES)))
+    return (name, val)
+
+
+def parse_args(argv):
+    """
+    parse arguments/options
+
+    :param argv: argument list to parse, usually ``sys.argv[1:]``
+    :type argv: list
+    :returns: parsed arguments
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    p = argparse.ArgumentParser(
+        description='Run ReBuildBot against local fake GitHub, Travis and S3 '
+        'services with many synthetic repositories, and report its wall '
+        'time, API calls and peak memory.')
+    p.add_argument('-v', '--verbose', dest='verbose', action='count',
+                   default=0,
+                   help='verbose output. specify twice for debug-level '
+                   'output.')
+    p.add_argument('--repos', dest='repos', type=int, default=DEFAULT_REPOS,
+                   help='number of synthetic repositories (default: %d)' %
+                   DEFAULT_REPOS)
+    p.add_argument('--local-fraction', dest='local_fraction', type=float,
+                   default=DEFAULT_LOCAL_FRACTION,
+                   help='fraction of repositories built locally (default: '
+                   '%s)' % DEFAULT_LOCAL_FRACTION)
+    p.add_argument('--travis-fraction', dest='travis_fraction', type=float,
+                   default=DEFAULT_TRAVIS_FRACTION,
+                   help='fraction of repositories built on Travis (default: '
+                   '%s)' % DEFAULT_TRAVIS_FRACTION)
+    p.add_argument('--latency', dest='latencies', action='append',
+                   type=service_value, default=[],
+                   help='SERVICE=SECONDS added to every response from the '
+                   'fake service (github, travis or s3); may be specified '
+                   'multiple times')
+    p.add_argument('--failure-rate', dest='failure_rates', action='append',
+                   type=service_value, default=[],
+                   help='SERVICE=FRACTION of requests to the fake service '
+                   'that fail with a 503 (for github, including git clone '
+                   'requests); may be specified multiple times')
+    p.add_argument('--travis-build-secs', dest='travis_build_secs', type=int,
+                   default=0, help='seconds each Travis build runs for '
+                   '(default: 0)')
+    p.add_argument('--local-build-secs', dest='local_build_secs', type=int,
+                   default=0, help='seconds each local build runs for '
+                   '(default: 0)')
+    p.add_argument('--seed', dest='seed', type=int, default=1,
+                   help='random seed (default: 1)')
+    p.add_argument('--local-workers', dest='local_workers', type=int,
+                   default=1, help='local builds to run at once (default: 1)')
+    p.add_argument('--max-travis-in-flight', dest='max_travis_in_flight',
+                   type=int, default=None,
+                   help='maximum Travis builds triggered and unfinished at '
+                   'once (default: no limit)')
+    p.add_argument('--no-travis', dest='run_travis', action='store_false',
+                   default=True, help='do not run Travis builds')
+    p.add_argument('--no-local', dest='run_local', action='store_false',
+                   default=True, help='do not run local builds')
+    p.add_argument('--json', dest='json_path', action='store', default=None,
+                   help='also write the report as JSON to this path')
+    return p.parse_args(argv)
+
+
+def console_entry_point():
+    args = parse_args(sys.argv[1:])
+    level = logging.WARNING
+    if args.verbose == 1:
+        level = logging.INFO
+    elif args.verbose > 1:
+        level = logging.DEBUG
+    logging.basicConfig(level=level)
+    scenario = Scenario(
+        repos=args.repos, local_fraction=args.local_fraction,
+        travis_fraction=args.travis_fraction,
+        latencies=dict(args.latencies),
+        failure_rates=dict(args.failure_rates),
+        travis_build_secs=args.travis_build_secs,
+        local_build_secs=args.local_build_secs, seed=args.seed
+    )
+    report = run_load_test(
+        scenario, run_local=args.run_local, run_travis=args.run_travis,
+        local_workers=args.local_workers,
+        max_travis_in_flight=args.max_travis_in_flight
+    )
+    print(format_report(report))
+    if args.json_path is not None:
+        with open(args.json_path, 'w') as fh:
+            json.dump(report, fh, sort_keys=True, indent=2)
+
+
+if __name__ == "__main__":
+    console_entry_point()
@@ -39,17 +39,36 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import os
 import sys
+import time
+import signal
 import datetime
 import logging
 import subprocess
+import threading
 import locale
 from tempfile import mkdtemp
 from shutil import rmtree
 
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
 from git import Repo
 
+from .exceptions import LocalBuildTimeoutError
+from .reaper import TEMP_PREFIX
+
 logger = logging.getLogger()
 
+POLL_INTERVAL = 1  # seconds between checks of a running build's timeouts
+KILL_GRACE_SECONDS = 10  # seconds between SIGTERM and SIGKILL on timeout
+
 
 class LocalBuild(object):
     """
@@ -57,7 +76,11 @@ class LocalBuild(object):
     with the results.
     """
 
-    def __init__(self, repo_name, build_info, dry_run=False):
+    def __init__(self, repo_name, build_info, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None, caches=None,
+                 reaper=None, prefetched=None, history=None,
+                 race_clone=False, admission=None, clone_depth=None,
+                 cache_names=None):
         """
         :param repo_name: full name / slug of the repository to build
         :type repo_name: string
@@ -65,10 +88,58 @@ class LocalBuild(object):
         :type build_info: :py:class:`~.BuildInfo`
         :param dry_run: if True, do not actually clone or run the build
         :type dry_run: bool
+        :param timeout: if not None, kill the build after it has run for this
+          many seconds
+        :type timeout: int
+        :param inactivity_timeout: if not None, kill the build after it has
+          produced no output for this many seconds
+        :type inactivity_timeout: int
+        :param workspaces: if not None, build in a persistent workspace from
+          this manager instead of a fresh temporary clone
+        :type workspaces: :py:class:`~.WorkspaceManager`
+        :param caches: if not None, shared dependency caches to export to the
+          build's environment
+        :type caches: :py:class:`~.CacheManager`
+        :param reaper: if not None, remove the clone after the build in the
+          background with this reaper, instead of synchronously
+        :type reaper: :py:class:`~.Reaper`
+        :param prefetched: if not None, the return value of
+          :py:meth:`~.clone_repo` for a clone that has already been made (see
+          :py:class:`~.Prefetcher`), to use instead of cloning
+        :type prefetched: tuple
+        :param history: if not None, build history used to remember which
+          clone protocol (SSH or HTTPS) works for each repository and host
+        :type history: :py:class:`~.BuildHistory`
+        :param race_clone: if True and no protocol is known to work for this
+          repository, clone from the SSH and HTTPS URLs concurrently and use
+          whichever finishes first
+        :type race_clone: bool
+        :param admission: if not None, used to run the build under nice,
+          ionice and cgroup CPU/memory limits
+        :type admission: :py:class:`~.AdmissionController`
+        :param clone_depth: if not None, make temporary clones shallow, with
+          this many commits of history
+        :type clone_depth: int
+        :param cache_names: if not None, only export these of the shared
+          caches to the build
+        :type cache_names: list
         """
         self.repo_name = repo_name
         self.build_info = build_info
         self.dry_run = dry_run
+        self.timeout = timeout
+        self.inactivity_timeout = inactivity_timeout
+        self.workspaces = workspaces
+        self.caches = caches
+        self.reaper = reaper
+        self.prefetched = prefetched
+        self.history = history
+        self.race_clone = race_clone
+        self.admission = admission
+        self.clone_depth = clone_depth
+        self.cache_names = cache_names
+        self.rusage = None
+        """resource usage of the last build process; see poll_process()"""
 
     def run(self):
         """
@@ -78,7 +149,11 @@ class LocalBuild(object):
         """
         logger.info('Starting local build of %s', self.repo_name)
         try:
-            repo_path, repo_str = self.clone_repo()
+            if self.prefetched is not None:
+                repo_path, repo_str = self.prefetched
+                logger.debug("Using prefetched clone at %s", repo_path)
+            else:
+                repo_path, repo_str = self.clone_repo()
         except Exception as ex:
             logger.exception("Exception while cloning %s", self.repo_name)
             ex_type, ex, tb = sys.exc_info()
@@ -104,8 +179,22 @@ class LocalBuild(object):
                 end_dt=self.get_time(),
                 repo_str=repo_str
             )
-            logger.debug("shutil.rmtree(%s)", repo_path)
-            rmtree(repo_path)
+            self.cleanup(repo_path)
+            return
+        except LocalBuildTimeoutError as ex:
+            logger.error(ex.message)
+            ex_type, ex, tb = sys.exc_info()
+            self.build_info.set_local_build(
+                excinfo=ex,
+                output=ex.output,
+                ex_type=ex_type,
+                traceback=tb,
+                start_dt=start,
+                end_dt=self.get_time(),
+                repo_str=repo_str,
+                timed_out=True
+            )
+            self.cleanup(repo_path)
             return
         except Exception as ex:
             logger.exception("Unexpected exception while running local build "
@@ -115,12 +204,27 @@ class LocalBuild(object):
                                             traceback=tb, start_dt=start,
                                             end_dt=self.get_time(),
                                             repo_str=repo_str)
-            logger.debug("shutil.rmtree(%s)", repo_path)
-            rmtree(repo_path)
+            self.cleanup(repo_path)
             return
         self.build_info.set_local_build(return_code=return_code, output=output,
                                         start_dt=start, end_dt=self.get_time(),
                                         repo_str=repo_str)
+        self.cleanup(repo_path)
+
+    def cleanup(self, repo_path):
+        """
+        Remove the clone at ``repo_path`` after a build, unless it is a
+        persistent workspace.
+
+        :param repo_path: the absolute path to the repository clone
+        :type repo_path: string
+        """
+        if self.workspaces is not None:
+            logger.debug("Keeping persistent workspace %s", repo_path)
+            return
+        if self.reaper is not None:
+            self.reaper.reap(repo_path)
+            return
         logger.debug("shutil.rmtree(%s)", repo_path)
         rmtree(repo_path)
 
@@ -132,71 +236,338 @@ class LocalBuild(object):
 
     def clone_repo(self, branch='master'):
         """
-        Clone the repository. Return a 2-tuple of (path on disk, string
+        Clone the repository, or update its persistent workspace if
+        ``self.workspaces`` is set. Return a 2-tuple of (path on disk, string
         describing the state of the repo)
+
+        Clone URLs are tried in the order given by :py:meth:`~.clone_urls`;
+        the protocol that works is remembered in ``self.history``, and the
+        time taken by each attempt is recorded on ``self.build_info``.
         """
-        path = self.path_for_repo()
-        logger.debug("Cloning %s branch %s into: %s", self.repo_name, branch,
-                     path)
-        if self.dry_run:
-            logger.info("DRY RUN - not actually cloning %s into %s",
-                        self.repo_name, path)
-            return (path, '(DRY RUN)')
+        urls = self.clone_urls()
+        if self.workspaces is not None:
+            path = self.workspaces.path_for(self.repo_name)
+            if self.dry_run:
+                logger.info("DRY RUN - not actually updating workspace %s",
+                            path)
+                return (path, '(DRY RUN)')
+        else:
+            path = self.path_for_repo()
+            logger.debug("Cloning %s branch %s into: %s", self.repo_name,
+                         branch, path)
+            if self.dry_run:
+                logger.info("DRY RUN - not actually cloning %s into %s",
+                            self.repo_name, path)
+                return (path, '(DRY RUN)')
+            if self.should_race(urls):
+                os.rmdir(path)
+                return self.race_clone_urls(urls, branch)
         excinfo = None
-        for url in [
-                self.build_info.ssh_clone_url,
-                self.build_info.https_clone_url
-        ]:
+        for proto, url in urls:
+            start = time.time()
             try:
-                logger.debug("Cloning %s into %s", url, path)
-                repo = Repo.clone_from(
-                    url,
-                    path,
-                    branch=branch
-                )
-                logger.debug("Cloned %s to %s", url, path)
-                br_name = repo.head.ref.name
-                sha = repo.head.ref.commit.hexsha
-                repo_str = '<%s> %s (%s)' % (url, br_name, sha)
-                return (path, repo_str)
+                if self.workspaces is not None:
+                    res = self.workspaces.prepare(self.repo_name, [url],
+                                                  branch=branch)
+                else:
+                    logger.debug("Cloning %s into %s", url, path)
+                    repo = Repo.clone_from(
+                        url,
+                        path,
+                        branch=branch,
+                        **self.clone_kwargs()
+                    )
+                    logger.debug("Cloned %s to %s", url, path)
+                    res = (path, repo_state_str(url, repo))
             except Exception as ex:
+                self.build_info.add_clone_attempt(proto, url,
+                                                  time.time() - start, ex)
                 excinfo = ex
+                continue
+            self.build_info.add_clone_attempt(proto, url, time.time() - start)
+            self.remember_protocol(proto, url)
+            return res
+        if excinfo is None:
+            raise ValueError("No clone URLs for %s" % self.repo_name)
         raise excinfo
 
+    def clone_kwargs(self):
+        """
+        Return a dict of additional keyword arguments for
+        :py:meth:`git.Repo.clone_from`; ``depth`` if ``self.clone_depth`` is
+        set.
+
+        :rtype: dict
+        """
+        if self.clone_depth is None:
+            return {}
+        return {'depth': self.clone_depth}
+
+    def clone_urls(self):
+        """
+        Return a list of (protocol, URL) 2-tuples to clone the repository
+        from, in the order they should be tried; the protocol known (from
+        ``self.history``) to work for this repository, or failing that for
+        its host, first, otherwise SSH then HTTPS.
+
+        :rtype: list
+        """
+        urls = [
+            ('ssh', self.build_info.ssh_clone_url),
+            ('https', self.build_info.https_clone_url)
+        ]
+        urls = [u for u in urls if u[1] is not None]
+        if self.history is None or len(urls) == 0:
+            return urls
+        pref = self.history.clone_protocol(self.repo_name,
+                                           url_host(urls[0][1]))
+        if pref is not None:
+            logger.debug("Preferring %s clone URL for %s", pref,
+                         self.repo_name)
+        return sorted(urls, key=lambda u: u[0] != pref)
+
+    def should_race(self, urls):
+        """
+        Return whether to race clones from all of ``urls``; only if
+        ``self.race_clone`` is set, there is more than one URL, and no
+        protocol is known to work for this specific repository.
+
+        :param urls: (protocol, URL) 2-tuples, from :py:meth:`~.clone_urls`
+        :type urls: list
+        :rtype: bool
+        """
+        if not self.race_clone or len(urls) < 2:
+            return False
+        if self.history is None:
+            return True
+        return self.history.clone_protocol(self.repo_name) is None
+
+    def race_clone_urls(self, urls, branch):
+        """
+        Clone from each of ``urls`` concurrently, each into its own temporary
+        directory, and return the (path, repo state string) 2-tuple of the
+        first to succeed. Clones that finish later are removed.
+
+        :param urls: (protocol, URL) 2-tuples, from :py:meth:`~.clone_urls`
+        :type urls: list
+        :param branch: name of the branch to clone
+        :type branch: str
+        :rtype: tuple
+        """
+        results = Queue()
+        lock = threading.Lock()
+        won = []
+
+        def attempt(proto, url, dest):
+            start = time.time()
+            try:
+                repo = Repo.clone_from(url, dest, branch=branch,
+                                       **self.clone_kwargs())
+                res = (dest, repo_state_str(url, repo))
+            except Exception as ex:
+                rmtree(dest, ignore_errors=True)
+                results.put((proto, url, time.time() - start, None, ex))
+                return
+            with lock:
+                winner = len(won) == 0
+                won.append(proto)
+            if not winner:
+                logger.debug("Removing losing %s clone of %s", proto,
+                             self.repo_name)
+                rmtree(dest, ignore_errors=True)
+                res = None
+            results.put((proto, url, time.time() - start, res, None))
+
+        logger.debug("Racing clones of %s from: %s", self.repo_name,
+                     [u[1] for u in urls])
+        for proto, url in urls:
+            dest = mkdtemp(prefix=TEMP_PREFIX)
+            t = threading.Thread(target=attempt, args=(proto, url, dest))
+            t.daemon = True
+            t.start()
+        excinfo = None
+        for i in range(len(urls)):
+            proto, url, secs, res, ex = results.get()
+            if ex is not None:
+                self.build_info.add_clone_attempt(proto, url, secs, ex)
+                excinfo = ex
+                continue
+            if res is None:
+                continue
+            self.build_info.add_clone_attempt(proto, url, secs)
+            self.remember_protocol(proto, url)
+            return res
+        raise excinfo
+
+    def remember_protocol(self, proto, url):
+        """
+        Record in ``self.history`` that cloning via ``proto`` worked for this
+        repository and the host of ``url``.
+
+        :param proto: the protocol, "ssh" or "https"
+        :type proto: str
+        :param url: the URL cloned from
+        :type url: str
+        """
+        if self.history is None:
+            return
+        self.history.set_clone_protocol(self.repo_name, url_host(url), proto)
+
     def run_build(self, repo_path):
         """
         Helper method to actually run the build.
 
+        The build script is run in its own process group, so that if it
+        exceeds ``self.timeout`` or produces no output for
+        ``self.inactivity_timeout`` seconds, the whole process tree (including
+        any helper processes, such as those of VMs it started) can be killed.
+
         :param repo_path: the absolute path to the repository clone
         :type repo_path: string
-        :raises: exception
         :returns: string combined STDOUT/STDERR
         :rtype: string
-        :raises: subprocess.CalledProcessError
+        :raises: subprocess.CalledProcessError, LocalBuildTimeoutError
         """
         if self.dry_run:
             return "DRY RUN"
-        oldpwd = os.getcwd()
-        logger.debug("os.chdir(%s)", repo_path)
-        os.chdir(repo_path)
+        script_path = os.path.join(repo_path, '.rebuildbot.sh')
+        logger.info("Running: %s" % script_path)
+        kwargs = {}
+        if sys.version_info >= (3, 2):
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+        if self.caches is not None:
+            env = os.environ.copy()
+            env.update(self.caches.env(self.cache_names))
+            kwargs['env'] = env
+            cache_token = self.caches.begin_build(self.cache_names)
+        cmd = ['./.rebuildbot.sh']
+        cgroup = None
+        self.rusage = None
+        if self.admission is not None:
+            cgroup = self.admission.create_cgroup(self.repo_name)
+            cmd = self.admission.command(cmd, cgroup=cgroup)
         try:
-            script_path = os.path.join(repo_path, '.rebuildbot.sh')
-            logger.info("Running: %s" % script_path)
-            res = subprocess.check_output(
-                ['./.rebuildbot.sh'],
-                stderr=subprocess.STDOUT
+            proc = subprocess.Popen(
+                cmd,
+                cwd=repo_path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                close_fds=True,
+                **kwargs
+            )
+        except Exception:
+            if cgroup is not None:
+                self.admission.remove_cgroup(cgroup)
+            if self.caches is not None:
+                self.caches.end_build(cache_token)
+            raise
+        reader = OutputReader(proc.stdout)
+        reader.start()
+        start = time.time()
+        timed_out = None
+        while self.poll_process(proc) is None:
+            now = time.time()
+            if self.timeout is not None and now - start > self.timeout:
+                timed_out = ('hard', self.timeout)
+            elif (
+                    self.inactivity_timeout is not None and
+                    now - reader.last_output > self.inactivity_timeout
+            ):
+                timed_out = ('inactivity', self.inactivity_timeout)
+            if timed_out is not None:
+                logger.warning("Build of %s exceeded %s timeout of %ss; "
+                               "killing process group %s", self.repo_name,
+                               timed_out[0], timed_out[1], proc.pid)
+                self.kill_process_group(proc)
+                break
+            time.sleep(POLL_INTERVAL)
+        reader.join(KILL_GRACE_SECONDS)
+        usage = self.rusage
+        if cgroup is not None:
+            cg_usage = self.admission.cgroup_usage(cgroup)
+            if cg_usage:
+                usage = dict(usage or {})
+                usage['cgroup'] = cg_usage
+            self.admission.remove_cgroup(cgroup)
+        if usage is not None:
+            self.build_info.set_local_build_rusage(usage)
+        if self.caches is not None:
+            self.build_info.set_cache_stats(
+                self.caches.end_build(cache_token))
+        res = reader.output
+        if sys.version_info >= (3, 0):
+            res = res.decode(locale.getdefaultlocale()[1])
+        if timed_out is not None:
+            raise LocalBuildTimeoutError(self.repo_name, timed_out[0],
+                                         timed_out[1], res)
+        if proc.returncode != 0:
+            # handled in self.run()
+            raise subprocess.CalledProcessError(
+                proc.returncode, './.rebuildbot.sh', output=res
             )
-            if sys.version_info >= (3, 0):
-                res = res.decode(locale.getdefaultlocale()[1])
-            logger.debug("os.chdir(%s)", oldpwd)
-            os.chdir(oldpwd)
-        except Exception as ex:
-            logger.debug("os.chdir(%s)", oldpwd)
-            os.chdir(oldpwd)
-            # any CalledProcessError is handled in self.run()
-            raise ex
         return res
 
+    def kill_process_group(self, proc):
+        """
+        Send SIGTERM to the process group of ``proc``; if it has not exited
+        after :py:const:`~.KILL_GRACE_SECONDS`, send SIGKILL.
+
+        :param proc: the build process, which must be a process group leader
+        :type proc: subprocess.Popen
+        """
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except OSError:
+            logger.debug("Process group %s already gone", proc.pid)
+            return
+        deadline = time.time() + KILL_GRACE_SECONDS
+        while time.time() < deadline:
+            if self.poll_process(proc) is not None:
+                break
+            time.sleep(POLL_INTERVAL)
+        try:
+            # members of the group may outlive the leader; make sure
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.poll_process(proc, block=True)
+
+    def poll_process(self, proc, block=False):
+        """
+        Like :py:meth:`subprocess.Popen.poll` (or, if ``block`` is True,
+        :py:meth:`subprocess.Popen.wait`), but reap the process with
+        :py:func:`os.wait4`, storing the resource usage of it and all of the
+        descendants it waited for in ``self.rusage`` (see
+        :py:func:`~.rusage_dict`). Return the process's return code, or None
+        if it is still running.
+
+        :param proc: the build process
+        :type proc: subprocess.Popen
+        :param block: whether to wait for the process to exit
+        :type block: bool
+        :rtype: int
+        """
+        if proc.returncode is not None:
+            return proc.returncode
+        flags = 0 if block else os.WNOHANG
+        try:
+            pid, status, ru = os.wait4(proc.pid, flags)
+        except OSError:
+            # already reaped; fall back to what Popen knows
+            if block:
+                return proc.wait()
+            return proc.poll()
+        if pid == 0:
+            return None
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        self.rusage = rusage_dict(ru)
+        return proc.returncode
+
     def path_for_repo(self):
         """
         Determine where to clone the repo to.
@@ -204,5 +575,97 @@ class LocalBuild(object):
         :returns: absolute path to clone the repo at
         :rtype: string
         """
-        path = mkdtemp(prefix='rebuildbot_')
+        path = mkdtemp(prefix=TEMP_PREFIX)
         return path
+
+
+def rusage_dict(ru):
+    """
+    Return a dict of the interesting fields of a
+    :py:func:`resource.getrusage`-style result: ``user_cpu`` and
+    ``sys_cpu`` (seconds), ``max_rss_kb`` (the largest resident set of any
+    single process, in KB on Linux), ``block_in`` and ``block_out``
+    (filesystem block operations), and ``voluntary_switches`` and
+    ``involuntary_switches`` (context switches).
+
+    :param ru: resource usage, i.e. from :py:func:`os.wait4`
+    :type ru: resource.struct_rusage
+    :rtype: dict
+    """
+    return {
+        'user_cpu': ru.ru_utime,
+        'sys_cpu': ru.ru_stime,
+        'max_rss_kb': ru.ru_maxrss,
+        'block_in': ru.ru_inblock,
+        'block_out': ru.ru_oublock,
+        'voluntary_switches': ru.ru_nvcsw,
+        'involuntary_switches': ru.ru_nivcsw,
+    }
+
+
+def repo_state_str(url, repo):
+    """
+    Return a string describing the state of a clone, i.e.
+    "<url> master (sha)".
+
+    :param url: the URL the repository was cloned from
+    :type url: str
+    :param repo: the cloned repository
+    :type repo: :py:class:`git.Repo`
+    :rtype: str
+    """
+    return '<%s> %s (%s)' % (url, repo.head.ref.name,
+                             repo.head.ref.commit.hexsha)
+
+
+def url_host(url):
+    """
+    Return the host name of a git clone URL, either a URL with a scheme
+    (i.e. ``https://github.com/foo/bar.git``) or an scp-like SSH URL (i.e.
+    ``git@github.com:foo/bar.git``).
+
+    :param url: the clone URL
+    :type url: str
+    :rtype: str
+    """
+    if '://' in url:
+        return urlparse(url).hostname
+    return url.split('@', 1)[-1].split(':', 1)[0]
+
+
+class OutputReader(threading.Thread):
+    """
+    Thread that reads a build process's combined output until EOF, keeping
+    track of when output was last received.
+    """
+
+    def __init__(self, fh):
+        """
+        :param fh: file object to read output from
+        :type fh: file
+        """
+        super(OutputReader, self).__init__()
+        self.daemon = True
+        self.fh = fh
+        self.chunks = []
+        self.last_output = time.time()
+
+    def run(self):
+        """read ``self.fh`` until EOF"""
+        fd = self.fh.fileno()
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            self.chunks.append(chunk)
+            self.last_output = time.time()
+        self.fh.close()
+
+    @property
+    def output(self):
+        """
+        Return all output read so far.
+
+        :rtype: bytes
+        """
+        return b''.join(self.chunks)
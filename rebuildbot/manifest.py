@@ -0,0 +1,160 @@
+"""
+rebuildbot/manifest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import logging
+
+import yaml
+
+from .caches import CACHES
+from .exceptions import ManifestError
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = '.rebuildbot.yml'
+
+
+def positive_int(value):
+    """
+    Convert a manifest value to an integer greater than zero.
+
+    :param value: the value from the manifest
+    :rtype: int
+    :raises: ValueError
+    """
+    if isinstance(value, bool):
+        raise ValueError('must be a number')
+    res = int(value)
+    if res < 1:
+        raise ValueError('must be greater than zero')
+    return res
+
+
+def positive_float(value):
+    """
+    Convert a manifest value to a number greater than zero.
+
+    :param value: the value from the manifest
+    :rtype: float
+    :raises: ValueError
+    """
+    if isinstance(value, bool):
+        raise ValueError('must be a number')
+    res = float(value)
+    if res <= 0:
+        raise ValueError('must be greater than zero')
+    return res
+
+
+def string_list(value):
+    """
+    Convert a manifest value, either a list or a string of items separated by
+    whitespace or commas, to a list of strings.
+
+    :param value: the value from the manifest
+    :rtype: list
+    :raises: ValueError
+    """
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    if not hasattr(value, 'split'):
+        raise ValueError('must be a list')
+    return value.replace(',', ' ').split()
+
+
+def cache_list(value):
+    """
+    Convert a manifest value to a list of shared cache names, which must be
+    keys of :py:const:`~.CACHES`.
+
+    :param value: the value from the manifest
+    :rtype: list
+    :raises: ValueError
+    """
+    res = string_list(value)
+    for name in res:
+        if name not in CACHES:
+            raise ValueError("unknown cache '%s'; must be one of: %s" % (
+                name, ', '.join(sorted(CACHES.keys()))))
+    return res
+
+
+#: manifest keys and the functions that validate and convert their values
+FIELDS = {
+    'timeout': positive_int,  # hard timeout for the local build, in seconds
+    'expected_duration': positive_int,  # seconds; if there is no history
+    'clone_depth': positive_int,  # shallow clone depth
+    'tags': string_list,  # resource tags; see BuildScheduler
+    'rebuild_interval': positive_float,  # days between rebuilds
+    'caches': cache_list,  # shared caches the build uses
+}
+
+
+def parse_manifest(text, repo):
+    """
+    Parse the YAML content of a repository's ``.rebuildbot.yml`` and return
+    a dict of its settings; only keys in :py:const:`~.FIELDS` are returned,
+    with values converted to the appropriate types. Unknown keys are logged
+    and ignored.
+
+    :param text: the content of the manifest
+    :type text: str
+    :param repo: the repository slug / full name, for messages
+    :type repo: str
+    :rtype: dict
+    :raises: ManifestError
+    """
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError as ex:
+        raise ManifestError(repo, 'not valid YAML: %s' % ex)
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ManifestError(repo, 'must be a mapping of settings')
+    res = {}
+    for key, value in sorted(data.items()):
+        if key not in FIELDS:
+            logger.warning("Ignoring unknown key '%s' in %s of %s", key,
+                           MANIFEST_FILE, repo)
+            continue
+        try:
+            res[key] = FIELDS[key](value)
+        except (TypeError, ValueError) as ex:
+            raise ManifestError(repo, "'%s' %s" % (key, ex))
+    return res
@@ -0,0 +1,198 @@
+"""
+rebuildbot/prefetch.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import logging
+import threading
+from tempfile import gettempdir
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_FREE_MB = 10240  # don't prefetch if it would leave less free
+
+
+class Prefetcher(object):
+    """
+    Clones the next few queued repositories in a background thread while the
+    current local build runs, so each build can start with its clone (or
+    persistent workspace) already up to date.
+
+    At most ``depth`` repositories are prefetched ahead of the current
+    build, and a repository is only prefetched if cloning it (by its
+    GitHub-reported size) would leave at least ``min_free_mb`` MB free on
+    the filesystem it is cloned to. Repositories that are not prefetched, or
+    whose prefetch fails, are simply cloned when their build starts.
+    """
+
+    def __init__(self, depth, workspaces=None, reaper=None,
+                 min_free_mb=DEFAULT_MIN_FREE_MB, history=None,
+                 race_clone=False):
+        """
+        :param depth: maximum number of repositories to prefetch ahead
+        :type depth: int
+        :param workspaces: if not None, prefetch into persistent workspaces
+          from this manager instead of temporary clones
+        :type workspaces: :py:class:`~.WorkspaceManager`
+        :param reaper: used to remove prefetched clones that are never built
+        :type reaper: :py:class:`~.Reaper`
+        :param min_free_mb: free space in MB to leave on the filesystem
+        :type min_free_mb: int
+        :param history: build history, passed to :py:class:`~.LocalBuild`
+          to choose and remember clone protocols
+        :type history: :py:class:`~.BuildHistory`
+        :param race_clone: passed to :py:class:`~.LocalBuild`
+        :type race_clone: bool
+        """
+        self.depth = depth
+        self.workspaces = workspaces
+        self.reaper = reaper
+        self.min_free_mb = min_free_mb
+        self.history = history
+        self.race_clone = race_clone
+        self.entries = {}
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name='prefetcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def prefetch(self, upcoming):
+        """
+        Queue prefetches of the first ``self.depth`` of ``upcoming`` that are
+        not already prefetched or queued.
+
+        :param upcoming: (slug, BuildInfo) 2-tuples of the local builds that
+          will run next, in order
+        :type upcoming: list
+        """
+        for slug, build_info in upcoming[:self.depth]:
+            if slug in self.entries:
+                continue
+            logger.debug("Queueing prefetch of %s", slug)
+            entry = {'done': threading.Event(), 'result': None}
+            self.entries[slug] = entry
+            self.queue.put((slug, build_info, entry))
+
+    def take(self, slug):
+        """
+        Return the 2-tuple (path on disk, string describing the state of the
+        repo) of the prefetched clone of ``slug``, waiting for the prefetch
+        if it is still running, or None if it was not (successfully)
+        prefetched. Ownership of the clone passes to the caller.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: tuple
+        """
+        entry = self.entries.pop(slug, None)
+        if entry is None:
+            return None
+        if not entry['done'].is_set():
+            logger.info("Waiting for prefetch of %s to finish", slug)
+        entry['done'].wait()
+        return entry['result']
+
+    @property
+    def slugs(self):
+        """
+        Return the sorted slugs of all repositories that are queued, being
+        prefetched, or prefetched but not yet taken.
+
+        :rtype: list
+        """
+        return sorted(self.entries.keys())
+
+    def discard_all(self):
+        """
+        Wait for any running prefetches, and remove all prefetched temporary
+        clones that were never taken.
+        """
+        for slug in sorted(self.entries.keys()):
+            res = self.take(slug)
+            if res is None or self.workspaces is not None:
+                continue
+            logger.debug("Removing unused prefetched clone of %s", slug)
+            self.reaper.reap(res[0])
+
+    def has_space_for(self, build_info):
+        """
+        Return whether prefetching ``build_info`` would leave at least
+        ``self.min_free_mb`` MB free.
+
+        :param build_info: the BuildInfo of the repository to prefetch
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: bool
+        """
+        path = gettempdir()
+        if self.workspaces is not None:
+            path = self.workspaces.root
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        st = os.statvfs(path)
+        free_kb = (st.f_bavail * st.f_frsize) // 1024
+        need_kb = (build_info.repo_size or 0) + (self.min_free_mb * 1024)
+        return free_kb >= need_kb
+
+    def _run(self):
+        """worker thread; perform queued prefetches forever"""
+        while True:
+            slug, build_info, entry = self.queue.get()
+            try:
+                if not self.has_space_for(build_info):
+                    logger.warning("Not prefetching %s; not enough free "
+                                   "disk space", slug)
+                    continue
+                from .local_build import LocalBuild
+                b = LocalBuild(slug, build_info, workspaces=self.workspaces,
+                               history=self.history,
+                               race_clone=self.race_clone,
+                               clone_depth=build_info.manifest.get(
+                                   'clone_depth', None))
+                entry['result'] = b.clone_repo()
+                logger.info("Prefetched %s", slug)
+            except Exception:
+                logger.warning("Prefetch of %s failed; it will be cloned "
+                               "when its build starts", slug, exc_info=True)
+            finally:
+                entry['done'].set()
+                self.queue.task_done()
@@ -0,0 +1,331 @@
+"""
+rebuildbot/ratelimit.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_tz, mktime_tz
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESERVE = 50  # requests per rate-limit window to leave unused
+PACE_FRACTION = 0.1  # pace requests once less than this much quota is left
+DEFAULT_BLOCK = 60  # seconds to back off after a 429 with no Retry-After
+MAX_SLEEP = 60  # longest single sleep; the wait is recomputed after it
+DEFAULT_PHASE = 'other'
+
+
+def get_header(headers, name):
+    """
+    Return the value of the named header from a dict of response headers,
+    regardless of case, or None if it is not present.
+
+    :param headers: response headers
+    :type headers: dict
+    :param name: header name
+    :type name: str
+    :rtype: str
+    """
+    name = name.lower()
+    for k, v in headers.items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+def parse_retry_after(value, now):
+    """
+    Parse a ``Retry-After`` header value - either a number of seconds or an
+    HTTP date - into the epoch time to retry after. Return None if it cannot
+    be parsed.
+
+    :param value: the header value
+    :type value: str
+    :param now: current epoch time
+    :type now: float
+    :rtype: float
+    """
+    try:
+        return now + max(float(value), 0)
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return float(mktime_tz(parsed))
+
+
+class TokenBucket(object):
+    """
+    Rate-limit state of one service. The service's own
+    ``X-RateLimit-Remaining`` count is the bucket's tokens, and refills at
+    ``X-RateLimit-Reset``. Each request takes a token; once fewer than
+    :py:const:`~.PACE_FRACTION` of the window's limit remain, the rest are
+    spread evenly over the time until the reset, and none are handed out
+    below the reserve. A 429 (or a 403 with the quota exhausted) stops all
+    requests until its ``Retry-After`` time or the reset.
+    """
+
+    def __init__(self, service, reserve=DEFAULT_RESERVE):
+        """
+        :param service: service name, for logging
+        :type service: str
+        :param reserve: requests per window to leave unused
+        :type reserve: int
+        """
+        self.service = service
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.limit = None
+        self.reset = None
+        self.blocked_until = None
+        self.last_grant = 0
+
+    def wait_time(self, now):
+        """
+        Return how many seconds a request must wait before it may be made;
+        0 if it may be made now.
+
+        :param now: current epoch time
+        :type now: float
+        :rtype: float
+        """
+        if self.blocked_until is not None and now < self.blocked_until:
+            return self.blocked_until - now
+        if self.remaining is None or self.reset is None or now >= self.reset:
+            return 0
+        available = self.remaining - self.reserve
+        if available <= 0:
+            return self.reset - now
+        if self.limit is not None and available < self.limit * PACE_FRACTION:
+            interval = (self.reset - now) / float(available)
+            return max(self.last_grant + interval - now, 0)
+        return 0
+
+    def take(self, now):
+        """
+        Take a token for a request being made now.
+
+        :param now: current epoch time
+        :type now: float
+        """
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.last_grant = now
+
+    def update(self, status, headers, now):
+        """
+        Update the bucket from a response's status and headers.
+
+        :param status: HTTP status code
+        :type status: int
+        :param headers: response headers
+        :type headers: dict
+        :param now: current epoch time
+        :type now: float
+        """
+        remaining = get_header(headers, 'X-RateLimit-Remaining')
+        reset = get_header(headers, 'X-RateLimit-Reset')
+        limit = get_header(headers, 'X-RateLimit-Limit')
+        try:
+            if remaining is not None:
+                remaining = int(remaining)
+                if reset is not None:
+                    reset = float(reset)
+                if (self.remaining is None or reset != self.reset or
+                        remaining < self.remaining):
+                    # responses to concurrent requests arrive out of order;
+                    # within a window, the lowest count is the latest
+                    self.remaining = remaining
+                self.reset = reset
+            if limit is not None:
+                self.limit = int(limit)
+        except ValueError:
+            logger.debug("Ignoring unparseable %s rate-limit headers",
+                         self.service)
+        if status != 429 and not (status == 403 and remaining == 0):
+            return
+        until = None
+        retry_after = get_header(headers, 'Retry-After')
+        if retry_after is not None:
+            until = parse_retry_after(retry_after, now)
+        if until is None and self.reset is not None and self.reset > now:
+            until = self.reset
+        if until is None:
+            until = now + DEFAULT_BLOCK
+        self.blocked_until = max(until, self.blocked_until or 0)
+        logger.warning("%s rate limit exceeded (HTTP %s); pausing requests "
+                       "for %d seconds", self.service, status, until - now)
+
+
+class RateLimiter(object):
+    """
+    Governor for the rate-limited APIs (GitHub and Travis), shared by every
+    thread that calls them. Callers :py:meth:`~.acquire` before each request
+    and :py:meth:`~.observe` each response; see :py:class:`~.TokenBucket`.
+    Requests are counted per phase of the run, as set by :py:meth:`~.phase`
+    in the calling thread.
+    """
+
+    def __init__(self, reserve=DEFAULT_RESERVE):
+        """
+        :param reserve: requests per rate-limit window to leave unused, for
+          other clients using the same credentials
+        :type reserve: int
+        """
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.buckets = {}
+        self.usage = {}
+        """nested dict of phase to service to [requests, seconds waited]"""
+
+    def bucket(self, service):
+        """
+        Return the :py:class:`~.TokenBucket` for a service, creating it if
+        needed.
+
+        :param service: service name
+        :type service: str
+        :rtype: :py:class:`~.TokenBucket`
+        """
+        with self.lock:
+            if service not in self.buckets:
+                self.buckets[service] = TokenBucket(service,
+                                                    reserve=self.reserve)
+            return self.buckets[service]
+
+    @property
+    def current_phase(self):
+        """
+        Return the calling thread's phase of the run.
+
+        :rtype: str
+        """
+        return getattr(self.local, 'phase', DEFAULT_PHASE)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager to count the calling thread's requests under the
+        named phase of the run.
+
+        :param name: phase name
+        :type name: str
+        """
+        old = self.current_phase
+        self.local.phase = name
+        try:
+            yield
+        finally:
+            self.local.phase = old
+
+    def acquire(self, service):
+        """
+        Block until a request to ``service`` may be made, then count it.
+
+        :param service: service name
+        :type service: str
+        """
+        bucket = self.bucket(service)
+        waited = 0
+        while True:
+            with bucket.lock:
+                now = time.time()
+                wait = bucket.wait_time(now)
+                if wait <= 0:
+                    bucket.take(now)
+                    break
+            wait = min(wait, MAX_SLEEP)
+            logger.debug("Waiting %.1f seconds for %s rate limit", wait,
+                         service)
+            time.sleep(wait)
+            waited += wait
+        with self.lock:
+            counts = self.usage.setdefault(
+                self.current_phase, {}).setdefault(service, [0, 0])
+            counts[0] += 1
+            counts[1] += waited
+
+    def observe(self, service, status, headers):
+        """
+        Update the rate-limit state of ``service`` from a response.
+
+        :param service: service name
+        :type service: str
+        :param status: HTTP status code
+        :type status: int
+        :param headers: response headers
+        :type headers: dict
+        """
+        bucket = self.bucket(service)
+        with bucket.lock:
+            bucket.update(status, headers, time.time())
+
+    def summary(self):
+        """
+        Return API usage of the run so far, as a list of dicts with
+        ``phase``, ``service``, ``requests`` and ``waited`` (seconds) keys,
+        sorted by phase and service.
+
+        :rtype: list
+        """
+        res = []
+        with self.lock:
+            for phase, services in sorted(self.usage.items()):
+                for service, (requests, waited) in sorted(services.items()):
+                    res.append({'phase': phase, 'service': service,
+                                'requests': requests, 'waited': waited})
+        return res
+
+    def log_summary(self):
+        """
+        Log API usage per phase (see :py:meth:`~.summary`) and the quota
+        left for each service.
+        """
+        for u in self.summary():
+            logger.info("API usage: %s phase made %d %s requests (%.0fs "
+                        "waiting for rate limit)", u['phase'], u['requests'],
+                        u['service'], u['waited'])
+        for service, bucket in sorted(self.buckets.items()):
+            if bucket.remaining is not None:
+                logger.info("%s rate limit: %d requests remaining",
+                            service, bucket.remaining)
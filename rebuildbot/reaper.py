@@ -0,0 +1,158 @@
+"""
+rebuildbot/reaper.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import time
+import logging
+import threading
+from tempfile import mkdtemp, gettempdir
+from shutil import rmtree
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+TEMP_PREFIX = 'rebuildbot_'  # prefix of temporary clone directories
+# prefix of directories awaiting deletion; must not collide with
+# TEMP_PREFIX or with workspace names (``owner__repo``)
+REAP_PREFIX = '.rebuildbot-reap-'
+SWEEP_MIN_AGE = 86400  # seconds; leftover clones younger than this are kept
+
+
+class Reaper(object):
+    """
+    Removes directories in a background thread, so that the main loop never
+    blocks on deleting large trees (i.e. clones containing VM images or
+    vendored dependencies).
+
+    A directory passed to :py:meth:`~.reap` is first renamed to a
+    :py:const:`~.REAP_PREFIX` directory next to it, so its original path is
+    immediately free for reuse, and then deleted by the worker thread.
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run, name='reaper')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def reap(self, path):
+        """
+        Rename ``path`` out of the way and queue it for deletion.
+
+        :param path: the directory to remove
+        :type path: str
+        """
+        if not os.path.exists(path):
+            return
+        path = path.rstrip(os.sep)
+        parent, name = os.path.split(path)
+        try:
+            trash = mkdtemp(prefix=REAP_PREFIX, dir=parent)
+            os.rename(path, os.path.join(trash, name))
+        except OSError:
+            logger.debug("Unable to rename %s for removal; removing in place",
+                         path, exc_info=True)
+            trash = path
+        logger.debug("Queueing %s for removal", trash)
+        self.queue.put(trash)
+
+    def sweep(self, directory=None, min_age=SWEEP_MIN_AGE, clones=True):
+        """
+        Queue for deletion any directories in ``directory`` left over from
+        previous runs that crashed or were killed: those awaiting deletion
+        (:py:const:`~.REAP_PREFIX`), and, if ``clones`` is True, temporary
+        clones (:py:const:`~.TEMP_PREFIX`) last modified more than ``min_age``
+        seconds ago. Younger clones are left alone, as they may belong to
+        another running instance.
+
+        :param directory: directory to sweep; defaults to the system temporary
+          directory
+        :type directory: str
+        :param min_age: minimum age in seconds of temporary clones to remove
+        :type min_age: int
+        :param clones: whether to also remove old temporary clones; False for
+          directories such as the workspace root, where other entries must
+          never be touched
+        :type clones: bool
+        :returns: number of directories queued for removal
+        :rtype: int
+        """
+        if directory is None:
+            directory = gettempdir()
+        if not os.path.isdir(directory):
+            return 0
+        now = time.time()
+        count = 0
+        for name in sorted(os.listdir(directory)):
+            reaping = name.startswith(REAP_PREFIX)
+            if not reaping and not (clones and name.startswith(TEMP_PREFIX)):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.islink(path) or not os.path.isdir(path):
+                continue
+            if not reaping and now - os.path.getmtime(path) < min_age:
+                continue
+            logger.info("Removing leftover directory from a previous run: %s",
+                        path)
+            self.queue.put(path)
+            count += 1
+        return count
+
+    def wait(self):
+        """
+        Block until all queued directories have been removed.
+        """
+        self.queue.join()
+
+    def _run(self):
+        """worker thread; remove queued directories forever"""
+        while True:
+            path = self.queue.get()
+            try:
+                start = time.time()
+                rmtree(path, ignore_errors=True)
+                logger.debug("Removed %s in %.1fs", path, time.time() - start)
+            except Exception:
+                logger.exception("Error removing %s", path)
+            finally:
+                self.queue.task_done()
@@ -40,9 +40,20 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 import sys
 import argparse
 import logging
+import datetime
 
 from .logbuffer import LogBuffer
-from .bot import ReBuildBot
+from .scheduler import POLICIES
+from .workspace import DEFAULT_MAX_SIZE_MB
+from .caches import CACHES
+from .prefetch import DEFAULT_MIN_FREE_MB
+from .admission import DEFAULT_CGROUP_ROOT, IONICE_CLASSES
+from .history import DEFAULT_REGRESSION_WINDOW, DEFAULT_REGRESSION_THRESHOLD
+from .webhook import DEFAULT_WEBHOOK_WINDOW
+from .defaults import DEFAULT_RETRIES, DEFAULT_TIMEOUTS
+from .ratelimit import DEFAULT_RESERVE
+from .circuitbreaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_OUTAGE
+from .authcache import DEFAULT_AUTH_TTL
 from .version import _VERSION, _PROJECT_URL
 
 logging.basicConfig(level=logging.WARNING)
@@ -70,6 +81,120 @@ github_log.setLevel(logging.WARNING)
 github_log.propagate = True
 
 
+def repo_timeout(s):
+    """
+    argparse type for ``--repo-timeout``; parse a ``USER/REPO=SECONDS``
+    string into a 2-tuple of (slug, int seconds).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        slug, secs = s.rsplit('=', 1)
+        return (slug, int(secs))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'%s' is not in USER/REPO=SECONDS format" % s
+        )
+
+
+def cache_limit(s):
+    """
+    argparse type for ``--cache-limit``; parse a ``NAME=MB`` string into a
+    2-tuple of (cache name, int MB).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        name, mb = s.rsplit('=', 1)
+        mb = int(mb)
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not in NAME=MB format" % s)
+    if name not in CACHES:
+        raise argparse.ArgumentTypeError(
+            "unknown cache '%s'; must be one of: %s" % (
+                name, ', '.join(sorted(CACHES.keys()))))
+    return (name, mb)
+
+
+def http_timeout(s):
+    """
+    argparse type for ``--http-timeout``; parse a ``SERVICE=SECONDS`` string
+    into a 2-tuple of (service name, int seconds).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        name, secs = s.rsplit('=', 1)
+        secs = int(secs)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'%s' is not in SERVICE=SECONDS format" % s
+        )
+    if name not in DEFAULT_TIMEOUTS:
+        raise argparse.ArgumentTypeError(
+            "unknown service '%s'; must be one of: %s" % (
+                name, ', '.join(sorted(DEFAULT_TIMEOUTS.keys()))))
+    return (name, secs)
+
+
+def resource_tag(s):
+    """
+    argparse type for ``--resource-tag``; parse a ``USER/REPO=TAG[,TAG...]``
+    string into a 2-tuple of (slug, list of tags).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        slug, tags = s.rsplit('=', 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'%s' is not in USER/REPO=TAG[,TAG...] format" % s
+        )
+    tags = [t.strip() for t in tags.split(',') if t.strip() != '']
+    if len(tags) == 0:
+        raise argparse.ArgumentTypeError("'%s' specifies no tags" % s)
+    return (slug, tags)
+
+
+def tag_limit(s):
+    """
+    argparse type for ``--tag-limit``; parse a ``TAG=N`` string into a
+    2-tuple of (tag, int limit).
+
+    :param s: the option value
+    :type s: str
+    :rtype: tuple
+    """
+    try:
+        tag, limit = s.rsplit('=', 1)
+        return (tag, int(limit))
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not in TAG=N format" % s)
+
+
+def deadline_time(s):
+    """
+    argparse type for ``--deadline``; parse a ``HH:MM`` string into a
+    :py:class:`datetime.time`.
+
+    :param s: the option value
+    :type s: str
+    :rtype: datetime.time
+    """
+    try:
+        return datetime.datetime.strptime(s, '%H:%M').time()
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not in HH:MM format" % s)
+
+
 class Runner(object):
 
     def parse_args(self, argv):
@@ -135,9 +260,215 @@ class Runner(object):
         p.add_argument('-i', '--ignore', dest='ignore_repos', default=[],
                        action='append',
                        help='repository slugs (USER/REPO) to completely ignore')
-        p.add_argument('BUCKET_NAME', action='store', type=str,
-                       help='Name of S3 bucket to upload reports to')
+        p.add_argument('--schedule', dest='schedule', action='store',
+                       type=str, choices=POLICIES, default='alphabetical',
+                       help='order in which to start local builds; '
+                       '"longest-first" and "shortest-first" use durations '
+                       'recorded in previous runs (default: alphabetical)')
+        p.add_argument('--state-dir', dest='state_dir', action='store',
+                       type=str, default=None,
+                       help='directory to store persistent state such as '
+                       'build history in (default: ~/.rebuildbot)')
+        p.add_argument('--build-timeout', dest='build_timeout', action='store',
+                       type=int, default=None,
+                       help='kill any local build that runs for longer than '
+                       'this many seconds (default: no timeout)')
+        p.add_argument('--inactivity-timeout', dest='inactivity_timeout',
+                       action='store', type=int, default=None,
+                       help='kill any local build that produces no output '
+                       'for this many seconds (default: no timeout)')
+        p.add_argument('--repo-timeout', dest='repo_timeouts', default=[],
+                       action='append', type=repo_timeout,
+                       help='USER/REPO=SECONDS timeout for one repository\'s '
+                       'local build, overriding --build-timeout. Can be '
+                       'specified multiple times.')
+        p.add_argument('--deadline', dest='deadline', action='store',
+                       type=deadline_time, default=None,
+                       help='local time (HH:MM, 24-hour) by which the run '
+                       'must finish; local builds not expected to finish '
+                       'in time are skipped, and at the deadline any '
+                       'remaining work is abandoned and the report '
+                       'published')
+        p.add_argument('--time-budget', dest='time_budget', action='store',
+                       type=int, default=None,
+                       help='like --deadline, but the run must finish this '
+                       'many seconds after it starts')
+        p.add_argument('--max-repos', dest='max_repos', action='store',
+                       type=int, default=None,
+                       help='when discovering projects, only build this many, '
+                       'choosing those whose last successful rebuild is '
+                       'oldest; successive runs rotate through all projects')
+        p.add_argument('--stale-after', dest='stale_after', action='store',
+                       type=int, default=None,
+                       help='when discovering projects, skip any that have '
+                       'been successfully rebuilt within this many days')
+        p.add_argument('--persistent-workspaces',
+                       dest='persistent_workspaces', action='store_true',
+                       default=False,
+                       help='keep a clone of each repository under the state '
+                       'directory and update it before each local build, '
+                       'preserving ignored files (i.e. installed '
+                       'dependencies) between runs, instead of cloning '
+                       'fresh every time')
+        p.add_argument('--workspace-max-size', dest='workspace_max_size',
+                       action='store', type=int, default=DEFAULT_MAX_SIZE_MB,
+                       help='maximum total size of persistent workspaces in '
+                       'MB; least recently used workspaces are removed '
+                       'above this (default: %d)' % DEFAULT_MAX_SIZE_MB)
+        p.add_argument('--cache', dest='caches', action='append', default=[],
+                       choices=sorted(CACHES.keys()),
+                       help='keep this shared dependency cache under the '
+                       'state directory and export it to local builds. Can '
+                       'be specified multiple times.')
+        p.add_argument('--cache-limit', dest='cache_limits', action='append',
+                       default=[], type=cache_limit,
+                       help='NAME=MB size limit for a shared cache, above '
+                       'which least recently used entries are removed. Can '
+                       'be specified multiple times.')
+        p.add_argument('--prefetch', dest='prefetch', action='store',
+                       type=int, default=0,
+                       help='clone this many upcoming repositories in the '
+                       'background while each local build runs (default: 0, '
+                       'disabled)')
+        p.add_argument('--prefetch-min-free', dest='prefetch_min_free',
+                       action='store', type=int, default=DEFAULT_MIN_FREE_MB,
+                       help='only prefetch a repository if at least this '
+                       'many MB of disk space would remain free (default: '
+                       '%d)' % DEFAULT_MIN_FREE_MB)
+        p.add_argument('--race-clone', dest='race_clone', action='store_true',
+                       default=False,
+                       help='for repositories with no known working clone '
+                       'protocol, clone from the SSH and HTTPS URLs '
+                       'concurrently and use whichever finishes first')
+        p.add_argument('--local-workers', dest='local_workers',
+                       action='store', type=int, default=1,
+                       help='maximum number of local builds to run at once '
+                       '(default: 1)')
+        p.add_argument('--max-load', dest='max_load', action='store',
+                       type=float, default=None,
+                       help='only start a local build while the 1-minute '
+                       'load average is at most this')
+        p.add_argument('--min-free-memory', dest='min_free_memory',
+                       action='store', type=int, default=None,
+                       help='only start a local build while at least this '
+                       'many MB of memory are available')
+        p.add_argument('--min-free-disk', dest='min_free_disk',
+                       action='store', type=int, default=None,
+                       help='only start a local build while at least this '
+                       'many MB of disk are free where builds are cloned')
+        p.add_argument('--nice', dest='build_nice', action='store', type=int,
+                       default=None, help='run local builds at this niceness')
+        p.add_argument('--ionice', dest='build_ionice', action='store',
+                       choices=sorted(IONICE_CLASSES), default=None,
+                       help='run local builds in this I/O scheduling class')
+        p.add_argument('--cpu-limit', dest='build_cpu_limit', action='store',
+                       type=float, default=None,
+                       help='limit each local build to this many CPUs, using '
+                       'a cgroup (v2) under --cgroup-root')
+        p.add_argument('--memory-limit', dest='build_memory_limit',
+                       action='store', type=int, default=None,
+                       help='limit each local build to this many MB of '
+                       'memory, using a cgroup (v2) under --cgroup-root')
+        p.add_argument('--cgroup-root', dest='cgroup_root', action='store',
+                       type=str, default=DEFAULT_CGROUP_ROOT,
+                       help='delegated cgroup v2 directory to create '
+                       'per-build cgroups in (default: %s)' %
+                       DEFAULT_CGROUP_ROOT)
+        p.add_argument('--resource-tag', dest='repo_tags', action='append',
+                       default=[], type=resource_tag,
+                       help='USER/REPO=TAG[,TAG...] resource tags for a '
+                       'repository\'s local builds, in addition to any in its '
+                       '.rebuildbot.yml. Can be specified multiple times.')
+        p.add_argument('--tag-limit', dest='tag_limits', action='append',
+                       default=[], type=tag_limit,
+                       help='TAG=N maximum number of local builds with a '
+                       'resource tag to run at once. Can be specified '
+                       'multiple times.')
+        p.add_argument('--regression-window', dest='regression_window',
+                       action='store', type=int,
+                       default=DEFAULT_REGRESSION_WINDOW,
+                       help='number of past passed builds of each repository '
+                       'to compare build durations to (default: %d)' %
+                       DEFAULT_REGRESSION_WINDOW)
+        p.add_argument('--regression-threshold', dest='regression_threshold',
+                       action='store', type=float,
+                       default=DEFAULT_REGRESSION_THRESHOLD,
+                       help='minimum percent slowdown of a build, compared to '
+                       'its past builds, to flag as a regression (default: '
+                       '%d)' % DEFAULT_REGRESSION_THRESHOLD)
+        p.add_argument('--fail-on-regression', dest='fail_on_regression',
+                       action='store_true', default=False,
+                       help='exit non-zero if any build duration regressions '
+                       'are found')
+        p.add_argument('--webhook-port', dest='webhook_port', action='store',
+                       type=int, default=None,
+                       help='receive Travis webhook notifications on this '
+                       'port, and only poll Travis for builds that have not '
+                       'reported within --webhook-window')
+        p.add_argument('--webhook-window', dest='webhook_window',
+                       action='store', type=int,
+                       default=DEFAULT_WEBHOOK_WINDOW,
+                       help='seconds, beyond its expected duration, to wait '
+                       'for a webhook notification of a Travis build before '
+                       'polling for it (default: %d)' % DEFAULT_WEBHOOK_WINDOW)
+        p.add_argument('--http-retries', dest='http_retries', action='store',
+                       type=int, default=DEFAULT_RETRIES,
+                       help='number of times to retry failed requests to '
+                       'Travis, GitHub and S3, with jittered exponential '
+                       'backoff (default: %d)' % DEFAULT_RETRIES)
+        p.add_argument('--http-timeout', dest='http_timeouts',
+                       action='append', default=[], type=http_timeout,
+                       help='SERVICE=SECONDS request timeout for travis, '
+                       'github or s3 (defaults: %s). Can be specified '
+                       'multiple times.' % ', '.join(
+                           '%s=%d' % (k, DEFAULT_TIMEOUTS[k])
+                           for k in sorted(DEFAULT_TIMEOUTS.keys())))
+        p.add_argument('--rate-limit-reserve', dest='rate_limit_reserve',
+                       action='store', type=int, default=DEFAULT_RESERVE,
+                       help='number of requests in each GitHub and Travis '
+                       'rate-limit window to leave unused; requests are '
+                       'paced, and wait for the window to reset, to stay '
+                       'above this (default: %d)' % DEFAULT_RESERVE)
+        p.add_argument('--breaker-threshold', dest='breaker_threshold',
+                       action='store', type=int,
+                       default=DEFAULT_FAILURE_THRESHOLD,
+                       help='number of consecutive failed calls to Travis or '
+                       'GitHub after which to stop calling it, with '
+                       'exponential backoff, until it recovers (default: '
+                       '%d)' % DEFAULT_FAILURE_THRESHOLD)
+        p.add_argument('--max-outage', dest='max_outage', action='store',
+                       type=int, default=DEFAULT_MAX_OUTAGE,
+                       help='seconds Travis may be unavailable before giving '
+                       'up on its unfinished builds, and Travis or GitHub '
+                       'before giving up on discovering its projects '
+                       '(default: %d)' % DEFAULT_MAX_OUTAGE)
+        p.add_argument('--max-travis-in-flight', dest='max_travis_in_flight',
+                       action='store', type=int, default=None,
+                       help='maximum number of Travis builds to have '
+                       'triggered and not yet finished at once; the rest are '
+                       'triggered as those finish (default: no limit)')
+        p.add_argument('--always-trigger', dest='travis_attach',
+                       action='store_false', default=True,
+                       help='trigger a new Travis build even if one of the '
+                       'repository is already pending or running, instead of '
+                       'using that build')
+        p.add_argument('--cancel-stale-travis', dest='cancel_stale_travis',
+                       action='store_true', default=False,
+                       help='cancel pending or running Travis builds that '
+                       'rebuildbot triggered previously, other than the one '
+                       'it uses')
+        p.add_argument('--auth-cache-ttl', dest='auth_cache_ttl',
+                       action='store', type=int, default=DEFAULT_AUTH_TTL,
+                       help='seconds to cache the Travis access token and '
+                       'the S3 bucket endpoint for, under the state '
+                       'directory; 0 to not cache them (default: %d)' %
+                       DEFAULT_AUTH_TTL)
+        p.add_argument('BUCKET_NAME', action='store', type=str, nargs='?',
+                       help='Name of S3 bucket to upload reports to; '
+                       'required unless --version is given')
         args = p.parse_args(argv)
+        if args.BUCKET_NAME is None and not args.version:
+            p.error('the following arguments are required: BUCKET_NAME')
         return args
 
     def console_entry_point(self):
@@ -162,12 +493,60 @@ class Runner(object):
             ))
             raise SystemExit(0)
 
+        # imported here, as it imports all of ReBuildBot's dependencies
+        from .bot import ReBuildBot
+        repo_tags = {}
+        for slug, tags in args.repo_tags:
+            repo_tags.setdefault(slug, []).extend(tags)
         bot = ReBuildBot(args.BUCKET_NAME, s3_prefix=args.s3_prefix,
                          dry_run=args.dry_run, date_check=args.date_check,
                          run_local=args.run_local, run_travis=args.run_travis,
                          log_buffer=log_capture_string,
-                         ignore_repos=args.ignore_repos)
+                         ignore_repos=args.ignore_repos,
+                         schedule=args.schedule, state_dir=args.state_dir,
+                         build_timeout=args.build_timeout,
+                         inactivity_timeout=args.inactivity_timeout,
+                         repo_timeouts=dict(args.repo_timeouts),
+                         deadline=args.deadline,
+                         time_budget=args.time_budget,
+                         max_repos=args.max_repos,
+                         stale_after=args.stale_after,
+                         persistent_workspaces=args.persistent_workspaces,
+                         workspace_max_size=args.workspace_max_size,
+                         caches=args.caches,
+                         cache_limits=dict(args.cache_limits),
+                         prefetch=args.prefetch,
+                         prefetch_min_free=args.prefetch_min_free,
+                         race_clone=args.race_clone,
+                         local_workers=args.local_workers,
+                         max_load=args.max_load,
+                         min_free_memory=args.min_free_memory,
+                         min_free_disk=args.min_free_disk,
+                         build_nice=args.build_nice,
+                         build_ionice=args.build_ionice,
+                         build_cpu_limit=args.build_cpu_limit,
+                         build_memory_limit=args.build_memory_limit,
+                         cgroup_root=args.cgroup_root,
+                         repo_tags=repo_tags,
+                         tag_limits=dict(args.tag_limits),
+                         regression_window=args.regression_window,
+                         regression_threshold=args.regression_threshold,
+                         webhook_port=args.webhook_port,
+                         webhook_window=args.webhook_window,
+                         http_retries=args.http_retries,
+                         http_timeouts=dict(args.http_timeouts),
+                         rate_limit_reserve=args.rate_limit_reserve,
+                         breaker_threshold=args.breaker_threshold,
+                         max_outage=args.max_outage,
+                         max_travis_in_flight=args.max_travis_in_flight,
+                         travis_attach=args.travis_attach,
+                         cancel_stale_travis=args.cancel_stale_travis,
+                         auth_cache_ttl=args.auth_cache_ttl)
         bot.run(projects=args.repos)
+        if args.fail_on_regression and len(bot.regressions) > 0:
+            logger.error("Build duration regressions found in: %s",
+                         ', '.join(sorted(bot.regressions.keys())))
+            raise SystemExit(1)
 
 
 def console_entry_point():
@@ -0,0 +1,189 @@
+"""
+rebuildbot/scheduler.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_DURATION = 600  # seconds; assumed for repos with no history
+
+#: names of the available local build scheduling policies
+POLICIES = ['alphabetical', 'longest-first', 'shortest-first']
+
+
+class BuildScheduler(object):
+    """
+    Decides the order in which pending local builds are started.
+
+    Policies:
+
+    * ``alphabetical`` - by repository slug (the historical behavior).
+    * ``longest-first`` - longest expected duration first (LPT), which
+      minimizes total run time when builds run in parallel.
+    * ``shortest-first`` - shortest expected duration first, for the fastest
+      feedback on the most repositories.
+
+    Expected durations come from :py:class:`~.BuildHistory`. Repositories
+    with no history are assumed to take the ``expected_duration`` from their
+    ``.rebuildbot.yml``, or :py:const:`~.DEFAULT_LOCAL_DURATION`, with ties
+    broken by repository size (larger repos are assumed to take longer), and
+    then by slug.
+
+    When local builds run in parallel, repositories can be tagged with the
+    resources their builds use (i.e. ``virtualbox`` or ``docker``), and each
+    tag can have a limit on how many builds using it may run at once. A
+    build is only started if none of its tags is at its limit; untagged
+    builds, and tags without a limit, are only limited by the number of
+    workers.
+    """
+
+    def __init__(self, policy='alphabetical', history=None, tag_limits={},
+                 repo_tags={}):
+        """
+        :param policy: name of the scheduling policy; one of
+          :py:const:`~.POLICIES`
+        :type policy: str
+        :param history: build history to estimate durations from
+        :type history: :py:class:`~.BuildHistory`
+        :param tag_limits: dict of resource tag to the maximum number of
+          local builds with that tag that may run at once
+        :type tag_limits: dict
+        :param repo_tags: dict of repository slug to a list of resource tags,
+          in addition to those declared by the repository itself
+        :type repo_tags: dict
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown scheduling policy '%s'; must be one "
+                             "of: %s" % (policy, ', '.join(POLICIES)))
+        self.policy = policy
+        self.history = history
+        self.tag_limits = tag_limits
+        self.repo_tags = dict(
+            (k.lower(), v) for k, v in repo_tags.items()
+        )
+
+    def expected_duration(self, build_info):
+        """
+        Return the expected duration of a local build, in seconds; the
+        median from the build history, else the ``expected_duration`` from
+        the repository's manifest, else
+        :py:const:`~.DEFAULT_LOCAL_DURATION`.
+
+        :param build_info: the BuildInfo of the build
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: float
+        """
+        if self.history is not None:
+            d = self.history.expected_local_duration(build_info.slug)
+            if d is not None:
+                return d
+        return build_info.manifest.get('expected_duration',
+                                       DEFAULT_LOCAL_DURATION)
+
+    def fits(self, build_info, remaining):
+        """
+        Return whether a local build is expected to finish within
+        ``remaining`` seconds.
+
+        :param build_info: the BuildInfo of the build
+        :type build_info: :py:class:`~.BuildInfo`
+        :param remaining: seconds left before the run's deadline
+        :type remaining: float
+        :rtype: bool
+        """
+        return self.expected_duration(build_info) <= remaining
+
+    def tags_for(self, build_info):
+        """
+        Return the sorted list of resource tags of a build; those declared
+        in the repository's manifest plus those configured in
+        ``self.repo_tags``.
+
+        :param build_info: the BuildInfo of the build
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: list
+        """
+        tags = set(build_info.resource_tags)
+        tags.update(self.repo_tags.get(build_info.slug.lower(), []))
+        return sorted(tags)
+
+    def blocking_tag(self, build_info, running):
+        """
+        Return the first resource tag of ``build_info`` that already has as
+        many builds running as its limit allows, or None if the build may
+        start.
+
+        :param build_info: the BuildInfo of the build to start
+        :type build_info: :py:class:`~.BuildInfo`
+        :param running: BuildInfo objects of the local builds running now
+        :type running: list
+        :rtype: str
+        """
+        if len(self.tag_limits) == 0 or len(running) == 0:
+            return None
+        for tag in self.tags_for(build_info):
+            if tag not in self.tag_limits:
+                continue
+            count = len([b for b in running if tag in self.tags_for(b)])
+            if count >= self.tag_limits[tag]:
+                return tag
+        return None
+
+    def order(self, builds):
+        """
+        Return the items of ``builds`` as a list of (slug, BuildInfo) 2-tuples
+        in the order they should be started according to ``self.policy``.
+
+        :param builds: dict of repository slug to BuildInfo
+        :type builds: dict
+        :rtype: list
+        """
+        items = sorted(builds.items())
+        if self.policy == 'alphabetical':
+            return items
+        sign = -1
+        if self.policy == 'shortest-first':
+            sign = 1
+
+        def sort_key(item):
+            bi = item[1]
+            size = bi.repo_size or 0
+            return (sign * self.expected_duration(bi), sign * size, item[0])
+
+        return sorted(items, key=sort_key)
@@ -0,0 +1,236 @@
+"""
+rebuildbot/tests/test_admission.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import errno
+
+from rebuildbot.admission import (AdmissionController, available_memory_mb,
+                                  free_disk_mb, MAX_ADMISSION_WAIT,
+                                  DEFAULT_CGROUP_ROOT)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import Mock, patch, mock_open
+else:
+    from unittest.mock import Mock, patch, mock_open
+
+pbm = 'rebuildbot.admission'
+pb = '%s.AdmissionController' % pbm
+
+
+class TestAdmissionController(object):
+
+    def setup(self):
+        self.cls = AdmissionController(disk_path='/builds')
+
+    def test_init(self):
+        cls = AdmissionController()
+        assert cls.max_load is None
+        assert cls.min_free_memory_mb is None
+        assert cls.min_free_disk_mb is None
+        assert cls.disk_path is not None
+        assert cls.nice is None
+        assert cls.ionice is None
+        assert cls.cpu_limit is None
+        assert cls.memory_limit_mb is None
+        assert cls.cgroup_root == DEFAULT_CGROUP_ROOT
+        assert cls.refused_since is None
+
+    def test_check_no_thresholds(self):
+        with patch('%s.os.getloadavg' % pbm) as mock_load:
+            assert self.cls.check() is None
+        assert mock_load.mock_calls == []
+
+    def test_check_load(self):
+        self.cls.max_load = 4
+        with patch('%s.os.getloadavg' % pbm) as mock_load:
+            mock_load.return_value = (3.5, 1.0, 1.0)
+            assert self.cls.check() is None
+            mock_load.return_value = (4.25, 1.0, 1.0)
+            assert self.cls.check() == 'load average 4.25 is above 4'
+
+    def test_check_memory(self):
+        self.cls.min_free_memory_mb = 1024
+        with patch('%s.available_memory_mb' % pbm) as mock_mem:
+            mock_mem.return_value = 2048
+            assert self.cls.check() is None
+            mock_mem.return_value = 512
+            assert self.cls.check() == 'only 512 MB of memory is available'
+            mock_mem.return_value = None
+            assert self.cls.check() is None
+
+    def test_check_disk(self):
+        self.cls.min_free_disk_mb = 1024
+        with patch('%s.free_disk_mb' % pbm) as mock_disk:
+            mock_disk.return_value = 100
+            assert self.cls.check() == 'only 100 MB of disk is free on ' \
+                '/builds'
+        mock_disk.assert_called_once_with('/builds')
+
+    def test_check_disk_unknown(self):
+        self.cls.min_free_disk_mb = 1024
+        with patch('%s.free_disk_mb' % pbm) as mock_disk:
+            mock_disk.return_value = None
+            assert self.cls.check() is None
+
+    def test_admit(self):
+        with patch('%s.check' % pb) as mock_check, \
+                patch('%s.time.time' % pbm) as mock_time:
+            mock_check.return_value = 'too busy'
+            mock_time.return_value = 1000
+            assert self.cls.admit() == 'too busy'
+            assert self.cls.refused_since == 1000
+            mock_time.return_value = 1000 + MAX_ADMISSION_WAIT
+            # a build is running; keep waiting
+            assert self.cls.admit(1) == 'too busy'
+            # nothing running; don't wait forever
+            assert self.cls.admit(0) is None
+            assert self.cls.refused_since is None
+            mock_check.return_value = None
+            assert self.cls.admit(1) is None
+
+    def test_command(self):
+        assert self.cls.command(['./foo']) == ['./foo']
+        self.cls.nice = 10
+        self.cls.ionice = 'idle'
+        assert self.cls.command(['./foo']) == [
+            'nice', '-n', '10', 'ionice', '-c', '3', './foo'
+        ]
+        assert self.cls.command(['./foo'], cgroup='/cg/b') == [
+            'sh', '-c', 'echo $$ > "$0" && exec "$@"', '/cg/b/cgroup.procs',
+            'nice', '-n', '10', 'ionice', '-c', '3', './foo'
+        ]
+
+    def test_create_cgroup_no_limits(self, tmpdir):
+        self.cls.cgroup_root = str(tmpdir.join('cg'))
+        assert self.cls.create_cgroup('me/repo') is None
+        assert tmpdir.listdir() == []
+
+    def test_create_cgroup(self, tmpdir):
+        self.cls.cgroup_root = str(tmpdir.join('cg'))
+        self.cls.cpu_limit = 1.5
+        self.cls.memory_limit_mb = 512
+        res = self.cls.create_cgroup('me/repo')
+        cg = tmpdir.join('cg', 'build-me__repo-%d' % os.getpid())
+        assert res == str(cg)
+        assert tmpdir.join('cg', 'cgroup.subtree_control').read() == \
+            '+cpu +memory'
+        assert cg.join('cpu.max').read() == '150000 100000'
+        assert cg.join('memory.max').read() == str(512 * 1024 * 1024)
+
+    def test_create_cgroup_fails(self, tmpdir):
+        tmpdir.join('cg').write('not a directory')
+        self.cls.cgroup_root = str(tmpdir.join('cg'))
+        self.cls.cpu_limit = 1
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.create_cgroup('me/repo') is None
+        assert mock_logger.warning.call_count == 1
+
+    def test_cgroup_usage(self, tmpdir):
+        tmpdir.join('cpu.stat').write(
+            'usage_usec 75000000\nuser_usec 60000000\n'
+            'system_usec 15000000\nnr_periods 0\n')
+        tmpdir.join('memory.peak').write('%d\n' % (1536 * 1024 * 1024))
+        tmpdir.join('io.stat').write(
+            '8:0 rbytes=1000 wbytes=2000 rios=1 wios=2\n'
+            '8:16 rbytes=24 wbytes=48 rios=1 wios=2\n')
+        assert self.cls.cgroup_usage(str(tmpdir)) == {
+            'cpu': 75.0,
+            'user_cpu': 60.0,
+            'sys_cpu': 15.0,
+            'max_memory_mb': 1536.0,
+            'read_bytes': 1024,
+            'write_bytes': 2048,
+        }
+
+    def test_cgroup_usage_missing(self, tmpdir):
+        assert self.cls.cgroup_usage(str(tmpdir)) == {}
+
+    def test_remove_cgroup(self, tmpdir):
+        d = tmpdir.mkdir('build')
+        self.cls.remove_cgroup(None)
+        self.cls.remove_cgroup(str(d))
+        assert d.exists() is False
+        # already gone
+        self.cls.remove_cgroup(str(d))
+
+
+class TestHelpers(object):
+
+    def test_available_memory_mb(self):
+        content = 'MemTotal:  16384000 kB\nMemAvailable:  2097152 kB\n'
+        with patch('%s.open' % pbm, mock_open(read_data=content),
+                   create=True):
+            assert available_memory_mb() == 2048
+
+    def test_available_memory_mb_missing(self):
+        with patch('%s.open' % pbm, create=True) as mock_open_:
+            mock_open_.side_effect = IOError('no such file')
+            assert available_memory_mb() is None
+
+    def test_free_disk_mb(self):
+        st = Mock(f_bavail=2048, f_frsize=1024 * 1024)
+        with patch('%s.os.statvfs' % pbm) as mock_statvfs:
+            mock_statvfs.return_value = st
+            assert free_disk_mb('/foo') == 2048
+        mock_statvfs.assert_called_once_with('/foo')
+
+    def test_free_disk_mb_missing_path(self, tmpdir):
+        path = str(tmpdir.join('workspaces', 'root'))
+        res = free_disk_mb(path)
+        assert res == free_disk_mb(str(tmpdir))
+        assert res > 0
+
+    def test_free_disk_mb_error(self):
+        with patch('%s.os.statvfs' % pbm) as mock_statvfs:
+            mock_statvfs.side_effect = OSError(errno.EACCES, 'denied')
+            assert free_disk_mb('/foo') is None
+        mock_statvfs.assert_called_once_with('/foo')
+
+    def test_check_disk_missing_root(self, tmpdir):
+        cls = AdmissionController(
+            min_free_disk_mb=1,
+            disk_path=str(tmpdir.join('workspaces'))
+        )
+        assert cls.check() is None
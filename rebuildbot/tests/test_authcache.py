@@ -0,0 +1,131 @@
+"""
+rebuildbot/tests/test_authcache.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import json
+import stat
+
+from rebuildbot.authcache import AuthCache, DEFAULT_AUTH_TTL, fingerprint
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch
+else:
+    from unittest.mock import patch
+
+pbm = 'rebuildbot.authcache'
+
+
+def test_fingerprint():
+    res = fingerprint('mytoken')
+    assert len(res) == 64
+    assert res == fingerprint('mytoken')
+    assert res != fingerprint('othertoken')
+    assert 'mytoken' not in res
+
+
+class TestAuthCache(object):
+
+    def test_init_no_file(self, tmpdir):
+        path = str(tmpdir.join('auth.json'))
+        cls = AuthCache(path)
+        assert cls.path == path
+        assert cls.ttl == DEFAULT_AUTH_TTL
+        assert cls.data == {'entries': {}}
+        assert cls.get('foo') is None
+
+    def test_init_bad_file(self, tmpdir):
+        path = tmpdir.join('auth.json')
+        path.write('not json{')
+        cls = AuthCache(str(path))
+        assert cls.data == {'entries': {}}
+
+    def test_delete(self, tmpdir):
+        path = str(tmpdir.join('auth.json'))
+        cls = AuthCache(path, ttl=100)
+        cls.set('travis:abc', {'token': 'tkn'})
+        cls.set('s3:def', {'endpoint': 'ep'})
+        cls.delete('travis:abc')
+        assert cls.get('travis:abc') is None
+        with open(path, 'r') as fh:
+            data = json.load(fh)
+        assert list(data['entries'].keys()) == ['s3:def']
+        with patch('%s.AuthCache.save' % pbm) as mock_save:
+            cls.delete('travis:abc')
+        assert mock_save.mock_calls == []
+
+    def test_set_get(self, tmpdir):
+        path = str(tmpdir.join('auth.json'))
+        cls = AuthCache(path, ttl=100)
+        with patch('%s.time.time' % pbm) as mock_time:
+            mock_time.return_value = 1000.0
+            cls.set('travis:abc', {'token': 'tkn'})
+            assert cls.get('travis:abc') == {'token': 'tkn'}
+            mock_time.return_value = 1099.0
+            assert cls.get('travis:abc') == {'token': 'tkn'}
+            mock_time.return_value = 1100.0
+            assert cls.get('travis:abc') is None
+        with open(path, 'r') as fh:
+            data = json.load(fh)
+        assert data == {
+            'entries': {
+                'travis:abc': {'value': {'token': 'tkn'}, 'expires': 1100.0}
+            }
+        }
+
+    def test_load_saved(self, tmpdir):
+        path = str(tmpdir.join('auth.json'))
+        AuthCache(path).set('s3:bkt', 'bkt.example.com')
+        cls = AuthCache(path)
+        assert cls.get('s3:bkt') == 'bkt.example.com'
+
+    def test_save_permissions(self, tmpdir):
+        path = str(tmpdir.join('state', 'auth.json'))
+        cls = AuthCache(path)
+        cls.set('s3:bkt', 'bkt.example.com')
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+        assert mode == 0o600
+        dirmode = stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode)
+        assert dirmode & 0o077 == 0
+        assert not os.path.exists(path + '.tmp')
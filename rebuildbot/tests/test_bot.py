@@ -41,7 +41,10 @@ import sys
 import pytest
 import pytz
 import re
-from datetime import datetime, timedelta
+import json
+import threading
+from time import mktime
+from datetime import datetime, timedelta, time
 from textwrap import dedent
 
 from boto.s3.connection import S3Connection
@@ -49,11 +52,31 @@ from boto.s3.bucket import Bucket
 from boto.s3.key import Key
 
 from rebuildbot.bot import ReBuildBot
-from rebuildbot.travis import Travis
+from rebuildbot.travis import Travis, BuildStatus
 from rebuildbot.exceptions import (GitTokenMissingError, PollTimeoutException,
-                                   TravisTriggerError)
+                                   TravisTriggerError, CircuitOpenError)
 from rebuildbot.github_wrapper import GitHubWrapper
 from rebuildbot.buildinfo import BuildInfo
+from rebuildbot.history import BuildHistory
+from rebuildbot.scheduler import BuildScheduler
+from rebuildbot.workspace import WorkspaceManager
+from rebuildbot.caches import CacheManager
+from rebuildbot.reaper import Reaper
+from rebuildbot.prefetch import Prefetcher
+from rebuildbot.admission import AdmissionController, DEFAULT_CGROUP_ROOT
+from rebuildbot.discovery import Discoverer
+from rebuildbot.history import (DEFAULT_REGRESSION_WINDOW,
+                                DEFAULT_REGRESSION_THRESHOLD)
+from rebuildbot.webhook import WebhookReceiver, DEFAULT_WEBHOOK_WINDOW
+from rebuildbot.ratelimit import RateLimiter, DEFAULT_RESERVE
+from rebuildbot.triggers import TriggerQueue
+from rebuildbot.authcache import AuthCache, DEFAULT_AUTH_TTL
+from rebuildbot.connector import Connector
+from rebuildbot.circuitbreaker import (CircuitBreaker,
+                                       DEFAULT_FAILURE_THRESHOLD,
+                                       DEFAULT_MAX_OUTAGE)
+from rebuildbot.httpsession import (HTTPConfig, DEFAULT_RETRIES,
+                                    DEFAULT_TIMEOUTS, DEFAULT_POOL_SIZE)
 from rebuildbot.version import _VERSION
 
 from travispy.errors import TravisError
@@ -89,17 +112,31 @@ class TestReBuildBotInit(object):
         with patch('%s.get_github_token' % pb) as mock_get_gh_token, \
                 patch('%s.GitHubWrapper' % pbm) as mock_gh, \
                 patch('%s.Travis' % pbm) as mock_travis, \
-                patch('%s.connect_s3' % pb) as mock_connect_s3:
+                patch('%s.connect_s3' % pb) as mock_connect_s3, \
+                patch('%s.BuildHistory' % pbm) as mock_history, \
+                patch('%s.Reaper' % pbm) as mock_reaper, \
+                patch('%s.os.path.expanduser' % pbm) as mock_expanduser:
             mock_get_gh_token.return_value = 'myGHtoken'
+            mock_expanduser.return_value = '/home/me/.rebuildbot'
             cls = ReBuildBot('mybucket', log_buffer=mock_stringio)
+            # nothing is connected to until it is used
+            assert mock_gh.mock_calls == []
+            assert mock_travis.mock_calls == []
+            assert mock_connect_s3.mock_calls == []
+            assert cls.github is mock_gh.return_value
+            assert cls.travis is mock_travis.return_value
+            assert cls.bucket is mock_connect_s3.return_value
         assert mock_get_gh_token.mock_calls == [call()]
-        assert mock_gh.mock_calls == [call('myGHtoken')]
-        assert mock_travis.mock_calls == [call('myGHtoken')]
+        assert mock_gh.mock_calls == [call('myGHtoken', http=cls.http)]
+        assert mock_travis.mock_calls == [
+            call('myGHtoken', http=cls.http, cache=cls.auth_cache)
+        ]
         assert mock_connect_s3.mock_calls == [call('mybucket')]
         assert cls.gh_token == 'myGHtoken'
-        assert cls.github == mock_gh.return_value
-        assert cls.travis == mock_travis.return_value
-        assert cls.bucket == mock_connect_s3.return_value
+        assert isinstance(cls.auth_cache, AuthCache)
+        assert cls.auth_cache.path == '/home/me/.rebuildbot/auth.json'
+        assert cls.auth_cache.ttl == DEFAULT_AUTH_TTL
+        assert sorted(cls.connections.keys()) == ['github', 's3', 'travis']
         assert cls.dry_run is False
         assert cls.builds == {}
         assert cls.s3_prefix == 'rebuildbot'
@@ -108,6 +145,253 @@ class TestReBuildBotInit(object):
         assert cls.run_local is True
         assert cls.log_buffer == mock_stringio
         assert cls.ignore_repos == []
+        assert mock_expanduser.mock_calls == [call('~/.rebuildbot')]
+        assert cls.state_dir == '/home/me/.rebuildbot'
+        assert mock_history.mock_calls == [
+            call('/home/me/.rebuildbot/history.json')
+        ]
+        assert cls.history == mock_history.return_value
+        assert isinstance(cls.scheduler, BuildScheduler)
+        assert cls.scheduler.policy == 'alphabetical'
+        assert cls.scheduler.history == mock_history.return_value
+        assert cls.build_timeout is None
+        assert cls.inactivity_timeout is None
+        assert cls.repo_timeouts == {}
+        assert cls.deadline_time is None
+        assert cls.time_budget is None
+        assert cls.deadline is None
+        assert cls.max_repos is None
+        assert cls.stale_after is None
+        assert cls.workspaces is None
+        assert cls.caches is None
+        assert mock_reaper.mock_calls == [call()]
+        assert cls.reaper == mock_reaper.return_value
+        assert cls.prefetcher is None
+        assert cls.race_clone is False
+        assert cls.local_workers == 1
+        assert cls.local_running == {}
+        assert cls.admission is None
+        assert cls.discoverer is None
+        assert cls.select_stale is True
+        assert cls.stale_decided == {}
+        assert cls.stale_held == {}
+        assert cls.regression_window == DEFAULT_REGRESSION_WINDOW
+        assert cls.regression_threshold == DEFAULT_REGRESSION_THRESHOLD
+        assert cls.regressions == {}
+        assert cls.webhooks is None
+        assert cls.webhook_window == DEFAULT_WEBHOOK_WINDOW
+        assert cls.travis_next_poll == {}
+        assert cls.http.retries == DEFAULT_RETRIES
+        assert cls.http.timeouts == DEFAULT_TIMEOUTS
+        assert cls.http.pool_size == DEFAULT_POOL_SIZE
+        assert cls.http.governor == cls.ratelimit
+        assert cls.ratelimit.reserve == DEFAULT_RESERVE
+        assert sorted(cls.breakers.keys()) == ['github', 'travis']
+        assert cls.breakers['travis'].threshold == DEFAULT_FAILURE_THRESHOLD
+        assert cls.max_outage == DEFAULT_MAX_OUTAGE
+        assert cls.triggers.max_in_flight is None
+        assert cls.triggers.trigger == cls.trigger_travis_build
+        assert cls.travis_attach is True
+        assert cls.cancel_stale_travis is False
+
+    def test_init_http(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm) as mock_gh, \
+             patch('%s.Travis' % pbm) as mock_travis, \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', http_retries=2,
+                             http_timeouts={'github': 10}, local_workers=8,
+                             prefetch=4, auth_cache_ttl=0)
+            cls.github
+            cls.travis
+        assert cls.http.retries == 2
+        assert cls.http.timeouts == {'travis': 30, 'github': 10, 's3': 60}
+        assert cls.http.pool_size == 12
+        assert cls.auth_cache is None
+        assert mock_gh.mock_calls == [call('myGHtoken', http=cls.http)]
+        assert mock_travis.mock_calls == [
+            call('myGHtoken', http=cls.http, cache=None)
+        ]
+
+    def test_init_timeouts(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', build_timeout=3600,
+                             inactivity_timeout=60,
+                             repo_timeouts={'Foo/Bar': 7200})
+        assert cls.build_timeout == 3600
+        assert cls.inactivity_timeout == 60
+        assert cls.repo_timeouts == {'foo/bar': 7200}
+
+    def test_init_webhooks(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm) as mock_travis, \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.WebhookReceiver' % pbm) as mock_receiver:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', webhook_port=8080,
+                             webhook_window=600)
+        assert mock_receiver.mock_calls == [
+            call(8080)
+        ]
+        assert mock_travis.mock_calls == []
+        assert cls.webhooks == mock_receiver.return_value
+        assert cls.webhook_window == 600
+
+    def test_init_webhooks_no_travis(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.WebhookReceiver' % pbm) as mock_receiver:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', webhook_port=8080, run_travis=False)
+        assert mock_receiver.mock_calls == []
+        assert cls.webhooks is None
+
+    def test_init_deadline(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', deadline=time(6, 30),
+                             time_budget=3600)
+        assert cls.deadline_time == time(6, 30)
+        assert cls.time_budget == 3600
+        assert cls.deadline is None
+
+    def test_init_rotation(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', max_repos=10, stale_after=7)
+        assert cls.max_repos == 10
+        assert cls.stale_after == 7
+
+    def test_init_workspaces(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.WorkspaceManager' % pbm) as mock_wm, \
+             patch('%s.Reaper' % pbm) as mock_reaper:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', state_dir='/my/state',
+                             persistent_workspaces=True,
+                             workspace_max_size=1024)
+        assert mock_wm.mock_calls == [
+            call('/my/state/workspaces', max_size_mb=1024,
+                 reaper=mock_reaper.return_value)
+        ]
+        assert cls.workspaces == mock_wm.return_value
+
+    def test_init_caches(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.CacheManager' % pbm) as mock_cm, \
+             patch('%s.Reaper' % pbm) as mock_reaper:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', state_dir='/my/state',
+                             caches=['pip'], cache_limits={'pip': 10})
+        assert mock_cm.mock_calls == [
+            call('/my/state/caches', ['pip'], limits_mb={'pip': 10},
+                 reaper=mock_reaper.return_value)
+        ]
+        assert cls.caches == mock_cm.return_value
+
+    def test_init_prefetch(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.Prefetcher' % pbm) as mock_prefetcher, \
+             patch('%s.Reaper' % pbm) as mock_reaper:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', prefetch=2, prefetch_min_free=100)
+        assert mock_prefetcher.mock_calls == [
+            call(2, workspaces=None, reaper=mock_reaper.return_value,
+                 min_free_mb=100, history=cls.history, race_clone=False)
+        ]
+        assert cls.prefetcher == mock_prefetcher.return_value
+
+    def test_init_admission(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.AdmissionController' % pbm) as mock_adm, \
+             patch('%s.Reaper' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', state_dir='/my/state',
+                             persistent_workspaces=True, local_workers=2,
+                             max_load=4.0, min_free_disk=100, build_nice=10,
+                             build_memory_limit=512)
+        assert cls.local_workers == 2
+        assert mock_adm.mock_calls == [
+            call(max_load=4.0, min_free_memory_mb=None, min_free_disk_mb=100,
+                 disk_path='/my/state/workspaces', nice=10, ionice=None,
+                 cpu_limit=None, memory_limit_mb=512,
+                 cgroup_root=DEFAULT_CGROUP_ROOT)
+        ]
+        assert cls.admission == mock_adm.return_value
+
+    def test_init_prefetch_dry_run(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm), \
+             patch('%s.Prefetcher' % pbm) as mock_prefetcher, \
+             patch('%s.Reaper' % pbm):
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', prefetch=2, dry_run=True)
+        assert mock_prefetcher.mock_calls == []
+        assert cls.prefetcher is None
+
+    def test_init_schedule(self):
+        with \
+             patch('%s.get_github_token' % pb) as mock_get_gh_token, \
+             patch('%s.GitHubWrapper' % pbm), \
+             patch('%s.Travis' % pbm), \
+             patch('%s.connect_s3' % pb), \
+             patch('%s.BuildHistory' % pbm) as mock_history:
+            mock_get_gh_token.return_value = 'myGHtoken'
+            cls = ReBuildBot('mybucket', schedule='longest-first',
+                             state_dir='/my/state')
+        assert cls.state_dir == '/my/state'
+        assert mock_history.mock_calls == [call('/my/state/history.json')]
+        assert cls.scheduler.policy == 'longest-first'
 
     def test_init_dry_run(self):
         with \
@@ -119,13 +403,10 @@ class TestReBuildBotInit(object):
             cls = ReBuildBot('mybucket', s3_prefix='foo', dry_run=True,
                              date_check=False)
         assert mock_get_gh_token.mock_calls == [call()]
-        assert mock_gh.mock_calls == [call('myGHtoken')]
-        assert mock_travis.mock_calls == [call('myGHtoken')]
-        assert mock_connect_s3.mock_calls == [call('mybucket')]
+        assert mock_gh.mock_calls == []
+        assert mock_travis.mock_calls == []
+        assert mock_connect_s3.mock_calls == []
         assert cls.gh_token == 'myGHtoken'
-        assert cls.github == mock_gh.return_value
-        assert cls.travis == mock_travis.return_value
-        assert cls.bucket == mock_connect_s3.return_value
         assert cls.dry_run is True
         assert cls.builds == {}
         assert cls.s3_prefix == 'foo'
@@ -143,9 +424,9 @@ class TestReBuildBotInit(object):
             mock_get_gh_token.return_value = 'myGHtoken'
             cls = ReBuildBot('mybucket', run_travis=False)
         assert mock_get_gh_token.mock_calls == [call()]
-        assert mock_gh.mock_calls == [call('myGHtoken')]
-        assert mock_travis.mock_calls == [call('myGHtoken')]
-        assert mock_connect_s3.mock_calls == [call('mybucket')]
+        assert mock_gh.mock_calls == []
+        assert mock_travis.mock_calls == []
+        assert mock_connect_s3.mock_calls == []
         assert cls.run_travis is False
 
     def test_init_run_local_false(self):
@@ -157,9 +438,9 @@ class TestReBuildBotInit(object):
             mock_get_gh_token.return_value = 'myGHtoken'
             cls = ReBuildBot('mybucket', run_local=False)
         assert mock_get_gh_token.mock_calls == [call()]
-        assert mock_gh.mock_calls == [call('myGHtoken')]
-        assert mock_travis.mock_calls == [call('myGHtoken')]
-        assert mock_connect_s3.mock_calls == [call('mybucket')]
+        assert mock_gh.mock_calls == []
+        assert mock_travis.mock_calls == []
+        assert mock_connect_s3.mock_calls == []
         assert cls.run_local is False
 
     def test_init_ignore_repos(self):
@@ -171,9 +452,9 @@ class TestReBuildBotInit(object):
             mock_get_gh_token.return_value = 'myGHtoken'
             cls = ReBuildBot('mybucket', ignore_repos=['foo/Bar', 'foo/baZ'])
         assert mock_get_gh_token.mock_calls == [call()]
-        assert mock_gh.mock_calls == [call('myGHtoken')]
-        assert mock_travis.mock_calls == [call('myGHtoken')]
-        assert mock_connect_s3.mock_calls == [call('mybucket')]
+        assert mock_gh.mock_calls == []
+        assert mock_travis.mock_calls == []
+        assert mock_connect_s3.mock_calls == []
         assert cls.ignore_repos == ['foo/bar', 'foo/baz']
 
 
@@ -189,6 +470,8 @@ class TestReBuildBot(object):
 
         with patch('%s.__init__' % pb, Mock(return_value=None)):
             self.cls = ReBuildBot('bktname')
+            self.cls.connections = {}
+            self.cls.auth_cache = None
             self.cls.gh_token = 'myGHtoken'
             self.cls.github = self.mock_github
             self.cls.travis = self.mock_travis
@@ -201,6 +484,44 @@ class TestReBuildBot(object):
             self.cls.run_local = True
             self.cls.log_buffer = None
             self.cls.ignore_repos = []
+            self.cls.history = Mock(spec_set=BuildHistory)
+            self.cls.scheduler = BuildScheduler(history=self.cls.history)
+            self.cls.build_timeout = None
+            self.cls.inactivity_timeout = None
+            self.cls.repo_timeouts = {}
+            self.cls.deadline_time = None
+            self.cls.time_budget = None
+            self.cls.deadline = None
+            self.cls.max_repos = None
+            self.cls.stale_after = None
+            self.cls.workspaces = None
+            self.cls.caches = None
+            self.cls.reaper = Mock(spec_set=Reaper)
+            self.cls.prefetcher = None
+            self.cls.race_clone = False
+            self.cls.local_workers = 1
+            self.cls.local_running = {}
+            self.cls.admission = None
+            self.cls.discoverer = None
+            self.cls.select_stale = True
+            self.cls.stale_decided = {}
+            self.cls.stale_held = {}
+            self.cls.regression_window = 10
+            self.cls.regression_threshold = 20
+            self.cls.regressions = {}
+            self.cls.webhooks = None
+            self.cls.webhook_window = 1800
+            self.cls.travis_next_poll = {}
+            self.cls.http = Mock(spec_set=HTTPConfig)
+            self.cls.ratelimit = RateLimiter()
+            self.cls.breakers = {
+                'travis': CircuitBreaker('travis'),
+                'github': CircuitBreaker('github'),
+            }
+            self.cls.max_outage = 3600
+            self.cls.triggers = TriggerQueue(self.cls.trigger_travis_build)
+            self.cls.travis_attach = True
+            self.cls.cancel_stale_travis = False
 
     def test_get_github_token_env(self):
         new_env = {
@@ -321,22 +642,42 @@ class TestReBuildBot(object):
             call().__exit__(None, None, None)
         ]
 
+    def set_discovered(self, github, travis):
+        """
+        Make GitHub discovery find ``github``, a list of (slug, return value
+        of inspect_repo) tuples, and Travis discovery find the eligible
+        repositories ``travis``, a list of slugs. Return the lists of mock
+        GitHub and Travis repository objects.
+        """
+        gh = [Mock(full_name=slug) for slug, _ in github]
+        configs = dict(github)
+        self.cls.github.iter_repos.return_value = gh
+        self.cls.github.inspect_repo.side_effect = \
+            lambda r, date_check=True: configs[r.full_name]
+        tr = [Mock(slug=slug) for slug in travis]
+        self.cls.travis.iter_user_repos.return_value = tr
+        self.cls.travis.repo_eligible.return_value = True
+        return gh, tr
+
     def test_find_projects_automatic(self):
         self.cls.date_check = 'foo'
-        self.cls.github.find_projects.return_value = {
-            'a/p1': ('clone_a_p1', 'ssh_a_p1'),
-            'a/p2': ('clone_a_p2', 'ssh_a_p2'),
-        }
-        self.cls.travis.get_repos.return_value = [
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {})),
+            ('a/p2', ('clone_a_p2', 'ssh_a_p2', 20, {})),
+        ], [
             'a/p1',
             'a/p3',
-        ]
+        ])
         res = self.cls.find_projects(None)
         assert self.cls.github.mock_calls == [
-            call.find_projects(date_check='foo')
+            call.iter_repos(),
+            call.inspect_repo(gh[0], date_check='foo'),
+            call.inspect_repo(gh[1], date_check='foo'),
         ]
         assert self.cls.travis.mock_calls == [
-            call.get_repos(date_check='foo')
+            call.iter_user_repos(),
+            call.repo_eligible(tr[0], date_check='foo'),
+            call.repo_eligible(tr[1], date_check='foo'),
         ]
         assert len(res) == 3
         assert res['a/p1'].slug == 'a/p1'
@@ -344,6 +685,7 @@ class TestReBuildBot(object):
         assert res['a/p1'].run_local is True
         assert res['a/p1'].https_clone_url == 'clone_a_p1'
         assert res['a/p1'].ssh_clone_url == 'ssh_a_p1'
+        assert res['a/p1'].repo_size == 10
         assert res['a/p2'].slug == 'a/p2'
         assert res['a/p2'].run_travis is False
         assert res['a/p2'].run_local is True
@@ -355,25 +697,109 @@ class TestReBuildBot(object):
         assert res['a/p3'].https_clone_url is None
         assert res['a/p3'].ssh_clone_url is None
 
+    def test_find_projects_automatic_manifest(self):
+        self.cls.date_check = True
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {'tags': ['vbox']})),
+        ], ['a/p3'])
+        res = self.cls.find_projects(None)
+        assert res['a/p1'].manifest == {'tags': ['vbox']}
+        assert res['a/p1'].resource_tags == ['vbox']
+        assert res['a/p3'].manifest == {}
+
+    def test_find_projects_automatic_rotation(self):
+        self.cls.date_check = True
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {})),
+        ], ['a/p2'])
+        with patch('%s.select_stale_projects' % pb) as mock_select:
+            res = self.cls.find_projects(None)
+        assert res == mock_select.return_value
+        assert mock_select.call_count == 1
+        assert sorted(mock_select.call_args[0][0].keys()) == ['a/p1', 'a/p2']
+
+    def test_select_stale_projects_disabled(self):
+        builds = {'a/p1': Mock(manifest={}), 'a/p2': Mock(manifest={})}
+        assert self.cls.select_stale_projects(builds) == builds
+        assert self.cls.history.mock_calls == []
+
+    def test_select_stale_projects(self):
+        last = {
+            'a/p1': datetime(2015, 10, 19, 1, 0, 0),
+            'a/p2': None,
+            'a/p3': datetime(2015, 10, 1, 1, 0, 0),
+            'a/p4': datetime(2015, 10, 10, 1, 0, 0),
+            'a/p5': datetime(2015, 10, 12, 1, 0, 0),
+        }
+        self.cls.history.last_success.side_effect = lambda s: last[s]
+        builds = dict((k, Mock(manifest={})) for k in last.keys())
+        self.cls.stale_after = 7
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            res = self.cls.select_stale_projects(builds)
+            assert sorted(res.keys()) == ['a/p2', 'a/p3', 'a/p4', 'a/p5']
+            self.cls.max_repos = 3
+            res = self.cls.select_stale_projects(builds)
+            assert sorted(res.keys()) == ['a/p2', 'a/p3', 'a/p4']
+            assert res['a/p2'] == builds['a/p2']
+            self.cls.stale_after = None
+            self.cls.max_repos = 2
+            res = self.cls.select_stale_projects(builds)
+            assert sorted(res.keys()) == ['a/p2', 'a/p3']
+
+    def test_select_stale_projects_rebuild_interval(self):
+        last = {
+            'a/p1': datetime(2015, 10, 19, 1, 0, 0),
+            'a/p2': datetime(2015, 10, 1, 1, 0, 0),
+            'a/p3': datetime(2015, 10, 12, 1, 0, 0),
+        }
+        self.cls.history.last_success.side_effect = lambda s: last[s]
+        builds = {
+            'a/p1': Mock(manifest={'rebuild_interval': 1}),
+            'a/p2': Mock(manifest={'rebuild_interval': 30}),
+            'a/p3': Mock(manifest={}),
+        }
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            res = self.cls.select_stale_projects(builds)
+            assert sorted(res.keys()) == ['a/p1', 'a/p3']
+            self.cls.stale_after = 14
+            res = self.cls.select_stale_projects(builds)
+            assert sorted(res.keys()) == ['a/p1']
+
+    def test_rebuilt_recently(self):
+        now = datetime(2015, 10, 20, 20, 0, 0)
+        last = datetime(2015, 10, 18, 20, 0, 0)
+        bi = BuildInfo('a/p1')
+        assert self.cls.rebuilt_recently('a/p1', bi, last, now) is False
+        self.cls.stale_after = 3
+        assert self.cls.rebuilt_recently('a/p1', bi, None, now) is False
+        assert self.cls.rebuilt_recently('a/p1', bi, last, now) is True
+        bi.manifest = {'rebuild_interval': 2}
+        assert self.cls.rebuilt_recently('a/p1', bi, last, now) is False
+
     def test_find_projects_automatic_ignore_repos(self):
         self.cls.date_check = 'foo'
         self.cls.ignore_repos = 'a/p4'
-        self.cls.github.find_projects.return_value = {
-            'a/p1': ('clone_a_p1', 'ssh_a_p1'),
-            'a/p2': ('clone_a_p2', 'ssh_a_p2'),
-            'a/p4': ('clone_a_p3', 'ssh_a_p3')
-        }
-        self.cls.travis.get_repos.return_value = [
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {})),
+            ('a/p2', ('clone_a_p2', 'ssh_a_p2', 20, {})),
+            ('a/p4', ('clone_a_p3', 'ssh_a_p3', 30, {}))
+        ], [
             'a/p1',
             'a/p3',
             'a/p4'
-        ]
+        ])
         res = self.cls.find_projects(None)
         assert self.cls.github.mock_calls == [
-            call.find_projects(date_check='foo')
+            call.iter_repos(),
+            call.inspect_repo(gh[0], date_check='foo'),
+            call.inspect_repo(gh[1], date_check='foo'),
         ]
         assert self.cls.travis.mock_calls == [
-            call.get_repos(date_check='foo')
+            call.iter_user_repos(),
+            call.repo_eligible(tr[0], date_check='foo'),
+            call.repo_eligible(tr[1], date_check='foo'),
         ]
         assert len(res) == 3
         assert res['a/p1'].slug == 'a/p1'
@@ -381,6 +807,7 @@ class TestReBuildBot(object):
         assert res['a/p1'].run_local is True
         assert res['a/p1'].https_clone_url == 'clone_a_p1'
         assert res['a/p1'].ssh_clone_url == 'ssh_a_p1'
+        assert res['a/p1'].repo_size == 10
         assert res['a/p2'].slug == 'a/p2'
         assert res['a/p2'].run_travis is False
         assert res['a/p2'].run_local is True
@@ -395,17 +822,18 @@ class TestReBuildBot(object):
     def test_find_projects_automatic_no_travis(self):
         self.cls.date_check = 'foo'
         self.cls.run_travis = False
-        self.cls.github.find_projects.return_value = {
-            'a/p1': ('clone_a_p1', 'ssh_a_p1'),
-            'a/p2': ('clone_a_p2', 'ssh_a_p2'),
-        }
-        self.cls.travis.get_repos.return_value = [
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {})),
+            ('a/p2', ('clone_a_p2', 'ssh_a_p2', 20, {})),
+        ], [
             'a/p1',
             'a/p3',
-        ]
+        ])
         res = self.cls.find_projects(None)
         assert self.cls.github.mock_calls == [
-            call.find_projects(date_check='foo')
+            call.iter_repos(),
+            call.inspect_repo(gh[0], date_check='foo'),
+            call.inspect_repo(gh[1], date_check='foo'),
         ]
         assert self.cls.travis.mock_calls == []
         assert len(res) == 2
@@ -414,6 +842,7 @@ class TestReBuildBot(object):
         assert res['a/p1'].run_local is True
         assert res['a/p1'].https_clone_url == 'clone_a_p1'
         assert res['a/p1'].ssh_clone_url == 'ssh_a_p1'
+        assert res['a/p1'].repo_size == 10
         assert res['a/p2'].slug == 'a/p2'
         assert res['a/p2'].run_travis is False
         assert res['a/p2'].run_local is True
@@ -423,18 +852,19 @@ class TestReBuildBot(object):
     def test_find_projects_automatic_no_local(self):
         self.cls.date_check = 'foo'
         self.cls.run_local = False
-        self.cls.github.find_projects.return_value = {
-            'a/p1': ('clone_a_p1', 'ssh_a_p1'),
-            'a/p2': ('clone_a_p2', 'ssh_a_p2'),
-        }
-        self.cls.travis.get_repos.return_value = [
+        gh, tr = self.set_discovered([
+            ('a/p1', ('clone_a_p1', 'ssh_a_p1', 10, {})),
+            ('a/p2', ('clone_a_p2', 'ssh_a_p2', 20, {})),
+        ], [
             'a/p1',
             'a/p3',
-        ]
+        ])
         res = self.cls.find_projects(None)
         assert self.cls.github.mock_calls == []
         assert self.cls.travis.mock_calls == [
-            call.get_repos(date_check='foo')
+            call.iter_user_repos(),
+            call.repo_eligible(tr[0], date_check='foo'),
+            call.repo_eligible(tr[1], date_check='foo'),
         ]
         assert len(res) == 2
         assert res['a/p1'].slug == 'a/p1'
@@ -464,12 +894,12 @@ class TestReBuildBot(object):
 
         def se_config(projname):
             if projname == 'a/p1':
-                return ('clone_a_p1', 'ssh_a_p1')
+                return ('clone_a_p1', 'ssh_a_p1', 10, {})
             if projname == 'a/p2':
-                return ('clone_a_p2', 'ssh_a_p2')
+                return ('clone_a_p2', 'ssh_a_p2', 20, {})
             if projname == 'a/p4':
-                return ('clone_a_p4', 'ssh_a_p4')
-            return (None, None)
+                return ('clone_a_p4', 'ssh_a_p4', 40, {})
+            return (None, None, None, None)
 
         self.cls.github.get_project_config.side_effect = se_config
         self.cls.travis.get_last_build.side_effect = se_last_build
@@ -493,6 +923,7 @@ class TestReBuildBot(object):
         assert res['a/p1'].run_local is True
         assert res['a/p1'].https_clone_url == 'clone_a_p1'
         assert res['a/p1'].ssh_clone_url == 'ssh_a_p1'
+        assert res['a/p1'].repo_size == 10
         assert res['a/p2'].slug == 'a/p2'
         assert res['a/p2'].run_travis is False
         assert res['a/p2'].run_local is True
@@ -526,12 +957,12 @@ class TestReBuildBot(object):
 
         def se_config(projname):
             if projname == 'a/p1':
-                return ('clone_a_p1', 'ssh_a_p1')
+                return ('clone_a_p1', 'ssh_a_p1', 10, {})
             if projname == 'a/p2':
-                return ('clone_a_p2', 'ssh_a_p2')
+                return ('clone_a_p2', 'ssh_a_p2', 20, {})
             if projname == 'a/p4':
-                return ('clone_a_p4', 'ssh_a_p4')
-            return (None, None)
+                return ('clone_a_p4', 'ssh_a_p4', 40, {})
+            return (None, None, None, None)
 
         self.cls.github.get_project_config.side_effect = se_config
         self.cls.travis.get_last_build.side_effect = se_last_build
@@ -550,6 +981,7 @@ class TestReBuildBot(object):
         assert res['a/p1'].run_local is True
         assert res['a/p1'].https_clone_url == 'clone_a_p1'
         assert res['a/p1'].ssh_clone_url == 'ssh_a_p1'
+        assert res['a/p1'].repo_size == 10
         assert res['a/p2'].slug == 'a/p2'
         assert res['a/p2'].run_travis is False
         assert res['a/p2'].run_local is True
@@ -578,12 +1010,12 @@ class TestReBuildBot(object):
 
         def se_config(projname):
             if projname == 'a/p1':
-                return ('clone_a_p1', 'ssh_a_p1')
+                return ('clone_a_p1', 'ssh_a_p1', 10, {})
             if projname == 'a/p2':
-                return ('clone_a_p2', 'ssh_a_p2')
+                return ('clone_a_p2', 'ssh_a_p2', 20, {})
             if projname == 'a/p4':
-                return ('clone_a_p4', 'ssh_a_p4')
-            return (None, None)
+                return ('clone_a_p4', 'ssh_a_p4', 40, {})
+            return (None, None, None, None)
 
         self.cls.github.get_project_config.side_effect = se_config
         self.cls.travis.get_last_build.side_effect = se_last_build
@@ -615,21 +1047,113 @@ class TestReBuildBot(object):
         mock_bucket.get_website_endpoint.return_value = url
         mock_conn.get_bucket.return_value = mock_bucket
 
+        self.cls.http.configure_boto.return_value = mock_conn
         with patch('%s.boto.connect_s3' % pbm) as mock_s3:
-            mock_s3.return_value = mock_conn
             res = self.cls.connect_s3('bktname')
         assert res == mock_bucket
-        assert mock_s3.mock_calls == [
-            call(),
-            call().get_bucket('bktname'),
-            call().get_bucket().get_website_endpoint()
+        assert mock_s3.mock_calls == [call()]
+        assert self.cls.http.configure_boto.mock_calls[0] == call(
+            mock_s3.return_value
+        )
+        assert mock_conn.mock_calls == [
+            call.get_bucket('bktname'),
+            call.get_bucket().get_website_endpoint()
+        ]
+        assert self.cls.bucket_endpoint == url
+
+    def test_connect_s3_cache_miss(self):
+        mock_conn = Mock(spec_set=S3Connection)
+        mock_bucket = Mock(spec_set=Bucket)
+        url = 'bktname.s3-website-us-west-2.amazonaws.com'
+        mock_bucket.get_website_endpoint.return_value = url
+        mock_conn.get_bucket.return_value = mock_bucket
+        self.cls.auth_cache = Mock(spec_set=AuthCache)
+        self.cls.auth_cache.get.return_value = None
+
+        self.cls.http.configure_boto.return_value = mock_conn
+        with patch('%s.boto.connect_s3' % pbm):
+            res = self.cls.connect_s3('bktname')
+        assert res is mock_bucket
+        assert mock_conn.mock_calls == [
+            call.get_bucket('bktname'),
+            call.get_bucket().get_website_endpoint()
+        ]
+        assert self.cls.auth_cache.mock_calls == [
+            call.get('s3:bktname'),
+            call.set('s3:bktname', url)
+        ]
+        assert self.cls.bucket_endpoint == url
+
+    def test_connect_s3_cache_hit(self):
+        mock_conn = Mock(spec_set=S3Connection)
+        url = 'bktname.s3-website-us-west-2.amazonaws.com'
+        self.cls.auth_cache = Mock(spec_set=AuthCache)
+        self.cls.auth_cache.get.return_value = url
+
+        self.cls.http.configure_boto.return_value = mock_conn
+        with patch('%s.boto.connect_s3' % pbm):
+            res = self.cls.connect_s3('bktname')
+        assert res is mock_conn.get_bucket.return_value
+        assert mock_conn.mock_calls == [
+            call.get_bucket('bktname')
         ]
+        assert self.cls.auth_cache.mock_calls == [call.get('s3:bktname')]
         assert self.cls.bucket_endpoint == url
 
+    def test_connect_github(self):
+        with patch('%s.GitHubWrapper' % pbm) as mock_gh:
+            res = self.cls.connect_github()
+        assert res is mock_gh.return_value
+        assert mock_gh.mock_calls == [call('myGHtoken', http=self.cls.http)]
+
+    def test_connect_travis(self):
+        self.cls.auth_cache = Mock(spec_set=AuthCache)
+        with patch('%s.Travis' % pbm) as mock_travis:
+            res = self.cls.connect_travis()
+        assert res is mock_travis.return_value
+        assert mock_travis.mock_calls == [
+            call('myGHtoken', http=self.cls.http, cache=self.cls.auth_cache)
+        ]
+
+    def test_start_connections(self):
+        conns = {}
+        for name in ['github', 'travis', 's3']:
+            conns[name] = Mock(spec_set=Connector)
+        self.cls.connections = conns
+        self.cls.start_connections()
+        for name in ['github', 'travis', 's3']:
+            assert conns[name].mock_calls == [call.start()]
+
+    def test_start_connections_no_travis_no_local(self):
+        conns = {}
+        for name in ['github', 'travis', 's3']:
+            conns[name] = Mock(spec_set=Connector)
+        self.cls.connections = conns
+        self.cls.run_travis = False
+        self.cls.run_local = False
+        self.cls.start_connections()
+        assert conns['s3'].mock_calls == [call.start()]
+        assert conns['github'].mock_calls == []
+        assert conns['travis'].mock_calls == []
+
+    def test_connection_properties(self):
+        conns = {}
+        for name in ['github', 'travis', 's3']:
+            conns[name] = Mock(spec_set=Connector)
+        self.cls.connections = conns
+        assert self.cls.github is conns['github'].get.return_value
+        assert self.cls.travis is conns['travis'].get.return_value
+        assert self.cls.bucket is conns['s3'].get.return_value
+        self.cls.travis = 'foo'
+        assert isinstance(self.cls.connections['travis'], Connector)
+        assert self.cls.connections['travis'].connected is True
+        assert self.cls.travis == 'foo'
+
     def test_run(self):
         with \
              patch('%s.find_projects' % pb) as mock_find, \
              patch('%s.start_travis_builds' % pb) as mock_start_travis, \
+             patch('%s.start_discovery' % pb) as mock_discovery, \
              patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
              as mock_have_work, \
              patch('%s.runner_loop' % pb) as mock_runner_loop, \
@@ -641,19 +1165,188 @@ class TestReBuildBot(object):
                 datetime(2015, 10, 20, 20, 2, 23)
             ]
             self.cls.run()
-        assert mock_find.mock_calls == [call(None)]
-        assert self.cls.builds == mock_find.return_value
-        assert mock_start_travis.mock_calls == [call()]
+        assert mock_discovery.mock_calls == [call(None)]
+        assert mock_find.mock_calls == []
+        assert self.cls.builds == {}
+        assert mock_start_travis.mock_calls == []
         assert mock_have_work.mock_calls == [call(), call(), call()]
         assert mock_runner_loop.mock_calls == [call(), call()]
         assert mock_handle_results.mock_calls == [
             call(timedelta(0, 143))
         ]
+        assert self.cls.reaper.mock_calls == [call.sweep(), call.wait()]
 
-    def test_run_with_projects(self):
+    def test_run_webhooks(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        with \
+             patch('%s.start_discovery' % pb), \
+             patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
+             as mock_have_work, \
+             patch('%s.runner_loop' % pb), \
+             patch('%s.dt_now' % pb) as mock_dt_now, \
+             patch('%s.handle_results' % pb):
+            mock_have_work.side_effect = [True, False]
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            self.cls.run()
+        assert self.cls.webhooks.mock_calls == [
+            call.start(self.mock_travis.webhook_public_key.return_value),
+            call.stop()
+        ]
+
+    def test_run_max_repos(self):
+        self.cls.max_repos = 10
         with \
              patch('%s.find_projects' % pb) as mock_find, \
              patch('%s.start_travis_builds' % pb) as mock_start_travis, \
+             patch('%s.start_discovery' % pb) as mock_discovery, \
+             patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
+             as mock_have_work, \
+             patch('%s.runner_loop' % pb) as mock_runner_loop, \
+             patch('%s.dt_now' % pb) as mock_dt_now, \
+             patch('%s.handle_results' % pb):
+            mock_have_work.side_effect = [True, False]
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            self.cls.run()
+        assert mock_discovery.mock_calls == []
+        assert mock_find.mock_calls == [call(None)]
+        assert self.cls.builds == mock_find.return_value
+        assert mock_start_travis.mock_calls == [call()]
+        assert mock_runner_loop.mock_calls == [call()]
+
+    def test_run_prefetch(self):
+        self.cls.prefetcher = Mock(spec_set=Prefetcher)
+        with \
+             patch('%s.start_discovery' % pb), \
+             patch('%s.start_travis_builds' % pb), \
+             patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
+             as mock_have_work, \
+             patch('%s.dt_now' % pb) as mock_dt_now, \
+             patch('%s.handle_results' % pb) as mock_handle:
+            mock_have_work.return_value = False
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            order = []
+            self.cls.prefetcher.discard_all.side_effect = \
+                lambda: order.append('discard_all')
+            mock_handle.side_effect = lambda d: order.append('handle_results')
+            self.cls.run()
+        assert self.cls.prefetcher.mock_calls == [call.discard_all()]
+        # prefetches are finished before results (and history) are saved
+        assert order == ['discard_all', 'handle_results']
+
+    def test_sweep_leftovers(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        type(self.cls.workspaces).root = '/ws'
+        self.cls.sweep_leftovers()
+        assert self.cls.reaper.mock_calls == [
+            call.sweep(), call.sweep('/ws', clones=False)
+        ]
+
+    def test_sweep_leftovers_dry_run(self):
+        self.cls.dry_run = True
+        self.cls.sweep_leftovers()
+        assert self.cls.reaper.mock_calls == []
+
+    def test_run_deadline(self):
+        self.cls.time_budget = 3600
+        with \
+             patch('%s.start_discovery' % pb) as mock_discovery, \
+             patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
+             as mock_have_work, \
+             patch('%s.runner_loop' % pb) as mock_runner_loop, \
+             patch('%s.skip_remaining_builds' % pb) as mock_skip, \
+             patch('%s.dt_now' % pb) as mock_dt_now, \
+             patch('%s.handle_results' % pb) as mock_handle_results:
+            mock_have_work.return_value = True
+            mock_dt_now.side_effect = [
+                datetime(2015, 10, 20, 20, 0, 0),
+                datetime(2015, 10, 20, 20, 30, 0),
+                datetime(2015, 10, 20, 21, 0, 1),
+                datetime(2015, 10, 20, 21, 0, 2)
+            ]
+            self.cls.run()
+        assert self.cls.deadline == datetime(2015, 10, 20, 21, 0, 0)
+        assert mock_discovery.mock_calls == [call(None)]
+        assert mock_runner_loop.mock_calls == [call()]
+        assert mock_skip.mock_calls == [call()]
+        assert mock_handle_results.mock_calls == [
+            call(timedelta(0, 3602))
+        ]
+
+    def test_get_deadline_none(self):
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        assert self.cls.get_deadline(start) is None
+
+    def test_get_deadline_budget(self):
+        self.cls.time_budget = 7200
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        assert self.cls.get_deadline(start) == datetime(2015, 10, 20, 22, 0, 0)
+
+    def test_get_deadline_time_today(self):
+        self.cls.deadline_time = time(22, 30)
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        assert self.cls.get_deadline(start) == datetime(
+            2015, 10, 20, 22, 30, 0)
+
+    def test_get_deadline_time_tomorrow(self):
+        self.cls.deadline_time = time(6, 0)
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        assert self.cls.get_deadline(start) == datetime(2015, 10, 21, 6, 0, 0)
+
+    def test_get_deadline_earliest(self):
+        self.cls.deadline_time = time(6, 0)
+        self.cls.time_budget = 3600
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        assert self.cls.get_deadline(start) == datetime(2015, 10, 20, 21, 0, 0)
+
+    def test_seconds_remaining(self):
+        assert self.cls.seconds_remaining() is None
+        assert self.cls.deadline_reached is False
+        self.cls.deadline = datetime(2015, 10, 20, 21, 0, 0)
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 59, 30)
+            assert self.cls.seconds_remaining() == 30
+            assert self.cls.deadline_reached is False
+            mock_dt_now.return_value = datetime(2015, 10, 20, 21, 0, 0)
+            assert self.cls.deadline_reached is True
+
+    def test_skip_remaining_builds(self):
+        b_travis = BuildInfo('me/travis')
+        b_travis.run_travis = True
+        b_travis.set_travis_build_ids(1, 2)
+        b_local = BuildInfo('me/local', run_local=True)
+        b_done = BuildInfo('me/done', run_local=True)
+        b_done.run_travis = True
+        b_done.travis_build_finished = True
+        b_done.set_local_build(return_code=0, output='foo')
+        self.cls.builds = {
+            'me/travis': b_travis,
+            'me/local': b_local,
+            'me/done': b_done,
+        }
+        self.cls.skip_remaining_builds()
+        assert b_travis.travis_build_skipped == 'still running at ' \
+            'deadline; stopped polling'
+        assert b_travis.is_done is True
+        assert b_local.local_build_skipped == 'not started before deadline'
+        assert b_local.is_done is True
+        assert b_done.travis_build_skipped is None
+        assert b_done.local_build_skipped is None
+        assert self.cls.have_work_to_do is False
+
+    def test_skip_remaining_builds_queued(self):
+        b_queued = BuildInfo('me/queued')
+        b_queued.run_travis = True
+        self.cls.builds = {'me/queued': b_queued}
+        self.cls.triggers.add('me/queued', b_queued)
+        self.cls.skip_remaining_builds()
+        assert self.cls.triggers.busy is False
+        assert b_queued.travis_build_skipped == 'still running at ' \
+            'deadline; stopped polling'
+        assert self.cls.have_work_to_do is False
+
+    def test_run_with_projects(self):
+        with \
+             patch('%s.start_discovery' % pb) as mock_discovery, \
              patch('%s.have_work_to_do' % pb, new_callable=PropertyMock) \
              as mock_have_work, \
              patch('%s.runner_loop' % pb) as mock_runner_loop, \
@@ -665,9 +1358,7 @@ class TestReBuildBot(object):
                 datetime(2015, 10, 20, 20, 2, 23)
             ]
             self.cls.run(['foo/bar', 'baz/blam'])
-        assert mock_find.mock_calls == [call(['foo/bar', 'baz/blam'])]
-        assert self.cls.builds == mock_find.return_value
-        assert mock_start_travis.mock_calls == [call()]
+        assert mock_discovery.mock_calls == [call(['foo/bar', 'baz/blam'])]
         assert mock_have_work.mock_calls == [call()]
         assert mock_runner_loop.mock_calls == []
         assert mock_handle_results.mock_calls == [
@@ -681,7 +1372,8 @@ class TestReBuildBot(object):
         exc_blarg = TravisTriggerError('repo', 'branch', 'url', 'status_code',
                                        'headers', 'text')
 
-        def se_run_travis(repo_slug, branch='master'):
+        def se_run_travis(repo_slug, branch='master', attach=False,
+                          cancel_stale=False):
             if repo_slug == 'foo/bar':
                 return (1, 2)
             if repo_slug == 'foo/blam':
@@ -716,13 +1408,20 @@ class TestReBuildBot(object):
             'foo/other': bi_other,
         }
         self.cls.travis.run_build.side_effect = se_run_travis
-        self.cls.start_travis_builds()
-        assert self.cls.travis.run_build.mock_calls == [
-            call('foo/bar'),
-            call('foo/blam'),
-            call('foo/blarg'),
-            call('foo/other'),
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.start_travis_builds()
+            assert sorted(self.cls.triggers.wait()) == [
+                'foo/bar', 'foo/blam', 'foo/blarg', 'foo/other'
+            ]
+        assert sorted(self.cls.travis.run_build.mock_calls) == [
+            call('foo/bar', attach=True, cancel_stale=False),
+            call('foo/blam', attach=True, cancel_stale=False),
+            call('foo/blarg', attach=True, cancel_stale=False),
+            call('foo/other', attach=True, cancel_stale=False),
         ]
+        assert mock_logger.mock_calls[0] == call.info(
+            "Queued %d Travis builds to trigger", 4)
+        assert self.cls.triggers.busy is False
         assert self.cls.builds['foo/bar'].travis_build_id == 2
         assert self.cls.builds['foo/bar'].travis_last_build_id == 1
         assert self.cls.builds['foo/blam'].travis_build_id is None
@@ -760,6 +1459,14 @@ class TestReBuildBot(object):
         self.cls.builds = {'foo/1': bi_1, 'foo/2': bi_2}
         assert self.cls.have_work_to_do is True
 
+    def test_have_work_triggers(self):
+        bi_1 = Mock(spec_set=BuildInfo)
+        type(bi_1).is_done = PropertyMock(return_value=True)
+
+        self.cls.builds = {'foo/1': bi_1}
+        self.cls.triggers.add('foo/1', bi_1)
+        assert self.cls.have_work_to_do is True
+
     def test_have_work_false(self):
         bi_1 = Mock(spec_set=BuildInfo)
         type(bi_1).is_done = PropertyMock(return_value=True)
@@ -779,6 +1486,7 @@ class TestReBuildBot(object):
         build3 = Mock(spec_set=BuildInfo)
         type(build3).run_local = PropertyMock(return_value=True)
         type(build3).local_build_finished = PropertyMock(return_value=False)
+        type(build3).manifest = {}
         build4 = Mock(spec_set=BuildInfo)
         type(build4).run_local = PropertyMock(return_value=True)
         type(build4).local_build_finished = PropertyMock(return_value=False)
@@ -796,7 +1504,345 @@ class TestReBuildBot(object):
             self.cls.runner_loop()
         assert mock_poll_travis.mock_calls == [call()]
         assert mock_local_build.mock_calls == [
-            call('me/baz', build3, dry_run=False),
+            call('me/baz', build3, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+        assert mock_sleep.mock_calls == []
+
+    def test_runner_loop_longest_first(self):
+        build1 = BuildInfo('me/foo', run_local=True)
+        build2 = BuildInfo('me/bar', run_local=True)
+        build3 = BuildInfo('me/baz', run_local=True)
+        build3.local_build_finished = True
+
+        def se_duration(slug):
+            return {'me/foo': 600, 'me/bar': 3600, 'me/baz': 7200}[slug]
+
+        self.cls.history.expected_local_duration.side_effect = se_duration
+        self.cls.scheduler = BuildScheduler('longest-first',
+                                            history=self.cls.history)
+        self.cls.builds = {
+            'me/foo': build1,
+            'me/bar': build2,
+            'me/baz': build3,
+        }
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == [
+            call('me/bar', build2, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+        assert mock_sleep.mock_calls == []
+
+    def test_runner_loop_timeouts(self):
+        self.cls.build_timeout = 3600
+        self.cls.inactivity_timeout = 60
+        self.cls.repo_timeouts = {'me/foo': 7200}
+        build1 = BuildInfo('me/foo', run_local=True)
+        self.cls.builds = {'me/foo': build1}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == [
+            call('me/foo', build1, dry_run=False, timeout=7200,
+                 inactivity_timeout=60, workspaces=None,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+
+    def test_runner_loop_workspaces(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        build1 = BuildInfo('me/foo', run_local=True)
+        self.cls.builds = {'me/foo': build1}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == [
+            call('me/foo', build1, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=self.cls.workspaces,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+        assert self.cls.workspaces.mock_calls == [call.evict(keep=['me/foo'])]
+
+    def test_runner_loop_caches(self):
+        self.cls.caches = Mock(spec_set=CacheManager)
+        build1 = BuildInfo('me/foo', run_local=True)
+        self.cls.builds = {'me/foo': build1}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == [
+            call('me/foo', build1, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=self.cls.caches, reaper=self.cls.reaper,
+                 prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+        assert self.cls.caches.mock_calls == [call.evict()]
+
+    def test_runner_loop_admission_refused(self):
+        self.cls.admission = Mock(spec_set=AdmissionController)
+        self.cls.admission.admit.return_value = 'load is too high'
+        build1 = BuildInfo('me/foo', run_local=True)
+        self.cls.builds = {'me/foo': build1}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == []
+        assert self.cls.admission.mock_calls == [call.admit(0)]
+        assert mock_sleep.mock_calls == [call(10)]
+        assert build1.local_build_finished is False
+
+    def test_runner_loop_admission(self):
+        self.cls.admission = Mock(spec_set=AdmissionController)
+        self.cls.admission.admit.return_value = None
+        build1 = BuildInfo('me/foo', run_local=True)
+        self.cls.builds = {'me/foo': build1}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == [
+            call('me/foo', build1, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None, caches=None,
+                 reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=self.cls.admission,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+
+    def test_runner_loop_tag_limit(self):
+        self.cls.local_workers = 3
+        self.cls.scheduler = BuildScheduler(
+            tag_limits={'vbox': 1},
+            repo_tags={'me/a': ['vbox'], 'me/b': ['vbox']}
+        )
+        build1 = BuildInfo('me/a', run_local=True)
+        build2 = BuildInfo('me/b', run_local=True)
+        build3 = BuildInfo('me/c', run_local=True)
+        self.cls.builds = {'me/a': build1, 'me/b': build2, 'me/c': build3}
+        self.cls.local_running = {'me/a': Mock()}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.finish_local_builds' % pb) as mock_finish, \
+                patch('%s.start_local_build' % pb) as mock_start, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            mock_finish.return_value = False
+            self.cls.runner_loop()
+        # me/b waits for me/a to finish; me/c is untagged
+        assert mock_local_build.call_count == 1
+        assert mock_local_build.mock_calls[0][1] == ('me/c', build3)
+        assert mock_start.mock_calls == [
+            call('me/c', mock_local_build.return_value)
+        ]
+
+    def test_runner_loop_workers(self):
+        self.cls.local_workers = 2
+        release = threading.Event()
+        ran = []
+
+        def se_lb(name, bi, **kwargs):
+            m = Mock()
+
+            def se_run():
+                ran.append(name)
+                release.wait()
+                bi.local_build_finished = True
+
+            m.run.side_effect = se_run
+            return m
+
+        build1 = BuildInfo('me/a', run_local=True)
+        build2 = BuildInfo('me/b', run_local=True)
+        build3 = BuildInfo('me/c', run_local=True)
+        self.cls.builds = {'me/a': build1, 'me/b': build2, 'me/c': build3}
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.after_local_build' % pb) as mock_after, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            mock_local_build.side_effect = se_lb
+            self.cls.runner_loop()
+            assert sorted(self.cls.local_running.keys()) == ['me/a', 'me/b']
+            # both workers busy; nothing else started
+            self.cls.runner_loop()
+            assert mock_local_build.call_count == 2
+            release.set()
+            self.cls.wait_for_local_builds()
+        assert sorted(ran) == ['me/a', 'me/b']
+        assert self.cls.local_running == {}
+        assert mock_after.mock_calls == [call('me/a'), call('me/b')]
+        assert mock_sleep.mock_calls == [call(10)]
+
+    def test_finish_local_builds(self):
+        t1 = Mock()
+        t1.is_alive.return_value = False
+        t2 = Mock()
+        t2.is_alive.return_value = True
+        self.cls.local_running = {'me/a': t1, 'me/b': t2}
+        with patch('%s.after_local_build' % pb) as mock_after:
+            assert self.cls.finish_local_builds() is True
+            assert self.cls.finish_local_builds() is False
+        assert self.cls.local_running == {'me/b': t2}
+        assert mock_after.mock_calls == [call('me/a')]
+        assert t1.mock_calls == [call.is_alive(), call.join()]
+
+    def test_after_local_build(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        self.cls.caches = Mock(spec_set=CacheManager)
+        self.cls.local_running = {'me/c': Mock(), 'me/b': Mock()}
+        self.cls.after_local_build('me/a')
+        assert self.cls.workspaces.mock_calls == [
+            call.evict(keep=['me/a', 'me/b', 'me/c'])
+        ]
+        # another build may be using the caches
+        assert self.cls.caches.mock_calls == []
+        self.cls.local_running = {}
+        self.cls.after_local_build('me/a')
+        assert self.cls.caches.mock_calls == [call.evict()]
+
+    def test_after_local_build_prefetch(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        self.cls.prefetcher = Mock(spec_set=Prefetcher)
+        type(self.cls.prefetcher).slugs = PropertyMock(
+            return_value=['me/d', 'me/e'])
+        self.cls.local_running = {'me/b': Mock()}
+        self.cls.after_local_build('me/a')
+        # workspaces being (or already) prefetched are not evicted
+        assert self.cls.workspaces.mock_calls == [
+            call.evict(keep=['me/a', 'me/b', 'me/d', 'me/e'])
+        ]
+
+    def test_runner_loop_prefetch(self):
+        self.cls.prefetcher = Mock(spec_set=Prefetcher)
+        self.cls.prefetcher.take.return_value = ('/path', 'repostr')
+        build1 = BuildInfo('me/a', run_local=True)
+        build2 = BuildInfo('me/b', run_local=True)
+        build3 = BuildInfo('me/c', run_local=True)
+        build3.local_build_finished = True
+        build4 = BuildInfo('me/d', run_local=True)
+        self.cls.builds = {
+            'me/a': build1,
+            'me/b': build2,
+            'me/c': build3,
+            'me/d': build4,
+        }
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm), \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert self.cls.prefetcher.mock_calls == [
+            call.take('me/a'),
+            call.prefetch([('me/b', build2), ('me/d', build4)])
+        ]
+        assert mock_local_build.mock_calls == [
+            call('me/a', build1, dry_run=False, timeout=None,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=None, reaper=self.cls.reaper,
+                 prefetched=('/path', 'repostr'),
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
+            call().run()
+        ]
+
+    def test_local_build_timeout(self):
+        self.cls.build_timeout = 3600
+        self.cls.repo_timeouts = {'me/foo': 7200}
+        assert self.cls.local_build_timeout('Me/Foo') == 7200
+        assert self.cls.local_build_timeout('me/bar') == 3600
+
+    def test_local_build_timeout_manifest(self):
+        self.cls.build_timeout = 3600
+        self.cls.repo_timeouts = {'me/foo': 7200}
+        self.cls.builds = {
+            'me/foo': BuildInfo('me/foo', manifest={'timeout': 60}),
+            'me/bar': BuildInfo('me/bar', manifest={'timeout': 120}),
+            'me/baz': BuildInfo('me/baz'),
+        }
+        assert self.cls.local_build_timeout('me/foo') == 7200
+        assert self.cls.local_build_timeout('me/bar') == 120
+        assert self.cls.local_build_timeout('me/baz') == 3600
+
+    def test_local_build_timeout_deadline(self):
+        self.cls.build_timeout = 3600
+        self.cls.repo_timeouts = {'me/foo': 600}
+        self.cls.deadline = datetime(2015, 10, 20, 21, 0, 0)
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 40, 0)
+            assert self.cls.local_build_timeout('me/foo') == 600
+            assert self.cls.local_build_timeout('me/bar') == 1200
+            mock_dt_now.return_value = datetime(2015, 10, 20, 21, 1, 0)
+            assert self.cls.local_build_timeout('me/bar') == 0
+            self.cls.build_timeout = None
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 40, 0)
+            assert self.cls.local_build_timeout('me/bar') == 1200
+
+    def test_runner_loop_deadline(self):
+        build1 = BuildInfo('me/foo', run_local=True)
+        build2 = BuildInfo('me/bar', run_local=True)
+
+        def se_duration(slug):
+            return {'me/foo': 600, 'me/bar': 3600}[slug]
+
+        self.cls.history.expected_local_duration.side_effect = se_duration
+        self.cls.builds = {
+            'me/foo': build1,
+            'me/bar': build2,
+        }
+        self.cls.deadline = datetime(2015, 10, 20, 21, 0, 0)
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.dt_now' % pb) as mock_dt_now, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 40, 0)
+            self.cls.runner_loop()
+        assert build2.local_build_skipped == 'expected to take 3600s; only ' \
+            '1200s remained before the deadline'
+        assert build2.is_done is True
+        assert mock_local_build.mock_calls == [
+            call('me/foo', build1, dry_run=False, timeout=1200,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
             call().run()
         ]
         assert mock_sleep.mock_calls == []
@@ -807,6 +1853,7 @@ class TestReBuildBot(object):
         build1 = Mock(spec_set=BuildInfo)
         type(build1).run_local = PropertyMock(return_value=True)
         type(build1).local_build_finished = PropertyMock(return_value=False)
+        type(build1).manifest = {}
 
         self.cls.builds = {
             'me/foo': build1,
@@ -818,7 +1865,12 @@ class TestReBuildBot(object):
             self.cls.runner_loop()
         assert mock_poll_travis.mock_calls == [call()]
         assert mock_local_build.mock_calls == [
-            call('me/foo', build1, dry_run=True),
+            call('me/foo', build1, dry_run=True, timeout=None,
+                 inactivity_timeout=None, workspaces=None,
+                 caches=None, reaper=self.cls.reaper, prefetched=None,
+                 history=self.cls.history, race_clone=False,
+                 admission=None,
+                 clone_depth=None, cache_names=None),
             call().run()
         ]
         assert mock_sleep.mock_calls == []
@@ -840,6 +1892,197 @@ class TestReBuildBot(object):
         assert mock_local_build.mock_calls == []
         assert mock_sleep.mock_calls == [call(10)]
 
+    def test_runner_loop_discovering(self):
+        self.cls.discoverer = Mock(spec_set=Discoverer)
+        type(self.cls.discoverer).done = False
+        type(self.cls.discoverer).finished = set()
+        self.cls.discoverer.get.return_value = []
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == []
+        assert mock_sleep.mock_calls == []
+        assert self.cls.discoverer.mock_calls == [
+            call.get(timeout=None),
+            call.get(timeout=10)
+        ]
+
+    def test_runner_loop_webhooks(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        self.cls.webhooks.get.return_value = []
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert mock_local_build.mock_calls == []
+        assert mock_sleep.mock_calls == []
+        assert self.cls.webhooks.mock_calls == [
+            call.get(timeout=None),
+            call.get(timeout=10)
+        ]
+
+    def test_runner_loop_discovered(self):
+        bi = BuildInfo('me/foo', run_local=True)
+        self.cls.discoverer = Mock(spec_set=Discoverer)
+        type(self.cls.discoverer).done = False
+        type(self.cls.discoverer).finished = set()
+        self.cls.discoverer.get.return_value = [bi]
+        self.cls.stale_after = None
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.LocalBuild' % pbm) as mock_local_build:
+            mock_poll_travis.return_value = False
+            self.cls.runner_loop()
+        assert self.cls.builds == {'me/foo': bi}
+        assert mock_local_build.mock_calls[0][1] == ('me/foo', bi)
+        assert mock_sleep.mock_calls == []
+        assert self.cls.discoverer.mock_calls == [call.get(timeout=None)]
+
+    def test_runner_loop_triggered(self):
+        with patch('%s.poll_travis_updates' % pb) as mock_poll_travis, \
+                patch('%s.admit_travis_builds' % pb) as mock_admit, \
+                patch('%s.time.sleep' % pbm) as mock_sleep:
+            mock_poll_travis.return_value = False
+            mock_admit.return_value = True
+            self.cls.runner_loop()
+        assert mock_admit.mock_calls == [call()]
+        assert mock_sleep.mock_calls == []
+
+    def test_start_discovery(self):
+        with patch('%s.Discoverer' % pbm) as mock_disc, \
+                patch('%s.discovery_sources' % pb) as mock_sources:
+            self.cls.start_discovery(['a/b'])
+        assert mock_sources.mock_calls == [call(['a/b'])]
+        assert mock_disc.mock_calls == [
+            call(mock_sources.return_value),
+            call().start()
+        ]
+        assert self.cls.discoverer == mock_disc.return_value
+        assert self.cls.select_stale is False
+        self.cls.stale_decided = {'a/b': True}
+        self.cls.stale_held = {'a/c': BuildInfo('a/c')}
+        with patch('%s.Discoverer' % pbm), \
+                patch('%s.discovery_sources' % pb):
+            self.cls.start_discovery(None)
+        assert self.cls.select_stale is True
+        assert self.cls.stale_decided == {}
+        assert self.cls.stale_held == {}
+
+    def test_discovering(self):
+        assert self.cls.discovering is False
+        assert self.cls.check_discovery() is False
+        self.cls.discoverer = Mock(spec_set=Discoverer)
+        type(self.cls.discoverer).done = False
+        assert self.cls.discovering is True
+        assert self.cls.have_work_to_do is True
+        type(self.cls.discoverer).done = True
+        assert self.cls.discovering is False
+        assert self.cls.have_work_to_do is False
+
+    def test_add_discovered(self):
+        local = BuildInfo('a/p1', run_local=True, https_clone_url='u',
+                          manifest={'timeout': 5})
+        travis1 = BuildInfo('a/p1')
+        travis1.run_travis = True
+        travis2 = BuildInfo('a/p2')
+        travis2.run_travis = True
+        stale = BuildInfo('a/p3', run_local=True,
+                          manifest={'rebuild_interval': 10})
+        last = {'a/p3': datetime(2015, 10, 19, 1, 0, 0)}
+        self.cls.history.last_success.side_effect = lambda s: last.get(s)
+        self.cls.stale_after = None
+        with patch('%s.start_travis_builds' % pb) as mock_start_travis, \
+                patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            assert self.cls.add_discovered([travis1]) is True
+            assert mock_start_travis.mock_calls == [call({'a/p1': travis1})]
+            mock_start_travis.reset_mock()
+            assert self.cls.add_discovered([local, travis2, stale]) is True
+            assert mock_start_travis.mock_calls == [call({'a/p2': travis2})]
+            assert self.cls.add_discovered([]) is False
+        assert sorted(self.cls.builds.keys()) == ['a/p1', 'a/p2']
+        assert self.cls.builds['a/p1'] is travis1
+        assert travis1.run_local is True
+        assert travis1.run_travis is True
+        assert travis1.https_clone_url == 'u'
+        assert travis1.manifest == {'timeout': 5}
+
+    def test_add_discovered_travis_first(self):
+        self.cls.discoverer = Mock(spec_set=Discoverer)
+        type(self.cls.discoverer).finished = set()
+        # rebuilt 1.8 days ago; stale by --stale-after, but not by either
+        # repository's rebuild_interval
+        last = datetime(2015, 10, 19, 1, 0, 0)
+        self.cls.history.last_success.side_effect = lambda s: (
+            None if s == 'a/new' else last)
+        self.cls.stale_after = 1
+
+        def travis(slug):
+            bi = BuildInfo(slug)
+            bi.run_travis = True
+            return bi
+
+        t1 = travis('a/p1')
+        t2 = travis('a/p2')
+        t3 = travis('a/p3')
+        t4 = travis('a/new')
+        l1 = BuildInfo('a/p1', run_local=True,
+                       manifest={'rebuild_interval': 10})
+        l3 = BuildInfo('a/p3', run_local=True,
+                       manifest={'rebuild_interval': 1})
+        with patch('%s.start_travis_builds' % pb) as mock_start_travis, \
+                patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            # never rebuilt, so never held
+            assert self.cls.add_discovered([t1, t2, t3, t4]) is True
+            assert sorted(self.cls.stale_held.keys()) == [
+                'a/p1', 'a/p2', 'a/p3']
+            assert mock_start_travis.mock_calls == [call({'a/new': t4})]
+            mock_start_travis.reset_mock()
+            # GitHub found a/p1, whose manifest says it is not due yet
+            assert self.cls.add_discovered([l1, l3]) is True
+            assert mock_start_travis.mock_calls == [call({'a/p3': l3})]
+            mock_start_travis.reset_mock()
+            # a later BuildInfo for a/p1 follows the earlier decision
+            assert self.cls.add_discovered([travis('a/p1')]) is False
+            # GitHub discovery finished; a/p2 falls back to --stale-after
+            self.cls.discoverer.finished.add('github')
+            assert self.cls.add_discovered([]) is True
+            assert mock_start_travis.mock_calls == [call({'a/p2': t2})]
+        assert sorted(self.cls.builds.keys()) == ['a/new', 'a/p2', 'a/p3']
+        assert self.cls.builds['a/p3'] is l3
+        assert l3.run_travis is True
+        assert self.cls.stale_held == {}
+        assert self.cls.stale_decided == {
+            'a/new': True, 'a/p1': False, 'a/p2': True, 'a/p3': True}
+
+    def test_add_discovered_explicit(self):
+        stale = BuildInfo('a/p3', run_local=True,
+                          manifest={'rebuild_interval': 10})
+        self.cls.history.last_success.return_value = datetime(
+            2015, 10, 19, 1, 0, 0)
+        self.cls.select_stale = False
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            assert self.cls.add_discovered([stale]) is True
+        assert self.cls.builds == {'a/p3': stale}
+
+    def test_discovery_sources(self):
+        res = self.cls.discovery_sources(None)
+        assert [x[0] for x in res] == ['github', 'travis']
+        self.cls.run_travis = False
+        res = self.cls.discovery_sources(None)
+        assert [x[0] for x in res] == ['github']
+        self.cls.github.get_project_config.return_value = (
+            'clone', 'ssh', 10, {})
+        res = self.cls.discovery_sources(['a/p1'])
+        assert [x[0] for x in res] == ['projects']
+        builds = list(res[0][1]())
+        assert [b.slug for b in builds] == ['a/p1']
+
     def test_poll_travis_updates(self):
         build1 = Mock(spec_set=BuildInfo)
         type(build1).run_travis = PropertyMock(return_value=False)
@@ -903,11 +2146,16 @@ class TestReBuildBot(object):
             'a/6': build6,
         }
 
-        with patch('%s.update_travis_build' % pb) as mock_update:
+        with patch('%s.update_travis_build' % pb) as mock_update, \
+                patch('%s.batch_poll_travis' % pb) as mock_batch:
             mock_update.side_effect = se_update
+            mock_batch.side_effect = lambda p: (False, p)
             res = self.cls.poll_travis_updates()
 
         assert res is True
+        assert mock_batch.mock_calls == [call([
+            ('a/3', build3), ('a/4', build4), ('a/5', build5), ('a/6', build6)
+        ])]
         assert self.cls.travis.mock_calls == [
             call.get_build(123),
             call.get_build(456),
@@ -926,6 +2174,365 @@ class TestReBuildBot(object):
             call(build6),
         ]
 
+    def test_poll_travis_updates_batch(self):
+        bi = BuildInfo('a/1')
+        bi.run_travis = True
+        bi.set_travis_build_ids(1, 2)
+        bi2 = BuildInfo('a/2')
+        bi2.run_travis = True
+        bi2.set_travis_build_ids(3, 4)
+        self.cls.builds = {'a/1': bi, 'a/2': bi2}
+        with patch('%s.batch_poll_travis' % pb) as mock_batch, \
+                patch('%s.poll_travis_build' % pb) as mock_poll:
+            mock_batch.return_value = (True, [('a/2', bi2)])
+            mock_poll.return_value = False
+            assert self.cls.poll_travis_updates() is True
+        assert mock_batch.mock_calls == [call([('a/1', bi), ('a/2', bi2)])]
+        assert mock_poll.mock_calls == [call('a/2', bi2)]
+
+    def test_poll_travis_updates_nothing_pending(self):
+        with patch('%s.batch_poll_travis' % pb) as mock_batch:
+            assert self.cls.poll_travis_updates() is False
+        assert mock_batch.mock_calls == []
+
+    def make_travis_builds(self):
+        """return a dict of BuildInfos in various Travis states"""
+        builds = {}
+        for slug, last_id, new_id in [
+                ('me/new', 10, None), ('me/notyet', 20, None),
+                ('me/running', 30, 31), ('me/finished', 40, 41),
+                ('me/missing', 50, 51), ('me/triggerfail', None, None),
+        ]:
+            bi = BuildInfo(slug)
+            bi.run_travis = True
+            bi.set_travis_build_ids(last_id, new_id)
+            builds[slug] = bi
+        return builds
+
+    def test_batch_poll_travis(self):
+        builds = self.make_travis_builds()
+        pending = sorted(builds.items())
+
+        def status(bid, slug, state):
+            return BuildStatus({'id': bid, 'state': state, 'number': str(bid),
+                                'duration': 10, 'repository': {'slug': slug}})
+
+        self.cls.travis.get_recent_builds.return_value = ([
+            status(61, 'me/other', 'passed'),
+            status(42, 'me/finished', 'started'),
+            status(41, 'Me/Finished', 'failed'),
+            status(31, 'me/running', 'started'),
+            status(13, 'me/new', 'passed'),
+            status(12, 'me/new', 'passed'),
+            status(11, 'me/new', 'started'),
+            status(20, 'me/notyet', 'passed'),
+        ], 11)
+        res = self.cls.batch_poll_travis(pending)
+        assert res == (True, [
+            ('me/missing', builds['me/missing']),
+            ('me/triggerfail', builds['me/triggerfail'])
+        ])
+        assert self.cls.travis.mock_calls == [call.get_recent_builds(11, 1)]
+        assert builds['me/new'].travis_build_id == 11
+        assert builds['me/new'].travis_build_finished is False
+        assert builds['me/notyet'].travis_build_id is None
+        assert builds['me/running'].travis_build_finished is False
+        assert builds['me/finished'].travis_build_finished is True
+        assert builds['me/finished'].travis_build_state == 'failed'
+        assert builds['me/finished'].travis_build_number == '41'
+
+    def test_batch_poll_travis_partial(self):
+        builds = self.make_travis_builds()
+        pending = sorted(builds.items())
+        self.cls.travis.get_recent_builds.return_value = ([
+            BuildStatus({'id': 52, 'state': 'passed',
+                         'repository': {'slug': 'me/other'}}),
+            BuildStatus({'id': 51, 'repository': {'slug': 'me/missing'}}),
+            BuildStatus({'id': 41, 'state': 'passed',
+                         'repository': {'slug': 'me/finished'}}),
+        ], 35)
+        res = self.cls.batch_poll_travis(pending)
+        assert res == (True, [
+            ('me/missing', builds['me/missing']),
+            ('me/new', builds['me/new']),
+            ('me/notyet', builds['me/notyet']),
+            ('me/running', builds['me/running']),
+            ('me/triggerfail', builds['me/triggerfail'])
+        ])
+        assert builds['me/finished'].travis_build_finished is True
+        assert builds['me/missing'].travis_build_finished is False
+
+    def test_batch_poll_travis_max_pages(self):
+        pending = []
+        for i in range(250):
+            bi = BuildInfo('me/r%d' % i)
+            bi.run_travis = True
+            bi.set_travis_build_ids(i * 2, i * 2 + 1)
+            pending.append(('me/r%d' % i, bi))
+        self.cls.travis.get_recent_builds.return_value = ([], 1)
+        self.cls.batch_poll_travis(pending)
+        assert self.cls.travis.mock_calls == [call.get_recent_builds(1, 3)]
+
+    def test_batch_poll_travis_no_ids(self):
+        bi = BuildInfo('me/a')
+        bi.run_travis = True
+        assert self.cls.batch_poll_travis([('me/a', bi)]) == (
+            False, [('me/a', bi)])
+        assert self.cls.travis.mock_calls == []
+
+    def test_batch_poll_travis_error(self):
+        builds = self.make_travis_builds()
+        pending = sorted(builds.items())
+        self.cls.travis.get_recent_builds.side_effect = TravisError(
+            {'status_code': 500, 'error': 'foo'})
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.batch_poll_travis(pending) == (False, pending)
+        assert mock_logger.mock_calls == [
+            call.exception("Unable to list recent Travis builds; polling "
+                           "each build individually")
+        ]
+
+    def test_poll_travis_build_finished(self):
+        bi = BuildInfo('a/1')
+        bi.set_travis_build_ids(1, 2)
+        self.cls.travis.get_build.return_value.finished = True
+        assert self.cls.poll_travis_build('a/1', bi) is True
+        assert bi.travis_build_finished is True
+        assert self.cls.travis.mock_calls == [call.get_build(2)]
+
+    def test_poll_travis_build_no_id(self):
+        bi = BuildInfo('a/1')
+        with patch('%s.update_travis_build' % pb) as mock_update:
+            mock_update.return_value = None
+            assert self.cls.poll_travis_build('a/1', bi) is False
+        assert mock_update.mock_calls == [call(bi)]
+        assert self.cls.travis.mock_calls == []
+
+    def open_breaker(self, name):
+        for _ in range(DEFAULT_FAILURE_THRESHOLD):
+            self.cls.breakers[name].record_failure(IOError('down'))
+        assert self.cls.breakers[name].is_closed is False
+
+    def test_batch_poll_travis_unavailable(self):
+        builds = self.make_travis_builds()
+        pending = sorted(builds.items())
+        with patch('%s.logger' % pbm):
+            self.open_breaker('travis')
+        assert self.cls.batch_poll_travis(pending) == (False, [])
+        assert self.cls.travis.mock_calls == []
+
+    def test_poll_travis_build_error(self):
+        bi = BuildInfo('a/1')
+        bi.set_travis_build_ids(1, 2)
+        self.cls.travis.get_build.side_effect = IOError('down')
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.poll_travis_build('a/1', bi) is False
+        assert bi.travis_build_finished is False
+        assert mock_logger.mock_calls == [
+            call.exception("Unable to get Travis build %s of %s", 2, 'a/1')
+        ]
+        assert self.cls.breakers['travis'].failures == 1
+
+    def test_poll_travis_build_unavailable(self):
+        bi = BuildInfo('a/1')
+        bi.set_travis_build_ids(1, 2)
+        with patch('%s.logger' % pbm):
+            self.open_breaker('travis')
+        assert self.cls.poll_travis_build('a/1', bi) is False
+        assert self.cls.travis.mock_calls == []
+
+    def test_poll_travis_updates_outage(self):
+        with patch('%s.logger' % pbm):
+            self.open_breaker('travis')
+        self.cls.breakers['travis'].outages[-1]['start'] -= 3601
+        with patch('%s.abandon_travis_builds' % pb) as mock_abandon:
+            res = self.cls.poll_travis_updates()
+        assert res is mock_abandon.return_value
+        assert mock_abandon.mock_calls == [call()]
+        assert self.cls.travis.mock_calls == []
+
+    def test_abandon_travis_builds(self):
+        bi1 = BuildInfo('a/1')
+        bi1.run_travis = True
+        bi2 = BuildInfo('a/2')
+        bi2.run_travis = True
+        bi2.travis_build_finished = True
+        bi3 = BuildInfo('a/3')
+        self.cls.builds = {'a/1': bi1, 'a/2': bi2, 'a/3': bi3}
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.abandon_travis_builds() is True
+        assert bi1.travis_build_finished is True
+        assert bi1.travis_build_skipped == 'Travis unavailable for more than ' \
+            '3600 seconds; stopped polling'
+        assert bi3.travis_build_finished is False
+        assert mock_logger.mock_calls == [
+            call.warning("Abandoning Travis build of %s; Travis has been "
+                         "unavailable for more than %d seconds", 'a/1', 3600)
+        ]
+        assert self.cls.abandon_travis_builds() is False
+
+    def test_start_travis_builds_unavailable(self):
+        bi = BuildInfo('foo/bar', None)
+        bi.run_travis = True
+        self.cls.builds = {'foo/bar': bi}
+        with patch('%s.logger' % pbm):
+            self.open_breaker('travis')
+            self.cls.start_travis_builds()
+        assert self.cls.travis.mock_calls == []
+        # it waits to be triggered once Travis is available again
+        assert self.cls.triggers.waiting == [('foo/bar', bi)]
+        assert bi.travis_trigger_error is None
+
+    def test_trigger_travis_build(self):
+        bi = BuildInfo('foo/bar', None)
+        self.mock_travis.run_build.return_value = (1, 2)
+        self.cls.trigger_travis_build('foo/bar', bi)
+        assert self.mock_travis.mock_calls == [
+            call.run_build('foo/bar', attach=True, cancel_stale=False)
+        ]
+        assert bi.travis_last_build_id == 1
+        assert bi.travis_build_id == 2
+        assert bi.travis_build_attached is False
+        assert bi.travis_trigger_error is None
+        assert self.cls.ratelimit.current_phase == 'other'
+
+    def test_trigger_travis_build_attached(self):
+        bi = BuildInfo('foo/bar', None)
+        self.cls.travis_attach = False
+        self.cls.cancel_stale_travis = True
+        self.mock_travis.run_build.return_value = (None, 5)
+        self.cls.trigger_travis_build('foo/bar', bi)
+        assert self.mock_travis.mock_calls == [
+            call.run_build('foo/bar', attach=False, cancel_stale=True)
+        ]
+        assert bi.travis_last_build_id is None
+        assert bi.travis_build_id == 5
+        assert bi.travis_build_attached is True
+
+    def test_trigger_travis_build_error(self):
+        bi = BuildInfo('foo/bar', None)
+        ex = TravisTriggerError('foo/bar', 'master', 'url', 500, 'headers',
+                                'text')
+        self.mock_travis.run_build.side_effect = ex
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.trigger_travis_build('foo/bar', bi)
+        assert bi.travis_build_id is None
+        assert bi.travis_trigger_error == ex
+        assert mock_logger.mock_calls == [call.exception(ex)]
+        assert self.cls.breakers['travis'].failures == 1
+
+    def make_trigger_builds(self):
+        builds = {}
+        for name in ['a/running', 'a/done', 'a/error', 'a/local', 'a/new1',
+                     'a/new2', 'a/new3']:
+            builds[name] = BuildInfo(name, None)
+            builds[name].run_travis = True
+        builds['a/running'].set_travis_build_ids(1, None)
+        builds['a/done'].set_travis_build_ids(3, 4)
+        builds['a/done'].travis_build_finished = True
+        builds['a/error'].set_travis_trigger_error(IOError('foo'))
+        builds['a/local'].run_travis = False
+        self.cls.builds = builds
+        return builds
+
+    def test_travis_in_flight(self):
+        builds = self.make_trigger_builds()
+        assert self.cls.travis_in_flight() == 1
+        builds['a/new1'].set_travis_build_ids(5, 6)
+        assert self.cls.travis_in_flight() == 2
+        builds['a/new2'].set_travis_build_attached(7)
+        assert self.cls.travis_in_flight() == 3
+        # being triggered is counted by the TriggerQueue
+        self.cls.triggers.running['a/new1'] = Mock()
+        assert self.cls.travis_in_flight() == 2
+
+    def test_admit_travis_builds(self):
+        builds = self.make_trigger_builds()
+        self.cls.triggers.max_in_flight = 2
+        for name in ['a/new1', 'a/new2', 'a/new3']:
+            self.cls.triggers.add(name, builds[name])
+        self.mock_travis.run_build.return_value = (7, 8)
+        with patch('%s.logger' % pbm):
+            with patch('rebuildbot.triggers.logger'):
+                assert self.cls.admit_travis_builds() is True
+                assert self.cls.triggers.wait() == ['a/new1']
+                # a/running and a/new1 are in flight
+                assert self.cls.admit_travis_builds() is False
+                builds['a/running'].travis_build_finished = True
+                assert self.cls.admit_travis_builds() is True
+                assert self.cls.triggers.wait() == ['a/new2']
+        assert self.mock_travis.run_build.mock_calls == [
+            call('a/new1', attach=True, cancel_stale=False),
+            call('a/new2', attach=True, cancel_stale=False)
+        ]
+        assert builds['a/new1'].travis_build_id == 8
+        assert builds['a/new2'].travis_build_id == 8
+        assert self.cls.triggers.waiting == [('a/new3', builds['a/new3'])]
+
+    def test_admit_travis_builds_collect(self):
+        t = Mock()
+        t.is_alive.return_value = False
+        self.cls.triggers.running['a/b'] = t
+        assert self.cls.admit_travis_builds() is True
+        assert self.cls.triggers.running == {}
+        assert self.cls.admit_travis_builds() is False
+
+    def test_admit_travis_builds_unavailable(self):
+        builds = self.make_trigger_builds()
+        self.cls.triggers.add('a/new1', builds['a/new1'])
+        with patch('%s.logger' % pbm):
+            self.open_breaker('travis')
+        assert self.cls.admit_travis_builds() is False
+        assert self.cls.triggers.waiting == [('a/new1', builds['a/new1'])]
+        assert self.mock_travis.mock_calls == []
+
+    def test_poll_travis_updates_queued(self):
+        bi = BuildInfo('a/b', None)
+        bi.run_travis = True
+        self.cls.builds = {'a/b': bi}
+        self.cls.triggers.add('a/b', bi)
+        with patch('%s.batch_poll_travis' % pb) as mock_batch:
+            assert self.cls.poll_travis_updates() is False
+        assert mock_batch.mock_calls == []
+        assert self.mock_travis.mock_calls == []
+
+    def test_abandon_travis_builds_queued(self):
+        bi = BuildInfo('a/b', None)
+        bi.run_travis = True
+        self.cls.builds = {'a/b': bi}
+        self.cls.triggers.add('a/b', bi)
+        with patch('%s.logger' % pbm):
+            assert self.cls.abandon_travis_builds() is True
+        assert self.cls.triggers.busy is False
+        assert bi.travis_build_skipped is not None
+
+    def test_update_travis_build_error(self):
+        b = Mock(spec_set=BuildInfo)
+        type(b).slug = 'my/slug'
+        type(b).travis_last_build_id = 1
+        self.mock_travis.wait_for_new_build.side_effect = IOError('down')
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.update_travis_build(b) is None
+        assert b.mock_calls == []
+        assert mock_logger.mock_calls == [
+            call.debug("Checking for new build ID for %s (last ID %s)",
+                       'my/slug', 1),
+            call.exception("Unable to poll for new Build ID for %s",
+                           'my/slug')
+        ]
+
+    def test_find_projects_list_github_error(self):
+        self.cls.github.get_project_config.side_effect = IOError('down')
+        self.cls.travis.get_last_build.return_value = True
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = self.cls.find_projects(['a/p1'])
+        assert res['a/p1'].run_local is False
+        assert res['a/p1'].run_travis is True
+        assert call.exception(
+            "Unable to get GitHub project config for %s; not running a "
+            "local build", 'a/p1') in mock_logger.mock_calls
+        assert self.cls.breakers['github'].failures == 1
+
     def test_poll_travis_updates_dry_run(self):
         self.cls.dry_run = True
 
@@ -1084,27 +2691,237 @@ class TestReBuildBot(object):
         with patch.multiple(
                 pb,
                 get_s3_prefix=DEFAULT,
+                check_regressions=DEFAULT,
                 write_local_output=DEFAULT,
                 generate_report=DEFAULT,
+                generate_results_json=DEFAULT,
                 write_to_s3=DEFAULT,
                 get_log_buffer_url=DEFAULT,
                 write_index_html=DEFAULT,
+                update_history=DEFAULT,
         ) as mocks:
             mocks['get_s3_prefix'].return_value = 's3/prefix'
             mocks['generate_report'].return_value = 'myreport'
             mocks['write_to_s3'].return_value = 'myurl'
             mocks['get_log_buffer_url'].return_value = 's3/log'
-            self.cls.handle_results(timedelta(0, 143))
+            with patch.object(self.cls.ratelimit, 'log_summary') as mock_log:
+                self.cls.handle_results(timedelta(0, 143))
+        assert mock_log.mock_calls == [call()]
         assert mocks['get_s3_prefix'].mock_calls == [call()]
+        assert mocks['check_regressions'].mock_calls == [call()]
         assert mocks['write_local_output'].mock_calls == [call('s3/prefix')]
         assert mocks['generate_report'].mock_calls == [
             call('s3/prefix', timedelta(0, 143), 's3/log')
         ]
         assert mocks['write_to_s3'].mock_calls == [
-            call('s3/prefix', 'index.html', 'myreport', ctype='text/html')
+            call('s3/prefix', 'index.html', 'myreport', ctype='text/html'),
+            call('s3/prefix', 'results.json', mocks[
+                'generate_results_json'].return_value,
+                ctype='application/json')
+        ]
+        assert mocks['generate_results_json'].mock_calls == [
+            call(timedelta(0, 143))
         ]
         assert mocks['get_log_buffer_url'].mock_calls == [call('s3/prefix')]
         assert mocks['write_index_html'].mock_calls == [call('myurl')]
+        assert mocks['update_history'].mock_calls == [call()]
+
+    def test_generate_results_json(self):
+        b1 = BuildInfo('a/p1', run_local=True)
+        b1.set_local_build(return_code=0, output='out',
+                           start_dt=datetime(2015, 10, 20, 20, 0, 0),
+                           end_dt=datetime(2015, 10, 20, 20, 1, 0))
+        b1.set_local_build_rusage({'user_cpu': 1.5})
+        self.cls.builds = {'a/p1': b1}
+        self.cls.dry_run = False
+        with patch('%s.platform_node' % pbm) as mock_node:
+            mock_node.return_value = 'myhost'
+            res = json.loads(
+                self.cls.generate_results_json(timedelta(0, 143)))
+        assert res['host'] == 'myhost'
+        assert res['duration'] == 143
+        assert res['dry_run'] is False
+        assert res['version'] == _VERSION
+        assert res['builds']['a/p1']['travis'] is None
+        assert res['builds']['a/p1']['local']['duration'] == 60
+        assert res['builds']['a/p1']['local']['resource_usage'] == {
+            'user_cpu': 1.5
+        }
+        assert res['regressions'] == []
+        assert res['api_usage'] == []
+        assert res['outages'] == []
+        self.cls.ratelimit.acquire('github')
+        res = json.loads(self.cls.generate_results_json(timedelta(0, 143)))
+        assert res['api_usage'] == [{'phase': 'other', 'service': 'github',
+                                     'requests': 1, 'waited': 0}]
+
+    def test_discover_phase(self):
+        phases = []
+
+        def se_iter():
+            phases.append(self.cls.ratelimit.current_phase)
+            return iter([])
+
+        self.cls.date_check = True
+        self.cls.github = Mock()
+        self.cls.github.iter_repos.side_effect = se_iter
+        self.cls.travis = Mock()
+        self.cls.travis.iter_user_repos.side_effect = se_iter
+        assert list(self.cls.discover_github()) == []
+        assert list(self.cls.discover_travis()) == []
+        assert phases == ['discovery', 'discovery']
+        assert self.cls.ratelimit.current_phase == 'other'
+
+    def test_discover_github_resume(self):
+        repos = [Mock(full_name='me/%s' % c) for c in 'abc']
+        listed = []
+        inspected = []
+
+        def se_iter():
+            listed.append(1)
+            yield repos[0]
+            if len(listed) == 1:
+                raise IOError('down')
+            for r in repos[1:]:
+                yield r
+
+        def se_inspect(repo, date_check=True):
+            inspected.append(repo.full_name)
+            if inspected == ['me/a', 'me/b']:
+                raise IOError('down')
+            return ('https', 'ssh', 1, {})
+
+        self.cls.date_check = True
+        self.cls.max_outage = 3600
+        self.cls.github = Mock()
+        self.cls.github.iter_repos.side_effect = se_iter
+        self.cls.github.inspect_repo.side_effect = se_inspect
+        with patch('rebuildbot.circuitbreaker.logger'):
+            res = [bi.slug for bi in self.cls.discover_github()]
+        # the listing failed after me/a and was restarted, and inspecting
+        # me/b was retried; nothing was dropped or inspected twice
+        assert res == ['me/a', 'me/b', 'me/c']
+        assert len(listed) == 2
+        assert inspected == ['me/a', 'me/b', 'me/b', 'me/c']
+        assert self.cls.breakers['github'].is_closed is True
+
+    def test_discover_travis_outage(self):
+        clock = [1000]
+        repos = [Mock(slug='me/a'), Mock(slug='me/b')]
+        listed = []
+
+        def se_iter():
+            listed.append(1)
+            if len(listed) <= DEFAULT_FAILURE_THRESHOLD:
+                raise IOError('down')
+            for r in repos:
+                yield r
+
+        def se_sleep(secs):
+            clock[0] += secs
+
+        self.cls.date_check = True
+        self.cls.max_outage = 3600
+        self.cls.travis = Mock()
+        self.cls.travis.iter_user_repos.side_effect = se_iter
+        self.cls.travis.repo_eligible.side_effect = \
+            lambda r, date_check=True: r.slug == 'me/b'
+        with patch('rebuildbot.circuitbreaker.logger'), \
+                patch('rebuildbot.circuitbreaker.time') as mock_time:
+            mock_time.time.side_effect = lambda: clock[0]
+            mock_time.sleep.side_effect = se_sleep
+            res = [bi.slug for bi in self.cls.discover_travis()]
+        # discovery waited for the circuit to allow a trial call
+        assert res == ['me/b']
+        assert mock_time.sleep.mock_calls == [call(30)]
+        assert self.cls.breakers['travis'].is_closed is True
+        assert len(self.cls.breakers['travis'].outages) == 1
+
+    def test_discover_github_max_outage(self):
+        self.cls.date_check = True
+        self.cls.max_outage = 5
+        self.cls.github = Mock()
+        self.cls.github.iter_repos.return_value = iter([])
+        with patch('%s.logger' % pbm), \
+                patch('rebuildbot.circuitbreaker.logger'):
+            self.open_breaker('github')
+            self.cls.breakers['github'].outages[-1]['start'] -= 10
+            try:
+                list(self.cls.discover_github())
+            except CircuitOpenError:
+                pass
+            else:
+                raise AssertionError("CircuitOpenError not raised")
+        assert self.cls.github.mock_calls == [call.iter_repos()]
+
+    def test_check_regressions(self):
+        b1 = Mock(spec_set=BuildInfo)
+        b2 = Mock(spec_set=BuildInfo)
+        self.cls.builds = {'a/b': b1, 'a/c': b2}
+        self.cls.regressions = {'old': {}}
+        self.cls.regression_window = 5
+
+        def se_find(bi, window=None, threshold=None):
+            if bi == b1:
+                return {'local': (50.0, 60.0), 'travis': (25.0, 120.0)}
+            return {}
+
+        self.cls.history.find_regressions.side_effect = se_find
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.check_regressions()
+        assert self.cls.history.mock_calls == [
+            call.find_regressions(b1, window=5, threshold=20),
+            call.find_regressions(b2, window=5, threshold=20),
+        ]
+        assert mock_logger.mock_calls == [
+            call.warning("%s %s build took %.0f%% longer than its median of "
+                         "%.0fs", 'a/b', 'local', 50.0, 60.0),
+            call.warning("%s %s build took %.0f%% longer than its median of "
+                         "%.0fs", 'a/b', 'travis', 25.0, 120.0),
+        ]
+        assert b1.mock_calls == [call.set_regressions(
+            {'local': (50.0, 60.0), 'travis': (25.0, 120.0)})]
+        assert b2.mock_calls == []
+        assert self.cls.regressions == {
+            'a/b': {'local': (50.0, 60.0), 'travis': (25.0, 120.0)}
+        }
+
+    def test_check_regressions_dry_run(self):
+        self.cls.dry_run = True
+        self.cls.builds = {'a/b': Mock(spec_set=BuildInfo)}
+        self.cls.regressions = {'old': {}}
+        self.cls.check_regressions()
+        assert self.cls.history.mock_calls == []
+        assert self.cls.regressions == {}
+
+    def test_update_history(self):
+        self.cls.builds = {'a/b': Mock(spec_set=BuildInfo)}
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            self.cls.update_history()
+        assert self.cls.history.mock_calls == [
+            call.record_builds(self.cls.builds,
+                               datetime(2015, 10, 20, 20, 0, 0)),
+            call.save()
+        ]
+
+    def test_update_history_save_error(self):
+        self.cls.history.save.side_effect = IOError('foo')
+        type(self.cls.history).path = '/foo/history.json'
+        with patch('%s.dt_now' % pb) as mock_dt_now, \
+                patch('%s.logger' % pbm) as mock_logger:
+            mock_dt_now.return_value = datetime(2015, 10, 20, 20, 0, 0)
+            self.cls.update_history()
+        assert self.cls.history.mock_calls == [
+            call.record_builds({}, datetime(2015, 10, 20, 20, 0, 0)),
+            call.save()
+        ]
+        assert mock_logger.exception.call_count == 1
+
+    def test_update_history_dry_run(self):
+        self.cls.dry_run = True
+        self.cls.update_history()
+        assert self.cls.history.mock_calls == []
 
     def test_write_local_output(self):
         build1 = Mock(spec_set=BuildInfo)
@@ -1168,6 +2985,8 @@ class TestReBuildBot(object):
             'dry_run': False,
             'duration': '0:02:23',
             'log_url': 'logstr',
+            'regressions': [],
+            'outages': [],
         }
 
         assert mock_env.mock_calls == [
@@ -1229,6 +3048,63 @@ class TestReBuildBot(object):
             '(<a href="myLogURL">Logging output</a>)</h3>' in res
         assert table_re.search(res) is not None, "Content:\n%s\n" \
             "Not found in content:\n%s" % (table_re.pattern, res)
+        assert 'slower than usual' not in res
+
+    def test_report_template_regressions(self):
+        self.cls.regressions = {'u1/name2': {}, 'u1/name1': {}}
+        with \
+             patch('%s.get_build_info_html_list' % pb) as mock_get_html, \
+             patch('%s.platform_node' % pbm) as mock_node, \
+             patch('%s.getuser' % pbm) as mock_user:
+            mock_get_html.return_value = []
+            mock_node.return_value = 'my.node.name'
+            mock_user.return_value = 'myuser'
+            res = self.cls.generate_report('my/prefix', timedelta(0, 143),
+                                           'myLogURL')
+        assert '<h3>Builds slower than usual: u1/name1, u1/name2</h3>' in res
+
+    def test_report_template_outages(self):
+        with \
+             patch('%s.get_build_info_html_list' % pb) as mock_get_html, \
+             patch('%s.outage_strs' % pb) as mock_outages, \
+             patch('%s.platform_node' % pbm) as mock_node, \
+             patch('%s.getuser' % pbm) as mock_user:
+            mock_get_html.return_value = []
+            mock_outages.return_value = ['outage1', 'outage2']
+            mock_node.return_value = 'my.node.name'
+            mock_user.return_value = 'myuser'
+            res = self.cls.generate_report('my/prefix', timedelta(0, 143),
+                                           'myLogURL')
+        assert '<h3>Service outages:</h3>' in res
+        assert '<li>outage1</li>' in res
+        assert '<li>outage2</li>' in res
+
+    def test_outages(self):
+        self.cls.breakers['github'].outages = [
+            {'start': 200, 'end': 300, 'failures': 3, 'error': 'foo'}
+        ]
+        self.cls.breakers['travis'].outages = [
+            {'start': 100, 'end': 150, 'failures': 4, 'error': 'bar'},
+            {'start': 400, 'end': None, 'failures': 5, 'error': 'baz'},
+        ]
+        assert [(o['service'], o['start']) for o in self.cls.outages()] == [
+            ('travis', 100), ('github', 200), ('travis', 400)
+        ]
+
+    def test_outage_strs(self):
+        start = mktime(datetime(2015, 10, 20, 12, 34, 56).timetuple())
+        self.cls.breakers['travis'].outages = [
+            {'start': start, 'end': start + 125.5, 'failures': 4,
+             'error': 'bar'},
+            {'start': start + 3600, 'end': None, 'failures': 5,
+             'error': 'baz'},
+        ]
+        assert self.cls.outage_strs() == [
+            'travis unavailable from 12:34:56 for 0:02:05 (4 failed calls; '
+            'last error: bar)',
+            'travis unavailable from 13:34:56 until the end of the run (5 '
+            'failed calls; last error: baz)'
+        ]
 
     def test_get_build_info_html_list(self):
         build1 = Mock(spec_set=BuildInfo)
@@ -1265,6 +3141,104 @@ class TestReBuildBot(object):
                 call.make_local_build_html()
             ]
 
+    def test_poll_travis_updates_not_due(self):
+        bi = BuildInfo('a/1')
+        bi.run_travis = True
+        bi.set_travis_build_ids(1, 2)
+        self.cls.builds = {'a/1': bi}
+        with patch('%s.travis_poll_due' % pb) as mock_due:
+            mock_due.return_value = False
+            assert self.cls.poll_travis_updates() is False
+        assert mock_due.mock_calls == [call('a/1')]
+        assert self.cls.travis.mock_calls == []
+
+    def test_check_webhooks_disabled(self):
+        assert self.cls.check_webhooks() is False
+
+    def test_check_webhooks(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        builds = {}
+        for slug, last_id, new_id in [
+                ('me/new', 10, None), ('me/running', 20, 21),
+                ('me/other', 30, 31), ('me/old', 40, None),
+                ('me/untriggered', None, None), ('me/done', 50, 51),
+        ]:
+            bi = BuildInfo(slug)
+            bi.run_travis = True
+            bi.set_travis_build_ids(last_id, new_id)
+            builds[slug] = bi
+        builds['me/done'].travis_build_finished = True
+        self.cls.builds = builds
+        self.cls.webhooks.get.return_value = [
+            ('me/new', BuildStatus({'id': 11, 'state': 'started'})),
+            ('me/running', BuildStatus({'id': 21, 'state': 'passed',
+                                        'number': '7', 'duration': 60})),
+            ('me/other', BuildStatus({'id': 29, 'state': 'passed'})),
+            ('me/old', BuildStatus({'id': 40, 'state': 'passed'})),
+            ('me/untriggered', BuildStatus({'id': 1, 'state': 'passed'})),
+            ('me/done', BuildStatus({'id': 51, 'state': 'failed'})),
+            ('me/unknown', BuildStatus({'id': 1, 'state': 'passed'})),
+        ]
+        assert self.cls.check_webhooks(timeout=10) is True
+        assert self.cls.webhooks.mock_calls == [call.get(timeout=10)]
+        assert builds['me/new'].travis_build_id == 11
+        assert builds['me/new'].travis_build_finished is False
+        assert builds['me/running'].travis_build_finished is True
+        assert builds['me/running'].travis_build_state == 'passed'
+        assert builds['me/running'].travis_build_number == '7'
+        assert builds['me/running'].travis_build_duration == 60
+        assert builds['me/other'].travis_build_finished is False
+        assert builds['me/old'].travis_build_id is None
+        assert builds['me/untriggered'].travis_build_id is None
+        assert builds['me/done'].travis_build_state is None
+
+    def test_check_webhooks_nothing(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        self.cls.webhooks.get.return_value = []
+        assert self.cls.check_webhooks() is False
+
+    def test_travis_poll_due_no_webhooks(self):
+        assert self.cls.travis_poll_due('a/b') is True
+        assert self.cls.travis_next_poll == {}
+
+    def test_travis_poll_due(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        self.cls.webhook_window = 600
+        self.cls.history.passed_durations.return_value = [100, 200, 300]
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        with patch('%s.dt_now' % pb) as mock_dt_now, \
+                patch('%s.logger' % pbm) as mock_logger:
+            mock_dt_now.return_value = start
+            assert self.cls.travis_poll_due('a/b') is False
+            assert self.cls.travis_next_poll == {
+                'a/b': start + timedelta(seconds=800)
+            }
+            mock_dt_now.return_value = start + timedelta(seconds=799)
+            assert self.cls.travis_poll_due('a/b') is False
+            mock_dt_now.return_value = start + timedelta(seconds=800)
+            assert self.cls.travis_poll_due('a/b') is True
+        assert self.cls.travis_next_poll == {
+            'a/b': start + timedelta(seconds=1100)
+        }
+        assert self.cls.history.mock_calls == [
+            call.passed_durations('a/b', 'travis')
+        ]
+        assert mock_logger.mock_calls == [
+            call.info("No webhook notification for Travis build of %s "
+                      "within expected window; polling", 'a/b')
+        ]
+
+    def test_travis_poll_due_no_history(self):
+        self.cls.webhooks = Mock(spec_set=WebhookReceiver)
+        self.cls.history.passed_durations.return_value = []
+        start = datetime(2015, 10, 20, 20, 0, 0)
+        with patch('%s.dt_now' % pb) as mock_dt_now:
+            mock_dt_now.return_value = start
+            assert self.cls.travis_poll_due('a/b') is False
+        assert self.cls.travis_next_poll == {
+            'a/b': start + timedelta(seconds=1800)
+        }
+
     def test_update_travis_build(self):
         b = Mock(spec_set=BuildInfo)
         type(b).slug = 'my/slug'
@@ -37,6 +37,8 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
+import os
+import re
 import sys
 import traceback
 from datetime import (datetime, timedelta)
@@ -65,9 +67,12 @@ class TestBuildInfoInit(object):
         assert cls.travis_trigger_error is None
         assert cls.travis_build_id is None
         assert cls.travis_last_build_id is None
+        assert cls.travis_build_attached is False
         assert cls.travis_build_result is None
         assert cls.local_build_return_code is None
         assert cls.local_build_output is None
+        assert cls.local_build_rusage is None
+        assert cls.regressions == {}
         assert cls.local_build_exception is None
         assert cls.local_build_ex_type is None
         assert cls.local_build_traceback is None
@@ -77,6 +82,11 @@ class TestBuildInfoInit(object):
         assert cls.local_build_duration is None
         assert cls.local_build_s3_link is None
         assert cls.local_build_repo_str is None
+        assert cls.local_build_skipped is None
+        assert cls.cache_stats is None
+        assert cls.clone_attempts == []
+        assert cls.resource_tags == []
+        assert cls.manifest == {}
         assert cls.run_local is False
         assert cls.travis_build_result is None
         assert cls.travis_build_state is None
@@ -86,6 +96,40 @@ class TestBuildInfoInit(object):
         assert cls.travis_build_number is None
         assert cls.travis_build_url is None
         assert cls.travis_build_finished is False
+        assert cls.repo_size is None
+
+    def test_repo_size(self):
+        cls = BuildInfo('myslug', repo_size=1234)
+        assert cls.repo_size == 1234
+
+    def test_manifest(self):
+        cls = BuildInfo('myslug', manifest={'timeout': 60, 'tags': ['a']})
+        assert cls.manifest == {'timeout': 60, 'tags': ['a']}
+        assert cls.resource_tags == ['a']
+
+    def test_merge(self):
+        cls = BuildInfo('myslug')
+        cls.run_travis = True
+        other = BuildInfo('myslug', run_local=True, https_clone_url='h',
+                          ssh_clone_url='s', repo_size=12,
+                          manifest={'tags': ['a']})
+        cls.merge(other)
+        assert cls.run_travis is True
+        assert cls.run_local is True
+        assert cls.https_clone_url == 'h'
+        assert cls.ssh_clone_url == 's'
+        assert cls.repo_size == 12
+        assert cls.manifest == {'tags': ['a']}
+        assert cls.resource_tags == ['a']
+
+    def test_merge_travis(self):
+        cls = BuildInfo('myslug', run_local=True, https_clone_url='h')
+        other = BuildInfo('myslug')
+        other.run_travis = True
+        cls.merge(other)
+        assert cls.run_travis is True
+        assert cls.run_local is True
+        assert cls.https_clone_url == 'h'
 
     def test_local_script(self):
         cls = BuildInfo('myslug', run_local=True)
@@ -139,6 +183,7 @@ class TestBuildInfoInit(object):
         assert cls.local_build_duration is None
         assert cls.local_build_s3_link is None
         assert cls.local_build_repo_str is None
+        assert cls.local_build_skipped is None
         assert cls.run_local is False
         assert cls.travis_build_result is None
         assert cls.travis_build_state is None
@@ -148,6 +193,7 @@ class TestBuildInfoInit(object):
         assert cls.travis_build_number is None
         assert cls.travis_build_url is None
         assert cls.travis_build_finished is False
+        assert cls.travis_build_skipped is None
 
 
 class TestBuildInfo(object):
@@ -191,6 +237,13 @@ class TestBuildInfo(object):
         assert self.cls.travis_last_build_id == 123
         assert self.cls.travis_build_id == 456
 
+    def test_set_travis_build_attached(self):
+        self.cls.set_travis_build_attached(456)
+        assert self.cls.travis_last_build_id is None
+        assert self.cls.travis_build_id == 456
+        assert self.cls.travis_build_attached is True
+        assert self.cls.is_done is False
+
     def test_set_travis_build_finished(self):
         bld = Mock()
         type(bld).state = 'state'
@@ -224,6 +277,32 @@ class TestBuildInfo(object):
         assert self.cls.local_build_start is None
         assert self.cls.local_build_end is None
         assert self.cls.local_build_repo_str is None
+        assert self.cls.local_build_timed_out is False
+
+    def test_set_local_build_timed_out(self):
+        ex = Exception("foo")
+        self.cls.set_local_build(excinfo=ex, output='myoutput',
+                                 timed_out=True)
+        assert self.cls.local_build_return_code is None
+        assert self.cls.local_build_output == 'myoutput'
+        assert self.cls.local_build_exception == ex
+        assert self.cls.local_build_finished is True
+        assert self.cls.local_build_timed_out is True
+
+    def test_set_local_build_skipped(self):
+        self.cls.set_local_build_skipped('no time')
+        assert self.cls.local_build_skipped == 'no time'
+        assert self.cls.local_build_finished is True
+        assert self.cls.is_done is True
+
+    def test_set_travis_build_skipped(self):
+        self.cls.run_local = False
+        self.cls.set_travis_build_ids(1, 2)
+        assert self.cls.is_done is False
+        self.cls.set_travis_build_skipped('stopped polling')
+        assert self.cls.travis_build_skipped == 'stopped polling'
+        assert self.cls.travis_build_finished is True
+        assert self.cls.is_done is True
 
     def test_set_local_build_duration(self):
         s = datetime(2015, 1, 1, 1, 10, 11)
@@ -304,6 +383,53 @@ class TestBuildInfo(object):
                    "==> Build exited 3 in 1:02:03"
         assert res == expected
 
+    def test_local_build_output_str_clone_attempts(self):
+        self.cls.local_build_output = 'my output'
+        self.cls.slug = 'foo/bar'
+        self.cls.local_build_return_code = 0
+        self.cls.local_build_repo_str = 'myrepostr'
+        self.cls.add_clone_attempt('ssh', 'ssh_url', 30.04, Exception('foo'))
+        self.cls.add_clone_attempt('https', 'https_url', 2.5)
+        res = self.cls.local_build_output_str
+        expected = "=> Build of foo/bar myrepostr\n" \
+                   "=> Clone: ssh <ssh_url> failed after 30.0s; " \
+                   "https <https_url> ok in 2.5s\n" \
+                   "my output\n\n" \
+                   "==> Build exited 0"
+        assert res == expected
+
+    def test_add_clone_attempt(self):
+        self.cls.add_clone_attempt('ssh', 'ssh_url', 30.0, Exception('foo'))
+        self.cls.add_clone_attempt('https', 'https_url', 2.5)
+        assert self.cls.clone_attempts == [
+            {'protocol': 'ssh', 'url': 'ssh_url', 'duration': 30.0,
+             'error': 'foo'},
+            {'protocol': 'https', 'url': 'https_url', 'duration': 2.5,
+             'error': None},
+        ]
+
+    def test_local_build_output_str_timed_out(self):
+        self.cls.local_build_output = 'my output'
+        self.cls.slug = 'foo/bar'
+        self.cls.local_build_exception = Exception('killed')
+        self.cls.local_build_timed_out = True
+        self.cls.local_build_start = datetime(2015, 1, 1, 0, 0, 0)
+        self.cls.local_build_end = datetime(2015, 1, 1, 1, 0, 0)
+        self.cls.local_build_duration = timedelta(hours=1)
+        self.cls.local_build_repo_str = 'myrepostr'
+        res = self.cls.local_build_output_str
+        expected = "=> Build of foo/bar myrepostr starts at " \
+                   "2015-01-01 00:00:00\n" \
+                   "my output\n\n" \
+                   "=> Build ends at 2015-01-01 01:00:00\n" \
+                   "==> Build timed out in 1:00:00: killed"
+        assert res == expected
+
+    def test_local_build_output_str_skipped(self):
+        self.cls.set_local_build_skipped('no time')
+        assert self.cls.local_build_output_str == '=> Build of me/myrepo ' \
+            'skipped: no time\n'
+
     def test_local_build_output_str_exception(self):
         # get an exception with a traceback
         try:
@@ -334,6 +460,27 @@ class TestBuildInfo(object):
         expected += '<a href="myurl">#123</a> ran in 0:17:37'
         assert res == expected
 
+    def test_make_travis_html_regression(self):
+        self.cls.travis_build_url = 'myurl'
+        self.cls.travis_build_number = 123
+        self.cls.travis_build_duration = 1057
+        self.cls.travis_build_state = 'passed'
+        self.cls.set_regressions({'travis': (41.5, 747.4)})
+        res = self.cls.make_travis_html()
+        assert res == '<span class="icon passed">&nbsp;</span>' \
+            '<a href="myurl">#123</a> ran in 0:17:37<br /><strong>42% ' \
+            'slower than usual (median 0:12:27)</strong>'
+
+    def test_make_travis_html_attached(self):
+        self.cls.travis_build_url = 'myurl'
+        self.cls.travis_build_number = 123
+        self.cls.travis_build_duration = 1057
+        self.cls.travis_build_state = 'passed'
+        self.cls.set_travis_build_attached(456)
+        assert self.cls.make_travis_html() == '<span class="icon passed">' \
+            '&nbsp;</span><a href="myurl">#123</a> ran in 0:17:37 ' \
+            '(already running; not triggered)'
+
     def test_make_travis_html_no_build(self):
         with patch('%s.travis_build_icon' % pb,
                    new_callable=PropertyMock) as mock_icon:
@@ -341,6 +488,11 @@ class TestBuildInfo(object):
             res = self.cls.make_travis_html()
         assert res == 'n/a'
 
+    def test_make_travis_html_skipped(self):
+        self.cls.set_travis_build_skipped('stopped polling')
+        assert self.cls.make_travis_html() == '<span class="icon skipped">' \
+            '&nbsp;</span>Skipped: stopped polling'
+
     def test_travis_build_icon_canceled(self):
         self.cls.travis_build_state = 'canceled'
         assert self.cls.travis_build_icon == 'errored'
@@ -365,6 +517,12 @@ class TestBuildInfo(object):
         self.cls.local_build_exception = Mock()
         assert self.cls.local_build_icon == 'errored'
 
+    def test_local_build_icon_timed_out(self):
+        self.cls.local_build_exception = Mock()
+        self.cls.local_build_output = 'foo'
+        self.cls.local_build_timed_out = True
+        assert self.cls.local_build_icon == 'timedout'
+
     def test_local_build_icon_passed(self):
         self.cls.local_build_return_code = 0
         assert self.cls.local_build_icon == 'passed'
@@ -384,6 +542,163 @@ class TestBuildInfo(object):
         assert res == '<span class="icon bar">&nbsp;</span>' \
             '<a href="s3link">Local Build</a> ran in 1:02:03'
 
+    def test_make_local_build_html_timed_out(self):
+        self.cls.run_local = True
+        self.cls.local_build_s3_link = 's3link'
+        self.cls.local_build_timed_out = True
+        self.cls.local_build_duration = timedelta(hours=1)
+        res = self.cls.make_local_build_html()
+        assert res == '<span class="icon timedout">&nbsp;</span>' \
+            '<a href="s3link">Local Build</a> timed out after 1:00:00'
+
+    def test_set_cache_stats(self):
+        self.cls.set_cache_stats({'pip': {}})
+        assert self.cls.cache_stats == {'pip': {}}
+
+    def test_cache_stats_str(self):
+        self.cls.cache_stats = {
+            'pip': {'cached': 120, 'updated': 2, 'removed': 1, 'added': 3,
+                    'written_bytes': 1258291},
+            'npm': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 0,
+                    'written_bytes': 0},
+            'vagrant': None,
+        }
+        assert self.cls.cache_stats_str == 'npm: 0 cached (0 updated, ' \
+            '0 removed), 0 new; 0.0 MB written; pip: 120 cached (2 updated, ' \
+            '1 removed), 3 new; 1.2 MB written; vagrant: shared with a ' \
+            'concurrent build'
+
+    def test_make_local_build_html_cache_stats(self):
+        self.cls.run_local = True
+        self.cls.local_build_s3_link = 's3link'
+        self.cls.local_build_return_code = 0
+        self.cls.local_build_duration = timedelta(hours=1)
+        self.cls.cache_stats = {
+            'pip': {'cached': 1, 'updated': 0, 'removed': 0, 'added': 0,
+                    'written_bytes': 0},
+        }
+        res = self.cls.make_local_build_html()
+        assert res == '<span class="icon passed">&nbsp;</span>' \
+            '<a href="s3link">Local Build</a> ran in 1:00:00' \
+            '<br /><small>pip: 1 cached (0 updated, 0 removed), 0 new; ' \
+            '0.0 MB written</small>'
+
+    def test_set_local_build_rusage(self):
+        self.cls.set_local_build_rusage({'user_cpu': 1.0})
+        assert self.cls.local_build_rusage == {'user_cpu': 1.0}
+
+    def test_rusage_str(self):
+        self.cls.local_build_rusage = {
+            'user_cpu': 61.23, 'sys_cpu': 8.4, 'max_rss_kb': 524288,
+            'block_in': 120, 'block_out': 3400, 'voluntary_switches': 2100,
+            'involuntary_switches': 340,
+            'cgroup': {'cpu': 75.0, 'max_memory_mb': 1536.0,
+                       'read_bytes': 1258291, 'write_bytes': 41943040},
+        }
+        assert self.cls.rusage_str == 'CPU 61.2s user, 8.4s sys; max RSS ' \
+            '512.0 MB; 120 blocks in, 3400 out; 2100/340 vol/invol context ' \
+            'switches; cgroup: CPU 75.0s, peak memory 1536.0 MB, read ' \
+            '1.2 MB, wrote 40.0 MB'
+
+    def test_rusage_str_cgroup_only(self):
+        self.cls.local_build_rusage = {'cgroup': {'cpu': 2.0}}
+        assert self.cls.rusage_str == 'cgroup: CPU 2.0s'
+
+    def test_make_local_build_html_rusage(self):
+        self.cls.run_local = True
+        self.cls.local_build_s3_link = 's3link'
+        self.cls.local_build_return_code = 0
+        self.cls.local_build_duration = timedelta(hours=1)
+        self.cls.local_build_rusage = {'cgroup': {'cpu': 2.0}}
+        res = self.cls.make_local_build_html()
+        assert res == '<span class="icon passed">&nbsp;</span>' \
+            '<a href="s3link">Local Build</a> ran in 1:00:00' \
+            '<br /><small>cgroup: CPU 2.0s</small>'
+
+    def test_as_dict(self):
+        self.cls.run_travis = True
+        self.cls.local_build_return_code = 0
+        self.cls.local_build_duration = timedelta(seconds=90)
+        self.cls.local_build_s3_link = 's3link'
+        self.cls.local_build_rusage = {'cgroup': {'cpu': 2.0}}
+        self.cls.travis_build_id = 123
+        self.cls.travis_build_number = '45'
+        self.cls.travis_build_state = 'passed'
+        self.cls.travis_build_duration = 60
+        self.cls.travis_build_url = 'turl'
+        self.cls.regressions = {'local': (50.0, 60.0)}
+        assert self.cls.as_dict() == {
+            'slug': 'me/myrepo',
+            'local': {
+                'return_code': 0,
+                'duration': 90.0,
+                'timed_out': False,
+                'skipped': None,
+                'exception': None,
+                'output_url': 's3link',
+                'resource_usage': {'cgroup': {'cpu': 2.0}},
+                'cache_stats': None,
+                'regression': {'percent': 50.0, 'median_duration': 60.0},
+            },
+            'travis': {
+                'build_id': 123,
+                'number': '45',
+                'state': 'passed',
+                'duration': 60,
+                'url': 'turl',
+                'skipped': None,
+                'attached': False,
+                'trigger_error': None,
+                'regression': None,
+            }
+        }
+
+    def test_as_dict_exception(self):
+        self.cls.local_build_exception = RuntimeError('foo')
+        assert self.cls.as_dict() == {
+            'slug': 'me/myrepo',
+            'local': {
+                'return_code': None,
+                'duration': None,
+                'timed_out': False,
+                'skipped': None,
+                'exception': 'foo',
+                'output_url': None,
+                'resource_usage': None,
+                'cache_stats': None,
+                'regression': None,
+            },
+            'travis': None,
+        }
+
+    def test_make_local_build_html_regression(self):
+        self.cls.run_local = True
+        self.cls.local_build_s3_link = 's3link'
+        self.cls.local_build_return_code = 0
+        self.cls.local_build_duration = timedelta(hours=1)
+        self.cls.regressions = {'local': (50.0, 2400.0)}
+        res = self.cls.make_local_build_html()
+        assert res == '<span class="icon passed">&nbsp;</span>' \
+            '<a href="s3link">Local Build</a> ran in 1:00:00' \
+            '<br /><strong>50% slower than usual (median 0:40:00)</strong>'
+
+    def test_regression_html_none(self):
+        assert self.cls.regression_html('local') == ''
+
+    def test_make_local_build_html_skipped(self):
+        self.cls.set_local_build_skipped('no time')
+        res = self.cls.make_local_build_html()
+        assert res == '<span class="icon skipped">&nbsp;</span>Skipped: ' \
+            'no time'
+
+    def test_report_styles_icons(self):
+        path = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'templates', 'report.html')
+        with open(path, 'r') as fh:
+            styled = re.findall(r'\.([a-z]+)[ ,{]', fh.read())
+        for icon in ['passed', 'failed', 'errored', 'timedout', 'skipped']:
+            assert icon in styled
+
     def test_make_local_build_html_run_local_false(self):
         self.cls.run_local = False
         assert self.cls.make_local_build_html() == '&nbsp;'
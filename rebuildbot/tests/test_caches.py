@@ -0,0 +1,203 @@
+"""
+rebuildbot/tests/test_caches.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import pytest
+
+from rebuildbot.caches import CacheManager, CACHES
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.caches'
+
+
+def write_file(path, size, atime):
+    """write a ``size``-byte file at py.path ``path`` with the given atime"""
+    path.write('x' * size, ensure=True)
+    os.utime(str(path), (atime, atime))
+
+
+class TestCacheManager(object):
+
+    def test_init(self):
+        cls = CacheManager('/foo', ['pip', 'npm', 'pip'],
+                           limits_mb={'npm': 10})
+        assert cls.root == '/foo'
+        assert cls.names == ['npm', 'pip']
+        assert cls.limits_mb == {
+            'npm': 10,
+            'pip': CACHES['pip']['limit_mb'],
+        }
+
+    def test_init_bad_name(self):
+        with pytest.raises(ValueError):
+            CacheManager('/foo', ['foo'])
+
+    def test_init_bad_limit_name(self):
+        with pytest.raises(ValueError):
+            CacheManager('/foo', ['pip'], limits_mb={'foo': 10})
+
+    def test_env(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['pip', 'vagrant'])
+        res = cls.env()
+        assert res == {
+            'PIP_CACHE_DIR': str(tmpdir.join('pip')),
+            'VAGRANT_HOME': str(tmpdir.join('vagrant')),
+        }
+        assert tmpdir.join('pip').isdir()
+        assert tmpdir.join('vagrant').isdir()
+
+    def test_env_names(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['pip', 'vagrant'])
+        assert cls.selected() == ['pip', 'vagrant']
+        assert cls.selected(['vagrant', 'npm']) == ['vagrant']
+        res = cls.env(['vagrant'])
+        assert res == {'VAGRANT_HOME': str(tmpdir.join('vagrant'))}
+        assert not tmpdir.join('pip').exists()
+        assert cls.stats(cls.snapshot(['vagrant']), ['vagrant']) == {
+            'vagrant': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 0,
+                        'written_bytes': 0},
+        }
+
+    def test_snapshot_stats(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['npm', 'pip'])
+        cls.env()
+        for name, size in [('a', 10), ('b', 4), ('d', 8), ('e', 6)]:
+            tmpdir.join('pip', 'http', name).write('x' * size, ensure=True)
+            os.utime(str(tmpdir.join('pip', 'http', name)), (100, 100))
+        before = cls.snapshot()
+        assert before['npm'] == {}
+        assert before['pip'][os.path.join('http', 'a')] == (10, 100)
+        assert len(before['pip']) == 4
+        # updated in place
+        tmpdir.join('pip', 'http', 'b').write('x' * 20)
+        # deleted and fetched again, with the same size
+        tmpdir.join('pip', 'http', 'd').remove()
+        tmpdir.join('pip', 'http', 'd').write('x' * 8)
+        # removed
+        tmpdir.join('pip', 'http', 'e').remove()
+        # added
+        tmpdir.join('pip', 'c').write('x' * 5)
+        assert cls.stats(before) == {
+            'npm': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 0,
+                    'written_bytes': 0},
+            'pip': {'cached': 4, 'updated': 2, 'removed': 1, 'added': 1,
+                    'written_bytes': 33},
+        }
+
+    def test_build_alone(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['npm', 'pip'])
+        cls.env()
+        tmpdir.join('pip', 'a').write('x' * 10)
+        token = cls.begin_build(['pip'])
+        tmpdir.join('pip', 'b').write('x' * 5)
+        assert cls.end_build(token) == {
+            'pip': {'cached': 1, 'updated': 0, 'removed': 0, 'added': 1,
+                    'written_bytes': 5},
+        }
+        assert cls.users == {'npm': set(), 'pip': set()}
+        assert cls.shared == {}
+
+    def test_build_concurrent(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['npm', 'pip'])
+        cls.env()
+        first = cls.begin_build()
+        with patch('%s.CacheManager.snapshot' % pbm,
+                   wraps=cls.snapshot) as mock_snapshot:
+            second = cls.begin_build(['pip'])
+        # the shared cache is not walked for the second build
+        assert mock_snapshot.mock_calls == [call([])]
+        tmpdir.join('pip', 'b').write('x' * 5)
+        tmpdir.join('npm', 'c').write('x' * 3)
+        assert cls.end_build(second) == {'pip': None}
+        # npm was only used by the first build, so its stats are kept
+        assert cls.end_build(first) == {
+            'npm': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 1,
+                    'written_bytes': 3},
+            'pip': None,
+        }
+        third = cls.begin_build(['pip'])
+        assert cls.end_build(third)['pip']['cached'] == 1
+
+    def test_evict_files(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['pip'], limits_mb={'pip': 1})
+        mb = 1024 * 1024
+        write_file(tmpdir.join('pip', 'a'), mb, 300)
+        write_file(tmpdir.join('pip', 'sub', 'b'), mb, 100)
+        write_file(tmpdir.join('pip', 'c'), mb // 2, 200)
+        cls.evict()
+        assert tmpdir.join('pip', 'sub', 'b').exists() is False
+        assert tmpdir.join('pip', 'c').exists() is False
+        assert tmpdir.join('pip', 'a').exists() is True
+
+    def test_evict_under_limit(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['pip'], limits_mb={'pip': 1})
+        write_file(tmpdir.join('pip', 'a'), 1024, 300)
+        with patch('%s.os.unlink' % pbm) as mock_unlink:
+            cls.evict()
+        assert mock_unlink.mock_calls == []
+
+    def test_evict_units(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['vagrant'],
+                           limits_mb={'vagrant': 1})
+        mb = 1024 * 1024
+        boxes = tmpdir.join('vagrant', 'boxes')
+        write_file(boxes.join('old', 'box.img'), mb, 100)
+        write_file(boxes.join('new', 'box.img'), mb, 300)
+        os.utime(str(boxes.join('old')), (100, 100))
+        os.utime(str(boxes.join('new')), (300, 300))
+        write_file(tmpdir.join('vagrant', 'data', 'foo'), 10, 50)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            cls.evict()
+        assert mock_rmtree.mock_calls == [call(str(boxes.join('old')))]
+
+    def test_evict_missing_dir(self, tmpdir):
+        cls = CacheManager(str(tmpdir), ['pip', 'vagrant'])
+        cls.evict()
+        tmpdir.mkdir('vagrant')
+        assert cls._entries('vagrant') == []
@@ -0,0 +1,424 @@
+"""
+rebuildbot/tests/test_circuitbreaker.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+
+from requests.exceptions import ConnectionError
+from travispy.errors import TravisError
+
+from rebuildbot.circuitbreaker import (CircuitBreaker, error_status,
+                                       is_service_failure, STATE_CLOSED,
+                                       STATE_OPEN, STATE_HALF_OPEN)
+from rebuildbot.exceptions import CircuitOpenError
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock
+else:
+    from unittest.mock import patch, call, Mock
+
+pbm = 'rebuildbot.circuitbreaker'
+
+
+class StatusError(Exception):
+
+    def __init__(self, status):
+        super(StatusError, self).__init__('status %s' % status)
+        self.status = status
+
+
+class TestHelpers(object):
+
+    def test_error_status_response(self):
+        ex = Exception('foo')
+        ex.response = Mock(status_code=503)
+        assert error_status(ex) == 503
+
+    def test_error_status_attr(self):
+        assert error_status(StatusError(502)) == 502
+
+    def test_error_status_travis(self):
+        ex = TravisError({'error_message': 'Bad gateway',
+                          'status_code': 502})
+        assert error_status(ex) == 502
+
+    def test_error_status_none(self):
+        assert error_status(Exception('foo')) is None
+        assert error_status(StatusError('x')) is None
+
+    def test_is_service_failure(self):
+        assert is_service_failure(StatusError(500)) is True
+        assert is_service_failure(StatusError(503)) is True
+        assert is_service_failure(StatusError(429)) is True
+        assert is_service_failure(StatusError(404)) is False
+        assert is_service_failure(StatusError(403)) is False
+        assert is_service_failure(ConnectionError('foo')) is True
+        assert is_service_failure(IOError('foo')) is True
+        assert is_service_failure(RuntimeError('foo')) is False
+
+
+class TestCircuitBreaker(object):
+
+    def setup(self):
+        self.cls = CircuitBreaker('travis', threshold=2, backoff=10,
+                                  max_backoff=35)
+
+    def test_init(self):
+        cls = CircuitBreaker('github')
+        assert cls.service == 'github'
+        assert cls.threshold == 3
+        assert cls.backoff == 30
+        assert cls.max_backoff == 1800
+        assert cls.state == STATE_CLOSED
+        assert cls.failures == 0
+        assert cls.retry_at is None
+        assert cls.outages == []
+        assert cls.is_closed is True
+        assert cls.outage_duration == 0
+
+    def test_init_threshold(self):
+        assert CircuitBreaker('github', threshold=0).threshold == 1
+
+    def test_failure_below_threshold(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.return_value = 100
+                self.cls.record_failure(StatusError(500))
+                assert self.cls.allow() is True
+        assert self.cls.state == STATE_CLOSED
+        assert self.cls.failures == 1
+        assert self.cls.outages == []
+        assert mock_logger.mock_calls == []
+
+    def test_open(self):
+        ex = StatusError(500)
+        with patch('%s.logger' % pbm) as mock_logger:
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.return_value = 100
+                self.cls.record_failure(ex)
+                self.cls.record_failure(ex)
+                mock_time.return_value = 109
+                assert self.cls.allow() is False
+                assert self.cls.outage_duration == 9
+        assert self.cls.state == STATE_OPEN
+        assert self.cls.is_closed is False
+        assert self.cls.retry_at == 110
+        assert self.cls.outages == [
+            {'start': 100, 'end': None, 'failures': 2, 'error': 'status 500'}
+        ]
+        assert mock_logger.mock_calls == [
+            call.warning("%s unavailable after %d consecutive failures "
+                         "(%s); suspending calls for %d seconds", 'travis',
+                         2, ex, 10)
+        ]
+
+    def test_half_open(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.return_value = 100
+                self.cls.record_failure(StatusError(500))
+                self.cls.record_failure(StatusError(500))
+                mock_time.return_value = 110
+                assert self.cls.allow() is True
+                # only one trial call is let through
+                assert self.cls.allow() is False
+        assert self.cls.state == STATE_HALF_OPEN
+        assert mock_logger.mock_calls[-1] == call.info(
+            "Trying %s again after outage", 'travis')
+
+    def test_half_open_failure(self):
+        with patch('%s.logger' % pbm):
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.return_value = 100
+                self.cls.record_failure(StatusError(500))
+                self.cls.record_failure(StatusError(500))
+                mock_time.return_value = 110
+                assert self.cls.allow() is True
+                self.cls.record_failure(StatusError(503))
+                assert self.cls.state == STATE_OPEN
+                assert self.cls.open_for == 20
+                assert self.cls.retry_at == 130
+                mock_time.return_value = 130
+                assert self.cls.allow() is True
+                self.cls.record_failure(StatusError(503))
+                assert self.cls.open_for == 35
+                assert self.cls.retry_at == 165
+        assert self.cls.outages == [
+            {'start': 100, 'end': None, 'failures': 4, 'error': 'status 503'}
+        ]
+
+    def test_success_closes(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.return_value = 100
+                self.cls.record_failure(StatusError(500))
+                self.cls.record_failure(StatusError(500))
+                mock_time.return_value = 110
+                assert self.cls.allow() is True
+                self.cls.record_failure(StatusError(500))
+                mock_time.return_value = 130
+                assert self.cls.allow() is True
+                self.cls.record_success()
+                assert self.cls.outage_duration == 0
+        assert self.cls.state == STATE_CLOSED
+        assert self.cls.failures == 0
+        assert self.cls.open_for == 10
+        assert self.cls.retry_at is None
+        assert self.cls.outages == [
+            {'start': 100, 'end': 130, 'failures': 3, 'error': 'status 500'}
+        ]
+        assert mock_logger.mock_calls[-1] == call.warning(
+            "%s is available again after %d seconds", 'travis', 30)
+
+    def test_success_resets_failures(self):
+        self.cls.record_failure(StatusError(500))
+        self.cls.record_success()
+        self.cls.record_failure(StatusError(500))
+        assert self.cls.state == STATE_CLOSED
+        assert self.cls.failures == 1
+
+    def test_call(self):
+        func = Mock(return_value='res')
+        assert self.cls.call(func, 'a', b=2) == 'res'
+        assert func.mock_calls == [call('a', b=2)]
+        assert self.cls.failures == 0
+
+    def test_call_service_failure(self):
+        func = Mock(side_effect=StatusError(502))
+        for i in range(2):
+            try:
+                with patch('%s.logger' % pbm):
+                    self.cls.call(func)
+            except StatusError:
+                pass
+            else:
+                raise AssertionError("StatusError not raised")
+        assert self.cls.state == STATE_OPEN
+        try:
+            self.cls.call(func)
+        except CircuitOpenError as ex:
+            assert ex.service == 'travis'
+            assert ex.retry_at == self.cls.retry_at
+        else:
+            raise AssertionError("CircuitOpenError not raised")
+        assert len(func.mock_calls) == 2
+
+    def test_call_other_error(self):
+        self.cls.record_failure(StatusError(500))
+        func = Mock(side_effect=StatusError(404))
+        try:
+            self.cls.call(func)
+        except StatusError:
+            pass
+        else:
+            raise AssertionError("StatusError not raised")
+        # the service answered, so it is available
+        assert self.cls.failures == 0
+        assert self.cls.state == STATE_CLOSED
+
+    def fake_clock(self, mock_time, now=100):
+        """make mock_time's sleep() advance its time()"""
+        clock = [now]
+        mock_time.time.side_effect = lambda: clock[0]
+
+        def se_sleep(secs):
+            clock[0] += secs
+
+        mock_time.sleep.side_effect = se_sleep
+
+    def test_wait(self):
+        with patch('%s.time' % pbm) as mock_time:
+            self.fake_clock(mock_time)
+            self.cls.wait()
+            assert mock_time.sleep.mock_calls == []
+            with patch('%s.logger' % pbm):
+                for _ in range(2):
+                    self.cls.record_failure(StatusError(503))
+            mock_time.time.side_effect = None
+            mock_time.time.return_value = 104
+            self.cls.wait()
+            assert mock_time.sleep.mock_calls == [call(6)]
+            self.cls.state = STATE_HALF_OPEN
+            self.cls.wait()
+            assert mock_time.sleep.mock_calls == [call(6), call(1)]
+
+    def test_retryable(self):
+        assert self.cls.retryable(StatusError(503), 60) is True
+        assert self.cls.retryable(StatusError(404), 60) is False
+        assert self.cls.retryable(CircuitOpenError('travis', 1), 60) is True
+        self.cls.state = STATE_OPEN
+        self.cls.outages = [{'start': 100}]
+        with patch('%s.time.time' % pbm) as mock_time:
+            mock_time.return_value = 160
+            assert self.cls.retryable(StatusError(503), 60) is True
+            mock_time.return_value = 161
+            assert self.cls.retryable(StatusError(503), 60) is False
+
+    def test_call_retrying(self):
+        func = Mock(side_effect=[StatusError(503), StatusError(503),
+                                 StatusError(503), 'res'])
+        with patch('%s.time' % pbm) as mock_time, \
+                patch('%s.logger' % pbm):
+            self.fake_clock(mock_time)
+            assert self.cls.call_retrying(60, func, 'a', b=1) == 'res'
+        assert func.mock_calls == [call('a', b=1)] * 4
+        # the third failure was the trial call after 10 seconds' backoff
+        assert mock_time.sleep.mock_calls == [call(10), call(20)]
+        assert self.cls.state == STATE_CLOSED
+
+    def test_call_retrying_other_error(self):
+        func = Mock(side_effect=StatusError(404))
+        try:
+            self.cls.call_retrying(60, func)
+        except StatusError:
+            pass
+        else:
+            raise AssertionError("StatusError not raised")
+        assert len(func.mock_calls) == 1
+
+    def test_call_retrying_gives_up(self):
+        func = Mock(side_effect=StatusError(503))
+        with patch('%s.time' % pbm) as mock_time, \
+                patch('%s.logger' % pbm):
+            self.fake_clock(mock_time)
+            try:
+                self.cls.call_retrying(25, func)
+            except StatusError:
+                pass
+            else:
+                raise AssertionError("StatusError not raised")
+        assert mock_time.sleep.mock_calls == [call(10), call(20)]
+        assert len(func.mock_calls) == 4
+
+    def test_iterate(self):
+        assert list(self.cls.iterate(lambda: iter([1, 2]))) == [1, 2]
+        assert self.cls.failures == 0
+
+    def test_iterate_resume(self):
+        started = []
+
+        def gen():
+            started.append(1)
+            yield 1
+            if len(started) < 4:
+                raise StatusError(502)
+            yield 2
+            yield 3
+
+        with patch('%s.time' % pbm) as mock_time, \
+                patch('%s.logger' % pbm):
+            self.fake_clock(mock_time)
+            assert list(self.cls.iterate(gen, max_outage=60)) == [1, 2, 3]
+        # restarted after each failure; listing the first item again does
+        # not reset the failures, so the second opened the circuit and the
+        # third was the trial call
+        assert len(started) == 4
+        assert mock_time.sleep.mock_calls == [call(10), call(20)]
+        assert self.cls.state == STATE_CLOSED
+
+    def test_iterate_stuck(self):
+        def gen():
+            yield 1
+            raise StatusError(502)
+
+        res = []
+        with patch('%s.time' % pbm) as mock_time, \
+                patch('%s.logger' % pbm):
+            self.fake_clock(mock_time)
+            try:
+                for i in self.cls.iterate(gen, max_outage=25):
+                    res.append(i)
+            except StatusError:
+                pass
+            else:
+                raise AssertionError("StatusError not raised")
+        assert res == [1]
+        assert mock_time.sleep.mock_calls == [call(10), call(20)]
+
+    def test_iterate_gives_up(self):
+        started = []
+
+        def gen():
+            started.append(1)
+            raise StatusError(502)
+            yield 1
+
+        with patch('%s.time' % pbm) as mock_time, \
+                patch('%s.logger' % pbm):
+            self.fake_clock(mock_time)
+            try:
+                list(self.cls.iterate(gen, max_outage=25))
+            except StatusError:
+                pass
+            else:
+                raise AssertionError("StatusError not raised")
+        assert len(started) == 4
+        assert self.cls.state == STATE_OPEN
+
+    def test_iterate_other_error(self):
+        def gen():
+            yield 1
+            raise StatusError(404)
+
+        res = []
+        try:
+            for i in self.cls.iterate(gen):
+                res.append(i)
+        except StatusError:
+            pass
+        else:
+            raise AssertionError("StatusError not raised")
+        assert res == [1]
+
+    def test_summary(self):
+        self.cls.outages = [
+            {'start': 100, 'end': 130, 'failures': 3, 'error': 'foo'},
+            {'start': 200, 'end': None, 'failures': 2, 'error': 'bar'},
+        ]
+        assert self.cls.summary() == [
+            {'service': 'travis', 'start': 100, 'end': 130, 'failures': 3,
+             'error': 'foo'},
+            {'service': 'travis', 'start': 200, 'end': None, 'failures': 2,
+             'error': 'bar'},
+        ]
+        assert 'service' not in self.cls.outages[0]
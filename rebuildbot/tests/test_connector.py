@@ -0,0 +1,98 @@
+"""
+rebuildbot/tests/test_connector.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import threading
+
+import pytest
+
+from rebuildbot.connector import Connector
+
+
+class TestConnector(object):
+
+    def test_get(self):
+        calls = []
+
+        def func():
+            calls.append(threading.current_thread().name)
+            return 'conn'
+
+        cls = Connector('svc', func)
+        assert cls.connected is False
+        assert cls.get() == 'conn'
+        assert cls.get() == 'conn'
+        assert calls == ['connect-svc']
+        assert cls.connected is True
+
+    def test_start_once(self):
+        calls = []
+        event = threading.Event()
+
+        def func():
+            event.wait(5)
+            calls.append(1)
+            return 'conn'
+
+        cls = Connector('svc', func)
+        cls.start()
+        thread = cls.thread
+        cls.start()
+        assert cls.thread is thread
+        event.set()
+        assert cls.get() == 'conn'
+        assert calls == [1]
+
+    def test_get_exception(self):
+        def func():
+            raise RuntimeError('foo')
+
+        cls = Connector('svc', func)
+        with pytest.raises(RuntimeError) as excinfo:
+            cls.get()
+        assert str(excinfo.value) == 'foo'
+        assert cls.connected is False
+        with pytest.raises(RuntimeError):
+            cls.get()
+
+    def test_for_value(self):
+        cls = Connector.for_value('svc', 'conn')
+        assert cls.connected is True
+        cls.start()
+        assert cls.thread is None
+        assert cls.get() == 'conn'
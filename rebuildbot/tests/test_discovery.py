@@ -0,0 +1,144 @@
+"""
+rebuildbot/tests/test_discovery.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import threading
+
+from rebuildbot.discovery import Discoverer
+from rebuildbot.buildinfo import BuildInfo
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, ANY
+else:
+    from unittest.mock import patch, call, ANY
+
+pbm = 'rebuildbot.discovery'
+
+
+class TestDiscoverer(object):
+
+    def setup(self):
+        self.b1 = BuildInfo('me/a')
+        self.b2 = BuildInfo('me/b')
+        self.b3 = BuildInfo('me/c')
+
+    def test_init(self):
+        cls = Discoverer([])
+        assert cls.sources == []
+        assert cls.threads == []
+        assert cls.running == 0
+        assert cls.finished == set()
+        assert cls.errors == {}
+        assert cls.done is True
+        assert cls.get() == []
+
+    def test_get(self):
+        cls = Discoverer([
+            ('one', lambda: iter([self.b1, self.b2])),
+            ('two', lambda: iter([self.b3])),
+        ])
+        cls.start()
+        assert cls.running == 2
+        assert cls.done is False
+        for t in cls.threads:
+            t.join()
+        res = cls.get()
+        assert sorted(b.slug for b in res) == ['me/a', 'me/b', 'me/c']
+        assert cls.done is True
+        assert cls.finished == set(['one', 'two'])
+        assert cls.get() == []
+
+    def test_get_incremental(self):
+        release = threading.Event()
+
+        def source():
+            yield self.b1
+            release.wait(5)
+            yield self.b2
+
+        cls = Discoverer([('one', source)])
+        cls.start()
+        # the first project is available before the source has finished
+        assert cls.get(timeout=5) == [self.b1]
+        assert cls.done is False
+        assert cls.finished == set()
+        release.set()
+        cls.threads[0].join()
+        assert cls.get() == [self.b2]
+        assert cls.done is True
+
+    def test_get_timeout(self):
+        release = threading.Event()
+
+        def source():
+            release.wait(5)
+            yield self.b1
+
+        cls = Discoverer([('one', source)])
+        cls.start()
+        assert cls.get(timeout=0.01) == []
+        release.set()
+        cls.threads[0].join()
+        assert cls.get() == [self.b1]
+
+    def test_source_error(self):
+        ex = RuntimeError('foo')
+
+        def source():
+            yield self.b1
+            raise ex
+
+        cls = Discoverer([('bad', source)])
+        with patch('%s.logger' % pbm) as mock_logger:
+            cls.start()
+            cls.threads[0].join()
+        assert cls.get() == [self.b1]
+        assert cls.done is True
+        assert cls.errors == {'bad': ex}
+        assert mock_logger.mock_calls == [
+            call.debug("Discovered %s from %s", 'me/a', 'bad'),
+            call.exception("Error discovering projects from %s", 'bad'),
+            call.info("Discovery from %s finished; found %d projects in "
+                      "%.1fs", 'bad', 1, ANY)
+        ]
@@ -38,7 +38,8 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 from rebuildbot.exceptions import (GitTokenMissingError, TravisTriggerError,
-                                   PollTimeoutException)
+                                   PollTimeoutException,
+                                   LocalBuildTimeoutError, CircuitOpenError)
 
 
 class TestGitTokenMissingError(object):
@@ -78,3 +79,31 @@ class TestPollTimeoutException(object):
         assert ex.num_times == 2
         assert ex.message == "Polling Travis for update to mytype on myrepo " \
             "timed out after 6 seconds"
+
+
+class TestLocalBuildTimeoutError(object):
+
+    def test_hard(self):
+        ex = LocalBuildTimeoutError('myrepo', 'hard', 3600, 'myout')
+        assert ex.repo == 'myrepo'
+        assert ex.kind == 'hard'
+        assert ex.timeout == 3600
+        assert ex.output == 'myout'
+        assert ex.message == "Local build of myrepo killed after running " \
+            "for more than 3600 seconds"
+
+    def test_inactivity(self):
+        ex = LocalBuildTimeoutError('myrepo', 'inactivity', 60, 'myout')
+        assert ex.kind == 'inactivity'
+        assert ex.message == "Local build of myrepo killed after producing " \
+            "no output for 60 seconds"
+
+
+class TestCircuitOpenError(object):
+
+    def test_exception(self):
+        ex = CircuitOpenError('travis', 1234)
+        assert ex.service == 'travis'
+        assert ex.retry_at == 1234
+        assert ex.message == "travis is unavailable; not calling it until " \
+            "it recovers"
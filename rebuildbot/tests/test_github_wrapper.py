@@ -51,6 +51,9 @@ from github.GithubException import UnknownObjectException
 from github.GithubException import GithubException
 
 from rebuildbot.github_wrapper import GitHubWrapper
+from rebuildbot.httpsession import (HTTPConfig, DEFAULT_RETRIES,
+                                    DEFAULT_TIMEOUTS)
+from rebuildbot.ratelimit import RateLimiter
 
 from freezegun import freeze_time
 
@@ -71,11 +74,72 @@ pb = 'rebuildbot.github_wrapper.GitHubWrapper'  # patch base for class
 class TestGitHubWrapperInit(object):
 
     def test_init(self):
+        mock_http = Mock(spec_set=HTTPConfig)
+        mock_http.timeout.return_value = 12
         with patch('%s.Github' % pbm) as mock_github:
-            cls = GitHubWrapper('mytoken')
-        assert mock_github.mock_calls == [call('mytoken')]
+            cls = GitHubWrapper('mytoken', http=mock_http)
+        assert mock_github.mock_calls == [
+            call('mytoken', timeout=12, retry=mock_http.retry.return_value)
+        ]
+        assert mock_http.mock_calls == [
+            call.timeout('github'),
+            call.retry()
+        ]
         assert cls.github == mock_github.return_value
 
+    def test_init_default_http(self):
+        with patch('%s.Github' % pbm) as mock_github:
+            GitHubWrapper('mytoken')
+        assert len(mock_github.mock_calls) == 1
+        kwargs = mock_github.mock_calls[0][2]
+        assert kwargs['timeout'] == DEFAULT_TIMEOUTS['github']
+        assert kwargs['retry'].total == DEFAULT_RETRIES
+
+    def test_use_adapter(self):
+        gov = RateLimiter()
+        cls = GitHubWrapper('mytoken', http=HTTPConfig(governor=gov))
+        requester = cls.github._Github__requester
+        cnx = requester._Requester__connectionClass(
+            'api.github.com', None, retry=3, timeout=30, verify=True)
+        adapter = cnx.session.get_adapter('https://api.github.com/foo')
+        assert adapter.service == 'github'
+        assert adapter.governor == gov
+        assert adapter.timeout == 30
+
+    def test_init_base_url(self):
+        mock_http = Mock(spec_set=HTTPConfig)
+        mock_http.timeout.return_value = 12
+        with patch('%s.Github' % pbm) as mock_github:
+            GitHubWrapper('mytoken', http=mock_http,
+                          base_url='http://127.0.0.1:8000')
+        assert mock_github.mock_calls[0] == call(
+            'mytoken', timeout=12, retry=mock_http.retry.return_value,
+            base_url='http://127.0.0.1:8000'
+        )
+
+    def test_use_adapter_http(self):
+        gov = RateLimiter()
+        cls = GitHubWrapper('mytoken', http=HTTPConfig(governor=gov),
+                            base_url='http://127.0.0.1:8000')
+        requester = cls.github._Github__requester
+        cnx = requester._Requester__connectionClass(
+            '127.0.0.1', 8000, retry=3, timeout=30, verify=True)
+        assert cnx.protocol == 'http'
+        adapter = cnx.session.get_adapter('http://127.0.0.1:8000/foo')
+        assert adapter.service == 'github'
+        assert adapter.governor == gov
+
+    def test_use_adapter_unsupported(self):
+        with patch('%s.Github' % pbm) as mock_github, \
+                patch('%s.logger' % pbm) as mock_logger:
+            del mock_github.return_value._Github__requester
+            GitHubWrapper('mytoken')
+        assert mock_logger.mock_calls == [
+            call.debug("Connecting to GitHub API"),
+            call.debug("Unable to configure PyGithub connections"),
+            call.debug("Connected to GitHub API")
+        ]
+
 
 class TestGitHubWrapper(object):
 
@@ -93,29 +157,33 @@ class TestGitHubWrapper(object):
 
         mock_repo1 = Mock(spec_set=Repository)
         type(mock_repo1).full_name = 'myuser/foo'
-        mock_repo1.get_file_contents.return_value = True
+        mock_repo1.get_contents.return_value = True
         type(mock_repo1).clone_url = 'cloneurl'
         type(mock_repo1).ssh_url = 'sshurl'
+        type(mock_repo1).size = 123
 
         mock_repo2 = Mock(spec_set=Repository)
         type(mock_repo2).full_name = 'myuser/bar'
 
         mock_repo3 = Mock(spec_set=Repository)
         type(mock_repo3).full_name = 'myuser/baz'
-        mock_repo3.get_file_contents.side_effect = se_404
+        mock_repo3.get_contents.side_effect = se_404
 
-        with patch('%s.get_repos' % pb) as mock_get_repos, \
+        with patch('%s.iter_repos' % pb) as mock_get_repos, \
                 patch('%s.repo_commit_in_last_day' % pb) as mock_last_day, \
+                patch('%s.get_manifest' % pb) as mock_manifest, \
                 patch('%s.logger' % pbm) as mock_logger:
             mock_get_repos.return_value = [
                 mock_repo1, mock_repo2, mock_repo3
             ]
+            mock_manifest.return_value = {'timeout': 60}
             mock_last_day.side_effect = [False, True, False]
             res = self.cls.find_projects()
 
         assert res == {
-            'myuser/foo': ('cloneurl', 'sshurl')
+            'myuser/foo': ('cloneurl', 'sshurl', 123, {'timeout': 60})
         }
+        assert mock_manifest.mock_calls == [call(mock_repo1)]
         assert mock_logger.mock_calls == [
             call.debug("Skipping repository '%s' - commit on master in "
                        "last day", 'myuser/bar'),
@@ -131,56 +199,88 @@ class TestGitHubWrapper(object):
 
         mock_repo1 = Mock(spec_set=Repository)
         type(mock_repo1).full_name = 'myuser/foo'
-        mock_repo1.get_file_contents.return_value = True
+        mock_repo1.get_contents.return_value = True
         type(mock_repo1).clone_url = 'cloneurl'
         type(mock_repo1).ssh_url = 'sshurl'
+        type(mock_repo1).size = 123
 
         mock_repo2 = Mock(spec_set=Repository)
         type(mock_repo2).full_name = 'myuser/bar'
-        mock_repo2.get_file_contents.return_value = True
+        mock_repo2.get_contents.return_value = True
         type(mock_repo2).clone_url = 'cloneurl2'
         type(mock_repo2).ssh_url = 'sshurl2'
+        type(mock_repo2).size = 456
 
         mock_repo3 = Mock(spec_set=Repository)
         type(mock_repo3).full_name = 'myuser/baz'
-        mock_repo3.get_file_contents.side_effect = se_404
+        mock_repo3.get_contents.side_effect = se_404
 
-        with patch('%s.get_repos' % pb) as mock_get_repos, \
+        with patch('%s.iter_repos' % pb) as mock_get_repos, \
                 patch('%s.repo_commit_in_last_day' % pb) as mock_last_day, \
+                patch('%s.get_manifest' % pb) as mock_manifest, \
                 patch('%s.logger' % pbm) as mock_logger:
             mock_get_repos.return_value = [
                 mock_repo1, mock_repo2, mock_repo3
             ]
+            mock_manifest.return_value = {'timeout': 60}
             mock_last_day.side_effect = [False, True, False]
             res = self.cls.find_projects(date_check=False)
 
         assert res == {
-            'myuser/foo': ('cloneurl', 'sshurl'),
-            'myuser/bar': ('cloneurl2', 'sshurl2'),
+            'myuser/foo': ('cloneurl', 'sshurl', 123, {'timeout': 60}),
+            'myuser/bar': ('cloneurl2', 'sshurl2', 456, {'timeout': 60}),
         }
+        assert mock_manifest.mock_calls == [call(mock_repo1), call(mock_repo2)]
         assert mock_logger.mock_calls == [
             call.debug("Skipping repository '%s' - .rebuildbot.sh not "
                        "present", 'myuser/baz'),
             call.debug("Found %d repos: %s", 2, ['myuser/bar', 'myuser/foo'])
         ]
 
+    def test_iter_projects(self):
+        mock_repo1 = Mock(spec_set=Repository)
+        type(mock_repo1).full_name = 'myuser/foo'
+        type(mock_repo1).clone_url = 'cloneurl'
+        type(mock_repo1).ssh_url = 'sshurl'
+        type(mock_repo1).size = 123
+        mock_repo2 = Mock(spec_set=Repository)
+        type(mock_repo2).full_name = 'myuser/bar'
+
+        with patch('%s.iter_repos' % pb) as mock_iter_repos, \
+                patch('%s.repo_commit_in_last_day' % pb) as mock_last_day, \
+                patch('%s.get_manifest' % pb) as mock_manifest:
+            mock_iter_repos.return_value = iter([mock_repo1, mock_repo2])
+            mock_last_day.return_value = False
+            mock_manifest.return_value = {}
+            gen = self.cls.iter_projects()
+            assert next(gen) == (
+                'myuser/foo', ('cloneurl', 'sshurl', 123, {})
+            )
+            # the second repository is not inspected until it is asked for
+            assert mock_last_day.mock_calls == [call(mock_repo1)]
+            assert mock_repo2.mock_calls == []
+
     def test_get_project_config(self):
         mock_repo1 = Mock(spec_set=Repository)
         type(mock_repo1).full_name = 'myuser/foo'
-        mock_repo1.get_file_contents.return_value = True
+        mock_repo1.get_contents.return_value = True
         type(mock_repo1).clone_url = 'cloneurl'
         type(mock_repo1).ssh_url = 'sshurl'
+        type(mock_repo1).size = 123
 
         self.cls.github.get_repo.return_value = mock_repo1
-        res = self.cls.get_project_config('me/myrepo')
-        assert res == ('cloneurl', 'sshurl')
+        with patch('%s.get_manifest' % pb) as mock_manifest:
+            mock_manifest.return_value = {'timeout': 60}
+            res = self.cls.get_project_config('me/myrepo')
+        assert res == ('cloneurl', 'sshurl', 123, {'timeout': 60})
         assert self.cls.github.mock_calls == [
             call.get_repo('me/myrepo'),
-            call.get_repo().get_file_contents('.rebuildbot.sh', ref='master')
+            call.get_repo().get_contents('.rebuildbot.sh', ref='master')
         ]
         assert mock_repo1.mock_calls == [
-            call.get_file_contents('.rebuildbot.sh', ref='master')
+            call.get_contents('.rebuildbot.sh', ref='master')
         ]
+        assert mock_manifest.mock_calls == [call(mock_repo1, branch='master')]
 
     def test_get_project_config_404(self):
 
@@ -189,17 +289,67 @@ class TestGitHubWrapper(object):
 
         mock_repo1 = Mock(spec_set=Repository)
         type(mock_repo1).full_name = 'myuser/foo'
-        mock_repo1.get_file_contents.side_effect = se_404
+        mock_repo1.get_contents.side_effect = se_404
 
         self.cls.github.get_repo.return_value = mock_repo1
         res = self.cls.get_project_config('me/myrepo')
-        assert res == (None, None)
+        assert res == (None, None, None, None)
         assert self.cls.github.mock_calls == [
             call.get_repo('me/myrepo'),
-            call.get_repo().get_file_contents('.rebuildbot.sh', ref='master')
+            call.get_repo().get_contents('.rebuildbot.sh', ref='master')
+        ]
+        assert mock_repo1.mock_calls == [
+            call.get_contents('.rebuildbot.sh', ref='master')
         ]
+
+    def test_get_manifest(self):
+        mock_repo1 = Mock(spec_set=Repository)
+        type(mock_repo1).full_name = 'me/myrepo'
+        mock_repo1.get_contents.return_value = Mock(
+            decoded_content=b'timeout: 600\ntags: [docker]\n'
+        )
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = self.cls.get_manifest(mock_repo1, branch='foo')
+        assert res == {'timeout': 600, 'tags': ['docker']}
+        assert mock_repo1.mock_calls == [
+            call.get_contents('.rebuildbot.yml', ref='foo')
+        ]
+        assert mock_logger.mock_calls == [
+            call.debug("Repository %s manifest: %s", 'me/myrepo', res)
+        ]
+
+    def test_get_manifest_default_branch(self):
+        mock_repo1 = Mock(spec_set=Repository)
+        type(mock_repo1).full_name = 'me/myrepo'
+        mock_repo1.get_contents.return_value = Mock(
+            decoded_content=b''
+        )
+        assert self.cls.get_manifest(mock_repo1) == {}
         assert mock_repo1.mock_calls == [
-            call.get_file_contents('.rebuildbot.sh', ref='master')
+            call.get_contents('.rebuildbot.yml')
+        ]
+
+    def test_get_manifest_404(self):
+
+        def se_404(fname, ref='master'):
+            raise UnknownObjectException(404, 'some data')
+
+        mock_repo1 = Mock(spec_set=Repository)
+        mock_repo1.get_contents.side_effect = se_404
+        assert self.cls.get_manifest(mock_repo1, branch='master') == {}
+
+    def test_get_manifest_invalid(self):
+        mock_repo1 = Mock(spec_set=Repository)
+        type(mock_repo1).full_name = 'me/myrepo'
+        mock_repo1.get_contents.return_value = Mock(
+            decoded_content=b'timeout: -2\n'
+        )
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = self.cls.get_manifest(mock_repo1)
+        assert res == {}
+        assert mock_logger.mock_calls == [
+            call.warning("%s; ignoring it", "Invalid .rebuildbot.yml in "
+                         "me/myrepo: 'timeout' must be greater than zero")
         ]
 
     def test_get_repos(self):
@@ -0,0 +1,330 @@
+"""
+rebuildbot/tests/test_history.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+
+from rebuildbot.history import (BuildHistory, MAX_RUNS, median,
+                                run_succeeded, detect_regression)
+from rebuildbot.buildinfo import BuildInfo
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.history'
+
+
+def make_build(slug, local_secs=None, rc=0, travis_secs=None,
+               travis_state=None):
+    """return a finished BuildInfo"""
+    bi = BuildInfo(slug, run_local=(local_secs is not None))
+    if local_secs is not None:
+        start = datetime(2015, 1, 1, 1, 0, 0)
+        bi.set_local_build(return_code=rc, output='out', start_dt=start,
+                           end_dt=start + timedelta(seconds=local_secs))
+    if travis_state is not None:
+        bi.travis_build_finished = True
+        bi.travis_build_state = travis_state
+        bi.travis_build_duration = travis_secs
+    return bi
+
+
+class TestBuildHistory(object):
+
+    def test_init_no_file(self, tmpdir):
+        path = str(tmpdir.join('history.json'))
+        cls = BuildHistory(path)
+        assert cls.path == path
+        assert cls.data == {'repos': {}}
+
+    def test_init_bad_file(self, tmpdir):
+        p = tmpdir.join('history.json')
+        p.write('not json{')
+        with patch('%s.logger' % pbm) as mock_logger:
+            cls = BuildHistory(str(p))
+        assert cls.data == {'repos': {}}
+        assert mock_logger.warning.call_count == 1
+
+    def test_save_locked(self, tmpdir):
+        cls = BuildHistory(str(tmpdir.join('history.json')))
+        cls.set_clone_protocol('a/b', 'github.com', 'ssh')
+
+        def se_dumps(*args, **kwargs):
+            # threads recording clone protocols cannot change data meanwhile
+            assert cls.lock.locked() is True
+            return '{}'
+
+        with patch('%s.json.dumps' % pbm) as mock_dumps:
+            mock_dumps.side_effect = se_dumps
+            cls.save()
+        assert mock_dumps.mock_calls == [
+            call(cls.data, sort_keys=True, indent=2)
+        ]
+        assert cls.lock.locked() is False
+
+    def test_save_load(self, tmpdir):
+        path = str(tmpdir.join('foo', 'history.json'))
+        cls = BuildHistory(path)
+        cls.record_build(make_build('a/b', local_secs=90),
+                         datetime(2015, 1, 2, 3, 4, 5))
+        cls.save()
+        with open(path, 'r') as fh:
+            raw = json.load(fh)
+        assert raw == {
+            'repos': {
+                'a/b': {
+                    'runs': [{
+                        'date': '2015-01-02T03:04:05',
+                        'local_duration': 90.0,
+                        'local_return_code': 0,
+                        'travis_duration': None,
+                        'travis_state': None,
+                    }],
+                    'last_success': '2015-01-02T03:04:05'
+                }
+            }
+        }
+        cls2 = BuildHistory(path)
+        assert cls2.data == raw
+        assert cls2.local_durations('a/b') == [90.0]
+
+    def test_record_build_travis(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        cls.record_build(
+            make_build('a/b', travis_secs=120, travis_state='passed'),
+            datetime(2015, 1, 2, 3, 4, 5)
+        )
+        assert cls.runs_for('a/b') == [{
+            'date': '2015-01-02T03:04:05',
+            'local_duration': None,
+            'local_return_code': None,
+            'travis_duration': 120,
+            'travis_state': 'passed',
+        }]
+        assert cls.local_durations('a/b') == []
+
+    def test_record_build_rusage(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        b = make_build('a/b', local_secs=90)
+        b.local_build_rusage = {'user_cpu': 60.0, 'sys_cpu': 5.5,
+                                'max_rss_kb': 2048}
+        cls.record_build(b, datetime(2015, 1, 2, 3, 4, 5))
+        assert cls.runs_for('a/b') == [{
+            'date': '2015-01-02T03:04:05',
+            'local_duration': 90.0,
+            'local_return_code': 0,
+            'local_cpu': 65.5,
+            'local_max_rss_kb': 2048,
+            'travis_duration': None,
+            'travis_state': None,
+        }]
+
+    def test_record_build_nothing(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        cls.record_build(BuildInfo('a/b', run_local=True),
+                         datetime(2015, 1, 2, 3, 4, 5))
+        assert cls.data == {'repos': {}}
+
+    def test_record_build_max_runs(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        for i in range(MAX_RUNS + 5):
+            cls.record_build(make_build('a/b', local_secs=i),
+                             datetime(2015, 1, 2, 3, 4, 5))
+        assert cls.local_durations('a/b') == [
+            float(x) for x in range(5, MAX_RUNS + 5)
+        ]
+
+    def test_record_builds(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        b1 = make_build('a/b', local_secs=10)
+        b2 = make_build('a/c', local_secs=20)
+        dt = datetime(2015, 1, 2, 3, 4, 5)
+        with patch('%s.BuildHistory.record_build' % pbm) as mock_record:
+            cls.record_builds({'a/c': b2, 'a/b': b1}, dt)
+        assert mock_record.mock_calls == [call(b1, dt), call(b2, dt)]
+
+    def test_expected_local_duration(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        for secs in [100, 300, 200]:
+            cls.record_build(make_build('a/b', local_secs=secs),
+                             datetime(2015, 1, 2, 3, 4, 5))
+        assert cls.expected_local_duration('a/b') == 200
+        assert cls.expected_local_duration('a/c') is None
+
+    def test_passed_durations(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        dt = datetime(2015, 1, 2, 3, 4, 5)
+        cls.record_build(make_build('a/b', local_secs=10, travis_secs=20,
+                                    travis_state='passed'), dt)
+        cls.record_build(make_build('a/b', local_secs=5, rc=1, travis_secs=8,
+                                    travis_state='failed'), dt)
+        cls.record_build(make_build('a/b', travis_secs=30,
+                                    travis_state='passed'), dt)
+        assert cls.passed_durations('a/b', 'local') == [10.0]
+        assert cls.passed_durations('a/b', 'travis') == [20, 30]
+        assert cls.passed_durations('a/c', 'local') == []
+
+    def test_find_regressions(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        dt = datetime(2015, 1, 2, 3, 4, 5)
+        # an old slow run outside the window
+        cls.record_build(make_build('a/b', local_secs=1000), dt)
+        for secs in [100, 102, 98, 101, 99]:
+            cls.record_build(make_build('a/b', local_secs=secs,
+                                        travis_secs=secs * 2,
+                                        travis_state='passed'), dt)
+        bi = make_build('a/b', local_secs=150, travis_secs=205,
+                        travis_state='passed')
+        assert cls.find_regressions(bi, window=5, threshold=20) == {
+            'local': (50.0, 100)
+        }
+
+    def test_find_regressions_failed(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        dt = datetime(2015, 1, 2, 3, 4, 5)
+        for secs in [100, 102, 98, 101, 99]:
+            cls.record_build(make_build('a/b', local_secs=secs,
+                                        travis_secs=secs,
+                                        travis_state='passed'), dt)
+        bi = make_build('a/b', local_secs=500, rc=2, travis_secs=500,
+                        travis_state='failed')
+        assert cls.find_regressions(bi) == {}
+
+    def test_last_success(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        assert cls.last_success('a/b') is None
+        cls.record_build(make_build('a/b', local_secs=10),
+                         datetime(2015, 1, 2, 3, 4, 5))
+        for i in range(MAX_RUNS + 1):
+            cls.record_build(make_build('a/b', local_secs=10, rc=1),
+                             datetime(2015, 1, 3, 3, 4, 5))
+        assert cls.last_success('a/b') == datetime(2015, 1, 2, 3, 4, 5)
+        cls.record_build(
+            make_build('a/b', travis_secs=10, travis_state='passed'),
+            datetime(2015, 1, 4, 3, 4, 5)
+        )
+        assert cls.last_success('a/b') == datetime(2015, 1, 4, 3, 4, 5)
+
+    def test_clone_protocol(self):
+        cls = BuildHistory('/nonexistent/history.json')
+        assert cls.clone_protocol('a/b') is None
+        assert cls.clone_protocol('a/b', 'github.com') is None
+        cls.set_clone_protocol('a/b', 'github.com', 'https')
+        assert cls.clone_protocol('a/b') == 'https'
+        assert cls.clone_protocol('a/c') is None
+        assert cls.clone_protocol('a/c', 'github.com') == 'https'
+        assert cls.clone_protocol('a/c', 'example.com') is None
+        cls.set_clone_protocol('a/c', 'github.com', 'ssh')
+        assert cls.clone_protocol('a/b', 'github.com') == 'https'
+        assert cls.clone_protocol('a/d', 'github.com') == 'ssh'
+        assert cls.data['hosts'] == {'github.com': {'clone_protocol': 'ssh'}}
+
+
+class TestRunSucceeded(object):
+
+    def make_run(self, local_rc=None, travis_state=None):
+        return {
+            'date': '2015-01-02T03:04:05',
+            'local_duration': None if local_rc is None else 10.0,
+            'local_return_code': local_rc,
+            'travis_duration': None if travis_state is None else 10,
+            'travis_state': travis_state,
+        }
+
+    def test_local(self):
+        assert run_succeeded(self.make_run(local_rc=0)) is True
+        assert run_succeeded(self.make_run(local_rc=2)) is False
+
+    def test_travis(self):
+        assert run_succeeded(self.make_run(travis_state='passed')) is True
+        assert run_succeeded(self.make_run(travis_state='failed')) is False
+
+    def test_both(self):
+        assert run_succeeded(self.make_run(0, 'passed')) is True
+        assert run_succeeded(self.make_run(0, 'errored')) is False
+        assert run_succeeded(self.make_run(1, 'passed')) is False
+
+    def test_neither(self):
+        assert run_succeeded(self.make_run()) is False
+
+
+class TestMedian(object):
+
+    def test_empty(self):
+        assert median([]) is None
+
+    def test_odd(self):
+        assert median([3, 1, 2]) == 2
+
+    def test_even(self):
+        assert median([4, 1, 2, 3]) == 2.5
+
+
+class TestDetectRegression(object):
+
+    def test_too_few_runs(self):
+        assert detect_regression(1000, [100, 100, 100, 100]) is None
+
+    def test_regression(self):
+        assert detect_regression(150, [100, 100, 100, 100, 100]) == 50.0
+
+    def test_below_threshold(self):
+        assert detect_regression(115, [100, 100, 100, 100, 100]) is None
+        assert detect_regression(115, [100, 100, 100, 100, 100],
+                                 threshold=10) == 15.0
+
+    def test_not_significant(self):
+        # noisy history; 30% slower is within the normal variation
+        past = [60, 140, 100, 70, 130, 100]
+        assert detect_regression(130, past) is None
+
+    def test_outlier_in_history(self):
+        past = [100, 101, 99, 100, 400]
+        assert detect_regression(130, past) == 30.0
+
+    def test_zero_median(self):
+        assert detect_regression(10, [0, 0, 0, 0, 0]) is None
@@ -0,0 +1,177 @@
+"""
+rebuildbot/tests/test_httpsession.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+
+from requests import Session, PreparedRequest
+
+from rebuildbot.httpsession import (HTTPConfig, JitteredRetry,
+                                    ServiceHTTPAdapter, DEFAULT_RETRIES,
+                                    DEFAULT_TIMEOUTS, DEFAULT_POOL_SIZE,
+                                    RETRY_STATUSES)
+from rebuildbot.ratelimit import RateLimiter
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock
+else:
+    from unittest.mock import patch, call, Mock
+
+pbm = 'rebuildbot.httpsession'
+
+
+class TestJitteredRetry(object):
+
+    def test_first_attempt(self):
+        r = JitteredRetry(total=5, backoff_factor=0.5)
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            assert r.get_backoff_time() == 0
+        assert mock_uniform.mock_calls == []
+
+    def test_backoff(self):
+        r = JitteredRetry(total=5, backoff_factor=0.5)
+        for _ in range(3):
+            r = r.increment('GET', '/foo')
+        assert isinstance(r, JitteredRetry)
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.return_value = 1.5
+            assert r.get_backoff_time() == 1.5
+        assert mock_uniform.mock_calls == [call(0, 2.0)]
+
+
+class TestServiceHTTPAdapter(object):
+
+    def setup(self):
+        self.cls = ServiceHTTPAdapter(timeout=12)
+        self.req = PreparedRequest()
+
+    def test_default(self):
+        with patch('%s.HTTPAdapter.send' % pbm) as mock_send:
+            res = self.cls.send(self.req, stream=False, timeout=None)
+        assert res is mock_send.return_value
+        assert mock_send.mock_calls == [
+            call(self.req, stream=False, timeout=12)
+        ]
+
+    def test_explicit(self):
+        with patch('%s.HTTPAdapter.send' % pbm) as mock_send:
+            self.cls.send(self.req, timeout=3)
+        assert mock_send.mock_calls == [call(self.req, timeout=3)]
+
+    def test_governor(self):
+        mock_gov = Mock(spec_set=RateLimiter)
+        cls = ServiceHTTPAdapter(service='github', timeout=12,
+                                 governor=mock_gov)
+        with patch('%s.HTTPAdapter.send' % pbm) as mock_send:
+            type(mock_send.return_value).status_code = 200
+            type(mock_send.return_value).headers = {'foo': 'bar'}
+            res = cls.send(self.req)
+        assert res is mock_send.return_value
+        assert mock_send.mock_calls == [call(self.req, timeout=12)]
+        assert mock_gov.mock_calls == [
+            call.acquire('github'),
+            call.observe('github', 200, {'foo': 'bar'})
+        ]
+
+
+class TestHTTPConfig(object):
+
+    def setup(self):
+        self.cls = HTTPConfig()
+
+    def test_init(self):
+        assert self.cls.retries == DEFAULT_RETRIES
+        assert self.cls.timeouts == DEFAULT_TIMEOUTS
+        assert self.cls.pool_size == DEFAULT_POOL_SIZE
+
+    def test_init_overrides(self):
+        cls = HTTPConfig(retries=2, timeouts={'s3': 5}, pool_size=0)
+        assert cls.retries == 2
+        assert cls.timeouts == {'travis': 30, 'github': 30, 's3': 5}
+        assert cls.pool_size == 1
+        assert DEFAULT_TIMEOUTS['s3'] == 60
+
+    def test_timeout(self):
+        assert self.cls.timeout('github') == 30
+
+    def test_retry(self):
+        r = self.cls.retry()
+        assert isinstance(r, JitteredRetry)
+        assert r.total == DEFAULT_RETRIES
+        assert r.backoff_factor == 0.5
+        assert sorted(r.status_forcelist) == RETRY_STATUSES
+        assert r.is_retry('GET', 503) is True
+        assert r.is_retry('GET', 429) is True
+        assert r.is_retry('GET', 404) is False
+        assert r.is_retry('POST', 503) is False
+
+    def test_configure_session(self):
+        s = Session()
+        assert self.cls.configure_session(s, 's3') == s
+        for prefix in ['https://', 'http://']:
+            adapter = s.get_adapter(prefix + 'example.com/')
+            assert isinstance(adapter, ServiceHTTPAdapter)
+            assert adapter.service == 's3'
+            assert adapter.governor is None
+            assert adapter.timeout == 60
+            assert adapter.max_retries.total == DEFAULT_RETRIES
+            assert adapter._pool_maxsize == DEFAULT_POOL_SIZE
+
+    def test_adapter_governor(self):
+        gov = RateLimiter()
+        cls = HTTPConfig(governor=gov)
+        assert cls.governor == gov
+        adapter = cls.adapter('travis')
+        assert adapter.governor == gov
+        assert adapter.service == 'travis'
+
+    def test_new_session(self):
+        s = self.cls.new_session('travis')
+        assert isinstance(s, Session)
+        assert s.get_adapter('https://api.travis-ci.org/').timeout == 30
+
+    def test_configure_boto(self):
+        conn = Mock(http_connection_kwargs={'timeout': 70}, num_retries=6)
+        assert self.cls.configure_boto(conn) == conn
+        assert conn.num_retries == DEFAULT_RETRIES
+        assert conn.http_connection_kwargs == {'timeout': 60}
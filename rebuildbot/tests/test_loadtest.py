@@ -0,0 +1,458 @@
+"""
+rebuildbot/tests/test_loadtest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import pytest
+
+from rebuildbot.loadtest import (Scenario, FakeService, FakeGitHub,
+                                 FakeTravis, FakeS3, LoadTestBot, Response,
+                                 make_template_repo, service_value,
+                                 parse_args, format_report, peak_memory_kb,
+                                 run_load_test,
+                                 LOGIN, BUCKET_NAME, TRAVIS_TOKEN,
+                                 GITHUB_RATE_LIMIT, DEFAULT_REPOS)
+from rebuildbot.httpsession import HTTPConfig
+from rebuildbot.ratelimit import RateLimiter
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock
+else:
+    from unittest.mock import patch, call, Mock
+
+pbm = 'rebuildbot.loadtest'  # patch base path for this module
+
+V3 = {'Travis-API-Version': '3'}
+
+
+def get_json(service, path, headers=None):
+    """GET ``path`` from a fake service; return (status, parsed body)"""
+    res = service.handle('GET', path, headers or {}, b'')
+    return res.status, json.loads(res.body.decode('utf-8'))
+
+
+class TestScenario(object):
+
+    def test_repos(self):
+        sc = Scenario(repos=200, local_fraction=0.5, travis_fraction=0.25)
+        assert len(sc.repos) == 200
+        assert sc.repos[0]['slug'] == LOGIN + '/repo00000'
+        assert sc.by_slug[LOGIN + '/repo00001'] is sc.repos[1]
+        local = len([r for r in sc.repos if r['local']])
+        travis = len([r for r in sc.repos if r['travis']])
+        assert 60 < local < 140
+        assert 20 < travis < 80
+
+    def test_repeatable(self):
+        a = Scenario(repos=50, seed=3)
+        b = Scenario(repos=50, seed=3)
+        assert a.repos == b.repos
+
+    def test_as_dict(self):
+        sc = Scenario(repos=10, local_fraction=1, travis_fraction=0,
+                      latencies={'s3': 1.0}, seed=2)
+        assert sc.as_dict() == {
+            'repos': 10, 'local_repos': 10, 'travis_repos': 0,
+            'latencies': {'s3': 1.0}, 'failure_rates': {},
+            'travis_build_secs': 0, 'local_build_secs': 0, 'seed': 2,
+        }
+        assert Scenario().as_dict()['repos'] == DEFAULT_REPOS
+
+
+class TestFakeService(object):
+
+    def test_response(self):
+        res = Response(200, {'a': 1})
+        assert res.body == b'{"a": 1}'
+        assert res.headers == {'Content-Type': 'application/json'}
+        assert Response(404, 'nope').body == b'nope'
+
+    def test_stats(self):
+        cls = FakeS3(Scenario(repos=1))
+        cls.handle('HEAD', '/' + BUCKET_NAME, {}, b'')
+        cls.handle('HEAD', '/' + BUCKET_NAME, {}, b'')
+        cls.handle('DELETE', '/foo', {}, b'')
+        status, body = get_json(cls, '/_stats')
+        assert status == 200
+        assert body == {
+            'requests': 3, 'failures': 0,
+            'by_route': {'HEAD head_bucket': 2, 'DELETE (unknown)': 1},
+        }
+
+    def test_failure_rate(self):
+        cls = FakeS3(Scenario(repos=1, failure_rates={'s3': 1}))
+        res = cls.handle('HEAD', '/' + BUCKET_NAME, {}, b'')
+        assert res.status == 503
+        assert cls.stats()['failures'] == 1
+
+    def test_latency(self):
+        cls = FakeS3(Scenario(repos=1, latencies={'s3': 0.5}))
+        with patch('%s.time.sleep' % pbm) as mock_sleep:
+            cls.handle('HEAD', '/' + BUCKET_NAME, {}, b'')
+            cls.handle('GET', '/_stats', {}, b'')
+        assert mock_sleep.mock_calls == [call(0.5)]
+
+    def test_base_class(self):
+        cls = FakeService(Scenario(repos=1))
+        assert cls.latency == 0
+        assert cls.failure_rate == 0
+        assert cls.handle('GET', '/', {}, b'').status == 404
+
+
+class TestFakeGitHub(object):
+
+    def setup(self):
+        self.sc = Scenario(repos=45, local_fraction=0.5)
+        self.cls = FakeGitHub(self.sc, git_dir='/git/dir')
+        self.cls.base_url = 'http://gh'
+
+    def test_user(self):
+        status, body = get_json(self.cls, '/user')
+        assert body['login'] == LOGIN
+
+    def test_user_repos_pages(self):
+        res = self.cls.handle('GET', '/user/repos?per_page=30', {}, b'')
+        body = json.loads(res.body.decode('utf-8'))
+        assert len(body) == 30
+        assert body[0]['full_name'] == LOGIN + '/repo00000'
+        assert body[0]['clone_url'] == 'http://gh/git/%s/repo00000.git' % LOGIN
+        assert body[0]['owner']['login'] == LOGIN
+        assert res.headers['Link'] == '<http://gh/user/repos?page=2&' \
+            'per_page=30>; rel="next"'
+        res = self.cls.handle('GET', '/user/repos?page=2&per_page=30', {},
+                              b'')
+        assert len(json.loads(res.body.decode('utf-8'))) == 15
+        assert 'Link' not in res.headers
+
+    def test_rate_limit_headers(self):
+        self.cls.handle('GET', '/user', {}, b'')
+        res = self.cls.handle('GET', '/user', {}, b'')
+        assert res.headers['X-RateLimit-Limit'] == str(GITHUB_RATE_LIMIT)
+        assert res.headers['X-RateLimit-Remaining'] == str(
+            GITHUB_RATE_LIMIT - 2)
+
+    def test_repo(self):
+        status, body = get_json(self.cls, '/repos/%s/repo00003' % LOGIN)
+        assert status == 200
+        assert body['full_name'] == LOGIN + '/repo00003'
+        status, body = get_json(self.cls, '/repos/%s/nope' % LOGIN)
+        assert status == 404
+
+    def test_branch(self):
+        status, body = get_json(
+            self.cls, '/repos/%s/repo00003/branches/master' % LOGIN)
+        assert body['name'] == 'master'
+        assert body['commit']['commit']['author']['date'].startswith('2015')
+
+    def test_contents(self):
+        local = [r for r in self.sc.repos if r['local']][0]['slug']
+        other = [r for r in self.sc.repos if not r['local']][0]['slug']
+        path = '/repos/%s/contents/.rebuildbot.sh'
+        assert self.cls.handle('GET', path % local, {}, b'').status == 200
+        assert self.cls.handle('GET', path % other, {}, b'').status == 404
+        assert self.cls.handle(
+            'GET', '/repos/%s/contents/.rebuildbot.yml' % local, {}, b''
+        ).status == 404
+
+    def test_git(self, tmpdir):
+        tmpdir.join('HEAD').write('ref: refs/heads/master\n')
+        self.cls.git_dir = str(tmpdir)
+        res = self.cls.handle('GET', '/git/%s/repo00001.git/HEAD' % LOGIN,
+                              {}, b'')
+        assert res.status == 200
+        assert res.body == b'ref: refs/heads/master\n'
+        res = self.cls.handle(
+            'GET', '/git/%s/repo00001.git/info/refs?service=git-upload-pack'
+            % LOGIN, {}, b'')
+        assert res.status == 404
+        res = self.cls.handle(
+            'GET', '/git/%s/repo00001.git/../../etc/passwd' % LOGIN, {}, b'')
+        assert res.status == 404
+
+    def test_git_sibling_dir(self, tmpdir):
+        tmpdir.join('git', 'HEAD').write('ref\n', ensure=True)
+        tmpdir.join('git-evil', 'secret').write('secret\n', ensure=True)
+        self.cls.git_dir = str(tmpdir.join('git'))
+        res = self.cls.handle(
+            'GET', '/git/%s/repo00001.git/../git-evil/secret' % LOGIN, {}, b'')
+        assert res.status == 404
+
+
+class TestFakeTravis(object):
+
+    def setup(self):
+        self.sc = Scenario(repos=20, travis_fraction=0.5,
+                           travis_build_secs=60)
+        self.cls = FakeTravis(self.sc)
+        self.travis = [r for r in self.sc.repos if r['travis']]
+        self.slug = self.travis[0]['slug']
+
+    def test_init(self):
+        assert len(self.cls.builds) == len(self.travis)
+        build = self.cls.builds[self.cls.last_build[self.slug]]
+        assert self.cls.state(build) == 'passed'
+
+    def test_auth_user(self):
+        res = self.cls.handle('POST', '/auth/github', {}, b'')
+        assert json.loads(res.body.decode('utf-8')) == {
+            'access_token': TRAVIS_TOKEN
+        }
+        status, body = get_json(self.cls, '/users/')
+        assert body['user']['login'] == LOGIN
+
+    def test_repos(self):
+        status, body = get_json(self.cls, '/repos?member=' + LOGIN)
+        assert [r['slug'] for r in body['repos']] == [
+            r['slug'] for r in self.travis
+        ]
+        assert body['repos'][0]['last_build_state'] == 'passed'
+
+    def test_repo(self):
+        status, body = get_json(self.cls, '/repos/' + self.slug)
+        assert body['repo']['slug'] == self.slug
+        other = [r for r in self.sc.repos if not r['travis']][0]['slug']
+        assert self.cls.handle('GET', '/repos/' + other, {}, b'').status == \
+            404
+
+    def test_trigger_and_build(self):
+        old_id = self.cls.last_build[self.slug]
+        body = json.dumps({'request': {'branch': 'master',
+                                       'message': 'mymsg'}})
+        res = self.cls.handle(
+            'POST', '/repo/%s/requests' % self.slug.replace('/', '%2F'), V3,
+            body.encode('utf-8'))
+        assert res.status == 202
+        new_id = self.cls.last_build[self.slug]
+        assert new_id > old_id
+        status, body = get_json(self.cls, '/builds/%d' % new_id)
+        assert body['build']['state'] == 'started'
+        assert body['build']['finished_at'] is None
+        self.cls.builds[new_id]['started'] -= 61
+        status, body = get_json(self.cls, '/builds/%d' % new_id)
+        assert body['build']['state'] == 'passed'
+        assert body['build']['duration'] == 60
+
+    def test_repo_builds_pending(self):
+        build_id = self.cls.add_build(self.travis[0], 60, message='m')
+        status, body = get_json(
+            self.cls, '/repo/%s/builds?branch.name=master&state=created,'
+            'received,started' % self.slug.replace('/', '%2F'), V3)
+        assert [b['id'] for b in body['builds']] == [build_id]
+        assert body['builds'][0]['commit']['message'] == 'm'
+        assert body['builds'][0]['repository']['slug'] == self.slug
+
+    def test_cancel(self):
+        build_id = self.cls.add_build(self.travis[0], 60)
+        res = self.cls.handle('POST', '/build/%d/cancel' % build_id, V3, b'')
+        assert res.status == 202
+        assert self.cls.state(self.cls.builds[build_id]) == 'canceled'
+        assert self.cls.handle('POST', '/build/999/cancel', V3,
+                               b'').status == 404
+
+    def test_builds_pages(self):
+        status, body = get_json(self.cls, '/builds?limit=4&sort_by=id:desc',
+                                V3)
+        ids = sorted(self.cls.builds.keys(), reverse=True)
+        assert [b['id'] for b in body['builds']] == ids[:4]
+        assert body['@pagination']['is_last'] is False
+        href = body['@pagination']['next']['@href']
+        assert href == '/builds?limit=4&offset=4&sort_by=id:desc'
+        status, body = get_json(self.cls, '/builds?limit=100&offset=4', V3)
+        assert [b['id'] for b in body['builds']] == ids[4:]
+        assert body['@pagination']['is_last'] is True
+
+
+class TestFakeS3(object):
+
+    def setup(self):
+        self.cls = FakeS3(Scenario(repos=1))
+        self.path = '/' + BUCKET_NAME
+
+    def test_location(self):
+        res = self.cls.handle('GET', self.path + '/?location', {}, b'')
+        assert res.status == 200
+        assert b'<LocationConstraint' in res.body
+
+    def test_no_bucket(self):
+        assert self.cls.handle('HEAD', '/other', {}, b'').status == 404
+        assert self.cls.handle('GET', '/other/', {}, b'').status == 404
+
+    def test_put_get_list(self):
+        res = self.cls.handle('PUT', self.path + '/a/index.html', {},
+                              b'<html/>')
+        assert res.headers['ETag'] == '"%s"' % hashlib.md5(
+            b'<html/>').hexdigest()
+        self.cls.handle('PUT', self.path + '/b/c.txt', {}, b'c')
+        res = self.cls.handle('GET', self.path + '/a/index.html', {}, b'')
+        assert res.body == b'<html/>'
+        assert self.cls.handle('GET', self.path + '/x', {}, b'').status == 404
+        res = self.cls.handle('GET', self.path + '/?prefix=a/', {}, b'')
+        assert b'<Key>a/index.html</Key>' in res.body
+        assert b'<Key>b/c.txt</Key>' not in res.body
+        res = self.cls.handle('GET', self.path + '/?max-keys=0', {}, b'')
+        assert b'<Contents>' not in res.body
+
+
+class TestLoadTestBot(object):
+
+    def setup(self):
+        self.urls = {
+            'github': 'http://127.0.0.1:1', 'travis': 'http://127.0.0.1:2',
+            's3': 'http://127.0.0.1:3',
+        }
+        with patch('rebuildbot.bot.ReBuildBot.__init__') as mock_init:
+            mock_init.return_value = None
+            self.cls = LoadTestBot(self.urls, BUCKET_NAME)
+        self.cls.gh_token = self.cls.get_github_token()
+        self.cls.http = Mock(spec_set=HTTPConfig)
+        self.cls.ratelimit = RateLimiter()
+        self.cls.auth_cache = None
+
+    def test_connect_github(self):
+        with patch('%s.GitHubWrapper' % pbm) as mock_gh:
+            self.cls.connect_github()
+        assert mock_gh.mock_calls == [
+            call(self.cls.gh_token, http=self.cls.http,
+                 base_url='http://127.0.0.1:1')
+        ]
+
+    def test_connect_travis(self):
+        with patch('%s.Travis' % pbm) as mock_travis:
+            self.cls.connect_travis()
+        assert mock_travis.mock_calls == [
+            call(self.cls.gh_token, http=self.cls.http, cache=None,
+                 uri='http://127.0.0.1:2')
+        ]
+
+    def test_s3_connection(self):
+        with patch('%s.S3Connection' % pbm) as mock_conn, \
+                patch('%s.OrdinaryCallingFormat' % pbm) as mock_fmt:
+            res = self.cls.s3_connection()
+        assert mock_conn.mock_calls == [
+            call(aws_access_key_id='loadtest',
+                 aws_secret_access_key='loadtest', host='127.0.0.1', port=3,
+                 is_secure=False, calling_format=mock_fmt.return_value)
+        ]
+        assert res is self.cls.http.configure_boto.return_value
+
+
+def test_run_load_test():
+    # end to end: ReBuildBot.run() against the fake services on localhost
+    report = run_load_test(
+        Scenario(repos=10, local_fraction=0.5, travis_fraction=0.5))
+    builds = report['builds']
+    assert builds['local_finished'] > 0
+    assert builds['local_finished'] == builds['local']
+    assert builds['travis_finished'] > 0
+    assert builds['travis_finished'] == builds['travis']
+    by_route = report['api_calls']['github']['by_route']
+    assert by_route['GET contents'] > 0
+    assert by_route['GET git'] > 0
+    assert report['api_calls']['s3']['by_route']['PUT put_object'] > 0
+
+
+def test_make_template_repo(tmpdir):
+    git_dir = make_template_repo(str(tmpdir.join('tmpl')), build_secs=2)
+    assert os.path.isfile(os.path.join(git_dir, 'info', 'refs'))
+    with open(os.path.join(str(tmpdir), 'tmpl', '.rebuildbot.sh')) as fh:
+        assert 'sleep 2' in fh.read()
+
+
+def test_service_value():
+    assert service_value('github=0.5') == ('github', 0.5)
+    with pytest.raises(argparse.ArgumentTypeError):
+        service_value('github')
+    with pytest.raises(argparse.ArgumentTypeError):
+        service_value('foo=1')
+
+
+def test_parse_args():
+    res = parse_args(['--repos=10', '--latency', 'travis=0.1',
+                      '--failure-rate', 's3=0.5', '--no-local'])
+    assert res.repos == 10
+    assert res.latencies == [('travis', 0.1)]
+    assert res.failure_rates == [('s3', 0.5)]
+    assert res.run_local is False
+    assert res.run_travis is True
+
+
+def test_peak_memory_kb():
+    res = peak_memory_kb()
+    assert res is None or res > 0
+
+
+def test_format_report():
+    report = {
+        'scenario': Scenario(repos=4, local_fraction=0,
+                             travis_fraction=0).as_dict(),
+        'wall_seconds': 1.5,
+        'peak_memory_kb': 2048,
+        'api_calls': {
+            'github': {'requests': 2, 'failures': 0,
+                       'by_route': {'GET user': 2}},
+            'travis': {'requests': 0, 'failures': 0, 'by_route': {}},
+            's3': {'requests': 1, 'failures': 1,
+                   'by_route': {'HEAD head_bucket': 1}},
+        },
+        'builds': {'total': 0, 'local': 0, 'local_finished': 0,
+                   'local_passed': 0, 'travis': 0, 'travis_finished': 0,
+                   'travis_passed': 0},
+    }
+    res = format_report(report)
+    assert res.split('\n') == [
+        'Scenario: 4 repos (0 local, 0 Travis), seed 1',
+        'Wall time: 1.5s',
+        'Peak memory: 2.0 MB',
+        'Local builds: 0 (0 finished, 0 passed)',
+        'Travis builds: 0 (0 finished, 0 passed)',
+        'github: 2 requests, 0 failed',
+        '    GET user                     2',
+        'travis: 0 requests, 0 failed',
+        's3: 1 requests, 1 failed',
+        '    HEAD head_bucket             1',
+    ]
@@ -37,11 +37,20 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
+import os
 import sys
+import time
+import threading
 import subprocess
 import pytest
-from rebuildbot.local_build import LocalBuild
+from rebuildbot.local_build import LocalBuild, url_host
 from rebuildbot.buildinfo import BuildInfo
+from rebuildbot.exceptions import LocalBuildTimeoutError
+from rebuildbot.workspace import WorkspaceManager
+from rebuildbot.caches import CacheManager
+from rebuildbot.reaper import Reaper
+from rebuildbot.history import BuildHistory
+from rebuildbot.admission import AdmissionController
 from datetime import datetime
 
 from freezegun import freeze_time
@@ -61,6 +70,20 @@ pbm = 'rebuildbot.local_build'
 pb = '%s.LocalBuild' % pbm
 
 
+def pid_running(pid):
+    """return whether ``pid`` is running (exists and is not a zombie)"""
+    try:
+        with open('/proc/%d/stat' % pid, 'r') as fh:
+            return fh.read().split(')')[-1].split()[0] != 'Z'
+    except IOError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
 class TestLocalBuildInit(object):
 
     def test_init(self):
@@ -69,6 +92,24 @@ class TestLocalBuildInit(object):
         assert b.repo_name == 'me/repo'
         assert b.build_info == bi
         assert b.dry_run is False
+        assert b.timeout is None
+        assert b.inactivity_timeout is None
+        assert b.workspaces is None
+        assert b.caches is None
+        assert b.reaper is None
+        assert b.prefetched is None
+        assert b.history is None
+        assert b.race_clone is False
+        assert b.admission is None
+        assert b.clone_depth is None
+        assert b.cache_names is None
+        assert b.rusage is None
+
+    def test_init_timeouts(self):
+        bi = Mock(spec_set=BuildInfo)
+        b = LocalBuild('me/repo', bi, timeout=3600, inactivity_timeout=60)
+        assert b.timeout == 3600
+        assert b.inactivity_timeout == 60
 
     def test_init_dry_run(self):
         bi = Mock(spec_set=BuildInfo)
@@ -203,6 +244,33 @@ class TestLocalBuild(object):
         ]
         assert mock_rmtree.mock_calls == [call('/my/clone/path')]
 
+    def test_run_timeout(self):
+        ex = LocalBuildTimeoutError('my/repo', 'hard', 60, 'my out')
+
+        def se_ex(foo):
+            raise ex
+
+        with patch('%s.clone_repo' % pb) as mock_clone, \
+                patch('%s.run_build' % pb) as mock_run, \
+                patch('%s.rmtree' % pbm) as mock_rmtree, \
+                patch('%s.get_time' % pb) as mock_time:
+            mock_clone.return_value = ('/my/clone/path', 'repostr')
+            mock_run.side_effect = se_ex
+            mock_time.side_effect = [
+                datetime(2015, 1, 1, 1, 0, 0),
+                datetime(2015, 1, 1, 2, 0, 0),
+            ]
+            self.cls.run()
+        assert len(self.bi.mock_calls) == 1
+        kwargs = self.bi.mock_calls[0][2]
+        assert kwargs['excinfo'] == ex
+        assert kwargs['output'] == 'my out'
+        assert kwargs['timed_out'] is True
+        assert kwargs['start_dt'] == datetime(2015, 1, 1, 1, 0, 0)
+        assert kwargs['end_dt'] == datetime(2015, 1, 1, 2, 0, 0)
+        assert kwargs['repo_str'] == 'repostr'
+        assert mock_rmtree.mock_calls == [call('/my/clone/path')]
+
     @freeze_time('2015-01-10 12:13:14')
     def test_get_time(self):
         res = self.cls.get_time()
@@ -227,6 +295,24 @@ class TestLocalBuild(object):
         )
         assert res == ('/repo/path', '<ssh_url> rname (mysha)')
 
+    def test_clone_repo_depth(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        self.cls.clone_depth = 1
+
+        mock_repo = Mock(name='mock_repo')
+        mock_repo.head.ref.name = 'rname'
+        mock_repo.head.ref.commit.hexsha = 'mysha'
+
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.Repo.clone_from' % pbm) as mock_clone:
+            mock_path.return_value = '/repo/path'
+            mock_clone.return_value = mock_repo
+            self.cls.clone_repo()
+        assert mock_clone.mock_calls[0] == call(
+            'ssh_url', '/repo/path', branch='master', depth=1
+        )
+
     def test_clone_repo_ssh_fail(self):
         type(self.bi).ssh_clone_url = 'ssh_url'
         type(self.bi).https_clone_url = 'https_url'
@@ -242,11 +328,17 @@ class TestLocalBuild(object):
             return mock_repo
 
         with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.time.time' % pbm) as mock_time, \
                 patch('%s.Repo.clone_from' % pbm) as mock_clone:
             mock_path.return_value = '/repo/path'
+            mock_time.side_effect = [10.0, 40.0, 40.0, 42.5]
             mock_clone.side_effect = se_clone
             res = self.cls.clone_repo(branch='mybranch')
         assert mock_path.mock_calls == [call()]
+        assert self.bi.mock_calls == [
+            call.add_clone_attempt('ssh', 'ssh_url', 30.0, ex),
+            call.add_clone_attempt('https', 'https_url', 2.5)
+        ]
         assert mock_clone.mock_calls[0] == call.clone_from(
             'ssh_url', '/repo/path', branch='mybranch'
         )
@@ -306,6 +398,239 @@ class TestLocalBuild(object):
         ]
         assert res == ('/repo/path', '(DRY RUN)')
 
+    def test_clone_repo_workspace(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        ws = Mock(spec_set=WorkspaceManager)
+        ws.path_for.return_value = '/ws/my__repo'
+        ws.prepare.return_value = ('/ws/my__repo', 'repostr')
+        self.cls.workspaces = ws
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.Repo' % pbm) as mock_repo:
+            res = self.cls.clone_repo(branch='mybranch')
+        assert res == ('/ws/my__repo', 'repostr')
+        assert mock_path.mock_calls == []
+        assert mock_repo.mock_calls == []
+        assert ws.mock_calls == [
+            call.path_for('my/repo'),
+            call.prepare('my/repo', ['ssh_url'], branch='mybranch')
+        ]
+
+    def test_clone_repo_workspace_ssh_fail(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        ex = Exception('foo')
+        ws = Mock(spec_set=WorkspaceManager)
+        ws.path_for.return_value = '/ws/my__repo'
+        ws.prepare.side_effect = [ex, ('/ws/my__repo', 'repostr')]
+        self.cls.workspaces = ws
+        res = self.cls.clone_repo(branch='mybranch')
+        assert res == ('/ws/my__repo', 'repostr')
+        assert ws.mock_calls == [
+            call.path_for('my/repo'),
+            call.prepare('my/repo', ['ssh_url'], branch='mybranch'),
+            call.prepare('my/repo', ['https_url'], branch='mybranch')
+        ]
+
+    def test_clone_repo_no_urls(self):
+        type(self.bi).ssh_clone_url = None
+        type(self.bi).https_clone_url = None
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.Repo' % pbm) as mock_repo:
+            mock_path.return_value = '/repo/path'
+            with pytest.raises(ValueError):
+                self.cls.clone_repo()
+        assert mock_repo.mock_calls == []
+
+    def test_clone_repo_history(self):
+        type(self.bi).ssh_clone_url = 'git@github.com:my/repo.git'
+        type(self.bi).https_clone_url = 'https://github.com/my/repo.git'
+        hist = Mock(spec_set=BuildHistory)
+        hist.clone_protocol.return_value = 'https'
+        self.cls.history = hist
+
+        mock_repo = Mock(name='mock_repo')
+        mock_repo.head.ref.name = 'rname'
+        mock_repo.head.ref.commit.hexsha = 'mysha'
+
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.Repo.clone_from' % pbm) as mock_clone:
+            mock_path.return_value = '/repo/path'
+            mock_clone.return_value = mock_repo
+            res = self.cls.clone_repo()
+        assert mock_clone.mock_calls[0] == call(
+            'https://github.com/my/repo.git', '/repo/path', branch='master'
+        )
+        assert res == (
+            '/repo/path', '<https://github.com/my/repo.git> rname (mysha)'
+        )
+        assert hist.mock_calls == [
+            call.clone_protocol('my/repo', 'github.com'),
+            call.set_clone_protocol('my/repo', 'github.com', 'https')
+        ]
+
+    def test_clone_urls(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        assert self.cls.clone_urls() == [
+            ('ssh', 'ssh_url'), ('https', 'https_url')
+        ]
+        hist = Mock(spec_set=BuildHistory)
+        hist.clone_protocol.return_value = None
+        self.cls.history = hist
+        assert self.cls.clone_urls() == [
+            ('ssh', 'ssh_url'), ('https', 'https_url')
+        ]
+        hist.clone_protocol.return_value = 'https'
+        assert self.cls.clone_urls() == [
+            ('https', 'https_url'), ('ssh', 'ssh_url')
+        ]
+        type(self.bi).ssh_clone_url = None
+        assert self.cls.clone_urls() == [('https', 'https_url')]
+
+    def test_should_race(self):
+        urls = [('ssh', 'ssh_url'), ('https', 'https_url')]
+        assert self.cls.should_race(urls) is False
+        self.cls.race_clone = True
+        assert self.cls.should_race(urls) is True
+        assert self.cls.should_race(urls[1:]) is False
+        hist = Mock(spec_set=BuildHistory)
+        hist.clone_protocol.return_value = None
+        self.cls.history = hist
+        assert self.cls.should_race(urls) is True
+        hist.clone_protocol.return_value = 'ssh'
+        assert self.cls.should_race(urls) is False
+        assert hist.mock_calls == [
+            call.clone_protocol('my/repo'),
+            call.clone_protocol('my/repo')
+        ]
+
+    def test_clone_repo_race(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        self.cls.race_clone = True
+        hist = Mock(spec_set=BuildHistory)
+        hist.clone_protocol.return_value = None
+        self.cls.history = hist
+        ssh_done = threading.Event()
+        ex = Exception('foo')
+
+        mock_repo = Mock(name='mock_repo')
+        mock_repo.head.ref.name = 'rname'
+        mock_repo.head.ref.commit.hexsha = 'mysha'
+
+        ssh_thread = []
+
+        def se_clone(url, path, branch=None):
+            if url == 'ssh_url':
+                ssh_thread.append(threading.current_thread())
+                ssh_done.set()
+                raise ex
+            # only succeed once the ssh failure has been reported
+            ssh_done.wait()
+            ssh_thread[0].join()
+            return mock_repo
+
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.os.rmdir' % pbm) as mock_rmdir, \
+                patch('%s.mkdtemp' % pbm) as mock_mkdtemp, \
+                patch('%s.rmtree' % pbm) as mock_rmtree, \
+                patch('%s.Repo.clone_from' % pbm) as mock_clone:
+            mock_path.return_value = '/repo/path'
+            mock_mkdtemp.side_effect = ['/tmp/a', '/tmp/b']
+            mock_clone.side_effect = se_clone
+            res = self.cls.clone_repo()
+        assert mock_rmdir.mock_calls == [call('/repo/path')]
+        assert mock_clone.call_count == 2
+        assert mock_rmtree.mock_calls == [call('/tmp/a', ignore_errors=True)]
+        assert res == ('/tmp/b', '<https_url> rname (mysha)')
+        calls = self.bi.mock_calls
+        assert calls[0][0] == 'add_clone_attempt'
+        assert calls[0][1][0:2] == ('ssh', 'ssh_url')
+        assert calls[0][1][3] == ex
+        assert calls[1][0] == 'add_clone_attempt'
+        assert calls[1][1][0:2] == ('https', 'https_url')
+        assert hist.mock_calls[-1] == call.set_clone_protocol(
+            'my/repo', 'https_url', 'https'
+        )
+
+    def test_clone_repo_race_loser_removed(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        self.cls.race_clone = True
+        https_done = threading.Event()
+
+        mock_repo = Mock(name='mock_repo')
+        mock_repo.head.ref.name = 'rname'
+        mock_repo.head.ref.commit.hexsha = 'mysha'
+
+        def se_clone(url, path, branch=None):
+            if url == 'https_url':
+                https_done.wait()
+            return mock_repo
+
+        def se_attempt(proto, url, duration):
+            https_done.set()
+
+        self.bi.add_clone_attempt.side_effect = se_attempt
+        with patch('%s.path_for_repo' % pb) as mock_path, \
+                patch('%s.os.rmdir' % pbm), \
+                patch('%s.mkdtemp' % pbm) as mock_mkdtemp, \
+                patch('%s.rmtree' % pbm) as mock_rmtree, \
+                patch('%s.Repo.clone_from' % pbm) as mock_clone:
+            mock_path.return_value = '/repo/path'
+            mock_mkdtemp.side_effect = ['/tmp/ssh', '/tmp/https']
+            mock_clone.side_effect = se_clone
+            res = self.cls.clone_repo()
+            for i in range(100):
+                if mock_rmtree.call_count > 0:
+                    break
+                time.sleep(0.05)
+        assert res == ('/tmp/ssh', '<ssh_url> rname (mysha)')
+        assert mock_rmtree.mock_calls == [
+            call('/tmp/https', ignore_errors=True)
+        ]
+
+    def test_clone_repo_workspace_dry_run(self):
+        type(self.bi).ssh_clone_url = 'ssh_url'
+        type(self.bi).https_clone_url = 'https_url'
+        ws = Mock(spec_set=WorkspaceManager)
+        ws.path_for.return_value = '/ws/my__repo'
+        self.cls.workspaces = ws
+        self.cls.dry_run = True
+        res = self.cls.clone_repo()
+        assert res == ('/ws/my__repo', '(DRY RUN)')
+        assert ws.mock_calls == [call.path_for('my/repo')]
+
+    def test_run_prefetched(self):
+        self.cls.prefetched = ('/my/clone/path', 'repostr')
+        with patch('%s.clone_repo' % pb) as mock_clone, \
+                patch('%s.run_build' % pb) as mock_run, \
+                patch('%s.rmtree' % pbm), \
+                patch('%s.get_time' % pb):
+            mock_run.return_value = 'my output'
+            self.cls.run()
+        assert mock_clone.mock_calls == []
+        assert mock_run.mock_calls == [call('/my/clone/path')]
+
+    def test_cleanup(self):
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            self.cls.cleanup('/repo/path')
+        assert mock_rmtree.mock_calls == [call('/repo/path')]
+
+    def test_cleanup_workspace(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            self.cls.cleanup('/repo/path')
+        assert mock_rmtree.mock_calls == []
+
+    def test_cleanup_reaper(self):
+        self.cls.reaper = Mock(spec_set=Reaper)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            self.cls.cleanup('/repo/path')
+        assert mock_rmtree.mock_calls == []
+        assert self.cls.reaper.mock_calls == [call.reap('/repo/path')]
+
     def test_path_for_repo(self):
         with patch('%s.mkdtemp' % pbm) as mock_mkdtemp:
             mock_mkdtemp.return_value = '/tmpdir'
@@ -313,179 +638,235 @@ class TestLocalBuild(object):
         assert res == '/tmpdir'
         assert mock_mkdtemp.mock_calls == [call(prefix='rebuildbot_')]
 
-    @pytest.mark.skipif(
-        (
-                sys.version_info[0] != 2 or
-                (sys.version_info[0] == 2 and sys.version_info[1] != 7)
-        ),
-        reason='not running py27 test on %d.%d.%d' % (
-                sys.version_info[0],
-                sys.version_info[1],
-                sys.version_info[2]
-        ))
-    def test_run_build_success_py27(self):
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess:
-            mock_getcwd.return_value = '/my/pwd'
+    def write_script(self, tmpdir, content):
+        """write an executable .rebuildbot.sh into tmpdir; return the dir"""
+        p = tmpdir.join('.rebuildbot.sh')
+        p.write("#!/bin/sh\n" + content)
+        p.chmod(0o755)
+        return str(tmpdir)
+
+    def test_run_build_success(self, tmpdir):
+        path = self.write_script(tmpdir, "pwd\necho foo >&2\n")
+        with patch('%s.POLL_INTERVAL' % pbm, 0.01):
+            res = self.cls.run_build(path)
+        assert res == "%s\nfoo\n" % os.path.realpath(path)
+
+    def test_run_build_failure(self, tmpdir):
+        path = self.write_script(tmpdir, "echo foo\nexit 3\n")
+        with patch('%s.POLL_INTERVAL' % pbm, 0.01):
+            with pytest.raises(subprocess.CalledProcessError) as excinfo:
+                self.cls.run_build(path)
+        assert excinfo.value.returncode == 3
+        assert excinfo.value.output == "foo\n"
+
+    def test_run_build_popen(self):
+        mock_proc = Mock()
+        mock_proc.poll.return_value = 0
+        type(mock_proc).returncode = 0
+        with patch('%s.subprocess.Popen' % pbm) as mock_popen, \
+                patch('%s.OutputReader' % pbm) as mock_reader:
+            mock_popen.return_value = mock_proc
+            type(mock_reader.return_value).output = b'myout'
             res = self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == [call()]
-        assert mock_chdir.mock_calls == [
-            call('/repo/path'),
-            call('/my/pwd')
-        ]
-        assert mock_subprocess.mock_calls == [
-            call.check_output(
+        assert res == 'myout'
+        if sys.version_info >= (3, 2):
+            kwargs = {'start_new_session': True}
+        else:
+            kwargs = {'preexec_fn': os.setsid}
+        assert mock_popen.mock_calls[0] == call(
                 ['./.rebuildbot.sh'],
-                stderr=mock_subprocess.STDOUT
-            )
+                cwd='/repo/path',
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                close_fds=True,
+                **kwargs
+        )
+        assert mock_reader.mock_calls == [
+            call(mock_proc.stdout),
+            call().start(),
+            call().join(10)
         ]
-        assert res == mock_subprocess.check_output.return_value
-
-    @pytest.mark.skipif(
-        (
-                sys.version_info[0] != 2 or
-                (sys.version_info[0] == 2 and sys.version_info[1] != 7)
-        ),
-        reason='not running py27 test on %d.%d.%d' % (
-                sys.version_info[0],
-                sys.version_info[1],
-                sys.version_info[2]
-        ))
-    def test_run_build_exception_py27(self):
-        ex = Exception('foo')
 
-        def se_exc(foo, stderr=None):
-            raise ex
+    def test_run_build_admission(self):
+        adm = Mock(spec_set=AdmissionController)
+        adm.create_cgroup.return_value = '/cg/build'
+        adm.command.return_value = ['nice', '-n', '10', './.rebuildbot.sh']
+        adm.cgroup_usage.return_value = {'cpu': 1.5}
+        self.cls.admission = adm
+        mock_proc = Mock()
+        mock_proc.poll.return_value = 0
+        type(mock_proc).returncode = 0
+        with patch('%s.subprocess.Popen' % pbm) as mock_popen, \
+                patch('%s.OutputReader' % pbm) as mock_reader:
+            mock_popen.return_value = mock_proc
+            type(mock_reader.return_value).output = b'myout'
+            res = self.cls.run_build('/repo/path')
+        assert res == 'myout'
+        assert mock_popen.mock_calls[0][1] == (
+            ['nice', '-n', '10', './.rebuildbot.sh'],
+        )
+        assert adm.mock_calls == [
+            call.create_cgroup('my/repo'),
+            call.command(['./.rebuildbot.sh'], cgroup='/cg/build'),
+            call.cgroup_usage('/cg/build'),
+            call.remove_cgroup('/cg/build')
+        ]
+        assert self.bi.mock_calls == [
+            call.set_local_build_rusage({'cgroup': {'cpu': 1.5}})
+        ]
 
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess:
-            mock_getcwd.return_value = '/my/pwd'
-            mock_subprocess.check_output.side_effect = se_exc
-            with pytest.raises(Exception) as excinfo:
+    def test_run_build_admission_popen_fails(self):
+        adm = Mock(spec_set=AdmissionController)
+        adm.create_cgroup.return_value = '/cg/build'
+        adm.command.return_value = ['./.rebuildbot.sh']
+        self.cls.admission = adm
+        with patch('%s.subprocess.Popen' % pbm) as mock_popen:
+            mock_popen.side_effect = OSError('foo')
+            with pytest.raises(OSError):
                 self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == [call()]
-        assert mock_chdir.mock_calls == [
-            call('/repo/path'),
-            call('/my/pwd')
-        ]
-        assert mock_subprocess.mock_calls == [
-            call.check_output(
-                ['./.rebuildbot.sh'],
-                stderr=mock_subprocess.STDOUT
-            )
+        assert adm.mock_calls[-1] == call.remove_cgroup('/cg/build')
+
+    def test_run_build_caches_popen_fails(self, tmpdir):
+        caches = CacheManager(str(tmpdir.join('caches')), ['pip'])
+        self.cls.caches = caches
+        with patch('%s.subprocess.Popen' % pbm) as mock_popen:
+            mock_popen.side_effect = OSError('foo')
+            with pytest.raises(OSError):
+                self.cls.run_build('/repo/path')
+        # the failed build no longer counts as using the cache
+        assert caches.users == {'pip': set()}
+
+    def test_run_build_nice(self, tmpdir):
+        path = self.write_script(tmpdir, 'nice\n')
+        bi = BuildInfo('my/repo', run_local=True)
+        cls = LocalBuild('my/repo', bi, admission=AdmissionController(nice=5))
+        res = cls.run_build(path)
+        assert int(res.strip()) == os.nice(0) + 5
+
+    def test_run_build_caches(self, tmpdir):
+        path = self.write_script(tmpdir, 'echo "$PIP_CACHE_DIR"\n'
+                                 'touch "$PIP_CACHE_DIR/new"\n')
+        caches = CacheManager(str(tmpdir.join('caches')), ['pip'])
+        bi = BuildInfo('my/repo', run_local=True)
+        cls = LocalBuild('my/repo', bi, caches=caches)
+        res = cls.run_build(path)
+        assert res.strip() == str(tmpdir.join('caches', 'pip'))
+        assert bi.cache_stats == {
+            'pip': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 1,
+                    'written_bytes': 0}
+        }
+
+    def test_run_build_cache_names(self, tmpdir):
+        path = self.write_script(tmpdir, 'echo "${PIP_CACHE_DIR}x"\n'
+                                 'echo "$npm_config_cache"\n')
+        caches = CacheManager(str(tmpdir.join('caches')), ['npm', 'pip'])
+        bi = BuildInfo('my/repo', run_local=True)
+        cls = LocalBuild('my/repo', bi, caches=caches, cache_names=['npm'])
+        with patch.dict('os.environ', clear=False):
+            os.environ.pop('PIP_CACHE_DIR', None)
+            res = cls.run_build(path)
+        assert res.split() == ['x', str(tmpdir.join('caches', 'npm'))]
+        assert bi.cache_stats == {
+            'npm': {'cached': 0, 'updated': 0, 'removed': 0, 'added': 0,
+                    'written_bytes': 0}
+        }
+
+    def test_run_build_rusage(self, tmpdir):
+        path = self.write_script(
+            tmpdir, 'i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done\n'
+                    'exit 3\n')
+        bi = BuildInfo('my/repo', run_local=True)
+        cls = LocalBuild('my/repo', bi)
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            cls.run_build(path)
+        assert excinfo.value.returncode == 3
+        usage = bi.local_build_rusage
+        assert sorted(usage.keys()) == [
+            'block_in', 'block_out', 'involuntary_switches', 'max_rss_kb',
+            'sys_cpu', 'user_cpu', 'voluntary_switches'
         ]
-        assert excinfo.value == ex
-
-    @pytest.mark.skipif(
-        (
-                sys.version_info[0] != 2 or
-                (sys.version_info[0] == 2 and sys.version_info[1] != 7)
-        ),
-        reason='not running py27 test on %d.%d.%d' % (
-                sys.version_info[0],
-                sys.version_info[1],
-                sys.version_info[2]
-        ))
-    def test_run_build_dry_run_py27(self):
+        assert usage['user_cpu'] + usage['sys_cpu'] > 0
+        assert usage['max_rss_kb'] > 0
+
+    def test_poll_process(self):
+        proc = subprocess.Popen(['sleep', '30'])
+        try:
+            assert self.cls.poll_process(proc) is None
+            assert self.cls.rusage is None
+        finally:
+            proc.kill()
+        assert self.cls.poll_process(proc, block=True) == -9
+        assert proc.returncode == -9
+        assert self.cls.rusage['max_rss_kb'] >= 0
+        assert self.cls.poll_process(proc) == -9
+
+    def test_poll_process_already_reaped(self):
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        proc.returncode = None
+        with patch('%s.os.wait4' % pbm) as mock_wait4:
+            mock_wait4.side_effect = OSError(10, 'No child processes')
+            with patch.object(proc, 'wait') as mock_wait:
+                mock_wait.return_value = 0
+                assert self.cls.poll_process(proc, block=True) == 0
+        assert self.cls.rusage is None
+
+    def test_run_build_hard_timeout(self, tmpdir):
+        path = self.write_script(
+            tmpdir, "echo started\nsleep 30 &\necho $! > child.pid\nwait\n"
+        )
+        self.cls.timeout = 1
+        with patch('%s.POLL_INTERVAL' % pbm, 0.05), \
+                patch('%s.KILL_GRACE_SECONDS' % pbm, 2):
+            with pytest.raises(LocalBuildTimeoutError) as excinfo:
+                self.cls.run_build(path)
+        assert excinfo.value.kind == 'hard'
+        assert excinfo.value.timeout == 1
+        assert excinfo.value.output == "started\n"
+        # the backgrounded grandchild must have been killed with the group
+        child_pid = int(tmpdir.join('child.pid').read().strip())
+        assert not pid_running(child_pid)
+
+    def test_run_build_inactivity_timeout(self, tmpdir):
+        path = self.write_script(
+            tmpdir, "echo started\nsleep 30\n"
+        )
+        self.cls.inactivity_timeout = 1
+        with patch('%s.POLL_INTERVAL' % pbm, 0.05), \
+                patch('%s.KILL_GRACE_SECONDS' % pbm, 2):
+            with pytest.raises(LocalBuildTimeoutError) as excinfo:
+                self.cls.run_build(path)
+        assert excinfo.value.kind == 'inactivity'
+        assert excinfo.value.timeout == 1
+        assert excinfo.value.output == "started\n"
+
+    def test_run_build_ignores_sigterm(self, tmpdir):
+        path = self.write_script(
+            tmpdir, "trap '' TERM\necho started\nsleep 30\n"
+        )
+        self.cls.timeout = 1
+        with patch('%s.POLL_INTERVAL' % pbm, 0.05), \
+                patch('%s.KILL_GRACE_SECONDS' % pbm, 0.5):
+            with pytest.raises(LocalBuildTimeoutError) as excinfo:
+                self.cls.run_build(path)
+        assert excinfo.value.kind == 'hard'
+
+    def test_run_build_dry_run(self):
         self.cls.dry_run = True
 
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess:
-            mock_getcwd.return_value = '/my/pwd'
+        with patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess:
             res = self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == []
-        assert mock_chdir.mock_calls == []
         assert mock_subprocess.mock_calls == []
         assert res == 'DRY RUN'
 
-    @pytest.mark.skipif(sys.version_info[0] < 3,
-                        reason='not running py3 test on %d.%d.%d' % (
-                            sys.version_info[0],
-                            sys.version_info[1],
-                            sys.version_info[2]
-                        ))
-    def test_run_build_success_py3(self):
-        mock_res = Mock()
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess,\
-                patch('%s.locale' % pbm, autospec=True) as mock_locale:
-            mock_getcwd.return_value = '/my/pwd'
-            mock_locale.getdefaultlocale.return_value = ['foo', 'bar']
-            mock_locale.return_value = ['foo', 'bar']
-            mock_subprocess.check_output.return_value = mock_res
-            res = self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == [call()]
-        assert mock_chdir.mock_calls == [
-            call('/repo/path'),
-            call('/my/pwd')
-        ]
-        assert mock_subprocess.mock_calls == [
-            call.check_output(
-                ['./.rebuildbot.sh'],
-                stderr=mock_subprocess.STDOUT
-            ),
-            call.check_output().decode('bar')
-        ]
-        assert res == mock_res.decode.return_value
-        assert mock_res.mock_calls == [
-            call.decode('bar')
-        ]
 
-    @pytest.mark.skipif(sys.version_info[0] < 3,
-                        reason='not running py3 test on %d.%d.%d' % (
-                            sys.version_info[0],
-                            sys.version_info[1],
-                            sys.version_info[2]
-                        ))
-    def test_run_build_exception_py3(self):
-        ex = Exception('foo')
+class TestUrlHost(object):
 
-        def se_exc(foo, stderr=None):
-            raise ex
+    def test_ssh(self):
+        assert url_host('git@github.com:foo/bar.git') == 'github.com'
 
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess,\
-                patch('%s.locale' % pbm) as mock_locale:
-            mock_getcwd.return_value = '/my/pwd'
-            mock_locale.getdefaultlocale.return_value = ['foo', 'bar']
-            mock_subprocess.check_output.side_effect = se_exc
-            with pytest.raises(Exception) as excinfo:
-                self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == [call()]
-        assert mock_chdir.mock_calls == [
-            call('/repo/path'),
-            call('/my/pwd')
-        ]
-        assert mock_subprocess.mock_calls == [
-            call.check_output(
-                ['./.rebuildbot.sh'],
-                stderr=mock_subprocess.STDOUT
-            )
-        ]
-        assert excinfo.value == ex
-
-    @pytest.mark.skipif(sys.version_info[0] < 3,
-                        reason='not running py3 test on %d.%d.%d' % (
-                            sys.version_info[0],
-                            sys.version_info[1],
-                            sys.version_info[2]
-                        ))
-    def test_run_build_dry_run_py3(self):
-        self.cls.dry_run = True
+    def test_https(self):
+        assert url_host('https://github.com/foo/bar.git') == 'github.com'
 
-        with patch('%s.os.getcwd' % pbm) as mock_getcwd, \
-                patch('%s.os.chdir' % pbm) as mock_chdir, \
-                patch('%s.subprocess' % pbm, autospec=True) as mock_subprocess,\
-                patch('%s.locale' % pbm) as mock_locale:
-            mock_getcwd.return_value = '/my/pwd'
-            mock_locale.getdefaultlocale.return_value = ['foo', 'bar']
-            res = self.cls.run_build('/repo/path')
-        assert mock_getcwd.mock_calls == []
-        assert mock_chdir.mock_calls == []
-        assert mock_subprocess.mock_calls == []
-        assert res == 'DRY RUN'
+    def test_ssh_scheme(self):
+        assert url_host('ssh://git@example.com:22/foo.git') == 'example.com'
@@ -0,0 +1,147 @@
+"""
+rebuildbot/tests/test_manifest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+
+import pytest
+
+from rebuildbot.manifest import (parse_manifest, positive_int, positive_float,
+                                 string_list, cache_list)
+from rebuildbot.exceptions import ManifestError
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.manifest'
+
+
+class TestConverters(object):
+
+    def test_positive_int(self):
+        assert positive_int(10) == 10
+        assert positive_int('3') == 3
+
+    def test_positive_int_invalid(self):
+        for val in [0, -1, True, 'foo']:
+            with pytest.raises(ValueError):
+                positive_int(val)
+
+    def test_positive_float(self):
+        assert positive_float(0.5) == 0.5
+        assert positive_float(2) == 2.0
+
+    def test_positive_float_invalid(self):
+        for val in [0, -0.5, False]:
+            with pytest.raises(ValueError):
+                positive_float(val)
+
+    def test_string_list(self):
+        assert string_list(['a', 1]) == ['a', '1']
+        assert string_list('a, b c') == ['a', 'b', 'c']
+
+    def test_string_list_invalid(self):
+        with pytest.raises(ValueError):
+            string_list({'a': 'b'})
+
+    def test_cache_list(self):
+        assert cache_list('pip npm') == ['pip', 'npm']
+
+    def test_cache_list_invalid(self):
+        with pytest.raises(ValueError) as excinfo:
+            cache_list(['pip', 'foo'])
+        assert "unknown cache 'foo'" in str(excinfo.value)
+
+
+class TestParseManifest(object):
+
+    def test_parse(self):
+        text = "timeout: 600\n" \
+               "expected_duration: 120\n" \
+               "clone_depth: 1\n" \
+               "tags: [docker, vagrant]\n" \
+               "rebuild_interval: 3.5\n" \
+               "caches: pip\n"
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = parse_manifest(text, 'me/repo')
+        assert res == {
+            'timeout': 600,
+            'expected_duration': 120,
+            'clone_depth': 1,
+            'tags': ['docker', 'vagrant'],
+            'rebuild_interval': 3.5,
+            'caches': ['pip'],
+        }
+        assert mock_logger.mock_calls == []
+
+    def test_parse_empty(self):
+        assert parse_manifest('', 'me/repo') == {}
+        assert parse_manifest('# nothing here\n', 'me/repo') == {}
+
+    def test_parse_unknown_key(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = parse_manifest("foo: bar\ntimeout: 5\n", 'me/repo')
+        assert res == {'timeout': 5}
+        assert mock_logger.mock_calls == [
+            call.warning("Ignoring unknown key '%s' in %s of %s", 'foo',
+                         '.rebuildbot.yml', 'me/repo')
+        ]
+
+    def test_parse_invalid_yaml(self):
+        with pytest.raises(ManifestError) as excinfo:
+            parse_manifest("timeout: [1\n", 'me/repo')
+        assert excinfo.value.repo == 'me/repo'
+        assert 'not valid YAML' in excinfo.value.problem
+
+    def test_parse_not_mapping(self):
+        with pytest.raises(ManifestError) as excinfo:
+            parse_manifest("- timeout\n", 'me/repo')
+        assert excinfo.value.message == "Invalid .rebuildbot.yml in " \
+            "me/repo: must be a mapping of settings"
+
+    def test_parse_invalid_value(self):
+        with pytest.raises(ManifestError) as excinfo:
+            parse_manifest("clone_depth: foo\n", 'me/repo')
+        assert excinfo.value.problem.startswith("'clone_depth' ")
@@ -0,0 +1,196 @@
+"""
+rebuildbot/tests/test_prefetch.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import threading
+
+from rebuildbot.prefetch import Prefetcher, DEFAULT_MIN_FREE_MB
+from rebuildbot.buildinfo import BuildInfo
+from rebuildbot.reaper import Reaper
+from rebuildbot.workspace import WorkspaceManager
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import Mock, patch, call
+else:
+    from unittest.mock import Mock, patch, call
+
+pbm = 'rebuildbot.prefetch'
+pb = '%s.Prefetcher' % pbm
+pblb = 'rebuildbot.local_build.LocalBuild'  # imported when used
+
+
+class TestPrefetcher(object):
+
+    def setup(self):
+        self.reaper = Mock(spec_set=Reaper)
+        self.cls = Prefetcher(2, reaper=self.reaper)
+        self.b1 = BuildInfo('me/a', run_local=True, repo_size=100)
+        self.b2 = BuildInfo('me/b', run_local=True)
+        self.b3 = BuildInfo('me/c', run_local=True)
+
+    def test_init(self):
+        assert self.cls.depth == 2
+        assert self.cls.workspaces is None
+        assert self.cls.reaper == self.reaper
+        assert self.cls.min_free_mb == DEFAULT_MIN_FREE_MB
+        assert self.cls.entries == {}
+        assert self.cls.thread.daemon is True
+
+    def test_prefetch_take(self):
+        def se_clone(self):
+            return ('/tmp/' + self.repo_name, 'str_' + self.repo_name)
+
+        with patch('%s.clone_repo' % pblb,
+                   autospec=True) as m_clone, \
+                patch('%s.has_space_for' % pb) as mock_space:
+            m_clone.side_effect = se_clone
+            mock_space.return_value = True
+            self.cls.prefetch([('me/a', self.b1), ('me/b', self.b2),
+                               ('me/c', self.b3)])
+            # already queued; not queued again
+            self.cls.prefetch([('me/b', self.b2)])
+            self.cls.queue.join()
+        assert sorted(self.cls.entries.keys()) == ['me/a', 'me/b']
+        assert m_clone.call_count == 2
+        assert self.cls.take('me/a') == ('/tmp/me/a', 'str_me/a')
+        assert self.cls.take('me/a') is None
+        assert self.cls.take('me/c') is None
+        assert sorted(self.cls.entries.keys()) == ['me/b']
+
+    def test_take_waits(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def se_clone(self):
+            started.set()
+            release.wait()
+            return ('/tmp/a', 'str')
+
+        with patch('%s.clone_repo' % pblb,
+                   autospec=True) as m_clone, \
+                patch('%s.has_space_for' % pb) as mock_space:
+            m_clone.side_effect = se_clone
+            mock_space.return_value = True
+            self.cls.prefetch([('me/a', self.b1)])
+            started.wait()
+            threading.Timer(0.1, release.set).start()
+            assert self.cls.take('me/a') == ('/tmp/a', 'str')
+
+    def test_prefetch_failure(self):
+        with patch('%s.clone_repo' % pblb) as m_clone, \
+                patch('%s.has_space_for' % pb) as mock_space, \
+                patch('%s.logger' % pbm):
+            m_clone.side_effect = RuntimeError('foo')
+            mock_space.return_value = True
+            self.cls.prefetch([('me/a', self.b1)])
+            self.cls.queue.join()
+        assert self.cls.take('me/a') is None
+
+    def test_prefetch_no_space(self):
+        with patch('%s.clone_repo' % pblb) as m_clone, \
+                patch('%s.has_space_for' % pb) as mock_space, \
+                patch('%s.logger' % pbm):
+            mock_space.return_value = False
+            self.cls.prefetch([('me/a', self.b1)])
+            self.cls.queue.join()
+        assert m_clone.mock_calls == []
+        assert self.cls.take('me/a') is None
+
+    def test_prefetch_workspaces(self):
+        ws = Mock(spec_set=WorkspaceManager)
+        self.cls.workspaces = ws
+        with patch(pblb) as mock_lb, \
+                patch('%s.has_space_for' % pb) as mock_space:
+            mock_lb.return_value.clone_repo.return_value = ('/ws/a', 's')
+            mock_space.return_value = True
+            self.cls.prefetch([('me/a', self.b1)])
+            self.cls.queue.join()
+        assert mock_lb.mock_calls == [
+            call('me/a', self.b1, workspaces=ws, history=None,
+                 race_clone=False, clone_depth=None),
+            call().clone_repo()
+        ]
+
+    def test_slugs(self):
+        assert self.cls.slugs == []
+        self.cls.entries = {'me/b': {}, 'me/a': {}}
+        assert self.cls.slugs == ['me/a', 'me/b']
+
+    def test_discard_all(self):
+        e1 = {'done': threading.Event(), 'result': ('/tmp/a', 's')}
+        e2 = {'done': threading.Event(), 'result': None}
+        e1['done'].set()
+        e2['done'].set()
+        self.cls.entries = {'me/a': e1, 'me/b': e2}
+        self.cls.discard_all()
+        assert self.cls.entries == {}
+        assert self.reaper.mock_calls == [call.reap('/tmp/a')]
+
+    def test_discard_all_workspaces(self):
+        self.cls.workspaces = Mock(spec_set=WorkspaceManager)
+        e1 = {'done': threading.Event(), 'result': ('/ws/a', 's')}
+        e1['done'].set()
+        self.cls.entries = {'me/a': e1}
+        self.cls.discard_all()
+        assert self.reaper.mock_calls == []
+
+    def test_has_space_for(self):
+        st = Mock(f_bavail=3 * 1024 * 1024, f_frsize=1024)  # 3 GB
+        self.cls.min_free_mb = 1024
+        with patch('%s.os.statvfs' % pbm) as mock_statvfs, \
+                patch('%s.gettempdir' % pbm) as mock_gettempdir:
+            mock_statvfs.return_value = st
+            mock_gettempdir.return_value = '/tmp'
+            assert self.cls.has_space_for(self.b1) is True
+            self.b1.repo_size = 2 * 1024 * 1024 + 1
+            assert self.cls.has_space_for(self.b1) is False
+        assert mock_statvfs.mock_calls == [call('/tmp'), call('/tmp')]
+
+    def test_has_space_for_workspaces(self, tmpdir):
+        ws = Mock(spec_set=WorkspaceManager)
+        type(ws).root = str(tmpdir.join('ws'))
+        self.cls.workspaces = ws
+        self.cls.min_free_mb = 0
+        assert self.cls.has_space_for(self.b2) is True
+        assert tmpdir.join('ws').isdir()
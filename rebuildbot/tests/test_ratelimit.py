@@ -0,0 +1,258 @@
+"""
+rebuildbot/tests/test_ratelimit.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import threading
+
+from rebuildbot.ratelimit import (RateLimiter, TokenBucket, get_header,
+                                  parse_retry_after, DEFAULT_BLOCK, MAX_SLEEP)
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.ratelimit'
+
+
+def headers(remaining, reset, limit=5000):
+    return {
+        'x-ratelimit-remaining': str(remaining),
+        'x-ratelimit-reset': str(reset),
+        'x-ratelimit-limit': str(limit),
+    }
+
+
+class TestHelpers(object):
+
+    def test_get_header(self):
+        h = {'X-RateLimit-Remaining': '12'}
+        assert get_header(h, 'x-ratelimit-remaining') == '12'
+        assert get_header(h, 'Retry-After') is None
+
+    def test_parse_retry_after_seconds(self):
+        assert parse_retry_after('30', 1000) == 1030
+        assert parse_retry_after('-5', 1000) == 1000
+
+    def test_parse_retry_after_date(self):
+        assert parse_retry_after('Thu, 01 Jan 1970 00:20:00 GMT',
+                                 1000) == 1200
+
+    def test_parse_retry_after_invalid(self):
+        assert parse_retry_after('foo', 1000) is None
+
+
+class TestTokenBucket(object):
+
+    def setup(self):
+        self.cls = TokenBucket('github', reserve=10)
+
+    def test_unknown(self):
+        assert self.cls.wait_time(1000) == 0
+        self.cls.take(1000)
+        assert self.cls.remaining is None
+        assert self.cls.last_grant == 1000
+
+    def test_plenty(self):
+        self.cls.update(200, headers(4000, 2000), 1000)
+        assert self.cls.remaining == 4000
+        assert self.cls.limit == 5000
+        assert self.cls.reset == 2000
+        assert self.cls.wait_time(1000) == 0
+        self.cls.take(1000)
+        assert self.cls.remaining == 3999
+
+    def test_exhausted(self):
+        self.cls.update(200, headers(10, 2000), 1000)
+        assert self.cls.wait_time(1500) == 500
+        # new window
+        assert self.cls.wait_time(2000) == 0
+
+    def test_pacing(self):
+        # 100 requests left in 1000 seconds: one every 10 seconds
+        self.cls.update(200, headers(111, 2000), 1000)
+        self.cls.take(1000)
+        assert self.cls.wait_time(1000) == 10.0
+        # the interval is recomputed from the time left: 996s / 100
+        assert round(self.cls.wait_time(1004), 2) == 5.96
+        assert self.cls.wait_time(1011) == 0
+
+    def test_update_out_of_order(self):
+        self.cls.update(200, headers(100, 2000), 1000)
+        self.cls.update(200, headers(102, 2000), 1000)
+        assert self.cls.remaining == 100
+        # window reset
+        self.cls.update(200, headers(4999, 5600), 2001)
+        assert self.cls.remaining == 4999
+        assert self.cls.reset == 5600
+
+    def test_update_no_headers(self):
+        self.cls.update(200, {}, 1000)
+        assert self.cls.remaining is None
+        assert self.cls.blocked_until is None
+
+    def test_update_invalid(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.update(200, {'X-RateLimit-Remaining': 'foo'}, 1000)
+        assert self.cls.remaining is None
+        assert mock_logger.mock_calls == [
+            call.debug("Ignoring unparseable %s rate-limit headers", 'github')
+        ]
+
+    def test_429_retry_after(self):
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.update(429, {'Retry-After': '120'}, 1000)
+        assert self.cls.blocked_until == 1120
+        assert self.cls.wait_time(1020) == 100
+        assert self.cls.wait_time(1120) == 0
+        assert mock_logger.mock_calls == [
+            call.warning("%s rate limit exceeded (HTTP %s); pausing requests "
+                         "for %d seconds", 'github', 429, 120)
+        ]
+
+    def test_429_no_retry_after(self):
+        with patch('%s.logger' % pbm):
+            self.cls.update(429, {}, 1000)
+        assert self.cls.blocked_until == 1000 + DEFAULT_BLOCK
+
+    def test_403_exhausted(self):
+        with patch('%s.logger' % pbm):
+            self.cls.update(403, headers(0, 1300), 1000)
+        assert self.cls.blocked_until == 1300
+
+    def test_403_other(self):
+        self.cls.update(403, headers(4000, 1300), 1000)
+        assert self.cls.blocked_until is None
+
+
+class TestRateLimiter(object):
+
+    def setup(self):
+        self.cls = RateLimiter(reserve=10)
+
+    def test_init(self):
+        assert self.cls.reserve == 10
+        assert self.cls.buckets == {}
+        assert self.cls.usage == {}
+        assert self.cls.current_phase == 'other'
+
+    def test_bucket(self):
+        b = self.cls.bucket('github')
+        assert isinstance(b, TokenBucket)
+        assert b.reserve == 10
+        assert self.cls.bucket('github') is b
+
+    def test_phase(self):
+        with self.cls.phase('discovery'):
+            assert self.cls.current_phase == 'discovery'
+            with self.cls.phase('builds'):
+                assert self.cls.current_phase == 'builds'
+            assert self.cls.current_phase == 'discovery'
+        assert self.cls.current_phase == 'other'
+
+    def test_phase_per_thread(self):
+        res = []
+        with self.cls.phase('discovery'):
+            t = threading.Thread(
+                target=lambda: res.append(self.cls.current_phase))
+            t.start()
+            t.join()
+        assert res == ['other']
+
+    def test_acquire(self):
+        with patch('%s.time.sleep' % pbm) as mock_sleep:
+            with self.cls.phase('discovery'):
+                self.cls.acquire('github')
+                self.cls.acquire('github')
+            self.cls.acquire('travis')
+        assert mock_sleep.mock_calls == []
+        assert self.cls.usage == {
+            'discovery': {'github': [2, 0]},
+            'other': {'travis': [1, 0]},
+        }
+
+    def test_acquire_wait(self):
+        self.cls.observe('github', 200, headers(10, 2000))
+        times = [1000, 1000 + MAX_SLEEP, 1100, 2000]
+
+        with patch('%s.time.sleep' % pbm) as mock_sleep, \
+                patch('%s.time.time' % pbm) as mock_time:
+            mock_time.side_effect = times
+            self.cls.acquire('github')
+        # each sleep is at most MAX_SLEEP, then the wait is recomputed
+        assert mock_sleep.mock_calls == [call(MAX_SLEEP)] * 3
+        assert self.cls.usage == {'other': {'github': [1, 3 * MAX_SLEEP]}}
+
+    def test_observe(self):
+        with patch('%s.time.time' % pbm) as mock_time:
+            mock_time.return_value = 1000
+            self.cls.observe('github', 200, headers(4000, 2000))
+        assert self.cls.bucket('github').remaining == 4000
+
+    def test_summary(self):
+        self.cls.usage = {
+            'discovery': {'travis': [3, 0], 'github': [5, 1.5]},
+            'builds': {'travis': [7, 0]},
+        }
+        assert self.cls.summary() == [
+            {'phase': 'builds', 'service': 'travis', 'requests': 7,
+             'waited': 0},
+            {'phase': 'discovery', 'service': 'github', 'requests': 5,
+             'waited': 1.5},
+            {'phase': 'discovery', 'service': 'travis', 'requests': 3,
+             'waited': 0},
+        ]
+
+    def test_log_summary(self):
+        self.cls.usage = {'discovery': {'github': [5, 1.5]}}
+        self.cls.bucket('github').remaining = 4321
+        self.cls.bucket('travis')
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.log_summary()
+        assert mock_logger.mock_calls == [
+            call.info("API usage: %s phase made %d %s requests (%.0fs "
+                      "waiting for rate limit)", 'discovery', 5, 'github',
+                      1.5),
+            call.info("%s rate limit: %d requests remaining", 'github', 4321)
+        ]
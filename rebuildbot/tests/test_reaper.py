@@ -0,0 +1,137 @@
+"""
+rebuildbot/tests/test_reaper.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import time
+
+from rebuildbot.reaper import Reaper, REAP_PREFIX
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.reaper'
+
+
+class TestReaper(object):
+
+    def setup(self):
+        self.cls = Reaper()
+
+    def test_init(self):
+        assert self.cls.thread.daemon is True
+        assert self.cls.thread.is_alive() is True
+
+    def test_reap(self, tmpdir):
+        d = tmpdir.mkdir('rebuildbot_abc')
+        d.mkdir('sub').join('file').write('foo')
+        self.cls.reap(str(d))
+        # the original path is free immediately
+        assert d.exists() is False
+        self.cls.wait()
+        assert tmpdir.listdir() == []
+
+    def test_reap_nonexistent(self, tmpdir):
+        with patch.object(self.cls.queue, 'put') as mock_put:
+            self.cls.reap(str(tmpdir.join('foo')))
+        assert mock_put.mock_calls == []
+
+    def test_reap_rename_fails(self, tmpdir):
+        d = tmpdir.mkdir('rebuildbot_abc')
+        with patch('%s.os.rename' % pbm) as mock_rename, \
+                patch.object(self.cls.queue, 'put') as mock_put:
+            mock_rename.side_effect = OSError('foo')
+            self.cls.reap(str(d) + '/')
+        assert mock_put.mock_calls == [call(str(d))]
+
+    def test_sweep(self, tmpdir):
+        old = time.time() - 2 * 86400
+        tmpdir.mkdir('rebuildbot_new')
+        o = tmpdir.mkdir('rebuildbot_old')
+        os.utime(str(o), (old, old))
+        tmpdir.mkdir(REAP_PREFIX + 'foo')
+        tmpdir.mkdir('other')
+        tmpdir.join('rebuildbot_file').write('foo')
+        with patch.object(self.cls.queue, 'put') as mock_put:
+            res = self.cls.sweep(str(tmpdir))
+        assert res == 2
+        assert mock_put.mock_calls == [
+            call(str(tmpdir.join(REAP_PREFIX + 'foo'))),
+            call(str(o)),
+        ]
+
+    def test_sweep_no_clones(self, tmpdir):
+        old = time.time() - 2 * 86400
+        # a workspace whose owner starts with the temporary clone prefix
+        ws = tmpdir.mkdir('rebuildbot__foo')
+        os.utime(str(ws), (old, old))
+        tmpdir.mkdir(REAP_PREFIX + 'foo')
+        with patch.object(self.cls.queue, 'put') as mock_put:
+            res = self.cls.sweep(str(tmpdir), clones=False)
+        assert res == 1
+        assert mock_put.mock_calls == [
+            call(str(tmpdir.join(REAP_PREFIX + 'foo'))),
+        ]
+
+    def test_sweep_default_dir(self, tmpdir):
+        with patch('%s.gettempdir' % pbm) as mock_gettempdir:
+            mock_gettempdir.return_value = str(tmpdir)
+            assert self.cls.sweep() == 0
+        assert mock_gettempdir.mock_calls == [call()]
+
+    def test_sweep_missing_dir(self, tmpdir):
+        assert self.cls.sweep(str(tmpdir.join('foo'))) == 0
+
+    def test_run_error(self, tmpdir):
+        with patch('%s.rmtree' % pbm) as mock_rmtree, \
+                patch('%s.logger' % pbm) as mock_logger:
+            mock_rmtree.side_effect = RuntimeError('foo')
+            self.cls.queue.put('/foo')
+            self.cls.wait()
+        assert mock_rmtree.mock_calls == [call('/foo', ignore_errors=True)]
+        assert mock_logger.exception.mock_calls == [
+            call("Error removing %s", '/foo')
+        ]
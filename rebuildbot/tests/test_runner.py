@@ -38,10 +38,28 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import sys
+import time as systime
 import pytest
+import subprocess
 import logging
-from rebuildbot.runner import (Runner, console_entry_point)
+import argparse
+from datetime import time
+from rebuildbot.runner import (Runner, console_entry_point, repo_timeout,
+                               deadline_time, cache_limit, resource_tag,
+                               tag_limit, http_timeout)
 from rebuildbot.version import (_VERSION, _PROJECT_URL)
+from rebuildbot.scheduler import POLICIES
+from rebuildbot.workspace import DEFAULT_MAX_SIZE_MB
+from rebuildbot.prefetch import DEFAULT_MIN_FREE_MB
+from rebuildbot.admission import DEFAULT_CGROUP_ROOT, IONICE_CLASSES
+from rebuildbot.history import (DEFAULT_REGRESSION_WINDOW,
+                                DEFAULT_REGRESSION_THRESHOLD)
+from rebuildbot.webhook import DEFAULT_WEBHOOK_WINDOW
+from rebuildbot.defaults import DEFAULT_RETRIES
+from rebuildbot.ratelimit import DEFAULT_RESERVE
+from rebuildbot.circuitbreaker import (DEFAULT_FAILURE_THRESHOLD,
+                                       DEFAULT_MAX_OUTAGE)
+from rebuildbot.authcache import DEFAULT_AUTH_TTL
 
 # https://code.google.com/p/mock/issues/detail?id=249
 # py>=3.4 should use unittest.mock not the mock package on pypi
@@ -54,8 +72,75 @@ else:
     from unittest.mock import patch, call, Mock
 
 pbm = 'rebuildbot.runner'  # patch base path for this module
+pbb = 'rebuildbot.bot.ReBuildBot'  # imported when used
 pb = 'rebuildbot.runner.Runner'  # patch base for class
 
+STARTUP_BUDGET = 0.3
+"""
+seconds ``rebuildbot --version`` may take, beyond starting the interpreter
+"""
+
+HEAVY_MODULES = ['boto', 'git', 'github', 'jinja2', 'pytz', 'requests',
+                 'travispy', 'tzlocal', 'rebuildbot.bot']
+"""modules that must not be imported just to parse the command line"""
+
+
+def bot_call(**kwargs):
+    """
+    Return the expected call to the ReBuildBot constructor for bucket
+    'bktname', with the default value for every option not in ``kwargs``.
+    """
+    kw = {
+        's3_prefix': 'rebuildbot',
+        'dry_run': False,
+        'date_check': True,
+        'run_travis': True,
+        'run_local': True,
+        'ignore_repos': [],
+        'schedule': 'alphabetical',
+        'state_dir': None,
+        'build_timeout': None,
+        'inactivity_timeout': None,
+        'repo_timeouts': {},
+        'deadline': None,
+        'time_budget': None,
+        'max_repos': None,
+        'stale_after': None,
+        'persistent_workspaces': False,
+        'workspace_max_size': DEFAULT_MAX_SIZE_MB,
+        'caches': [],
+        'cache_limits': {},
+        'prefetch': 0,
+        'prefetch_min_free': DEFAULT_MIN_FREE_MB,
+        'race_clone': False,
+        'local_workers': 1,
+        'max_load': None,
+        'min_free_memory': None,
+        'min_free_disk': None,
+        'build_nice': None,
+        'build_ionice': None,
+        'build_cpu_limit': None,
+        'build_memory_limit': None,
+        'cgroup_root': DEFAULT_CGROUP_ROOT,
+        'repo_tags': {},
+        'tag_limits': {},
+        'regression_window': DEFAULT_REGRESSION_WINDOW,
+        'regression_threshold': DEFAULT_REGRESSION_THRESHOLD,
+        'webhook_port': None,
+        'webhook_window': DEFAULT_WEBHOOK_WINDOW,
+        'http_retries': DEFAULT_RETRIES,
+        'http_timeouts': {},
+        'rate_limit_reserve': DEFAULT_RESERVE,
+        'breaker_threshold': DEFAULT_FAILURE_THRESHOLD,
+        'max_outage': DEFAULT_MAX_OUTAGE,
+        'max_travis_in_flight': None,
+        'travis_attach': True,
+        'cancel_stale_travis': False,
+        'auth_cache_ttl': DEFAULT_AUTH_TTL,
+    }
+    kw.update(kwargs)
+    return call('bktname', **kw)
+
 
 class TestConsoleEntryPoint(object):
 
@@ -68,6 +153,87 @@ class TestConsoleEntryPoint(object):
         ]
 
 
+class TestRepoTimeout(object):
+
+    def test_ok(self):
+        assert repo_timeout('foo/bar=3600') == ('foo/bar', 3600)
+
+    def test_no_equals(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            repo_timeout('foo/bar')
+
+    def test_not_int(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            repo_timeout('foo/bar=baz')
+
+
+class TestCacheLimit(object):
+
+    def test_ok(self):
+        assert cache_limit('pip=1024') == ('pip', 1024)
+
+    def test_not_int(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cache_limit('pip=foo')
+
+    def test_bad_name(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cache_limit('foo=1024')
+
+
+class TestHttpTimeout(object):
+
+    def test_ok(self):
+        assert http_timeout('github=10') == ('github', 10)
+
+    def test_not_int(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            http_timeout('github=foo')
+
+    def test_bad_name(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            http_timeout('foo=10')
+
+
+class TestResourceTag(object):
+
+    def test_ok(self):
+        assert resource_tag('foo/bar=docker') == ('foo/bar', ['docker'])
+
+    def test_multiple(self):
+        assert resource_tag('foo/bar=docker, virtualbox') == (
+            'foo/bar', ['docker', 'virtualbox']
+        )
+
+    def test_no_equals(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            resource_tag('foo/bar')
+
+    def test_no_tags(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            resource_tag('foo/bar=,')
+
+
+class TestTagLimit(object):
+
+    def test_ok(self):
+        assert tag_limit('virtualbox=1') == ('virtualbox', 1)
+
+    def test_not_int(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            tag_limit('virtualbox=foo')
+
+
+class TestDeadlineTime(object):
+
+    def test_ok(self):
+        assert deadline_time('06:30') == time(6, 30)
+
+    def test_invalid(self):
+        with pytest.raises(argparse.ArgumentTypeError):
+            deadline_time('6am')
+
+
 class TestRunner(object):
 
     def setup(self):
@@ -121,8 +287,256 @@ class TestRunner(object):
                                 default=[], action='append',
                                 help='repository slugs (USER/REPO) to '
                                      'completely ignore'),
+            call().add_argument('--schedule', dest='schedule',
+                                action='store', type=str,
+                                choices=POLICIES, default='alphabetical',
+                                help='order in which to start local builds; '
+                                '"longest-first" and "shortest-first" use '
+                                'durations recorded in previous runs '
+                                '(default: alphabetical)'),
+            call().add_argument('--state-dir', dest='state_dir',
+                                action='store', type=str, default=None,
+                                help='directory to store persistent state '
+                                'such as build history in (default: '
+                                '~/.rebuildbot)'),
+            call().add_argument('--build-timeout', dest='build_timeout',
+                                action='store', type=int, default=None,
+                                help='kill any local build that runs for '
+                                'longer than this many seconds (default: no '
+                                'timeout)'),
+            call().add_argument('--inactivity-timeout',
+                                dest='inactivity_timeout', action='store',
+                                type=int, default=None,
+                                help='kill any local build that produces no '
+                                'output for this many seconds (default: no '
+                                'timeout)'),
+            call().add_argument('--repo-timeout', dest='repo_timeouts',
+                                default=[], action='append',
+                                type=repo_timeout,
+                                help='USER/REPO=SECONDS timeout for one '
+                                'repository\'s local build, overriding '
+                                '--build-timeout. Can be specified multiple '
+                                'times.'),
+            call().add_argument('--deadline', dest='deadline',
+                                action='store', type=deadline_time,
+                                default=None,
+                                help='local time (HH:MM, 24-hour) by which '
+                                'the run must finish; local builds not '
+                                'expected to finish in time are skipped, and '
+                                'at the deadline any remaining work is '
+                                'abandoned and the report published'),
+            call().add_argument('--time-budget', dest='time_budget',
+                                action='store', type=int, default=None,
+                                help='like --deadline, but the run must '
+                                'finish this many seconds after it starts'),
+            call().add_argument('--max-repos', dest='max_repos',
+                                action='store', type=int, default=None,
+                                help='when discovering projects, only build '
+                                'this many, choosing those whose last '
+                                'successful rebuild is oldest; successive '
+                                'runs rotate through all projects'),
+            call().add_argument('--stale-after', dest='stale_after',
+                                action='store', type=int, default=None,
+                                help='when discovering projects, skip any '
+                                'that have been successfully rebuilt within '
+                                'this many days'),
+            call().add_argument('--persistent-workspaces',
+                                dest='persistent_workspaces',
+                                action='store_true', default=False,
+                                help='keep a clone of each repository under '
+                                'the state directory and update it before '
+                                'each local build, preserving ignored files '
+                                '(i.e. installed dependencies) between runs, '
+                                'instead of cloning fresh every time'),
+            call().add_argument('--workspace-max-size',
+                                dest='workspace_max_size', action='store',
+                                type=int, default=DEFAULT_MAX_SIZE_MB,
+                                help='maximum total size of persistent '
+                                'workspaces in MB; least recently used '
+                                'workspaces are removed above this '
+                                '(default: %d)' % DEFAULT_MAX_SIZE_MB),
+            call().add_argument('--cache', dest='caches', action='append',
+                                default=[],
+                                choices=['bundler', 'npm', 'pip', 'vagrant'],
+                                help='keep this shared dependency cache under '
+                                'the state directory and export it to local '
+                                'builds. Can be specified multiple times.'),
+            call().add_argument('--cache-limit', dest='cache_limits',
+                                action='append', default=[],
+                                type=cache_limit,
+                                help='NAME=MB size limit for a shared cache, '
+                                'above which least recently used entries are '
+                                'removed. Can be specified multiple times.'),
+            call().add_argument('--prefetch', dest='prefetch',
+                                action='store', type=int, default=0,
+                                help='clone this many upcoming repositories '
+                                'in the background while each local build '
+                                'runs (default: 0, disabled)'),
+            call().add_argument('--prefetch-min-free',
+                                dest='prefetch_min_free', action='store',
+                                type=int, default=DEFAULT_MIN_FREE_MB,
+                                help='only prefetch a repository if at least '
+                                'this many MB of disk space would remain '
+                                'free (default: %d)' % DEFAULT_MIN_FREE_MB),
+            call().add_argument('--race-clone', dest='race_clone',
+                                action='store_true', default=False,
+                                help='for repositories with no known working '
+                                'clone protocol, clone from the SSH and HTTPS '
+                                'URLs concurrently and use whichever '
+                                'finishes first'),
+            call().add_argument('--local-workers', dest='local_workers',
+                                action='store', type=int, default=1,
+                                help='maximum number of local builds to run '
+                                'at once (default: 1)'),
+            call().add_argument('--max-load', dest='max_load', action='store',
+                                type=float, default=None,
+                                help='only start a local build while the '
+                                '1-minute load average is at most this'),
+            call().add_argument('--min-free-memory', dest='min_free_memory',
+                                action='store', type=int, default=None,
+                                help='only start a local build while at '
+                                'least this many MB of memory are '
+                                'available'),
+            call().add_argument('--min-free-disk', dest='min_free_disk',
+                                action='store', type=int, default=None,
+                                help='only start a local build while at '
+                                'least this many MB of disk are free where '
+                                'builds are cloned'),
+            call().add_argument('--nice', dest='build_nice', action='store',
+                                type=int, default=None,
+                                help='run local builds at this niceness'),
+            call().add_argument('--ionice', dest='build_ionice',
+                                action='store',
+                                choices=sorted(IONICE_CLASSES), default=None,
+                                help='run local builds in this I/O '
+                                'scheduling class'),
+            call().add_argument('--cpu-limit', dest='build_cpu_limit',
+                                action='store', type=float, default=None,
+                                help='limit each local build to this many '
+                                'CPUs, using a cgroup (v2) under '
+                                '--cgroup-root'),
+            call().add_argument('--memory-limit', dest='build_memory_limit',
+                                action='store', type=int, default=None,
+                                help='limit each local build to this many MB '
+                                'of memory, using a cgroup (v2) under '
+                                '--cgroup-root'),
+            call().add_argument('--cgroup-root', dest='cgroup_root',
+                                action='store', type=str,
+                                default=DEFAULT_CGROUP_ROOT,
+                                help='delegated cgroup v2 directory to '
+                                'create per-build cgroups in (default: %s)' %
+                                DEFAULT_CGROUP_ROOT),
+            call().add_argument('--resource-tag', dest='repo_tags',
+                                action='append', default=[],
+                                type=resource_tag,
+                                help='USER/REPO=TAG[,TAG...] resource tags '
+                                'for a repository\'s local builds, in '
+                                'addition to any in its .rebuildbot.yml. '
+                                'Can be specified multiple times.'),
+            call().add_argument('--tag-limit', dest='tag_limits',
+                                action='append', default=[], type=tag_limit,
+                                help='TAG=N maximum number of local builds '
+                                'with a resource tag to run at once. Can be '
+                                'specified multiple times.'),
+            call().add_argument('--regression-window',
+                                dest='regression_window', action='store',
+                                type=int, default=DEFAULT_REGRESSION_WINDOW,
+                                help='number of past passed builds of each '
+                                'repository to compare build durations to '
+                                '(default: %d)' % DEFAULT_REGRESSION_WINDOW),
+            call().add_argument('--regression-threshold',
+                                dest='regression_threshold', action='store',
+                                type=float,
+                                default=DEFAULT_REGRESSION_THRESHOLD,
+                                help='minimum percent slowdown of a build, '
+                                'compared to its past builds, to flag as a '
+                                'regression (default: %d)' %
+                                DEFAULT_REGRESSION_THRESHOLD),
+            call().add_argument('--fail-on-regression',
+                                dest='fail_on_regression',
+                                action='store_true', default=False,
+                                help='exit non-zero if any build duration '
+                                'regressions are found'),
+            call().add_argument('--webhook-port', dest='webhook_port',
+                                action='store', type=int, default=None,
+                                help='receive Travis webhook notifications '
+                                'on this port, and only poll Travis for '
+                                'builds that have not reported within '
+                                '--webhook-window'),
+            call().add_argument('--webhook-window', dest='webhook_window',
+                                action='store', type=int,
+                                default=DEFAULT_WEBHOOK_WINDOW,
+                                help='seconds, beyond its expected duration, '
+                                'to wait for a webhook notification of a '
+                                'Travis build before polling for it '
+                                '(default: %d)' % DEFAULT_WEBHOOK_WINDOW),
+            call().add_argument('--http-retries', dest='http_retries',
+                                action='store', type=int,
+                                default=DEFAULT_RETRIES,
+                                help='number of times to retry failed '
+                                'requests to Travis, GitHub and S3, with '
+                                'jittered exponential backoff (default: '
+                                '%d)' % DEFAULT_RETRIES),
+            call().add_argument('--http-timeout', dest='http_timeouts',
+                                action='append', default=[],
+                                type=http_timeout,
+                                help='SERVICE=SECONDS request timeout for '
+                                'travis, github or s3 (defaults: github=30, '
+                                's3=60, travis=30). Can be specified multiple '
+                                'times.'),
+            call().add_argument('--rate-limit-reserve',
+                                dest='rate_limit_reserve', action='store',
+                                type=int, default=DEFAULT_RESERVE,
+                                help='number of requests in each GitHub and '
+                                'Travis rate-limit window to leave unused; '
+                                'requests are paced, and wait for the window '
+                                'to reset, to stay above this (default: '
+                                '%d)' % DEFAULT_RESERVE),
+            call().add_argument('--breaker-threshold',
+                                dest='breaker_threshold', action='store',
+                                type=int, default=DEFAULT_FAILURE_THRESHOLD,
+                                help='number of consecutive failed calls to '
+                                'Travis or GitHub after which to stop calling '
+                                'it, with exponential backoff, until it '
+                                'recovers (default: %d)' %
+                                DEFAULT_FAILURE_THRESHOLD),
+            call().add_argument('--max-outage', dest='max_outage',
+                                action='store', type=int,
+                                default=DEFAULT_MAX_OUTAGE,
+                                help='seconds Travis may be unavailable before '
+                                'giving up on its unfinished builds, and '
+                                'Travis or GitHub before giving up on '
+                                'discovering its projects (default: %d)' %
+                                DEFAULT_MAX_OUTAGE),
+            call().add_argument('--max-travis-in-flight',
+                                dest='max_travis_in_flight', action='store',
+                                type=int, default=None,
+                                help='maximum number of Travis builds to have '
+                                'triggered and not yet finished at once; the '
+                                'rest are triggered as those finish '
+                                '(default: no limit)'),
+            call().add_argument('--always-trigger', dest='travis_attach',
+                                action='store_false', default=True,
+                                help='trigger a new Travis build even if one '
+                                'of the repository is already pending or '
+                                'running, instead of using that build'),
+            call().add_argument('--cancel-stale-travis',
+                                dest='cancel_stale_travis',
+                                action='store_true', default=False,
+                                help='cancel pending or running Travis builds '
+                                'that rebuildbot triggered previously, other '
+                                'than the one it uses'),
+            call().add_argument('--auth-cache-ttl', dest='auth_cache_ttl',
+                                action='store', type=int,
+                                default=DEFAULT_AUTH_TTL,
+                                help='seconds to cache the Travis access '
+                                'token and the S3 bucket endpoint for, under '
+                                'the state directory; 0 to not cache them '
+                                '(default: %d)' % DEFAULT_AUTH_TTL),
             call().add_argument('BUCKET_NAME', action='store', type=str,
-                                help='Name of S3 bucket to upload reports to'),
+                                nargs='?',
+                                help='Name of S3 bucket to upload reports to; '
+                                'required unless --version is given'),
             call().parse_args([]),
         ]
 
@@ -143,6 +557,18 @@ class TestRunner(object):
         res = self.cls.parse_args(['-V', 'bktname'])
         assert res.version is True
 
+    def test_parse_args_version_no_bucket(self):
+        res = self.cls.parse_args(['-V'])
+        assert res.version is True
+        assert res.BUCKET_NAME is None
+
+    def test_parse_args_no_bucket(self, capsys):
+        with pytest.raises(SystemExit) as excinfo:
+            self.cls.parse_args(['-v'])
+        assert excinfo.value.code == 2
+        out, err = capsys.readouterr()
+        assert 'required: BUCKET_NAME' in err
+
     def test_parse_args_dry_run(self):
         res = self.cls.parse_args(['-d', 'bktname'])
         assert res.dry_run is True
@@ -184,17 +610,90 @@ class TestRunner(object):
         assert res.run_travis is True
         assert res.run_local is False
 
+    def test_parse_args_schedule(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.schedule == 'alphabetical'
+        assert res.state_dir is None
+        res = self.cls.parse_args(['--schedule=longest-first',
+                                   '--state-dir=/foo', 'bktname'])
+        assert res.schedule == 'longest-first'
+        assert res.state_dir == '/foo'
+
+    def test_parse_args_timeouts(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.build_timeout is None
+        assert res.inactivity_timeout is None
+        assert res.repo_timeouts == []
+        res = self.cls.parse_args([
+            '--build-timeout=3600', '--inactivity-timeout=600',
+            '--repo-timeout=foo/bar=7200', '--repo-timeout', 'foo/baz=60',
+            'bktname'
+        ])
+        assert res.build_timeout == 3600
+        assert res.inactivity_timeout == 600
+        assert res.repo_timeouts == [('foo/bar', 7200), ('foo/baz', 60)]
+
+    def test_parse_args_deadline(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.deadline is None
+        assert res.time_budget is None
+        res = self.cls.parse_args(['--deadline=06:30', '--time-budget=3600',
+                                   'bktname'])
+        assert res.deadline == time(6, 30)
+        assert res.time_budget == 3600
+
+    def test_parse_args_rotation(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.max_repos is None
+        assert res.stale_after is None
+        res = self.cls.parse_args(['--max-repos=10', '--stale-after=7',
+                                   'bktname'])
+        assert res.max_repos == 10
+        assert res.stale_after == 7
+
+    def test_parse_args_workspaces(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.persistent_workspaces is False
+        assert res.workspace_max_size == DEFAULT_MAX_SIZE_MB
+        res = self.cls.parse_args(['--persistent-workspaces',
+                                   '--workspace-max-size=1024', 'bktname'])
+        assert res.persistent_workspaces is True
+        assert res.workspace_max_size == 1024
+
+    def test_parse_args_caches(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.caches == []
+        assert res.cache_limits == []
+        res = self.cls.parse_args(['--cache=pip', '--cache=vagrant',
+                                   '--cache-limit=pip=100', 'bktname'])
+        assert res.caches == ['pip', 'vagrant']
+        assert res.cache_limits == [('pip', 100)]
+
+    def test_parse_args_prefetch(self):
+        res = self.cls.parse_args(['bktname'])
+        assert res.prefetch == 0
+        assert res.prefetch_min_free == DEFAULT_MIN_FREE_MB
+        res = self.cls.parse_args(['--prefetch=2', '--prefetch-min-free=100',
+                                   'bktname'])
+        assert res.prefetch == 2
+        assert res.prefetch_min_free == 100
+        assert res.race_clone is False
+        res = self.cls.parse_args(['--race-clone', 'bktname'])
+        assert res.race_clone is True
+
+    def test_parse_args_schedule_invalid(self):
+        with pytest.raises(SystemExit):
+            self.cls.parse_args(['--schedule=foo', 'bktname'])
+
     def test_console_entry_point(self):
         argv = ['/tmp/rebuildbot/runner.py', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -202,14 +701,12 @@ class TestRunner(object):
     def test_console_entry_point_no_date_check(self):
         argv = ['/tmp/rebuildbot/runner.py', '--no-date-check', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=False, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(date_check=False, log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -217,14 +714,12 @@ class TestRunner(object):
     def test_console_entry_point_prefix(self):
         argv = ['/tmp/rebuildbot/runner.py', '-p', 'my/prefix', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='my/prefix', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(s3_prefix='my/prefix', log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -233,14 +728,12 @@ class TestRunner(object):
         argv = ['/tmp/rebuildbot/runner.py', '-R', 'foo/bar', '-R', 'baz/blam',
                 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(log_buffer=mock_lcs),
             call().run(projects=['foo/bar', 'baz/blam'])
         ]
         assert mock_logger.mock_calls == []
@@ -248,14 +741,12 @@ class TestRunner(object):
     def test_console_entry_point_dry_run(self):
         argv = ['/tmp/rebuildbot/runner.py', '--dry-run', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=True,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(dry_run=True, log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -263,7 +754,7 @@ class TestRunner(object):
     def test_console_entry_point_version(self, capsys):
         argv = ['/tmp/rebuildbot/runner.py', '-V', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm):
                 with pytest.raises(SystemExit) as excinfo:
@@ -279,15 +770,13 @@ class TestRunner(object):
     def test_console_entry_point_verbose1(self):
         argv = ['/tmp/rebuildbot/runner.py', '-v', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.capture_handler' % pbm) as mock_cap_handler, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == [
@@ -300,7 +789,7 @@ class TestRunner(object):
     def test_console_entry_point_verbose2(self):
         argv = ['/tmp/rebuildbot/runner.py', '-vv', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.logging.Formatter' % pbm) as mock_formatter, \
                  patch('%s.capture_handler' % pbm) as mock_cap_handler, \
@@ -310,9 +799,7 @@ class TestRunner(object):
                 type(mock_logger).handlers = [mock_handler, mock_handler2]
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(log_buffer=mock_lcs),
             call().run(projects=None)
         ]
 
@@ -335,14 +822,12 @@ class TestRunner(object):
     def test_console_entry_point_no_travis(self):
         argv = ['/tmp/rebuildbot/runner.py', '--no-travis', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=False, run_local=True,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(run_travis=False, log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -350,14 +835,12 @@ class TestRunner(object):
     def test_console_entry_point_no_local(self):
         argv = ['/tmp/rebuildbot/runner.py', '--no-local', 'bktname']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=False,
-                 log_buffer=mock_lcs, ignore_repos=[]),
+            bot_call(run_local=False, log_buffer=mock_lcs),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
@@ -370,15 +853,358 @@ class TestRunner(object):
             'bktname'
         ]
         with patch.object(sys, 'argv', argv):
-            with patch('%s.ReBuildBot' % pbm) as mock_bot, \
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs,
+                     ignore_repos=['foo/bar', 'foo/baz']),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_schedule(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--schedule=shortest-first',
+            '--state-dir=/my/state',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, schedule='shortest-first',
+                     state_dir='/my/state'),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_timeouts(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--build-timeout=3600',
+            '--inactivity-timeout=600',
+            '--repo-timeout=foo/bar=7200',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, build_timeout=3600,
+                     inactivity_timeout=600,
+                     repo_timeouts={'foo/bar': 7200}),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_deadline(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--deadline=06:30',
+            '--time-budget=3600',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, deadline=time(6, 30),
+                     time_budget=3600),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_rotation(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--max-repos=10',
+            '--stale-after=7',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, max_repos=10, stale_after=7),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_workspaces(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--persistent-workspaces',
+            '--workspace-max-size=1024',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, persistent_workspaces=True,
+                     workspace_max_size=1024),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_caches(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--cache=pip',
+            '--cache-limit=pip=100',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, caches=['pip'],
+                     cache_limits={'pip': 100}),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_admission(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--local-workers=3',
+            '--max-load=4.5',
+            '--min-free-memory=2048',
+            '--min-free-disk=4096',
+            '--nice=10',
+            '--ionice=idle',
+            '--cpu-limit=1.5',
+            '--memory-limit=1024',
+            '--cgroup-root=/sys/fs/cgroup/foo',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, local_workers=3, max_load=4.5,
+                     min_free_memory=2048, min_free_disk=4096, build_nice=10,
+                     build_ionice='idle', build_cpu_limit=1.5,
+                     build_memory_limit=1024,
+                     cgroup_root='/sys/fs/cgroup/foo'),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_tags(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--resource-tag=me/a=virtualbox',
+            '--resource-tag=me/b=docker',
+            '--resource-tag=me/a=docker',
+            '--tag-limit=virtualbox=1',
+            '--tag-limit=docker=4',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs,
+                     repo_tags={'me/a': ['virtualbox', 'docker'],
+                                'me/b': ['docker']},
+                     tag_limits={'virtualbox': 1, 'docker': 4}),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_prefetch(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--prefetch=2',
+            '--prefetch-min-free=100',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, prefetch=2, prefetch_min_free=100),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_regression_options(self):
+        argv = [
+            '/tmp/rebuildbot/runner.py',
+            '--regression-window=20',
+            '--regression-threshold=12.5',
+            'bktname'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, regression_window=20,
+                     regression_threshold=12.5),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_fail_on_regression(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--fail-on-regression',
+                'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                mock_bot.return_value.regressions = {
+                    'me/b': {'local': (50.0, 60.0)},
+                    'me/a': {'travis': (25.0, 120.0)},
+                }
+                with pytest.raises(SystemExit) as excinfo:
+                    self.cls.console_entry_point()
+        assert excinfo.value.code == 1
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == [
+            call.error("Build duration regressions found in: %s",
+                       'me/a, me/b')
+        ]
+
+    def test_console_entry_point_fail_on_regression_none(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--fail-on-regression',
+                'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                mock_bot.return_value.regressions = {}
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_webhook(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--webhook-port=8080',
+                '--webhook-window=600', 'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, webhook_port=8080,
+                     webhook_window=600),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_max_travis_in_flight(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--max-travis-in-flight=5',
+                'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
                  patch('%s.logger' % pbm) as mock_logger, \
                  patch('%s.log_capture_string' % pbm) as mock_lcs:
                 self.cls.console_entry_point()
         assert mock_bot.mock_calls == [
-            call('bktname', s3_prefix='rebuildbot', dry_run=False,
-                 date_check=True, run_travis=True, run_local=True,
-                 log_buffer=mock_lcs,
-                 ignore_repos=['foo/bar', 'foo/baz']),
+            bot_call(log_buffer=mock_lcs, max_travis_in_flight=5),
             call().run(projects=None)
         ]
         assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_travis_attach(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--always-trigger',
+                '--cancel-stale-travis', 'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, travis_attach=False,
+                     cancel_stale_travis=True),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_auth_cache_ttl(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--auth-cache-ttl=0', 'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, auth_cache_ttl=0),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+    def test_console_entry_point_http(self):
+        argv = ['/tmp/rebuildbot/runner.py', '--http-retries=2',
+                '--http-timeout=github=10', '--http-timeout=s3=120',
+                '--rate-limit-reserve=100', '--breaker-threshold=5',
+                '--max-outage=600', 'bktname']
+        with patch.object(sys, 'argv', argv):
+            with patch(pbb) as mock_bot, \
+                 patch('%s.logger' % pbm) as mock_logger, \
+                 patch('%s.log_capture_string' % pbm) as mock_lcs:
+                self.cls.console_entry_point()
+        assert mock_bot.mock_calls == [
+            bot_call(log_buffer=mock_lcs, http_retries=2,
+                     http_timeouts={'github': 10, 's3': 120},
+                     rate_limit_reserve=100, breaker_threshold=5,
+                     max_outage=600),
+            call().run(projects=None)
+        ]
+        assert mock_logger.mock_calls == []
+
+
+def best_time(args, runs=3):
+    """return the shortest wall time, in seconds, of ``runs`` runs of args"""
+    times = []
+    for _ in range(runs):
+        start = systime.time()
+        subprocess.check_output(args)
+        times.append(systime.time() - start)
+    return min(times)
+
+
+class TestStartup(object):
+
+    def test_no_heavy_imports(self):
+        code = 'import sys, rebuildbot.runner; ' \
+               'print("\\n".join(sorted(sys.modules.keys())))'
+        out = subprocess.check_output([sys.executable, '-c', code])
+        modules = out.decode('utf-8').split()
+        for name in HEAVY_MODULES:
+            assert name not in modules
+
+    def test_version_startup_time(self):
+        base = best_time([sys.executable, '-c', 'pass'])
+        secs = best_time([sys.executable, '-m', 'rebuildbot.runner', '-V'])
+        assert secs - base < STARTUP_BUDGET
@@ -0,0 +1,154 @@
+"""
+rebuildbot/tests/test_scheduler.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import pytest
+
+from rebuildbot.scheduler import (BuildScheduler, DEFAULT_LOCAL_DURATION,
+                                  POLICIES)
+from rebuildbot.history import BuildHistory
+from rebuildbot.buildinfo import BuildInfo
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import Mock
+else:
+    from unittest.mock import Mock
+
+
+class TestBuildScheduler(object):
+
+    def setup(self):
+        durations = {'me/a': 60, 'me/c': 3600, 'me/d': 600}
+        self.history = Mock(spec_set=BuildHistory)
+        self.history.expected_local_duration.side_effect = \
+            lambda slug: durations.get(slug, None)
+        self.builds = {
+            'me/a': BuildInfo('me/a', repo_size=10),
+            'me/b': BuildInfo('me/b', repo_size=500),
+            'me/c': BuildInfo('me/c', repo_size=20),
+            'me/d': BuildInfo('me/d'),
+            'me/e': BuildInfo('me/e', repo_size=5),
+        }
+
+    def test_init_default(self):
+        cls = BuildScheduler()
+        assert cls.policy == 'alphabetical'
+        assert cls.history is None
+        assert cls.tag_limits == {}
+        assert cls.repo_tags == {}
+
+    def test_init_bad_policy(self):
+        with pytest.raises(ValueError):
+            BuildScheduler('foo')
+
+    def test_policies(self):
+        assert POLICIES == ['alphabetical', 'longest-first', 'shortest-first']
+
+    def test_expected_duration(self):
+        cls = BuildScheduler(history=self.history)
+        assert cls.expected_duration(self.builds['me/c']) == 3600
+        assert cls.expected_duration(
+            self.builds['me/b']) == DEFAULT_LOCAL_DURATION
+
+    def test_expected_duration_no_history(self):
+        cls = BuildScheduler()
+        assert cls.expected_duration(
+            self.builds['me/c']) == DEFAULT_LOCAL_DURATION
+
+    def test_expected_duration_manifest(self):
+        cls = BuildScheduler(history=self.history)
+        b = BuildInfo('me/b', manifest={'expected_duration': 90})
+        assert cls.expected_duration(b) == 90
+        c = BuildInfo('me/c', manifest={'expected_duration': 90})
+        assert cls.expected_duration(c) == 3600
+
+    def test_fits(self):
+        cls = BuildScheduler(history=self.history)
+        assert cls.fits(self.builds['me/c'], 3600) is True
+        assert cls.fits(self.builds['me/c'], 3599) is False
+        assert cls.fits(self.builds['me/b'], 3599) is True
+
+    def test_order_alphabetical(self):
+        cls = BuildScheduler('alphabetical', history=self.history)
+        res = cls.order(self.builds)
+        assert [x[0] for x in res] == ['me/a', 'me/b', 'me/c', 'me/d', 'me/e']
+        assert res[0][1] == self.builds['me/a']
+
+    def test_order_longest_first(self):
+        cls = BuildScheduler('longest-first', history=self.history)
+        res = cls.order(self.builds)
+        # me/d has history equal to the default; larger repo size first
+        assert [x[0] for x in res] == ['me/c', 'me/b', 'me/e', 'me/d', 'me/a']
+
+    def test_order_shortest_first(self):
+        cls = BuildScheduler('shortest-first', history=self.history)
+        res = cls.order(self.builds)
+        assert [x[0] for x in res] == ['me/a', 'me/d', 'me/e', 'me/b', 'me/c']
+
+    def test_tags_for(self):
+        cls = BuildScheduler(repo_tags={'Me/A': ['docker', 'vbox']})
+        self.builds['me/a'].resource_tags = ['vbox', 'big']
+        assert cls.tags_for(self.builds['me/a']) == ['big', 'docker', 'vbox']
+        assert cls.tags_for(self.builds['me/b']) == []
+
+    def test_blocking_tag(self):
+        cls = BuildScheduler(tag_limits={'vbox': 1, 'docker': 2},
+                             repo_tags={'me/a': ['vbox'], 'me/b': ['vbox'],
+                                        'me/c': ['docker'],
+                                        'me/d': ['docker', 'other']})
+        b = self.builds
+        assert cls.blocking_tag(b['me/a'], []) is None
+        assert cls.blocking_tag(b['me/a'], [b['me/b']]) == 'vbox'
+        assert cls.blocking_tag(b['me/a'], [b['me/c']]) is None
+        assert cls.blocking_tag(b['me/c'], [b['me/d']]) is None
+        assert cls.blocking_tag(b['me/c'], [b['me/d'], b['me/a']]) is None
+        assert cls.blocking_tag(b['me/c'], [b['me/d'], b['me/d']]) == \
+            'docker'
+        # untagged builds are never blocked
+        assert cls.blocking_tag(b['me/e'], [b['me/a'], b['me/d']]) is None
+
+    def test_blocking_tag_no_limits(self):
+        cls = BuildScheduler(repo_tags={'me/a': ['vbox'], 'me/b': ['vbox']})
+        assert cls.blocking_tag(self.builds['me/a'],
+                                [self.builds['me/b']]) is None
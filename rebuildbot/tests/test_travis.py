@@ -41,10 +41,16 @@ import sys
 import pytest
 from requests import Response
 
-from rebuildbot.travis import (Travis, CHECK_WAIT_TIME, POLL_NUM_TIMES)
+from rebuildbot.travis import (Travis, BuildStatus, TravisUser,
+                               CHECK_WAIT_TIME, POLL_NUM_TIMES,
+                               BATCH_MAX_PAGES,
+                               TRIGGER_MESSAGE)
 from rebuildbot.exceptions import (PollTimeoutException, TravisTriggerError)
+from rebuildbot.httpsession import HTTPConfig
+from rebuildbot.authcache import AuthCache, fingerprint
 
 from travispy import TravisPy
+from travispy.travispy import PUBLIC
 from travispy.entities.repo import Repo
 from travispy.entities.user import User
 from travispy.entities.build import Build
@@ -69,18 +75,176 @@ class TestTravisInit(object):
     """Test the rebuildbot.travis.Travis constructor"""
 
     def test_init(self):
+        mock_http = Mock(spec_set=HTTPConfig)
         with patch('%s.TravisPy.github_auth' % pbm) as mock_travispy:
             mock_user = Mock()
             type(mock_user).login = 'mylogin'
             type(mock_user).email = 'myemail'
             type(mock_user).id = 'mockid'
             mock_travispy.return_value.user.return_value = mock_user
-            cls = Travis('mytoken')
+            cls = Travis('mytoken', http=mock_http)
             assert mock_travispy.mock_calls == [
-                call('mytoken'),
+                call('mytoken', uri=PUBLIC),
                 call().user()
             ]
             assert cls.travis == mock_travispy.return_value
+        assert cls.uri == PUBLIC
+        assert mock_http.mock_calls == [
+            call.configure_session(mock_travispy.return_value._session,
+                                   'travis')
+        ]
+
+    def test_init_uri(self):
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_travispy:
+            cls = Travis('mytoken', http=Mock(spec_set=HTTPConfig),
+                         uri='http://127.0.0.1:8000')
+        assert mock_travispy.mock_calls[0] == call(
+            'mytoken', uri='http://127.0.0.1:8000')
+        assert cls.uri == 'http://127.0.0.1:8000'
+
+    def test_init_default_http(self):
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_travispy, \
+             patch('%s.HTTPConfig' % pbm) as mock_http:
+            Travis('mytoken')
+        assert mock_http.mock_calls == [
+            call(),
+            call().configure_session(mock_travispy.return_value._session,
+                                     'travis')
+        ]
+
+    def test_init_cache_miss(self):
+        mock_http = Mock(spec_set=HTTPConfig)
+        mock_cache = Mock(spec_set=AuthCache)
+        mock_cache.get.return_value = None
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_travispy:
+            mock_user = Mock()
+            type(mock_user).login = 'mylogin'
+            type(mock_user).email = 'myemail'
+            type(mock_user).id = 'mockid'
+            mock_travispy.return_value.user.return_value = mock_user
+            mock_travispy.return_value._session.headers = {
+                'Authorization': 'token travistoken'
+            }
+            cls = Travis('mytoken', http=mock_http, cache=mock_cache)
+        assert cls.user == mock_user
+        key = 'travis:' + fingerprint('mytoken')
+        assert mock_cache.mock_calls == [
+            call.get(key),
+            call.set(key, {
+                'token': 'travistoken',
+                'user': {'login': 'mylogin', 'email': 'myemail',
+                         'id': 'mockid'}
+            })
+        ]
+
+    def test_init_cache_hit(self):
+        mock_http = Mock(spec_set=HTTPConfig)
+        mock_cache = Mock(spec_set=AuthCache)
+        mock_cache.get.return_value = {
+            'token': 'travistoken',
+            'user': {'login': 'mylogin', 'email': 'myemail', 'id': 'mockid'}
+        }
+        with patch('%s.TravisPy' % pbm) as mock_travispy:
+            mock_travispy.return_value._session.hooks = {'response': []}
+            cls = Travis('mytoken', http=mock_http, cache=mock_cache)
+        assert mock_travispy.mock_calls == [call('travistoken', uri=PUBLIC)]
+        assert cls.travis == mock_travispy.return_value
+        assert isinstance(cls.user, TravisUser)
+        assert cls.user.login == 'mylogin'
+        assert cls.user.email == 'myemail'
+        assert cls.user.id == 'mockid'
+        assert mock_cache.mock_calls == [
+            call.get('travis:' + fingerprint('mytoken'))
+        ]
+        assert mock_http.mock_calls == [
+            call.configure_session(mock_travispy.return_value._session,
+                                   'travis')
+        ]
+        assert cls.travis._session.hooks['response'] == [
+            cls._retry_unauthorized
+        ]
+
+    def test_init_cache_token_only(self):
+        mock_cache = Mock(spec_set=AuthCache)
+        mock_cache.get.return_value = {'token': 'oldtoken'}
+        with patch('%s.TravisPy' % pbm) as mock_travispy:
+            mock_travispy.github_auth.return_value._session.headers = {
+                'Authorization': 'token newtoken'
+            }
+            cls = Travis('mytoken', http=Mock(spec_set=HTTPConfig),
+                         cache=mock_cache)
+        assert cls.travis == mock_travispy.github_auth.return_value
+        assert mock_travispy.mock_calls[0] == call.github_auth(
+            'mytoken', uri=PUBLIC)
+
+    def make_cached(self):
+        mock_cache = Mock(spec_set=AuthCache)
+        mock_cache.get.return_value = {
+            'token': 'oldtoken',
+            'user': {'login': 'mylogin', 'email': 'myemail', 'id': 'mockid'}
+        }
+        with patch('%s.TravisPy' % pbm) as mock_travispy:
+            session = mock_travispy.return_value._session
+            session.hooks = {'response': []}
+            session.headers = {'Authorization': 'token oldtoken'}
+            cls = Travis('mytoken', http=Mock(spec_set=HTTPConfig),
+                         cache=mock_cache)
+        mock_cache.reset_mock()
+        return cls, mock_cache, session
+
+    def make_response(self, status, auth):
+        response = Mock(status_code=status)
+        response.request.headers = {'Authorization': auth}
+        response.request.copy.return_value.headers = {'Authorization': auth}
+        return response
+
+    def test_retry_unauthorized_ok(self):
+        cls, mock_cache, session = self.make_cached()
+        response = self.make_response(200, 'token oldtoken')
+        assert cls._retry_unauthorized(response, timeout=5) is response
+        assert mock_cache.mock_calls == []
+
+    def test_retry_unauthorized(self):
+        cls, mock_cache, session = self.make_cached()
+        response = self.make_response(401, 'token oldtoken')
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_auth:
+            mock_auth.return_value._session.headers = {
+                'Authorization': 'token newtoken'
+            }
+            res = cls._retry_unauthorized(response, timeout=5)
+        assert mock_auth.mock_calls == [call('mytoken', uri=PUBLIC)]
+        assert session.headers['Authorization'] == 'token newtoken'
+        key = 'travis:' + fingerprint('mytoken')
+        assert mock_cache.mock_calls == [
+            call.delete(key),
+            call.set(key, {
+                'token': 'newtoken',
+                'user': {'login': 'mylogin', 'email': 'myemail',
+                         'id': 'mockid'}
+            })
+        ]
+        new_req = response.request.copy.return_value
+        assert new_req.headers == {'Authorization': 'token newtoken'}
+        assert session.send.mock_calls == [call(new_req, timeout=5)]
+        assert res is session.send.return_value
+        # only re-authenticate once; later 401s are returned as-is
+        response = self.make_response(401, 'token newtoken')
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_auth:
+            assert cls._retry_unauthorized(response) is response
+        assert mock_auth.mock_calls == []
+
+    def test_retry_unauthorized_already_renewed(self):
+        cls, mock_cache, session = self.make_cached()
+        session.headers['Authorization'] = 'token newtoken'
+        response = self.make_response(401, 'token oldtoken')
+        with patch('%s.TravisPy.github_auth' % pbm) as mock_auth:
+            res = cls._retry_unauthorized(response)
+        assert mock_auth.mock_calls == []
+        assert mock_cache.mock_calls == []
+        new_req = response.request.copy.return_value
+        assert new_req.headers == {'Authorization': 'token newtoken'}
+        assert session.send.mock_calls == [call(new_req)]
+        assert res is session.send.return_value
 
 
 class TestTravis(object):
@@ -98,6 +262,13 @@ class TestTravis(object):
             self.cls = Travis('mytoken')
             self.cls.travis = self.mock_travis
             self.cls.user = self.mock_user
+            self.cls.uri = PUBLIC
+
+    def test_access_token(self):
+        mock_session = Mock()
+        mock_session.headers = {'Authorization': 'token abc'}
+        type(self.mock_travis)._session = mock_session
+        assert self.cls.access_token == 'abc'
 
     def test_get_repos(self):
 
@@ -125,6 +296,19 @@ class TestTravis(object):
             call(r3)
         ]
 
+    def test_iter_repos(self):
+        r1 = Mock(spec_set=Repo)
+        type(r1).slug = 'mylogin/foo'
+        r2 = Mock(spec_set=Repo)
+        type(r2).slug = 'mylogin/bar'
+        self.mock_travis.repos.return_value = [r1, r2]
+        with patch('%s.repo_build_in_last_day' % pb) as mock_build:
+            mock_build.return_value = False
+            gen = self.cls.iter_repos()
+            assert next(gen) == 'mylogin/foo'
+            assert mock_build.mock_calls == [call(r1)]
+            assert list(gen) == ['mylogin/bar']
+
     def test_get_repos_date_check_false(self):
         r1 = Mock(spec_set=Repo)
         type(r1).slug = 'mylogin/foo'
@@ -211,6 +395,82 @@ class TestTravis(object):
         ]
         assert mock_wait.mock_calls == [call('mylogin/reponame', 1)]
 
+    def test_run_build_attach(self):
+        running = BuildStatus({'id': 5, 'number': '9', 'state': 'started'})
+        older = BuildStatus({'id': 4, 'number': '8', 'state': 'created'})
+        with patch('%s.get_pending_builds' % pb) as mock_pending, \
+                patch('%s.cancel_stale_builds' % pb) as mock_cancel, \
+                patch('%s.trigger_travis' % pb) as mock_trigger:
+            mock_pending.return_value = [running, older]
+            res = self.cls.run_build('mylogin/reponame', attach=True)
+        assert res == (None, 5)
+        assert mock_pending.mock_calls == [
+            call('mylogin/reponame', branch='master')
+        ]
+        assert mock_cancel.mock_calls == []
+        assert mock_trigger.mock_calls == []
+        assert self.mock_travis.mock_calls == []
+
+    def test_run_build_attach_none_pending(self):
+        mock_repo = Mock(spec_set=Repo)
+        mock_build = Mock(spec_set=Build)
+        type(mock_build).id = 1
+        type(mock_repo).last_build = mock_build
+        self.mock_travis.repo.return_value = mock_repo
+
+        with patch('%s.get_pending_builds' % pb) as mock_pending, \
+                patch('%s.wait_for_new_build' % pb) as mock_wait, \
+                patch('%s.trigger_travis' % pb) as mock_trigger:
+            mock_pending.return_value = []
+            mock_wait.return_value = 2
+            res = self.cls.run_build('mylogin/reponame', branch='foo',
+                                     attach=True)
+        assert res == (1, 2)
+        assert mock_pending.mock_calls == [
+            call('mylogin/reponame', branch='foo')
+        ]
+        assert mock_trigger.mock_calls == [
+            call('mylogin/reponame', branch='foo')
+        ]
+
+    def test_run_build_attach_cancel_stale(self):
+        running = BuildStatus({'id': 5, 'number': '9', 'state': 'started'})
+        older = BuildStatus({'id': 4, 'number': '8', 'state': 'created'})
+        with patch('%s.get_pending_builds' % pb) as mock_pending, \
+                patch('%s.cancel_stale_builds' % pb) as mock_cancel, \
+                patch('%s.trigger_travis' % pb) as mock_trigger:
+            mock_pending.return_value = [running, older]
+            res = self.cls.run_build('mylogin/reponame', attach=True,
+                                     cancel_stale=True)
+        assert res == (None, 5)
+        assert mock_cancel.mock_calls == [
+            call('mylogin/reponame', [running, older], keep=running)
+        ]
+        assert mock_trigger.mock_calls == []
+
+    def test_run_build_cancel_stale(self):
+        mock_repo = Mock(spec_set=Repo)
+        mock_build = Mock(spec_set=Build)
+        type(mock_build).id = 5
+        type(mock_repo).last_build = mock_build
+        self.mock_travis.repo.return_value = mock_repo
+        running = BuildStatus({'id': 5, 'number': '9', 'state': 'started'})
+
+        with patch('%s.get_pending_builds' % pb) as mock_pending, \
+                patch('%s.cancel_stale_builds' % pb) as mock_cancel, \
+                patch('%s.wait_for_new_build' % pb) as mock_wait, \
+                patch('%s.trigger_travis' % pb) as mock_trigger:
+            mock_pending.return_value = [running]
+            mock_wait.return_value = 6
+            res = self.cls.run_build('mylogin/reponame', cancel_stale=True)
+        assert res == (5, 6)
+        assert mock_cancel.mock_calls == [
+            call('mylogin/reponame', [running], keep=None)
+        ]
+        assert mock_trigger.mock_calls == [
+            call('mylogin/reponame', branch='master')
+        ]
+
     def test_run_build_timeout(self):
         mock_repo = Mock(spec_set=Repo)
         mock_build = Mock(spec_set=Build)
@@ -325,7 +585,6 @@ class TestTravis(object):
             }
         }
         expected_headers = {
-            'foo': 'bar',
             'Content-Type': 'application/json',
             'Accept': 'application/json',
             'Travis-API-Version': '3',
@@ -333,6 +592,7 @@ class TestTravis(object):
         assert self.mock_travis._session.post.mock_calls == [
             call(expected_url, json=expected_json, headers=expected_headers)
         ]
+        assert self.mock_travis._HEADERS == {'foo': 'bar'}
 
     def test_trigger_travis_ok_branch(self):
         mock_response = Mock(spec_set=Response)
@@ -355,7 +615,6 @@ class TestTravis(object):
             }
         }
         expected_headers = {
-            'foo': 'bar',
             'Content-Type': 'application/json',
             'Accept': 'application/json',
             'Travis-API-Version': '3',
@@ -363,6 +622,7 @@ class TestTravis(object):
         assert self.mock_travis._session.post.mock_calls == [
             call(expected_url, json=expected_json, headers=expected_headers)
         ]
+        assert self.mock_travis._HEADERS == {'foo': 'bar'}
 
     def test_trigger_travis_404(self):
         mock_response = Mock(spec_set=Response)
@@ -393,7 +653,6 @@ class TestTravis(object):
             }
         }
         expected_headers = {
-            'foo': 'bar',
             'Content-Type': 'application/json',
             'Accept': 'application/json',
             'Travis-API-Version': '3',
@@ -401,6 +660,182 @@ class TestTravis(object):
         assert self.mock_travis._session.post.mock_calls == [
             call(expected_url, json=expected_json, headers=expected_headers)
         ]
+        assert self.mock_travis._HEADERS == {'foo': 'bar'}
+
+    def test_webhook_public_key(self):
+        mock_session = Mock()
+        mock_session.get.return_value.json.return_value = {
+            'config': {'notifications': {'webhook': {'public_key': 'PEM'}}}
+        }
+        type(self.mock_travis)._session = mock_session
+        assert self.cls.webhook_public_key() == 'PEM'
+        assert mock_session.mock_calls == [
+            call.get('https://api.travis-ci.org/config', headers={
+                'Accept': 'application/vnd.travis-ci.2+json'}),
+            call.get().raise_for_status(),
+            call.get().json()
+        ]
+
+    def test_get_recent_builds(self):
+        pages = [
+            {
+                'builds': [{'id': 12, 'state': 'passed',
+                            'repository': {'slug': 'a/b'}},
+                           {'id': 11, 'state': 'started',
+                            'repository': {'slug': 'a/c'}}],
+                '@pagination': {'is_last': False,
+                                'next': {'@href': '/builds?offset=2'}},
+            },
+            {
+                'builds': [{'id': 10, 'state': 'failed',
+                            'repository': {'slug': 'a/b'}},
+                           {'id': 9, 'state': 'failed',
+                            'repository': {'slug': 'a/b'}}],
+                '@pagination': {'is_last': False,
+                                'next': {'@href': '/builds?offset=4'}},
+            },
+        ]
+        mock_session = Mock()
+        mock_session.get.return_value.json.side_effect = pages
+        type(self.mock_travis)._session = mock_session
+        res, covered = self.cls.get_recent_builds(10)
+        assert covered == 10
+        assert [(b.id, b.slug, b.state) for b in res] == [
+            (12, 'a/b', 'passed'), (11, 'a/c', 'started'),
+            (10, 'a/b', 'failed')
+        ]
+        headers = {'Accept': 'application/json', 'Travis-API-Version': '3'}
+        assert mock_session.get.mock_calls == [
+            call('https://api.travis-ci.org/builds?limit=100&sort_by=id:desc',
+                 headers=headers),
+            call().raise_for_status(),
+            call().json(),
+            call('https://api.travis-ci.org/builds?offset=2',
+                 headers=headers),
+            call().raise_for_status(),
+            call().json(),
+        ]
+
+    def test_get_recent_builds_last_page(self):
+        mock_session = Mock()
+        mock_session.get.return_value.json.return_value = {
+            'builds': [{'id': 12, 'state': 'passed',
+                        'repository': {'slug': 'a/b'}}],
+            '@pagination': {'is_last': True, 'next': None},
+        }
+        type(self.mock_travis)._session = mock_session
+        res, covered = self.cls.get_recent_builds(1)
+        assert [b.id for b in res] == [12]
+        assert covered == 1
+        assert mock_session.get.call_count == 1
+
+    def test_get_recent_builds_max_pages(self):
+        mock_session = Mock()
+        mock_session.get.return_value.json.return_value = {
+            'builds': [{'id': 12, 'state': 'passed',
+                        'repository': {'slug': 'a/b'}}],
+            '@pagination': {'is_last': False,
+                            'next': {'@href': '/builds?offset=1'}},
+        }
+        type(self.mock_travis)._session = mock_session
+        res, covered = self.cls.get_recent_builds(1)
+        assert len(res) == BATCH_MAX_PAGES
+        assert covered == 12
+        assert mock_session.get.call_count == BATCH_MAX_PAGES
+
+    def test_get_recent_builds_page_limit(self):
+        pages = [
+            {
+                'builds': [{'id': 20, 'state': 'passed'},
+                           {'id': 19, 'state': 'passed'}],
+                '@pagination': {'is_last': False,
+                                'next': {'@href': '/builds?offset=2'}},
+            },
+            {
+                'builds': [],
+                '@pagination': {'is_last': False,
+                                'next': {'@href': '/builds?offset=2'}},
+            },
+        ]
+        mock_session = Mock()
+        mock_session.get.return_value.json.side_effect = pages
+        type(self.mock_travis)._session = mock_session
+        res, covered = self.cls.get_recent_builds(5, max_pages=1)
+        assert [b.id for b in res] == [20, 19]
+        assert covered == 19
+        assert mock_session.get.call_count == 1
+        res, covered = self.cls.get_recent_builds(5, max_pages=1)
+        assert res == []
+        assert covered == 5
+
+    def test_get_pending_builds(self):
+        mock_session = Mock()
+        mock_session.get.return_value.json.return_value = {
+            'builds': [{'id': 12, 'state': 'started'},
+                       {'id': 11, 'state': 'created'},
+                       {'id': 10, 'state': 'passed'}],
+        }
+        type(self.mock_travis)._session = mock_session
+        res = self.cls.get_pending_builds('a/b c', branch='my/branch')
+        assert [b.id for b in res] == [12, 11]
+        assert mock_session.get.mock_calls == [
+            call('https://api.travis-ci.org/repo/a%2Fb%20c/builds?'
+                 'branch.name=my%2Fbranch&state=created,received,started'
+                 '&sort_by=id:desc&limit=100',
+                 headers={'Accept': 'application/json',
+                          'Travis-API-Version': '3'}),
+            call().raise_for_status(),
+            call().json()
+        ]
+
+    def test_cancel_stale_builds(self):
+        ours = {'event_type': 'api', 'commit': {'message': TRIGGER_MESSAGE}}
+        b1 = BuildStatus(dict(ours, id=4, state='started'))
+        b2 = BuildStatus(dict(ours, id=3, state='created'))
+        b3 = BuildStatus({'id': 2, 'state': 'created', 'event_type': 'push',
+                          'commit': {'message': 'fix'}})
+        b4 = BuildStatus(dict(ours, id=1, state='created'))
+        with patch('%s.cancel_build' % pb) as mock_cancel:
+            mock_cancel.side_effect = [True, False]
+            res = self.cls.cancel_stale_builds('a/b', [b1, b2, b3, b4],
+                                               keep=b1)
+        assert res == 1
+        assert mock_cancel.mock_calls == [call(3), call(1)]
+
+    def test_cancel_build(self):
+        mock_session = Mock()
+        mock_session.post.return_value.status_code = 202
+        type(self.mock_travis)._session = mock_session
+        assert self.cls.cancel_build(123) is True
+        assert mock_session.post.mock_calls == [
+            call('https://api.travis-ci.org/build/123/cancel',
+                 headers={'Accept': 'application/json',
+                          'Travis-API-Version': '3'})
+        ]
+
+    def test_cancel_build_uri(self):
+        mock_session = Mock()
+        mock_session.post.return_value.status_code = 202
+        type(self.mock_travis)._session = mock_session
+        self.cls.uri = 'http://127.0.0.1:8000'
+        assert self.cls.cancel_build(123) is True
+        assert mock_session.post.mock_calls == [
+            call('http://127.0.0.1:8000/build/123/cancel',
+                 headers={'Accept': 'application/json',
+                          'Travis-API-Version': '3'})
+        ]
+
+    def test_cancel_build_error(self):
+        mock_session = Mock()
+        mock_session.post.return_value.status_code = 409
+        mock_session.post.return_value.text = 'conflict'
+        type(self.mock_travis)._session = mock_session
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.cancel_build(123) is False
+        assert mock_logger.mock_calls == [
+            call.warning("Unable to cancel Travis build %s: %s %s", 123, 409,
+                         'conflict')
+        ]
 
     def test_url_for_build(self):
         res = self.cls.url_for_build('a/b', 123)
@@ -415,3 +850,57 @@ class TestTravis(object):
             call.build(123),
             call.build().check_state()
         ]
+
+
+class TestBuildStatus(object):
+
+    def test_passed(self):
+        b = BuildStatus({'id': 123, 'number': '45', 'state': 'passed',
+                         'duration': 60, 'repository': {'slug': 'me/repo'}})
+        assert b.id == 123
+        assert b.slug == 'me/repo'
+        assert b.number == '45'
+        assert b.state == 'passed'
+        assert b.duration == 60
+        assert b.finished is True
+        assert b.errored is False
+        assert b.color == 'green'
+
+    def test_errored(self):
+        b = BuildStatus({'id': 123, 'state': 'errored'})
+        assert b.number is None
+        assert b.duration is None
+        assert b.slug is None
+        assert b.finished is True
+        assert b.errored is True
+        assert b.color == 'red'
+
+    def test_no_state(self):
+        b = BuildStatus({'id': 123})
+        assert b.state is None
+        assert b.finished is False
+        assert b.color == 'yellow'
+
+    def test_started(self):
+        b = BuildStatus({'id': 123, 'state': 'started'})
+        assert b.finished is False
+        assert b.color == 'yellow'
+        assert b.message is None
+        assert b.event_type is None
+        assert b.triggered_by_rebuildbot is False
+
+    def test_triggered_by_rebuildbot(self):
+        b = BuildStatus({'id': 123, 'state': 'started', 'event_type': 'api',
+                         'commit': {'message': TRIGGER_MESSAGE}})
+        assert b.message == TRIGGER_MESSAGE
+        assert b.triggered_by_rebuildbot is True
+        b = BuildStatus({'id': 123, 'state': 'started', 'event_type': 'push',
+                         'commit': {'message': TRIGGER_MESSAGE}})
+        assert b.triggered_by_rebuildbot is False
+
+    def test_webhook_payload(self):
+        b = BuildStatus({'id': 123, 'state': 'started', 'type': 'api',
+                         'commit': 'abcd', 'message': TRIGGER_MESSAGE})
+        assert b.message == TRIGGER_MESSAGE
+        assert b.event_type == 'api'
+        assert b.triggered_by_rebuildbot is True
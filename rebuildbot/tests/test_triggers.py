@@ -0,0 +1,150 @@
+"""
+rebuildbot/tests/test_triggers.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import threading
+
+from rebuildbot.triggers import TriggerQueue, DEFAULT_TRIGGER_THREADS
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock
+else:
+    from unittest.mock import patch, call, Mock
+
+pbm = 'rebuildbot.triggers'
+
+
+class TestTriggerQueue(object):
+
+    def setup(self):
+        self.triggered = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def trigger(slug, build_info):
+            self.release.wait()
+            self.triggered.append((slug, build_info))
+
+        self.trigger = trigger
+        self.cls = TriggerQueue(trigger, max_in_flight=3, threads=2)
+
+    def test_init(self):
+        cls = TriggerQueue(self.trigger)
+        assert cls.trigger == self.trigger
+        assert cls.max_in_flight is None
+        assert cls.threads == DEFAULT_TRIGGER_THREADS
+        assert cls.waiting == []
+        assert cls.running == {}
+        assert cls.busy is False
+        assert TriggerQueue(self.trigger, threads=0).threads == 1
+
+    def test_add(self):
+        assert self.cls.add('a/1', 'bi1') is True
+        assert self.cls.add('a/2', 'bi2') is True
+        assert self.cls.add('a/1', 'bi1') is False
+        self.cls.running['a/3'] = Mock()
+        assert self.cls.add('a/3', 'bi3') is False
+        assert self.cls.waiting == [('a/1', 'bi1'), ('a/2', 'bi2')]
+        assert self.cls.is_queued('a/1') is True
+        assert self.cls.is_queued('a/3') is True
+        assert self.cls.is_queued('a/4') is False
+        assert self.cls.busy is True
+
+    def test_slots(self):
+        assert self.cls.slots(0) == 2
+        assert self.cls.slots(2) == 1
+        assert self.cls.slots(5) == 0
+        self.cls.running['a/1'] = Mock()
+        assert self.cls.slots(0) == 1
+        assert self.cls.slots(2) == 0
+        self.cls.max_in_flight = None
+        assert self.cls.slots(100) == 1
+
+    def test_admit(self):
+        for i in range(4):
+            self.cls.add('a/%d' % i, 'bi%d' % i)
+        self.release.clear()
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.admit(0) == ['a/0', 'a/1']
+            assert sorted(self.cls.running.keys()) == ['a/0', 'a/1']
+            # no thread free
+            assert self.cls.admit(0) == []
+            assert self.cls.collect() == []
+            self.release.set()
+            assert self.cls.wait() == ['a/0', 'a/1']
+            # a/0 and a/1 are now in flight, plus one other
+            assert self.cls.admit(3) == []
+            assert self.cls.admit(2) == ['a/2']
+            assert self.cls.wait() == ['a/2']
+        assert sorted(self.triggered) == [
+            ('a/0', 'bi0'), ('a/1', 'bi1'), ('a/2', 'bi2')
+        ]
+        assert self.cls.waiting == [('a/3', 'bi3')]
+        assert self.cls.running == {}
+        assert mock_logger.mock_calls[0:3] == [
+            call.info("Triggering Travis build of %s", 'a/0'),
+            call.info("Triggering Travis build of %s", 'a/1'),
+            call.debug("%d Travis builds in flight and %d being triggered; "
+                       "%d waiting to be triggered", 0, 2, 2),
+        ]
+
+    def test_admit_thread(self):
+        self.cls.add('a/1', 'bi1')
+        with patch('%s.threading.Thread' % pbm) as mock_thread:
+            with patch('%s.logger' % pbm):
+                self.cls.admit(0)
+        assert mock_thread.mock_calls == [
+            call(target=self.trigger, args=('a/1', 'bi1'),
+                 name='trigger-a/1'),
+            call().start()
+        ]
+        assert mock_thread.return_value.daemon is True
+        assert self.cls.running == {'a/1': mock_thread.return_value}
+
+    def test_clear(self):
+        self.cls.add('a/1', 'bi1')
+        self.cls.add('a/2', 'bi2')
+        assert self.cls.clear() == ['a/1', 'a/2']
+        assert self.cls.waiting == []
+        assert self.cls.busy is False
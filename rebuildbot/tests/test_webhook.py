@@ -0,0 +1,192 @@
+"""
+rebuildbot/tests/test_webhook.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import sys
+import json
+import base64
+import socket
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from rebuildbot.webhook import WebhookReceiver
+
+try:
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlencode
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call
+else:
+    from unittest.mock import patch, call
+
+pbm = 'rebuildbot.webhook'
+
+KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                               backend=default_backend())
+PUBLIC_PEM = KEY.public_key().public_bytes(
+    serialization.Encoding.PEM,
+    serialization.PublicFormat.SubjectPublicKeyInfo
+).decode('utf-8')
+
+
+def sign(payload):
+    """return the base64 Travis-style signature of a payload string"""
+    sig = KEY.sign(payload.encode('utf-8'), padding.PKCS1v15(), hashes.SHA1())
+    return base64.b64encode(sig).decode('utf-8')
+
+
+def post_webhook(port, payload, signature, slug):
+    """
+    POST a webhook notification to a receiver on localhost, the way Travis
+    does; return the HTTP status code of the response
+    """
+    body = urlencode({'payload': payload})
+    req = 'POST / HTTP/1.0\r\nContent-Type: application/x-www-form-' \
+          'urlencoded\r\nContent-Length: %d\r\nSignature: %s\r\n' \
+          'Travis-Repo-Slug: %s\r\n\r\n%s' % (
+              len(body), signature, slug, body)
+    s = socket.create_connection(('127.0.0.1', port), timeout=5)
+    try:
+        s.sendall(req.encode('utf-8'))
+        resp = b''
+        while True:
+            data = s.recv(4096)
+            if not data:
+                break
+            resp += data
+    finally:
+        s.close()
+    return int(resp.split(b' ')[1])
+
+
+class TestWebhookReceiver(object):
+
+    def setup(self):
+        self.cls = WebhookReceiver(0, PUBLIC_PEM, host='127.0.0.1')
+        self.payload = json.dumps({'id': 123, 'number': '45',
+                                   'state': 'passed', 'duration': 60})
+
+    def teardown(self):
+        self.cls.stop()
+
+    def test_init(self):
+        assert self.cls.host == '127.0.0.1'
+        assert self.cls.port == 0
+        assert self.cls.public_key == PUBLIC_PEM
+        assert self.cls.server is None
+        assert self.cls.get() == []
+
+    def test_start_public_key(self):
+        cls = WebhookReceiver(0, host='127.0.0.1')
+        assert cls.public_key is None
+        try:
+            cls.start(PUBLIC_PEM)
+            assert cls.public_key == PUBLIC_PEM
+            assert cls._key is not None
+        finally:
+            cls.stop()
+
+    def test_handle(self):
+        self.cls.start()
+        body = urlencode({'payload': self.payload})
+        assert self.cls.handle(body, sign(self.payload), 'me/repo') == 204
+        res = self.cls.get()
+        assert len(res) == 1
+        assert res[0][0] == 'me/repo'
+        assert res[0][1].id == 123
+        assert res[0][1].state == 'passed'
+        assert self.cls.get() == []
+
+    def test_handle_bad_signature(self):
+        self.cls.start()
+        body = urlencode({'payload': self.payload})
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.handle(body, sign('foo'), 'me/repo') == 403
+            assert self.cls.handle(body, 'not base64!', 'me/repo') == 403
+        assert self.cls.get() == []
+        assert mock_logger.mock_calls == [
+            call.warning("Ignoring webhook notification for %s with an "
+                         "invalid signature", 'me/repo'),
+            call.warning("Ignoring webhook notification for %s with an "
+                         "invalid signature", 'me/repo'),
+        ]
+
+    def test_handle_missing(self):
+        self.cls.start()
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.handle('', sign('foo'), 'me/repo') == 400
+            assert self.cls.handle(urlencode({'payload': self.payload}),
+                                   None, 'me/repo') == 400
+        assert self.cls.get() == []
+        assert mock_logger.warning.call_count == 2
+
+    def test_handle_bad_payload(self):
+        self.cls.start()
+        payload = json.dumps({'state': 'passed'})
+        body = urlencode({'payload': payload})
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert self.cls.handle(body, sign(payload), 'me/repo') == 400
+        assert self.cls.get() == []
+        assert mock_logger.mock_calls == [
+            call.warning("Ignoring unparseable webhook notification for %s",
+                         'me/repo')
+        ]
+
+    def test_server(self):
+        self.cls.start()
+        assert self.cls.port != 0
+        assert post_webhook(self.cls.port, self.payload, sign(self.payload),
+                            'me/repo') == 204
+        assert post_webhook(self.cls.port, self.payload, sign('foo'),
+                            'me/repo') == 403
+        res = self.cls.get(timeout=5)
+        assert [(slug, b.id) for slug, b in res] == [('me/repo', 123)]
+        self.cls.stop()
+        assert self.cls.server is None
+
+    def test_get_timeout(self):
+        assert self.cls.get(timeout=0.01) == []
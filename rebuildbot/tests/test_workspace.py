@@ -0,0 +1,186 @@
+"""
+rebuildbot/tests/test_workspace.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import sys
+import subprocess
+import pytest
+
+from rebuildbot.workspace import WorkspaceManager, dir_size
+from rebuildbot.reaper import Reaper, REAP_PREFIX
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import Mock, patch, call
+else:
+    from unittest.mock import Mock, patch, call
+
+pbm = 'rebuildbot.workspace'
+pb = '%s.WorkspaceManager' % pbm
+
+
+def git(path, *args):
+    """run a git command in ``path``"""
+    subprocess.check_call(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] +
+        list(args), cwd=path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+
+
+def make_origin(tmpdir):
+    """create an origin repository; return its path"""
+    origin = tmpdir.mkdir('origin')
+    git(str(origin), 'init', '-q')
+    git(str(origin), 'checkout', '-q', '-b', 'master')
+    origin.join('.gitignore').write('vendor/\n')
+    origin.join('file.txt').write('one\n')
+    git(str(origin), 'add', '.')
+    git(str(origin), 'commit', '-q', '-m', 'first')
+    return str(origin)
+
+
+class TestWorkspaceManager(object):
+
+    def test_init(self):
+        cls = WorkspaceManager('/foo')
+        assert cls.root == '/foo'
+        assert cls.max_size_mb == 20480
+        assert cls.reaper is None
+
+    def test_path_for(self):
+        cls = WorkspaceManager('/foo')
+        assert cls.path_for('me/repo') == '/foo/me__repo'
+
+    def test_prepare_clone_and_update(self, tmpdir):
+        origin = make_origin(tmpdir)
+        cls = WorkspaceManager(str(tmpdir.join('ws')))
+        path, repo_str = cls.prepare('me/repo', [origin])
+        assert path == str(tmpdir.join('ws', 'me__repo'))
+        assert repo_str.startswith('<%s> master (' % origin)
+        ws = tmpdir.join('ws', 'me__repo')
+        assert ws.join('file.txt').read() == 'one\n'
+        # dirty the workspace
+        ws.join('file.txt').write('changed\n')
+        ws.join('untracked.txt').write('foo')
+        ws.mkdir('vendor').join('gem').write('bar')
+        # new commit upstream
+        tmpdir.join('origin', 'file.txt').write('two\n')
+        git(origin, 'commit', '-q', '-a', '-m', 'second')
+        with patch('%s.clone' % pb) as mock_clone:
+            path2, repo_str2 = cls.prepare('me/repo', [origin])
+        assert mock_clone.mock_calls == []
+        assert path2 == path
+        assert repo_str2 != repo_str
+        assert ws.join('file.txt').read() == 'two\n'
+        assert ws.join('untracked.txt').exists() is False
+        assert ws.join('vendor', 'gem').read() == 'bar'
+
+    def test_prepare_fallback_url(self, tmpdir):
+        origin = make_origin(tmpdir)
+        cls = WorkspaceManager(str(tmpdir.join('ws')))
+        bad = str(tmpdir.join('nonexistent'))
+        path, repo_str = cls.prepare('me/repo', [None, bad, origin])
+        assert repo_str.startswith('<%s> master (' % origin)
+
+    def test_prepare_all_fail(self, tmpdir):
+        cls = WorkspaceManager(str(tmpdir.join('ws')))
+        bad = str(tmpdir.join('nonexistent'))
+        with pytest.raises(Exception):
+            cls.prepare('me/repo', [bad])
+
+    def test_prepare_reclones_broken_workspace(self, tmpdir):
+        origin = make_origin(tmpdir)
+        ws = tmpdir.mkdir('ws').mkdir('me__repo')
+        ws.join('junk').write('foo')
+        cls = WorkspaceManager(str(tmpdir.join('ws')))
+        path, repo_str = cls.prepare('me/repo', [origin])
+        assert ws.join('junk').exists() is False
+        assert ws.join('file.txt').read() == 'one\n'
+
+    def test_evict(self, tmpdir):
+        root = tmpdir.mkdir('ws')
+        for name, mtime in [('a', 300), ('b', 100), ('c', 200)]:
+            d = root.mkdir(name)
+            d.join('data').write('x' * 1024 * 1024)
+            os.utime(str(d), (mtime, mtime))
+        cls = WorkspaceManager(str(root), max_size_mb=1)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            cls.evict(keep=['b'])
+        # b is oldest but kept; c is next oldest, then a
+        assert mock_rmtree.mock_calls == [
+            call(str(root.join('c'))),
+            call(str(root.join('a')))
+        ]
+
+    def test_evict_reaper(self, tmpdir):
+        root = tmpdir.mkdir('ws')
+        root.mkdir('a').join('data').write('x' * 2 * 1024 * 1024)
+        root.mkdir(REAP_PREFIX + 'foo').join('data').write('x' * 1024)
+        reaper = Mock(spec_set=Reaper)
+        cls = WorkspaceManager(str(root), max_size_mb=1, reaper=reaper)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            cls.evict()
+        assert mock_rmtree.mock_calls == []
+        assert reaper.mock_calls == [call.reap(str(root.join('a')))]
+
+    def test_evict_under_limit(self, tmpdir):
+        root = tmpdir.mkdir('ws')
+        root.mkdir('a').join('data').write('x' * 1024)
+        cls = WorkspaceManager(str(root), max_size_mb=1)
+        with patch('%s.rmtree' % pbm) as mock_rmtree:
+            cls.evict()
+        assert mock_rmtree.mock_calls == []
+
+    def test_evict_no_limit(self, tmpdir):
+        cls = WorkspaceManager(str(tmpdir), max_size_mb=None)
+        with patch('%s.os.listdir' % pbm) as mock_listdir:
+            cls.evict()
+        assert mock_listdir.mock_calls == []
+
+
+class TestDirSize(object):
+
+    def test_dir_size(self, tmpdir):
+        tmpdir.join('a').write('x' * 10)
+        tmpdir.mkdir('b').join('c').write('x' * 5)
+        assert dir_size(str(tmpdir)) == 15
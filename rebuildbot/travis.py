@@ -41,10 +41,13 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import time
 import logging
+import threading
 from dateutil import parser
 from datetime import timedelta, datetime
 import pytz
 from rebuildbot.exceptions import (PollTimeoutException, TravisTriggerError)
+from rebuildbot.httpsession import HTTPConfig
+from rebuildbot.authcache import fingerprint
 
 try:
     from urllib import quote
@@ -58,6 +61,15 @@ logger = logging.getLogger(__name__)
 
 CHECK_WAIT_TIME = 10  # seconds to wait before polling for builds
 POLL_NUM_TIMES = 6  # how many times to poll before raising exception
+BATCH_PAGE_SIZE = 100  # builds per page when listing recent builds
+BATCH_MAX_PAGES = 10  # maximum pages to read when listing recent builds
+PENDING_STATES = ['created', 'received', 'queued', 'started', 'pending']
+V3_PENDING_STATES = ['created', 'received', 'started']
+TRIGGER_MESSAGE = 'triggered by https://github.com/jantman/rebuildbot'
+V3_HEADERS = {
+    'Accept': 'application/json',
+    'Travis-API-Version': '3',
+}
 
 
 class Travis(object):
@@ -65,19 +77,110 @@ class Travis(object):
     ReBuildBot wrapper around TravisPy.
     """
 
-    def __init__(self, github_token):
+    def __init__(self, github_token, http=None, cache=None, uri=PUBLIC):
         """
         Connect to TravisCI. Return a connected TravisPy instance.
 
+        If ``cache`` has a Travis access token and user for ``github_token``,
+        they are used instead of exchanging the GitHub token for a Travis
+        one and looking up the user, so that no requests are made; if
+        Travis later rejects the cached token, the GitHub token is exchanged
+        again then (see :py:meth:`~._retry_unauthorized`). Otherwise the
+        results of those requests are stored in it.
+
         :param github_token: GitHub access token to auth to Travis with
         :type github_token: str
+        :param http: shared HTTP settings to configure TravisPy's session with
+        :type http: :py:class:`~.HTTPConfig`
+        :param cache: cache of authentication results
+        :type cache: :py:class:`~.AuthCache`
+        :param uri: base URI of the Travis API
+        :type uri: str
         :rtype: :py:class:`TravisPy`
         """
-        self.travis = TravisPy.github_auth(github_token)
-        self.user = self.travis.user()
+        self.uri = uri
+        if http is None:
+            http = HTTPConfig()
+        self.cache = cache
+        self.cache_key = 'travis:' + fingerprint(github_token)
+        self._github_token = None
+        self._auth_lock = threading.Lock()
+        cached = None
+        if cache is not None:
+            cached = cache.get(self.cache_key)
+        if cached is None or 'user' not in cached:
+            self.travis = TravisPy.github_auth(github_token, uri=uri)
+            http.configure_session(self.travis._session, 'travis')
+            self.user = self.travis.user()
+            if cache is not None:
+                cache.set(self.cache_key, self.cache_value())
+        else:
+            logger.debug("Using cached Travis access token")
+            self.travis = TravisPy(cached['token'], uri=uri)
+            http.configure_session(self.travis._session, 'travis')
+            self.user = TravisUser(cached['user'])
+            self._github_token = github_token
+            self.travis._session.hooks['response'].append(
+                self._retry_unauthorized)
         logger.debug("Authenticated to TravisCI as %s <%s> (user ID %s)",
                      self.user.login, self.user.email, self.user.id)
 
+    def cache_value(self):
+        """
+        Return the access token and user, as stored in the
+        :py:class:`~.AuthCache`.
+
+        :rtype: dict
+        """
+        return {
+            'token': self.access_token,
+            'user': {'login': self.user.login, 'email': self.user.email,
+                     'id': self.user.id}
+        }
+
+    def _retry_unauthorized(self, response, **kwargs):
+        """
+        Response hook for TravisPy's session when authenticated with a
+        cached access token. The first time Travis rejects the token (HTTP
+        401), remove it from the cache, exchange the GitHub token for a new
+        one and store that, and re-send the request with it; requests that
+        were sent with the old token are re-sent with the new one.
+
+        :param response: the response
+        :type response: :py:class:`requests.Response`
+        :param kwargs: the keyword arguments the request was sent with
+        :rtype: :py:class:`requests.Response`
+        """
+        if response.status_code != 401:
+            return response
+        session = self.travis._session
+        with self._auth_lock:
+            auth = session.headers['Authorization']
+            if response.request.headers.get('Authorization') == auth:
+                if self._github_token is None:
+                    return response
+                logger.info("Cached Travis access token was rejected; "
+                            "re-authenticating")
+                github_token = self._github_token
+                self._github_token = None
+                self.cache.delete(self.cache_key)
+                authed = TravisPy.github_auth(github_token, uri=self.uri)
+                auth = authed._session.headers['Authorization']
+                session.headers['Authorization'] = auth
+                self.cache.set(self.cache_key, self.cache_value())
+        req = response.request.copy()
+        req.headers['Authorization'] = auth
+        return session.send(req, **kwargs)
+
+    @property
+    def access_token(self):
+        """
+        Return the Travis access token that TravisPy authenticates with.
+
+        :rtype: str
+        """
+        return self.travis._session.headers['Authorization'].split(' ', 1)[1]
+
     def get_repos(self, date_check=True):
         """
         Return a list of all repo names for the current authenticated user. If
@@ -94,23 +197,59 @@ class Travis(object):
         :returns: list of the user's repository slugs
         :rtype: list of strings
         """
-        repos = []
+        repos = list(self.iter_repos(date_check=date_check))
+        logger.debug('Found %d repos: %s', len(repos), repos)
+        return sorted(repos)
+
+    def iter_repos(self, date_check=True):
+        """
+        Generator version of :py:meth:`~.get_repos`; yields each repository
+        slug as it is checked.
+
+        :param date_check: whether or not to only return repos with a last
+        build more than 24 hours ago.
+        :type date_check: bool
+        :returns: generator of the user's repository slugs
+        """
+        for r in self.iter_user_repos():
+            if self.repo_eligible(r, date_check=date_check):
+                yield r.slug
+
+    def iter_user_repos(self):
+        """
+        Generator of the Travis repository objects owned by the current
+        authenticated user; see :py:meth:`~.get_repos`.
+
+        :returns: generator of :py:class:`travispy.entities.Repo` objects
+        """
         for r in self.travis.repos(member=self.user.login):
             if not r.slug.startswith(self.user.login + '/'):
                 logger.debug("Ignoring repo owned by another user: %s", r.slug)
                 continue
-            build_in_last_day = False
-            try:
-                build_in_last_day = self.repo_build_in_last_day(r)
-            except KeyError:
-                logger.debug('Skipping repo with no builds: %s', r.slug)
-                continue
-            if date_check and build_in_last_day:
-                logger.debug("Skipping repo with build in last day: %s", r.slug)
-                continue
-            repos.append(r.slug)
-        logger.debug('Found %d repos: %s', len(repos), repos)
-        return sorted(repos)
+            yield r
+
+    def repo_eligible(self, repo, date_check=True):
+        """
+        Return whether a repository from :py:meth:`~.iter_user_repos` should
+        have a build triggered: it has been built before and, if
+        ``date_check`` is True, its last build was more than 24 hours ago.
+
+        :param repo: Travis repository object
+        :type repo: :py:class:`travispy.entities.Repo`
+        :param date_check: whether or not to skip repos with a build in the
+          last 24 hours
+        :type date_check: bool
+        :rtype: bool
+        """
+        try:
+            build_in_last_day = self.repo_build_in_last_day(repo)
+        except KeyError:
+            logger.debug('Skipping repo with no builds: %s', repo.slug)
+            return False
+        if date_check and build_in_last_day:
+            logger.debug("Skipping repo with build in last day: %s", repo.slug)
+            return False
+        return True
 
     def repo_build_in_last_day(self, repo):
         """
@@ -125,7 +264,8 @@ class Travis(object):
             return False
         return True
 
-    def run_build(self, repo_slug, branch='master'):
+    def run_build(self, repo_slug, branch='master', attach=False,
+                  cancel_stale=False):
         """
         Trigger a Travis build of the specified repository on the specified
         branch. Wait for the build repository's latest build ID to change,
@@ -133,14 +273,41 @@ class Travis(object):
         If the new build has not started within the timeout interval, the
         new build ID will be None.
 
+        If ``attach`` is True and a build of the branch is already pending
+        or running (see :py:meth:`~.get_pending_builds`), no build is
+        triggered, and the old build ID returned is None and the new one is
+        that of the newest such build. If ``cancel_stale`` is True, pending
+        or running builds of the branch that ReBuildBot triggered, other than
+        the one attached to, are cancelled (see
+        :py:meth:`~.cancel_stale_builds`).
+
         :param repo_slug: repository slug (<username>/<repo_name>)
         :type repo_slug: string
         :param branch: name of the branch to build
         :type branch: string
+        :param attach: whether to use a build that is already in progress
+          instead of triggering another
+        :type attach: bool
+        :param cancel_stale: whether to cancel builds previously triggered
+          by ReBuildBot that are still in progress
+        :type cancel_stale: bool
         :raises: PollTimeoutException, TravisTriggerError
         :returns: (last build ID, new build ID)
         :rtype: tuple
         """
+        pending = []
+        if attach or cancel_stale:
+            pending = self.get_pending_builds(repo_slug, branch=branch)
+        keep = None
+        if attach and len(pending) > 0:
+            keep = pending[0]
+        if cancel_stale:
+            self.cancel_stale_builds(repo_slug, pending, keep=keep)
+        if keep is not None:
+            logger.info("Travis build #%s (%s) of %s is already %s; not "
+                        "triggering another", keep.number, keep.id, repo_slug,
+                        keep.state)
+            return (None, keep.id)
         repo = self.travis.repo(repo_slug)
         logger.info("Travis Repo %s (%s): pending=%s queued=%s running=%s "
                     "state=%s", repo_slug, repo.id, repo.pending, repo.queued,
@@ -215,15 +382,13 @@ class Travis(object):
         body = {
             'request': {
                 'branch': branch,
-                'message': 'triggered by https://github.com/jantman/rebuildbot'
+                'message': TRIGGER_MESSAGE
             }
         }
-        url = PUBLIC + '/repo/' + quote(repo_slug, safe='') + '/requests'
+        url = self.uri + '/repo/' + quote(repo_slug, safe='') + '/requests'
         logger.debug("Triggering build of %s %s via %s", repo_slug, branch, url)
-        headers = self.travis._HEADERS
+        headers = dict(V3_HEADERS)
         headers['Content-Type'] = 'application/json'
-        headers['Accept'] = 'application/json'
-        headers['Travis-API-Version'] = '3'
         res = self.travis._session.post(url, json=body, headers=headers)
         if res.status_code >= 200 and res.status_code < 300:
             logger.info("Successfully triggered build on %s", repo_slug)
@@ -231,6 +396,124 @@ class Travis(object):
         raise TravisTriggerError(repo_slug, branch, url, res.status_code,
                                  res.headers, res.text)
 
+    def get_pending_builds(self, repo_slug, branch='master'):
+        """
+        Return the builds of a branch of a repository that are pending or
+        running, newest first, from the v3 API's build listing.
+
+        :param repo_slug: repository slug (<username>/<repo_name>)
+        :type repo_slug: string
+        :param branch: name of the branch
+        :type branch: string
+        :returns: list of :py:class:`~.BuildStatus`
+        :rtype: list
+        """
+        url = self.uri + '/repo/%s/builds?branch.name=%s&state=%s' \
+            '&sort_by=id:desc&limit=%d' % (
+                quote(repo_slug, safe=''), quote(branch, safe=''),
+                ','.join(V3_PENDING_STATES), BATCH_PAGE_SIZE
+            )
+        logger.debug("Listing pending Travis builds of %s via %s", repo_slug,
+                     url)
+        r = self.travis._session.get(url, headers=V3_HEADERS)
+        r.raise_for_status()
+        builds = [BuildStatus(b) for b in r.json().get('builds', [])]
+        return [b for b in builds if not b.finished]
+
+    def cancel_stale_builds(self, repo_slug, builds, keep=None):
+        """
+        Cancel each of ``builds`` (pending or running builds of
+        ``repo_slug``) that was triggered by ReBuildBot, except ``keep``.
+        Return the number cancelled.
+
+        :param repo_slug: repository slug (<username>/<repo_name>)
+        :type repo_slug: string
+        :param builds: builds to consider
+        :type builds: list of :py:class:`~.BuildStatus`
+        :param keep: build not to cancel, if any
+        :type keep: :py:class:`~.BuildStatus`
+        :rtype: int
+        """
+        count = 0
+        for b in builds:
+            if b is keep or not b.triggered_by_rebuildbot:
+                continue
+            logger.info("Cancelling stale Travis build #%s (%s) of %s",
+                        b.number, b.id, repo_slug)
+            if self.cancel_build(b.id):
+                count += 1
+        return count
+
+    def cancel_build(self, build_id):
+        """
+        Cancel a Travis build. Return True if it was cancelled; failures are
+        logged.
+
+        :param build_id: the ID of the build to cancel
+        :type build_id: int
+        :rtype: bool
+        """
+        url = self.uri + '/build/%s/cancel' % build_id
+        res = self.travis._session.post(url, headers=V3_HEADERS)
+        if res.status_code >= 200 and res.status_code < 300:
+            return True
+        logger.warning("Unable to cancel Travis build %s: %s %s", build_id,
+                       res.status_code, res.text)
+        return False
+
+    def webhook_public_key(self):
+        """
+        Return the PEM-encoded public key that Travis signs webhook
+        notifications with, from the API's ``/config`` endpoint.
+
+        :rtype: str
+        """
+        res = self.travis._session.get(
+            self.uri + '/config',
+            headers={'Accept': 'application/vnd.travis-ci.2+json'}
+        )
+        res.raise_for_status()
+        return res.json()['config']['notifications']['webhook']['public_key']
+
+    def get_recent_builds(self, min_id, max_pages=BATCH_MAX_PAGES):
+        """
+        Return the current user's builds (across all repositories) with IDs
+        of at least ``min_id``, newest first, from the v3 API's ``/builds``
+        listing. This takes one request per :py:const:`~.BATCH_PAGE_SIZE`
+        builds, regardless of how many repositories they are for, up to
+        ``max_pages`` pages; older builds beyond that are not returned.
+
+        Return a 2-tuple of the list of :py:class:`~.BuildStatus` and the
+        lowest build ID that the list is complete down to; this is
+        ``min_id`` unless the page limit was reached first.
+
+        :param min_id: the lowest build ID of interest
+        :type min_id: int
+        :param max_pages: maximum number of pages to read
+        :type max_pages: int
+        :rtype: tuple
+        """
+        url = self.uri + '/builds?limit=%d&sort_by=id:desc' % BATCH_PAGE_SIZE
+        res = []
+        for _ in range(max_pages):
+            logger.debug("Listing recent Travis builds via %s", url)
+            r = self.travis._session.get(url, headers=V3_HEADERS)
+            r.raise_for_status()
+            data = r.json()
+            for b in data.get('builds', []):
+                if b['id'] < min_id:
+                    return res, min_id
+                res.append(BuildStatus(b))
+            pagination = data.get('@pagination', {})
+            if pagination.get('is_last', True) or not pagination.get('next'):
+                return res, min_id
+            url = self.uri + pagination['next']['@href']
+        logger.debug("Stopped listing recent Travis builds after %d pages",
+                     max_pages)
+        if len(res) == 0:
+            return res, min_id
+        return res, res[-1].id
+
     @staticmethod
     def url_for_build(repo_slug, build_num):
         """
@@ -251,3 +534,69 @@ class Travis(object):
         b = self.travis.build(build_id)
         b.check_state()
         return b
+
+
+class TravisUser(object):
+    """
+    The attributes of a :py:class:`travispy.entities.user.User` that
+    ReBuildBot uses, as stored in the :py:class:`~.AuthCache`.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: dict with ``login``, ``email`` and ``id`` keys
+        :type data: dict
+        """
+        self.login = data['login']
+        self.email = data['email']
+        self.id = data['id']
+
+
+class BuildStatus(object):
+    """
+    A Travis build, as described by a v3 API build representation or a
+    webhook notification payload (which share these fields). This has the
+    attributes of :py:class:`travispy.entities.build.Build` that
+    :py:meth:`~.BuildInfo.set_travis_build_finished` uses, so it can be
+    stored in the same way.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: the decoded build representation or payload
+        :type data: dict
+        """
+        self.id = data['id']
+        self.number = data.get('number', None)
+        self.state = data.get('state', None)
+        self.duration = data.get('duration', None)
+        self.slug = (data.get('repository', None) or {}).get('slug', None)
+        # webhook payloads have the commit SHA as ``commit``, and its message
+        # and the event type at the top level
+        commit = data.get('commit', None)
+        if isinstance(commit, dict):
+            self.message = commit.get('message', None)
+        else:
+            self.message = data.get('message', None)
+        self.event_type = data.get('event_type', data.get('type', None))
+        # a partial representation without a state is not known to be done
+        self.finished = (
+            self.state is not None and self.state not in PENDING_STATES
+        )
+        self.errored = self.state == 'errored'
+        if self.state == 'passed':
+            self.color = 'green'
+        elif not self.finished:
+            self.color = 'yellow'
+        else:
+            self.color = 'red'
+
+    @property
+    def triggered_by_rebuildbot(self):
+        """
+        Return whether this build was triggered by
+        :py:meth:`~.Travis.trigger_travis`.
+
+        :rtype: bool
+        """
+        return self.event_type == 'api' and self.message == TRIGGER_MESSAGE
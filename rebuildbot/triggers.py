@@ -0,0 +1,197 @@
+"""
+rebuildbot/triggers.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRIGGER_THREADS = 4  # Travis builds triggered at once
+
+
+class TriggerQueue(object):
+    """
+    Triggers Travis builds from background threads, several at a time, but
+    only admits as many as keep the number of Travis builds in flight
+    (triggered but not yet finished) within ``max_in_flight``; the rest wait
+    in the queue and are admitted by later calls to :py:meth:`~.admit` as
+    builds finish. Travis only runs a limited number of builds at once per
+    account, so triggering more than that just leaves them queued on Travis.
+
+    Only the main thread calls the methods of this class; the ``trigger``
+    function is called in a background thread per build.
+    """
+
+    def __init__(self, trigger, max_in_flight=None,
+                 threads=DEFAULT_TRIGGER_THREADS):
+        """
+        :param trigger: function to trigger one build; called with the
+          repository slug and its BuildInfo
+        :type trigger: callable
+        :param max_in_flight: maximum number of Travis builds in flight at
+          once, or None for no limit
+        :type max_in_flight: int
+        :param threads: maximum number of builds to trigger at once
+        :type threads: int
+        """
+        self.trigger = trigger
+        self.max_in_flight = max_in_flight
+        self.threads = max(threads, 1)
+        self.waiting = []
+        """list of (slug, BuildInfo) 2-tuples waiting to be triggered"""
+        self.running = {}
+        """mapping of slugs to the threads triggering their builds"""
+
+    def add(self, slug, build_info):
+        """
+        Queue the Travis build of ``slug`` to be triggered, unless it already
+        is. Return True if it was added.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param build_info: the BuildInfo for the repository
+        :type build_info: :py:class:`~.BuildInfo`
+        :rtype: bool
+        """
+        if self.is_queued(slug):
+            return False
+        self.waiting.append((slug, build_info))
+        return True
+
+    def is_queued(self, slug):
+        """
+        Return whether the build of ``slug`` is waiting to be triggered or
+        being triggered.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: bool
+        """
+        if slug in self.running:
+            return True
+        return slug in [s for s, _ in self.waiting]
+
+    @property
+    def busy(self):
+        """
+        Return True while any builds are waiting or being triggered.
+
+        :rtype: bool
+        """
+        return len(self.waiting) > 0 or len(self.running) > 0
+
+    def slots(self, in_flight):
+        """
+        Return the number of builds that may start being triggered now.
+
+        :param in_flight: number of triggered builds that have not finished,
+          not counting those being triggered
+        :type in_flight: int
+        :rtype: int
+        """
+        free = self.threads - len(self.running)
+        if self.max_in_flight is not None:
+            free = min(free,
+                       self.max_in_flight - in_flight - len(self.running))
+        return max(free, 0)
+
+    def admit(self, in_flight):
+        """
+        Start triggering as many waiting builds, in the order they were
+        queued, as :py:meth:`~.slots` allows. Return the list of their slugs.
+
+        :param in_flight: number of triggered builds that have not finished,
+          not counting those being triggered
+        :type in_flight: int
+        :rtype: list
+        """
+        started = []
+        count = min(self.slots(in_flight), len(self.waiting))
+        for slug, build_info in self.waiting[:count]:
+            logger.info("Triggering Travis build of %s", slug)
+            t = threading.Thread(target=self.trigger, args=(slug, build_info),
+                                 name='trigger-%s' % slug)
+            t.daemon = True
+            self.running[slug] = t
+            t.start()
+            started.append(slug)
+        self.waiting = self.waiting[count:]
+        if len(self.waiting) > 0:
+            logger.debug("%d Travis builds in flight and %d being triggered; "
+                         "%d waiting to be triggered", in_flight,
+                         len(self.running), len(self.waiting))
+        return started
+
+    def collect(self):
+        """
+        Return the list of slugs whose builds have finished being triggered
+        since the last call.
+
+        :rtype: list
+        """
+        finished = []
+        for slug, t in sorted(self.running.items()):
+            if t.is_alive():
+                continue
+            t.join()
+            del self.running[slug]
+            finished.append(slug)
+        return finished
+
+    def wait(self):
+        """
+        Wait for every build being triggered to finish being triggered, and
+        return their slugs (see :py:meth:`~.collect`).
+
+        :rtype: list
+        """
+        for slug, t in sorted(self.running.items()):
+            t.join()
+        return self.collect()
+
+    def clear(self):
+        """
+        Drop all builds that are waiting to be triggered, and return their
+        slugs.
+
+        :rtype: list
+        """
+        dropped = [s for s, _ in self.waiting]
+        self.waiting = []
+        return dropped
@@ -0,0 +1,243 @@
+"""
+rebuildbot/webhook.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import json
+import base64
+import logging
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+try:
+    from urlparse import parse_qs
+except ImportError:
+    from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEBHOOK_WINDOW = 1800  # seconds to wait for a webhook before polling
+WEBHOOK_POLL_INTERVAL = 300  # seconds between fallback polls of a build
+
+
+class WebhookReceiver(object):
+    """
+    Embedded HTTP server that receives Travis CI `webhook notifications
+    <https://docs.travis-ci.com/user/notifications/#configuring-webhook-notifications>`_,
+    verifies their signatures against the Travis public key, and hands the
+    builds they describe to the main thread via :py:meth:`~.get`. The server
+    runs in a daemon thread, so a slow or malicious client cannot block the
+    main loop.
+
+    Signature verification needs the optional ``cryptography`` package; it is
+    imported when the receiver is started.
+    """
+
+    def __init__(self, port, public_key=None, host=''):
+        """
+        :param port: TCP port to listen on; 0 to pick a free one
+        :type port: int
+        :param public_key: PEM-encoded Travis webhook public key, from
+          :py:meth:`~.Travis.webhook_public_key`; may instead be given to
+          :py:meth:`~.start`
+        :type public_key: str
+        :param host: address to listen on; defaults to all addresses
+        :type host: str
+        """
+        self.host = host
+        self.port = port
+        self.public_key = public_key
+        self.queue = Queue()
+        self.server = None
+        self.thread = None
+        self._key = None
+
+    def start(self, public_key=None):
+        """
+        Load the public key and start serving in a background thread.
+
+        :param public_key: PEM-encoded Travis webhook public key, if not
+          given to the constructor
+        :type public_key: str
+        """
+        if public_key is not None:
+            self.public_key = public_key
+        self._key = load_public_key(self.public_key)
+        self.server = HTTPServer((self.host, self.port), WebhookHandler)
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name='webhook-receiver')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info("Listening for Travis webhook notifications on port %d",
+                    self.port)
+
+    def stop(self):
+        """
+        Stop the server, if it is running.
+        """
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+        logger.debug("Stopped webhook receiver")
+
+    def get(self, timeout=None):
+        """
+        Return a list of (repository slug, :py:class:`~.BuildStatus`)
+        2-tuples received since the last call, without blocking. If
+        ``timeout`` is given and nothing has been received yet, wait up to
+        that many seconds for the first one.
+
+        :param timeout: seconds to wait if nothing is available, or None to
+          return immediately
+        :type timeout: float
+        :rtype: list
+        """
+        res = []
+        block = timeout is not None
+        while True:
+            try:
+                res.append(self.queue.get(block, timeout))
+            except Empty:
+                break
+            block = False
+        return res
+
+    def handle(self, body, signature, slug):
+        """
+        Handle the body of a webhook POST request; verify it and queue the
+        build it describes. Return the HTTP status code to respond with.
+
+        :param body: the (form-encoded) request body
+        :type body: str
+        :param signature: the base64-encoded ``Signature`` header
+        :type signature: str
+        :param slug: the ``Travis-Repo-Slug`` header
+        :type slug: str
+        :rtype: int
+        """
+        payload = parse_qs(body).get('payload', [None])[0]
+        if payload is None or signature is None or slug is None:
+            logger.warning("Ignoring webhook request with no payload, "
+                           "signature or repository slug")
+            return 400
+        if not self.verify(payload, signature):
+            logger.warning("Ignoring webhook notification for %s with an "
+                           "invalid signature", slug)
+            return 403
+        from .travis import BuildStatus
+        try:
+            build = BuildStatus(json.loads(payload))
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unparseable webhook notification for %s",
+                           slug)
+            return 400
+        logger.debug("Received webhook notification for %s build %s: %s",
+                     slug, build.id, build.state)
+        self.queue.put((slug, build))
+        return 204
+
+    def verify(self, payload, signature):
+        """
+        Return whether ``signature`` is a valid Travis signature of
+        ``payload``.
+
+        :param payload: the JSON payload string
+        :type payload: str
+        :param signature: the base64-encoded signature
+        :type signature: str
+        :rtype: bool
+        """
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        try:
+            self._key.verify(base64.b64decode(signature),
+                             payload.encode('utf-8'), padding.PKCS1v15(),
+                             hashes.SHA1())
+        except (InvalidSignature, TypeError, ValueError):
+            return False
+        return True
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for :py:class:`~.WebhookReceiver`; passes POST bodies to
+    :py:meth:`~.WebhookReceiver.handle`.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if not isinstance(body, str):
+            body = body.decode('utf-8')
+        code = self.server.receiver.handle(
+            body, self.headers.get('Signature'),
+            self.headers.get('Travis-Repo-Slug')
+        )
+        self.send_response(code)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Webhook request from %s: " + format,
+                     self.client_address[0], *args)
+
+
+def load_public_key(pem):
+    """
+    Load a PEM-encoded RSA public key.
+
+    :param pem: the PEM-encoded key
+    :type pem: str
+    :rtype: ``cryptography`` RSAPublicKey
+    """
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    return load_pem_public_key(pem.encode('utf-8'), default_backend())
@@ -0,0 +1,230 @@
+"""
+rebuildbot/workspace.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/rebuildbot>
+
+################################################################################
+Copyright 2015 Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+    This file is part of rebuildbot.
+
+    rebuildbot is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    rebuildbot is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with rebuildbot.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/rebuildbot> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import os
+import logging
+from shutil import rmtree
+
+from .reaper import REAP_PREFIX
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE_MB = 20480  # total size of all workspaces before eviction
+
+
+class WorkspaceManager(object):
+    """
+    Manages persistent per-repository workspaces (clones) for local builds.
+
+    Rather than cloning a fresh copy of the repository for every build and
+    removing it afterwards, each repository has a workspace under ``root``
+    that is updated before each build with a fetch, hard reset and
+    ``git clean``. ``git clean`` is run without ``-x``, so files ignored by
+    the repository (i.e. ``vendor/bundle``, ``.tox`` or ``.vagrant``) are
+    preserved between builds.
+
+    When the total size of all workspaces exceeds ``max_size_mb``, the least
+    recently used workspaces are removed until it no longer does.
+    """
+
+    def __init__(self, root, max_size_mb=DEFAULT_MAX_SIZE_MB, reaper=None):
+        """
+        :param root: directory to keep workspaces in
+        :type root: str
+        :param max_size_mb: maximum total size of all workspaces, in MB, or
+          None for no limit
+        :type max_size_mb: int
+        :param reaper: if not None, remove workspaces in the background with
+          this reaper instead of synchronously
+        :type reaper: :py:class:`~.Reaper`
+        """
+        self.root = root
+        self.max_size_mb = max_size_mb
+        self.reaper = reaper
+
+    def path_for(self, slug):
+        """
+        Return the workspace path for a repository.
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :rtype: str
+        """
+        return os.path.join(self.root, slug.replace('/', '__'))
+
+    def prepare(self, slug, urls, branch='master'):
+        """
+        Bring the workspace for ``slug`` up to date with the HEAD of
+        ``branch``, trying each of ``urls`` in order. If there is no usable
+        workspace, or updating it fails, it is (re-)cloned. Return a 2-tuple
+        of (path on disk, string describing the state of the repo).
+
+        :param slug: the repository slug / full name
+        :type slug: str
+        :param urls: URLs to fetch or clone from, in order of preference
+        :type urls: list
+        :param branch: name of the branch to build
+        :type branch: str
+        :rtype: tuple
+        """
+        path = self.path_for(slug)
+        excinfo = None
+        for url in urls:
+            if url is None:
+                continue
+            try:
+                if os.path.exists(os.path.join(path, '.git')):
+                    repo = self.update(path, url, branch)
+                else:
+                    repo = self.clone(path, url, branch)
+                os.utime(path, None)
+                repo_str = '<%s> %s (%s)' % (url, repo.head.ref.name,
+                                             repo.head.ref.commit.hexsha)
+                return (path, repo_str)
+            except Exception as ex:
+                logger.warning("Unable to prepare workspace %s from %s: %s",
+                               path, url, ex)
+                excinfo = ex
+        raise excinfo
+
+    def update(self, path, url, branch):
+        """
+        Update an existing workspace to the HEAD of ``branch`` at ``url``,
+        discarding any local changes and untracked (but not ignored) files.
+
+        :param path: path to the workspace
+        :type path: str
+        :param url: URL to fetch from
+        :type url: str
+        :param branch: name of the branch to build
+        :type branch: str
+        :rtype: :py:class:`git.Repo`
+        """
+        from git import Repo
+        logger.debug("Updating workspace %s from %s %s", path, url, branch)
+        repo = Repo(path)
+        repo.git.fetch(url, branch)
+        repo.git.checkout('-f', '-B', branch, 'FETCH_HEAD')
+        repo.git.reset('--hard', 'FETCH_HEAD')
+        repo.git.clean('-f', '-d')
+        return repo
+
+    def clone(self, path, url, branch):
+        """
+        Clone ``branch`` of ``url`` into a new workspace at ``path``, removing
+        anything already there.
+
+        :param path: path to the workspace
+        :type path: str
+        :param url: URL to clone
+        :type url: str
+        :param branch: name of the branch to build
+        :type branch: str
+        :rtype: :py:class:`git.Repo`
+        """
+        if os.path.exists(path):
+            logger.debug("Removing unusable workspace %s", path)
+            self.remove(path)
+        from git import Repo
+        logger.debug("Cloning %s into workspace %s", url, path)
+        return Repo.clone_from(url, path, branch=branch)
+
+    def evict(self, keep=None):
+        """
+        If the total size of all workspaces exceeds ``self.max_size_mb``,
+        remove the least recently used ones until it does not.
+
+        :param keep: slugs of repositories whose workspaces must not be
+          removed, i.e. those being built
+        :type keep: list
+        """
+        if self.max_size_mb is None or not os.path.isdir(self.root):
+            return
+        keep_paths = [self.path_for(k) for k in (keep or [])]
+        workspaces = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(REAP_PREFIX) or not os.path.isdir(path):
+                continue
+            workspaces.append(
+                (os.path.getmtime(path), path, dir_size(path))
+            )
+        total = sum([w[2] for w in workspaces])
+        limit = self.max_size_mb * 1024 * 1024
+        for mtime, path, size in sorted(workspaces):
+            if total <= limit:
+                break
+            if path in keep_paths:
+                continue
+            logger.info("Evicting workspace %s (%d MB) to stay under %d MB",
+                        path, size // (1024 * 1024), self.max_size_mb)
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        """
+        Remove a workspace directory, in the background if ``self.reaper`` is
+        set.
+
+        :param path: path to the workspace
+        :type path: str
+        """
+        if self.reaper is not None:
+            self.reaper.reap(path)
+        else:
+            rmtree(path)
+
+
+def dir_size(path):
+    """
+    Return the total size in bytes of all files under ``path``, not following
+    symlinks.
+
+    :param path: directory to find the size of
+    :type path: str
+    :rtype: int
+    """
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for f in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, f)).st_size
+            except OSError:
+                pass
+    return total
@@ -48,11 +48,13 @@ requires = [
     'TravisPy>=0.3.4,<1',
     'boto>=2.32.0',
     'python-dateutil>=2.4.2',
-    'PyGithub>=1.25',
+    'PyGithub>=1.44',
+    'requests>=2.16.0',
     'GitPython>=1.0.1',
     'Jinja2>=2.7.0, <=2.8.0',
     'pytz>=2014.4',
     'tzlocal>=1.1.1, <=2.0.0',
+    'PyYAML>=3.10',
 ]
 
 classifiers = [
@@ -85,11 +87,16 @@ setup(
     entry_points="""
     [console_scripts]
     rebuildbot = rebuildbot.runner:console_entry_point
+    rebuildbot-loadtest = rebuildbot.loadtest:console_entry_point
     """,
     url=_PROJECT_URL,
     description='Rebuildbot re-runs builds of your inactive projects.',
     long_description=long_description,
     install_requires=requires,
+    extras_require={
+        # verifying Travis webhook notification signatures (--webhook-port)
+        'webhook': ['cryptography'],
+    },
     keywords="travis travisci ci build rebuild testing",
     classifiers=classifiers
 )